@@ -25,103 +25,128 @@ db = SQLAlchemy()
 migrate = Migrate()
 login_manager = LoginManager()
 
+# Alembic migrations live next to the app package (backend/migrations)
+MIGRATIONS_DIRECTORY = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'migrations')
+
 def create_app(config_name='production'):
-    """Create and configure the Flask application"""
+    """Create and configure the Flask application
+    
+    config_name='script' builds a database-only app for CLI scripts: no
+    blueprints or frontend routes are imported or registered.
+    """
+    from app.utils.startup import StartupTimer, startup_mode, prepare_database
+    timer = StartupTimer()
+    
     app = Flask(__name__)
     
-    # Configuration
-    app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'dev-secret-key')
-    
-    # Database configuration - support DATABASE_URL (for cloud platforms) or individual vars
-    database_url = os.getenv('DATABASE_URL')
-    if database_url:
-        # Handle postgres:// vs postgresql:// (Heroku/Railway use postgres://)
-        if database_url.startswith('postgres://'):
-            database_url = database_url.replace('postgres://', 'postgresql://', 1)
-        app.config['SQLALCHEMY_DATABASE_URI'] = database_url
-    else:
-        # URL-encode the password to handle special characters like @, #, etc.
-        db_password = quote_plus(os.getenv('DATABASE_PASSWORD', ''))
-        app.config['SQLALCHEMY_DATABASE_URI'] = f"postgresql://{os.getenv('DATABASE_USER')}:{db_password}@{os.getenv('DATABASE_HOST')}:{os.getenv('DATABASE_PORT')}/{os.getenv('DATABASE_NAME')}"
-    
-    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-    app.config['MAX_CONTENT_LENGTH'] = 100 * 1024 * 1024  # 100MB max file size
-    
-    # CORS configuration
-    CORS(app, resources={r"/api/*": {"origins": "*"}}, supports_credentials=True)
-    
-    # Initialize extensions with app
-    db.init_app(app)
-    migrate.init_app(app, db)
-    login_manager.init_app(app)
-    login_manager.login_view = None
-    login_manager.session_protection = 'strong'
-    
-    # Configure logging
-    # In production (cloud), use stdout logging; locally use file logging
-    if os.getenv('RENDER') or os.getenv('RAILWAY_ENVIRONMENT') or os.getenv('DYNO'):
-        # Cloud environment - log to stdout (captured by platform)
-        stream_handler = logging.StreamHandler(sys.stdout)
-        stream_handler.setFormatter(logging.Formatter(
-            '%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]'
-        ))
-        stream_handler.setLevel(logging.INFO)
-        app.logger.addHandler(stream_handler)
-    else:
-        # Local environment - log to file
-        log_dir = 'logs'
-        if not os.path.exists(log_dir):
-            os.makedirs(log_dir)
+    with timer.phase('config'):
+        # Configuration
+        app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'dev-secret-key')
+        
+        # Database configuration - support DATABASE_URL (for cloud platforms) or individual vars
+        database_url = os.getenv('DATABASE_URL')
+        if database_url:
+            # Handle postgres:// vs postgresql:// (Heroku/Railway use postgres://)
+            if database_url.startswith('postgres://'):
+                database_url = database_url.replace('postgres://', 'postgresql://', 1)
+            app.config['SQLALCHEMY_DATABASE_URI'] = database_url
+        else:
+            # URL-encode the password to handle special characters like @, #, etc.
+            db_password = quote_plus(os.getenv('DATABASE_PASSWORD', ''))
+            app.config['SQLALCHEMY_DATABASE_URI'] = f"postgresql://{os.getenv('DATABASE_USER')}:{db_password}@{os.getenv('DATABASE_HOST')}:{os.getenv('DATABASE_PORT')}/{os.getenv('DATABASE_NAME')}"
+        
+        app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+        
+        # Connection pool sized per Gunicorn worker (pre-ping, recycle, statement timeout)
+        from app.utils.db_pool import build_engine_options, install_pool_listeners
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = build_engine_options(app.config['SQLALCHEMY_DATABASE_URI'])
+        app.config['MAX_CONTENT_LENGTH'] = 100 * 1024 * 1024  # 100MB max file size
         
-        log_file = os.getenv('LOG_FILE_PATH', os.path.join(log_dir, 'codex.log'))
-        log_dir = os.path.dirname(log_file)
-        if log_dir and not os.path.exists(log_dir):
-            os.makedirs(log_dir, exist_ok=True)
+        # Schema handling at startup: verify (default), upgrade, create or skip
+        app.config['DB_STARTUP_MODE'] = startup_mode()
+    
+    with timer.phase('extensions'):
+        # CORS configuration
+        CORS(app, resources={r"/api/*": {"origins": "*"}}, supports_credentials=True)
+        
+        # Response compression (gzip/brotli negotiated via Accept-Encoding)
+        from app.utils.responses import init_compression
+        init_compression(app)
+        
+        # Initialize extensions with app
+        db.init_app(app)
+        migrate.init_app(app, db, directory=MIGRATIONS_DIRECTORY)
+        login_manager.init_app(app)
+        login_manager.login_view = None
+        login_manager.session_protection = 'strong'
+    
+    with timer.phase('logging'):
+        # Configure logging
+        # In production (cloud), use stdout logging; locally use file logging
+        if os.getenv('RENDER') or os.getenv('RAILWAY_ENVIRONMENT') or os.getenv('DYNO'):
+            # Cloud environment - log to stdout (captured by platform)
+            stream_handler = logging.StreamHandler(sys.stdout)
+            stream_handler.setFormatter(logging.Formatter(
+                '%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]'
+            ))
+            stream_handler.setLevel(logging.INFO)
+            app.logger.addHandler(stream_handler)
+        else:
+            # Local environment - log to file
+            log_dir = 'logs'
+            if not os.path.exists(log_dir):
+                os.makedirs(log_dir)
+            
+            log_file = os.getenv('LOG_FILE_PATH', os.path.join(log_dir, 'codex.log'))
+            log_dir = os.path.dirname(log_file)
+            if log_dir and not os.path.exists(log_dir):
+                os.makedirs(log_dir, exist_ok=True)
+            
+            file_handler = RotatingFileHandler(
+                log_file,
+                maxBytes=10485760,  # 10MB
+                backupCount=int(os.getenv('LOG_BACKUP_COUNT', 5))
+            )
+            file_handler.setFormatter(logging.Formatter(
+                '%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]'
+            ))
+            file_handler.setLevel(logging.INFO)
+            app.logger.addHandler(file_handler)
         
-        file_handler = RotatingFileHandler(
-            log_file,
-            maxBytes=10485760,  # 10MB
-            backupCount=int(os.getenv('LOG_BACKUP_COUNT', 5))
-        )
-        file_handler.setFormatter(logging.Formatter(
-            '%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]'
-        ))
-        file_handler.setLevel(logging.INFO)
-        app.logger.addHandler(file_handler)
-    
-    app.logger.setLevel(logging.INFO)
-    app.logger.info('Codex startup')
+        app.logger.setLevel(logging.INFO)
+        app.logger.info('Codex startup')
     
     # Import models here to avoid circular imports
     from app.models import User, File, Project, Tag
     
-    # Create database tables if they don't exist (for cloud deployment)
-    with app.app_context():
+    # With a preloaded search snapshot, any ORM change to files, tags or
+    # projects bumps the index generation the Gunicorn master watches
+    if os.getenv('PRELOAD_APP', 'False').lower() == 'true':
+        from app.services.search_index import install_generation_tracking
+        install_generation_tracking()
+    
+    # Every ORM change adjusts the dashboard counters in the same transaction
+    from app.services.stats import install_stats_tracking
+    install_stats_tracking()
+    
+    # ...and the per-project / per-tag active file counts
+    from app.services.file_counts import install_file_count_tracking
+    install_file_count_tracking()
+    
+    # Schema is managed by migrations ("flask db upgrade" at release time);
+    # workers only verify it, once per process
+    with timer.phase('schema'), app.app_context():
+        install_pool_listeners(app, db.engine)
         try:
-            db.create_all()
-            app.logger.info('Database tables created/verified')
-            
-            # Create default admin if none exists
-            admin = User.query.filter_by(role='admin').first()
-            if not admin:
-                from werkzeug.security import generate_password_hash
-                default_admin = User(
-                    username='admin',
-                    password_hash=generate_password_hash('admin123'),
-                    email='admin@dccodex.local',
-                    full_name='System Administrator',
-                    role='admin',
-                    is_active=True
-                )
-                db.session.add(default_admin)
-                db.session.commit()
-                app.logger.info('Default admin user created')
+            result = prepare_database(app, db, app.config['DB_STARTUP_MODE'])
+            app.logger.info(f"Database startup ({app.config['DB_STARTUP_MODE']}): {result}")
         except Exception as e:
             app.logger.error(f'Database initialization error: {e}')
     
     @login_manager.user_loader
     def load_user(user_id):
-        return User.query.get(int(user_id))
+        from app.utils.user_cache import load_cached_user
+        return load_cached_user(db, int(user_id))
     
     @login_manager.unauthorized_handler
     def unauthorized():
@@ -129,6 +154,20 @@ def create_app(config_name='production'):
             return jsonify({'error': 'Authentication required'}), 401
         return redirect('/login.html')
     
+    if config_name != 'script':
+        with timer.phase('blueprints'):
+            _register_routes(app)
+        
+        # Periodic jobs (stats refresh, ...) start with the first request of each worker
+        from app.services.scheduler import init_scheduler
+        init_scheduler(app)
+    
+    app.config['STARTUP_TIMINGS'] = timer.report()
+    app.logger.info(f'Startup completed in {timer.summary()}')
+    return app
+
+def _register_routes(app):
+    """Register API blueprints, frontend pages and error handlers"""
     # Register blueprints
     from app.api import search_bp, admin_bp, auth_bp, file_bp, browse_bp
     app.register_blueprint(search_bp, url_prefix='/api/search')
@@ -217,5 +256,3 @@ def create_app(config_name='production'):
     @app.errorhandler(413)
     def request_entity_too_large(error):
         return jsonify({'error': 'File too large. Maximum size is 100MB'}), 413
-    
-    return app
@@ -4,18 +4,17 @@ Admin API Endpoints - Complete Implementation
 
 from flask import Blueprint, request, jsonify, current_app, send_file
 from flask_login import login_required, current_user
-from werkzeug.utils import secure_filename
 from app.models import File, Tag, Project, User, SearchLog, db
 from app.services.file_indexer import FileIndexer
+from app.services import blob_store
 from app.utils.decorators import admin_required
+from app.utils.responses import stream_json
+from app.utils.user_cache import user_cache
 import os
-import json
-import hashlib
 from datetime import datetime, timedelta
 from sqlalchemy import func, and_
-import zipfile
+from sqlalchemy.orm import selectinload
 import tempfile
-import subprocess
 import shutil
 
 admin_bp = Blueprint('admin', __name__)
@@ -34,25 +33,6 @@ def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def get_file_hash(filepath):
-    """Calculate MD5 hash of file"""
-    hash_md5 = hashlib.md5()
-    try:
-        with open(filepath, "rb") as f:
-            for chunk in iter(lambda: f.read(4096), b""):
-                hash_md5.update(chunk)
-        return hash_md5.hexdigest()
-    except:
-        return None
-
-def count_lines(filepath):
-    """Count lines in a text file"""
-    try:
-        with open(filepath, 'r', encoding='utf-8', errors='ignore') as f:
-            return sum(1 for line in f)
-    except:
-        return 0
-
 # Files Management
 
 @admin_bp.route('/files', methods=['GET'])
@@ -62,6 +42,9 @@ def get_files():
     """Get paginated list of files"""
     page = request.args.get('page', 1, type=int)
     per_page = request.args.get('per_page', 20, type=int)
+    page = max(page, 1)
+    if per_page < 1:
+        per_page = 20
     
     # Build query
     query = File.query.filter_by(is_active=True)
@@ -79,33 +62,36 @@ def get_files():
     # Order by indexed date
     query = query.order_by(File.indexed_date.desc())
     
-    # Paginate
-    pagination = query.paginate(page=page, per_page=per_page, error_out=False)
-    
-    results = []
-    for file in pagination.items:
-        results.append({
-            'id': file.id,
-            'filename': file.filename,
-            'filepath': file.filepath,
-            'filetype': file.filetype,
-            'description': file.description,
-            'size': file.size,
-            'line_count': file.line_count,
-            'modified_date': file.modified_date.isoformat() if file.modified_date else None,
-            'indexed_date': file.indexed_date.isoformat() if file.indexed_date else None,
-            'project': file.project.name if file.project else None,
-            'project_id': file.project_id,
-            'tags': [tag.name for tag in file.tags]
-        })
+    # Count once, then stream the page straight from the cursor
+    total = query.order_by(None).count()
+    pages = (total + per_page - 1) // per_page
+    
+    page_query = query.options(selectinload(File.project), selectinload(File.tags))\
+                      .limit(per_page).offset((page - 1) * per_page)
+    
+    def results():
+        for file in db.session.scalars(page_query.statement, execution_options={'yield_per': 500}):
+            yield {
+                'id': file.id,
+                'filename': file.filename,
+                'filepath': file.filepath,
+                'filetype': file.filetype,
+                'description': file.description,
+                'size': file.size,
+                'line_count': file.line_count,
+                'modified_date': file.modified_date.isoformat() if file.modified_date else None,
+                'indexed_date': file.indexed_date.isoformat() if file.indexed_date else None,
+                'project': file.project.name if file.project else None,
+                'project_id': file.project_id,
+                'tags': [tag.name for tag in file.tags]
+            }
     
-    return jsonify({
-        'results': results,
-        'total': pagination.total,
+    return stream_json({
+        'total': total,
         'page': page,
-        'pages': pagination.pages,
+        'pages': pages,
         'per_page': per_page
-    })
+    }, 'results', results())
 
 @admin_bp.route('/files', methods=['POST'])
 @login_required
@@ -195,13 +181,15 @@ def delete_file(file_id):
         # Delete physical file
         try:
             if os.path.exists(file.filepath):
-                os.remove(file.filepath)
+                blob_store.discard(file.filepath)
                 current_app.logger.info(f'Physical file deleted: {file.filepath}')
         except Exception as e:
             current_app.logger.error(f'Error deleting physical file {file.filepath}: {e}')
             return jsonify({'error': f'Failed to delete physical file: {str(e)}'}), 500
     
     # Always mark as inactive in database
+    if file.is_active and blob_store.is_blob_backed(file.filepath):
+        blob_store.release(db.session.connection(), [file.content_hash])
     file.is_active = False
     db.session.commit()
     
@@ -211,6 +199,54 @@ def delete_file(file_id):
     
     return jsonify({'message': message})
 
+@admin_bp.route('/files/batch', methods=['POST'])
+@login_required
+@admin_required
+def batch_files():
+    """Create, update, deactivate or move many files in one transaction"""
+    from app.services.file_batch import run_batch
+    data = request.get_json() or {}
+    
+    try:
+        result = run_batch(db.session.connection(), data.get('operations'), atomic=data.get('atomic', True))
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+    
+    if not result['applied']:
+        db.session.rollback()
+        return jsonify({'error': 'Batch rejected: some operations are invalid', **result}), 400
+    
+    db.session.commit()
+    return jsonify(result)
+
+@admin_bp.route('/files/duplicates', methods=['GET'])
+@login_required
+@admin_required
+def get_duplicate_files():
+    """Get exact duplicate sets (kind=exact) or duplicate clusters from the last analysis"""
+    from app.services import duplicates
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = min(max(request.args.get('per_page', 20, type=int), 1), 100)
+    project_id = request.args.get('project_id', type=int)
+    
+    with db.engine.connect() as connection:
+        if request.args.get('kind', 'similar') == 'exact':
+            result = duplicates.exact_duplicates(connection, project_id, page, per_page)
+        else:
+            result = duplicates.similar_groups(connection, project_id, page, per_page)
+    result['max_distance'] = duplicates.MAX_DISTANCE
+    return jsonify(result)
+
+@admin_bp.route('/files/duplicates/analyze', methods=['POST'])
+@login_required
+@admin_required
+def analyze_duplicate_files():
+    """Compute missing signatures and regroup duplicates now"""
+    from app.services.scheduler import run_job, job_status
+    result = run_job(current_app._get_current_object(), 'analyze_duplicates')
+    return jsonify({'result': result, 'job': job_status.get('analyze_duplicates')})
+
 # Projects Management
 
 @admin_bp.route('/projects', methods=['GET'])
@@ -222,7 +258,7 @@ def get_projects():
         'name': p.name,
         'description': p.description,
         'created_date': p.created_date.isoformat() if p.created_date else None,
-        'file_count': p.files.filter_by(is_active=True).count()
+        'file_count': p.active_file_count
     } for p in projects])
 
 @admin_bp.route('/projects', methods=['POST'])
@@ -299,7 +335,7 @@ def get_tags():
         'id': t.id,
         'name': t.name,
         'description': t.description,
-        'file_count': len([f for f in t.files if f.is_active])
+        'file_count': t.active_file_count
     } for t in tags])
 
 @admin_bp.route('/tags', methods=['POST'])
@@ -354,16 +390,38 @@ def update_tag(tag_id):
 @admin_required
 def delete_tag(tag_id):
     """Delete a tag"""
-    tag = Tag.query.get_or_404(tag_id)
+    from app.services.tag_operations import delete_tags
+    try:
+        result = delete_tags(db.session.connection(), [tag_id])
+    except LookupError:
+        db.session.rollback()
+        return jsonify({'error': 'Tag not found'}), 404
+    db.session.commit()
     
-    # Remove tag from all files
-    for file in tag.files:
-        file.tags.remove(tag)
+    return jsonify({'message': 'Tag deleted successfully', **result})
+
+@admin_bp.route('/tags/bulk', methods=['POST'])
+@login_required
+@admin_required
+def bulk_tag_operation():
+    """Delete, merge, rename, apply or remove tags in bulk"""
+    from app.services.tag_operations import run_bulk_operation, TagNameConflict
+    data = request.get_json() or {}
     
-    db.session.delete(tag)
+    try:
+        result = run_bulk_operation(db.session.connection(), data)
+    except LookupError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 404
+    except TagNameConflict as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 409
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
     db.session.commit()
     
-    return jsonify({'message': 'Tag deleted successfully'})
+    return jsonify({'message': f"Tag {data.get('action')} completed", **result})
 
 @admin_bp.route('/index', methods=['POST'])
 @login_required
@@ -384,6 +442,7 @@ def trigger_indexing():
             'files_indexed': result['files_indexed'],
             'files_updated': result['files_updated'],
             'files_skipped': result['files_skipped'],
+            'files_deactivated': result['files_deactivated'],
             'errors': result['errors'][:10] if result['errors'] else []  # Limit errors to 10
         })
     except Exception as e:
@@ -428,6 +487,7 @@ def index_custom_path():
             'files_indexed': result['files_indexed'],
             'files_updated': result['files_updated'],
             'files_skipped': result['files_skipped'],
+            'files_deactivated': result['files_deactivated'],
             'errors': result['errors'][:10] if result['errors'] else []
         })
     except Exception as e:
@@ -460,23 +520,13 @@ def get_file_stats():
 @login_required
 @admin_required
 def get_search_stats():
-    """Get search statistics"""
-    # Searches today
-    today = datetime.utcnow().date()
-    searches_today = SearchLog.query.filter(
-        func.date(SearchLog.timestamp) == today
-    ).count()
-    
-    # Popular searches
-    popular_searches = db.session.query(
-        SearchLog.search_term,
-        func.count(SearchLog.id).label('count')
-    ).group_by(SearchLog.search_term).order_by(func.count(SearchLog.id).desc()).limit(10).all()
+    """Get search statistics (from the rollups; ?days=N ranks terms over the last N days)"""
+    from app.services.search_analytics import search_stats
+    days = request.args.get('days', type=int)
+    limit = min(max(request.args.get('limit', 10, type=int), 1), 100)
     
-    return jsonify({
-        'searches_today': searches_today,
-        'popular_searches': [{'term': term, 'count': count} for term, count in popular_searches]
-    })
+    with db.engine.begin() as connection:
+        return jsonify(search_stats(connection, days=days if days and days > 0 else None, limit=limit))
 
 @admin_bp.route('/activity/recent', methods=['GET'])
 @login_required
@@ -582,6 +632,7 @@ def update_user(user_id):
         user.set_password(data['password'])
     
     db.session.commit()
+    user_cache.invalidate(user_id)
     
     return jsonify({'message': 'User updated successfully'})
 
@@ -596,6 +647,7 @@ def delete_user(user_id):
     user = User.query.get_or_404(user_id)
     user.is_active = False
     db.session.commit()
+    user_cache.invalidate(user_id)
     
     return jsonify({'message': 'User deactivated successfully'})
 
@@ -604,21 +656,21 @@ def delete_user(user_id):
 @login_required
 @admin_required
 def upload_file():
-    """Upload files via drag-and-drop or file selection"""
-    if 'file' not in request.files:
-        return jsonify({'error': 'No file part'}), 400
-    
-    file = request.files['file']
-    if file.filename == '':
+    """Upload files via drag-and-drop or file selection (several files or zip/tar archives per request)"""
+    from app.services.uploads import store_uploads, remove_paths
+    
+    uploads = [upload for upload in request.files.getlist('files') + request.files.getlist('file')
+               if upload and upload.filename]
+    if not uploads:
+        if 'file' not in request.files and 'files' not in request.files:
+            return jsonify({'error': 'No file part'}), 400
         return jsonify({'error': 'No selected file'}), 400
     
-    if not allowed_file(file.filename):
-        return jsonify({'error': 'File type not allowed'}), 400
-    
     # Get additional form data
     project_id = request.form.get('project_id', type=int)
     description = request.form.get('description', '')
-    tags = request.form.get('tags', '').split(',') if request.form.get('tags') else []
+    tags = [tag.strip() for tag in request.form.get('tags', '').split(',') if tag.strip()]
+    extract = request.form.get('extract', 'true').lower() != 'false'
     
     if not project_id:
         return jsonify({'error': 'Project is required'}), 400
@@ -629,66 +681,33 @@ def upload_file():
         return jsonify({'error': 'Project not found'}), 404
     
     try:
-        # Create upload directory if it doesn't exist
-        os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-        
-        # Secure filename and create unique name if necessary
-        filename = secure_filename(file.filename)
-        base_name, ext = os.path.splitext(filename)
-        counter = 1
-        
-        while File.query.filter_by(filename=filename).first():
-            filename = f"{base_name}_{counter}{ext}"
-            counter += 1
-        
-        # Save file
-        filepath = os.path.join(UPLOAD_FOLDER, filename)
-        file.save(filepath)
-        
-        # Get file info
-        file_size = os.path.getsize(filepath)
-        file_hash = get_file_hash(filepath)
-        line_count = count_lines(filepath)
-        
-        # Create database record
-        new_file = File(
-            filename=filename,
-            filepath=os.path.abspath(filepath),
-            filetype=ext.lower(),
-            project_id=project_id,
-            description=description,
-            size=file_size,
-            line_count=line_count,
-            content_hash=file_hash,
-            modified_date=datetime.utcnow()
-        )
-        
-        # Add tags
-        for tag_name in tags:
-            tag_name = tag_name.strip()
-            if tag_name:
-                tag = Tag.query.filter_by(name=tag_name).first()
-                if not tag:
-                    tag = Tag(name=tag_name, description=f"Auto-created from upload")
-                    db.session.add(tag)
-                new_file.tags.append(tag)
-        
-        db.session.add(new_file)
-        db.session.commit()
-        
-        return jsonify({
-            'message': 'File uploaded successfully',
-            'file': {
-                'id': new_file.id,
-                'filename': new_file.filename,
-                'size': new_file.size,
-                'project': project.name
-            }
-        }), 201
-        
+        outcome = store_uploads(uploads, project, UPLOAD_FOLDER, description=description,
+                                tags=tags, accept=allowed_file, extract=extract)
+        try:
+            db.session.commit()
+        except Exception:
+            remove_paths(outcome['paths'])
+            raise
     except Exception as e:
+        db.session.rollback()
         current_app.logger.error(f'File upload error: {str(e)}')
         return jsonify({'error': f'Upload failed: {str(e)}'}), 500
+    
+    results = outcome['results']
+    succeeded = [result for result in results if result['status'] == 'ok']
+    
+    # A single plain file keeps the original response shape
+    if len(results) == 1:
+        result = results[0]
+        if result['status'] != 'ok':
+            return jsonify({'error': result['error']}), 400
+        if 'file' in result:
+            return jsonify({'message': 'File uploaded successfully', 'file': result['file']}), 201
+    
+    return jsonify({
+        'message': f'{len(succeeded)} of {len(results)} uploads processed',
+        'results': results
+    }), 201 if succeeded else 400
 
 # Enhanced dashboard stats
 @admin_bp.route('/dashboard/stats', methods=['GET'])
@@ -696,186 +715,149 @@ def upload_file():
 @admin_required
 def get_dashboard_stats():
     """Get comprehensive dashboard statistics"""
+    from app.services.stats import read_dashboard
+    from app.services.scheduler import run_soon
     try:
-        # Basic counts
-        total_files = File.query.filter_by(is_active=True).count()
-        total_projects = Project.query.filter_by(is_active=True).count()
-        total_tags = Tag.query.count()
-        total_users = User.query.filter_by(is_active=True).count()
-        
-        # File statistics
-        total_size = db.session.query(func.sum(File.size)).filter_by(is_active=True).scalar() or 0
-        
-        # Recent activity counts
-        today = datetime.utcnow().date()
-        week_ago = today - timedelta(days=7)
-        
-        files_this_week = File.query.filter(
-            File.is_active == True,
-            func.date(File.indexed_date) >= week_ago
-        ).count()
-        
-        searches_this_week = SearchLog.query.filter(
-            func.date(SearchLog.timestamp) >= week_ago
-        ).count()
-        
-        # Popular file types
-        file_types = db.session.query(
-            File.filetype,
-            func.count(File.id).label('count')
-        ).filter_by(is_active=True).group_by(File.filetype).order_by(func.count(File.id).desc()).limit(10).all()
-        
-        # Most active projects
-        active_projects = db.session.query(
-            Project.name,
-            func.count(File.id).label('file_count')
-        ).join(File).filter(File.is_active == True).group_by(Project.name).order_by(func.count(File.id).desc()).limit(5).all()
-        
-        return jsonify({
-            'totals': {
-                'files': total_files,
-                'projects': total_projects,
-                'tags': total_tags,
-                'users': total_users,
-                'total_size': total_size
-            },
-            'activity': {
-                'files_this_week': files_this_week,
-                'searches_this_week': searches_this_week
-            },
-            'file_types': [{'type': ft, 'count': count} for ft, count in file_types],
-            'active_projects': [{'name': name, 'files': count} for name, count in active_projects]
-        })
+        with db.engine.begin() as connection:
+            stats = read_dashboard(connection)
+        if stats['updated'] is None:
+            # Nothing counted yet: compute the counters in the background
+            run_soon(current_app._get_current_object(), 'refresh_stats')
+        return jsonify(stats)
         
     except Exception as e:
         current_app.logger.error(f'Dashboard stats error: {str(e)}')
         return jsonify({'error': 'Failed to load dashboard statistics'}), 500
 
+@admin_bp.route('/dashboard/stats/refresh', methods=['POST'])
+@login_required
+@admin_required
+def refresh_dashboard_stats():
+    """Recompute the dashboard counters now"""
+    from app.services.scheduler import run_job, job_status
+    counters = run_job(current_app._get_current_object(), 'refresh_stats')
+    return jsonify({'counters': counters, 'job': job_status.get('refresh_stats')})
+
+@admin_bp.route('/system/jobs', methods=['GET'])
+@login_required
+@admin_required
+def get_scheduled_jobs():
+    """Get the last outcome of each scheduled job in this worker"""
+    from app.services.scheduler import job_status
+    return jsonify(job_status)
+
 # Backup and Restore
 
 @admin_bp.route('/backup', methods=['POST'])
 @login_required
 @admin_required
 def create_backup():
-    """Create a system backup"""
+    """Start a system backup in the background; poll /backup-jobs/<job_id> for progress"""
+    from app.services import backup, background_jobs
     try:
-        data = request.get_json()
+        data = request.get_json(silent=True) or {}
         backup_name = data.get('name') or f"codex_backup_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}"
+        backup.backup_path(backup_name)
         
-        # Create backup directory
-        backup_dir = os.path.join(current_app.root_path, '..', '..', 'backups')
-        os.makedirs(backup_dir, exist_ok=True)
-        
-        backup_path = os.path.join(backup_dir, f"{backup_name}.zip")
-        
-        # Create backup using the backup script
-        script_path = os.path.join(current_app.root_path, '..', '..', 'backup_restore.py')
-        result = subprocess.run([
-            'python', script_path, 'backup', '--name', backup_name, '--force'
-        ], capture_output=True, text=True, cwd=os.path.dirname(script_path))
+        job = background_jobs.submit('backup', {'backup_name': backup_name})
+        return jsonify({
+            'success': True,
+            'message': 'Backup started',
+            'backup_name': backup_name,
+            'job_id': job['id'],
+            'status_url': f"/api/admin/backup-jobs/{job['id']}"
+        }), 202
         
-        if result.returncode == 0:
-            backup_size = os.path.getsize(backup_path) / (1024 * 1024)  # MB
-            return jsonify({
-                'success': True,
-                'message': 'Backup created successfully',
-                'backup_name': backup_name,
-                'backup_path': backup_path,
-                'size_mb': round(backup_size, 2)
-            })
-        else:
-            return jsonify({
-                'success': False,
-                'message': f'Backup failed: {result.stderr}'
-            }), 500
-            
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
     except Exception as e:
         current_app.logger.error(f'Backup error: {e}')
         return jsonify({'success': False, 'message': str(e)}), 500
 
+@admin_bp.route('/backup-jobs', methods=['GET'])
+@login_required
+@admin_required
+def list_backup_jobs():
+    """Recent backup and restore jobs, newest first"""
+    from app.services.background_jobs import list_jobs
+    return jsonify({'jobs': list_jobs(request.args.get('limit', 20, type=int))})
+
+@admin_bp.route('/backup-jobs/<job_id>', methods=['GET'])
+@login_required
+@admin_required
+def get_backup_job(job_id):
+    """Status, progress and throughput of a backup or restore job"""
+    from app.services.background_jobs import get_job
+    job = get_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job)
+
 @admin_bp.route('/backups', methods=['GET'])
 @login_required
 @admin_required
 def list_backups():
     """List available backups"""
+    from app.services import backup_index
+    from app.services.backup import BACKUP_DIR
     try:
-        backup_dir = os.path.join(current_app.root_path, '..', '..', 'backups')
+        backup_dir = BACKUP_DIR
+        # Reads each backup's sidecar manifest; older backups fall back to the zip
+        return jsonify({'backups': backup_index.list_backups(backup_dir)})
         
-        if not os.path.exists(backup_dir):
-            return jsonify({'backups': []})
-        
-        backups = []
-        for backup_file in os.listdir(backup_dir):
-            if backup_file.endswith('.zip'):
-                backup_path = os.path.join(backup_dir, backup_file)
-                size = os.path.getsize(backup_path) / (1024 * 1024)  # MB
-                modified = datetime.fromtimestamp(os.path.getmtime(backup_path))
-                
-                backup_info = {
-                    'filename': backup_file,
-                    'name': backup_file.replace('.zip', ''),
-                    'path': backup_path,
-                    'size_mb': round(size, 2),
-                    'created_at': modified.isoformat(),
-                    'statistics': {}
-                }
-                
-                # Try to read manifest
-                try:
-                    with zipfile.ZipFile(backup_path, 'r') as backup_zip:
-                        manifest_data = backup_zip.read('manifest.json')
-                        manifest = json.loads(manifest_data)
-                        backup_info['statistics'] = manifest.get('statistics', {})
-                except:
-                    backup_info['statistics'] = {'error': 'Could not read backup manifest'}
-                
-                backups.append(backup_info)
-        
-        # Sort by creation time, newest first
-        backups.sort(key=lambda x: x['created_at'], reverse=True)
+    except Exception as e:
+        current_app.logger.error(f'List backups error: {e}')
+        return jsonify({'error': str(e)}), 500
+
+@admin_bp.route('/backup/<backup_name>/verify', methods=['POST'])
+@login_required
+@admin_required
+def verify_backup(backup_name):
+    """Check every member of a backup archive against its CRC and manifest checksums"""
+    from app.services import backup
+    try:
+        backup_path = backup.backup_path(backup_name)
+        if not os.path.exists(backup_path):
+            return jsonify({'error': 'Backup file not found'}), 404
         
-        return jsonify({'backups': backups})
+        failed = backup.verify_backup(backup_path)
+        return jsonify({'backup_name': backup_name, 'valid': not failed, 'failed_members': failed})
         
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
-        current_app.logger.error(f'List backups error: {e}')
+        current_app.logger.error(f'Verify backup error: {e}')
         return jsonify({'error': str(e)}), 500
 
 @admin_bp.route('/restore', methods=['POST'])
 @login_required
 @admin_required
 def restore_backup():
-    """Restore from backup"""
+    """Start restoring a backup in the background; poll /backup-jobs/<job_id> for progress"""
+    from app.services import backup, background_jobs
     try:
-        data = request.get_json()
+        data = request.get_json(silent=True) or {}
         backup_name = data.get('backup_name')
         
         if not backup_name:
             return jsonify({'success': False, 'message': 'Backup name required'}), 400
         
-        backup_dir = os.path.join(current_app.root_path, '..', '..', 'backups')
-        backup_path = os.path.join(backup_dir, f"{backup_name}.zip")
-        
+        backup_path = backup.backup_path(backup_name)
         if not os.path.exists(backup_path):
             return jsonify({'success': False, 'message': 'Backup file not found'}), 404
+        restore_config = bool(data.get('restore_config', False))
         
-        # Use the backup script to restore
-        script_path = os.path.join(current_app.root_path, '..', '..', 'backup_restore.py')
-        result = subprocess.run([
-            'python', script_path, 'restore', '--file', backup_path, '--force'
-        ], capture_output=True, text=True, cwd=os.path.dirname(script_path))
+        job = background_jobs.submit('restore', {'backup_name': backup_name, 'restore_config': restore_config})
+        return jsonify({
+            'success': True,
+            'message': 'Restore started',
+            'backup_name': backup_name,
+            'job_id': job['id'],
+            'status_url': f"/api/admin/backup-jobs/{job['id']}"
+        }), 202
         
-        if result.returncode == 0:
-            return jsonify({
-                'success': True,
-                'message': 'Restore completed successfully. Please restart the application.',
-                'backup_name': backup_name
-            })
-        else:
-            return jsonify({
-                'success': False,
-                'message': f'Restore failed: {result.stderr}'
-            }), 500
-            
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
     except Exception as e:
         current_app.logger.error(f'Restore error: {e}')
         return jsonify({'success': False, 'message': str(e)}), 500
@@ -884,45 +866,170 @@ def restore_backup():
 @login_required
 @admin_required
 def delete_backup(backup_name):
-    """Delete a backup file"""
+    """Delete a backup file and its sidecar manifest"""
+    from app.services.backup import backup_path as path_of
+    from app.services.backup_index import manifest_path
     try:
-        backup_dir = os.path.join(current_app.root_path, '..', '..', 'backups')
-        backup_path = os.path.join(backup_dir, f"{backup_name}.zip")
+        backup_path = path_of(backup_name)
         
         if not os.path.exists(backup_path):
             return jsonify({'error': 'Backup file not found'}), 404
         
         os.remove(backup_path)
+        if os.path.exists(manifest_path(backup_path)):
+            os.remove(manifest_path(backup_path))
         
         return jsonify({
             'success': True,
             'message': 'Backup deleted successfully'
         })
         
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         current_app.logger.error(f'Delete backup error: {e}')
         return jsonify({'error': str(e)}), 500
 
 # System Maintenance Endpoints
 
+@admin_bp.route('/system/pool', methods=['GET'])
+@login_required
+@admin_required
+def get_pool_stats():
+    """Get database connection pool sizing and checkout metrics for this worker"""
+    from app.utils.db_pool import pool_metrics, describe_pool
+    return jsonify({
+        'pool': describe_pool(db.engine),
+        'metrics': pool_metrics.snapshot()
+    })
+
+@admin_bp.route('/system/search-logs', methods=['GET'])
+@login_required
+@admin_required
+def get_search_log_partitions():
+    """Get the search_logs partitions and retention policy"""
+    from app.services import search_log_partitions as partitions
+    with db.engine.connect() as connection:
+        partitioned = partitions.is_partitioned(connection)
+        return jsonify({
+            'partitioned': partitioned,
+            'retention_months': partitions.RETENTION_MONTHS,
+            'archive': partitions.ARCHIVE_ENABLED,
+            'partitions': partitions.list_partitions(connection) if partitioned else []
+        })
+
+@admin_bp.route('/system/search-logs/maintain', methods=['POST'])
+@login_required
+@admin_required
+def maintain_search_log_partitions():
+    """Create upcoming search_logs partitions and apply retention now"""
+    from app.services.scheduler import run_job, job_status
+    result = run_job(current_app._get_current_object(), 'maintain_search_logs')
+    return jsonify({'result': result, 'job': job_status.get('maintain_search_logs')})
+
+@admin_bp.route('/system/blob-store', methods=['GET'])
+@login_required
+@admin_required
+def get_blob_store_summary():
+    """Get blob store usage and the space saved by deduplication"""
+    with db.engine.connect() as connection:
+        return jsonify(blob_store.store_summary(connection))
+
+@admin_bp.route('/system/blob-store/collect', methods=['POST'])
+@login_required
+@admin_required
+def collect_blob_store():
+    """Reconcile blob reference counts and delete unreferenced blobs now"""
+    from app.services.scheduler import run_job, job_status
+    result = run_job(current_app._get_current_object(), 'collect_blobs')
+    return jsonify({'result': result, 'job': job_status.get('collect_blobs')})
+
+@admin_bp.route('/system/db-report', methods=['GET'])
+@login_required
+@admin_required
+def get_database_report():
+    """Dead tuples, estimated bloat, scan ratios and unused indexes (PostgreSQL statistics views)"""
+    from app.services import db_maintenance
+    with db.engine.connect() as connection:
+        return jsonify(db_maintenance.report(connection))
+
+@admin_bp.route('/system/db-report/vacuum', methods=['POST'])
+@login_required
+@admin_required
+def vacuum_database():
+    """VACUUM (ANALYZE) the hot tables that are due now"""
+    from app.services.scheduler import run_job, job_status
+    result = run_job(current_app._get_current_object(), 'vacuum_hot_tables')
+    return jsonify({'result': result, 'job': job_status.get('vacuum_hot_tables')})
+
+@admin_bp.route('/system/integrity/verify', methods=['POST'])
+@login_required
+@admin_required
+def verify_integrity():
+    """Check stored content hashes against disk (the repository and uploads, or one root)"""
+    from app.services import integrity
+    data = request.get_json(silent=True) or {}
+    merkle = bool(data.get('merkle', integrity.MERKLE_ENABLED))
+    
+    root = data.get('root')
+    if root and not os.path.isdir(root):
+        return jsonify({'error': 'Root directory not found'}), 400
+    
+    with db.engine.begin() as connection:
+        if root:
+            reports = [integrity.verify_tree(connection, root, merkle)]
+        else:
+            reports = integrity.verify_roots(connection, merkle)
+    return jsonify({
+        'clean': all(report['clean'] for report in reports),
+        'roots': reports
+    })
+
+@admin_bp.route('/system/user-cache', methods=['GET'])
+@login_required
+@admin_required
+def get_user_cache_stats():
+    """Get user lookup cache hit/miss counters for this worker"""
+    return jsonify(user_cache.stats())
+
+@admin_bp.route('/system/search-index', methods=['GET'])
+@login_required
+@admin_required
+def get_search_index_stats():
+    """Get the preloaded search index snapshot served by this worker"""
+    from app.services.search_index import get_snapshot
+    snapshot = get_snapshot()
+    if snapshot is None:
+        return jsonify({'preloaded': False})
+    return jsonify({'preloaded': True, **snapshot.describe()})
+
+@admin_bp.route('/system/startup', methods=['GET'])
+@login_required
+@admin_required
+def get_startup_stats():
+    """Get the schema startup mode and create_app phase timings for this worker"""
+    return jsonify({
+        'mode': current_app.config.get('DB_STARTUP_MODE'),
+        'timings_ms': current_app.config.get('STARTUP_TIMINGS', {})
+    })
+
 @admin_bp.route('/system/analyze', methods=['POST'])
 @login_required
 @admin_required
 def analyze_system():
     """Analyze system for file synchronization issues"""
     try:
-        # Import the advanced file manager
-        import sys
-        sys.path.append(os.path.join(current_app.root_path, '..', '..'))
-        from advanced_file_manager import AdvancedFileManager
+        from app.scripts.advanced_file_manager import AdvancedFileManager
         
-        manager = AdvancedFileManager()
+        manager = AdvancedFileManager(current_app._get_current_object())
         manager.analyze_system()
         
         return jsonify({
             'success': True,
-            'issues_found': len(manager.issues_found),
-            'issues': manager.issues_found
+            'issues_found': manager.issue_count,
+            'issue_counts': manager.issue_counts,
+            'issues': manager.issues_found,
+            'issues_truncated': manager.issue_count > len(manager.issues_found)
         })
         
     except Exception as e:
@@ -935,19 +1042,17 @@ def analyze_system():
 def fix_system_issues():
     """Fix system file synchronization issues"""
     try:
-        # Import the advanced file manager
-        import sys
-        sys.path.append(os.path.join(current_app.root_path, '..', '..'))
-        from advanced_file_manager import AdvancedFileManager
+        from app.scripts.advanced_file_manager import AdvancedFileManager
         
-        manager = AdvancedFileManager()
+        manager = AdvancedFileManager(current_app._get_current_object())
         manager.analyze_system()
         manager.fix_all_issues(auto_fix=True)
         
         return jsonify({
             'success': True,
-            'issues_found': len(manager.issues_found),
-            'actions_taken': len(manager.actions_taken),
+            'issues_found': manager.issue_count,
+            'actions_taken': sum(manager.action_counts.values()),
+            'action_counts': manager.action_counts,
             'actions': manager.actions_taken
         })
         
@@ -965,12 +1070,9 @@ def smart_reindex():
         directory_path = data.get('directory_path')
         project_id = data.get('project_id')
         
-        # Import the advanced file manager
-        import sys
-        sys.path.append(os.path.join(current_app.root_path, '..', '..'))
-        from advanced_file_manager import AdvancedFileManager
+        from app.scripts.advanced_file_manager import AdvancedFileManager
         
-        manager = AdvancedFileManager()
+        manager = AdvancedFileManager(current_app._get_current_object())
         result = manager.smart_reindex(directory_path, project_id)
         
         return jsonify({
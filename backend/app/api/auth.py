@@ -6,6 +6,7 @@ from flask import Blueprint, request, jsonify, current_app
 from flask_login import login_user, logout_user, login_required, current_user
 from app.models import User, db
 from app import login_manager
+from app.utils.user_cache import user_cache
 from datetime import datetime
 import os
 
@@ -44,6 +45,7 @@ def login():
     # Update last login
     user.last_login = datetime.utcnow()
     db.session.commit()
+    user_cache.invalidate(user.id)
     
     # Login user
     login_user(user, remember=True)
@@ -130,6 +132,7 @@ def change_password():
     # Update password
     current_user.set_password(new_password)
     db.session.commit()
+    user_cache.invalidate(current_user.id)
     
     current_app.logger.info(f'Password changed for user: {current_user.username}')
     
@@ -175,5 +178,10 @@ def create_default_admin():
 def initialize_auth():
     """Initialize authentication on first request only"""
     global _admin_checked
-    if not _admin_checked:
-        create_default_admin()
+    if _admin_checked:
+        return
+    # Migrations seed the admin; only the legacy create mode bootstraps it at runtime
+    if current_app.config.get('DB_STARTUP_MODE') != 'create':
+        _admin_checked = True
+        return
+    create_default_admin()
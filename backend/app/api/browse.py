@@ -8,6 +8,7 @@ import json
 from datetime import datetime
 import mimetypes
 import base64
+from app.utils.responses import TextStream, stream_json, stream_json_members
 
 browse_bp = Blueprint('browse', __name__)
 
@@ -125,59 +126,122 @@ def get_file_info(filepath):
             'created': None
         }
 
-def scan_directory(path, max_depth=15, current_depth=0):
-    """Recursively scan directory structure"""
+def iter_directory(path, max_depth=15, current_depth=0, lazy=False):
+    """
+    Lazily yield the items of a directory. Folder children are scanned eagerly
+    into lists, or left as generators when `lazy` is set so that stream_json
+    can encode the whole tree without ever holding it in memory.
+    """
     if current_depth >= max_depth:
-        return []
+        return
     
     try:
-        items = []
-        total_children = 0
-        
-        # Get all items in directory
-        for item in sorted(os.listdir(path)):
-            if item.startswith('.'):
-                continue
-                
-            item_path = os.path.join(path, item)
+        entries = sorted(os.listdir(path))
+    except Exception as e:
+        print(f"Error scanning directory {path}: {str(e)}")
+        return
+    
+    for item in entries:
+        if item.startswith('.'):
+            continue
             
-            if os.path.isdir(item_path):
-                # It's a directory - scan its children
-                children = scan_directory(item_path, max_depth, current_depth + 1)
-                # Count immediate children (files and folders)
-                try:
-                    immediate_children = len([x for x in os.listdir(item_path) if not x.startswith('.')])
-                except:
-                    immediate_children = 0
-                
-                items.append({
-                    'name': item,
-                    'type': 'folder',
-                    'path': item_path.replace('\\', '/'),
-                    'children': children,
-                    'icon': 'fas fa-folder',
-                    'expandable': immediate_children > 0,
-                    'item_count': immediate_children
-                })
-                total_children += immediate_children
-            else:
-                # It's a file
-                file_info = get_file_info(item_path)
-                items.append({
-                    'name': item,
-                    'type': 'file',
-                    'path': item_path.replace('\\', '/'),
-                    'icon': get_file_icon(item),
-                    'size': file_info['size'],
-                    'modified': file_info['modified'],
-                    'extension': os.path.splitext(item)[1].lower()
-                })
+        item_path = os.path.join(path, item)
         
-        return items
+        if os.path.isdir(item_path):
+            # It's a directory - scan its children
+            if lazy:
+                children = iter_directory(item_path, max_depth, current_depth + 1, lazy=True)
+            else:
+                children = scan_directory(item_path, max_depth, current_depth + 1)
+            # Count immediate children (files and folders)
+            try:
+                immediate_children = len([x for x in os.listdir(item_path) if not x.startswith('.')])
+            except:
+                immediate_children = 0
+            
+            yield {
+                'name': item,
+                'type': 'folder',
+                'path': item_path.replace('\\', '/'),
+                'children': children,
+                'icon': 'fas fa-folder',
+                'expandable': immediate_children > 0,
+                'item_count': immediate_children
+            }
+        else:
+            # It's a file
+            file_info = get_file_info(item_path)
+            yield {
+                'name': item,
+                'type': 'file',
+                'path': item_path.replace('\\', '/'),
+                'icon': get_file_icon(item),
+                'size': file_info['size'],
+                'modified': file_info['modified'],
+                'extension': os.path.splitext(item)[1].lower()
+            }
+
+def scan_directory(path, max_depth=15, current_depth=0):
+    """Recursively scan directory structure"""
+    try:
+        return list(iter_directory(path, max_depth, current_depth))
     except Exception as e:
         print(f"Error scanning directory {path}: {str(e)}")
         return []
 
+def stream_directory(envelope, key, path, max_depth=15):
+    """Stream a directory listing as JSON without materializing the tree"""
+    counter = {'total_items': 0}
+    
+    def items():
+        for item in iter_directory(path, max_depth, lazy=True):
+            counter['total_items'] += 1
+            yield item
+    
+    return stream_json(envelope, key, items(), trailer=lambda: counter)
+
+# Characters (or bytes) read per chunk when streaming file previews
+PREVIEW_CHUNK_SIZE = 64 * 1024
+
+def read_image_data(handle, mime_type):
+    """Yield an image as a base64 data URL, a chunk at a time"""
+    with handle:
+        yield f"data:{mime_type};base64,"
+        # A multiple of 3 bytes encodes without padding, so the chunks concatenate
+        for chunk in iter(lambda: handle.read(3 * PREVIEW_CHUNK_SIZE // 4), b''):
+            yield base64.b64encode(chunk).decode('utf-8')
+
+def open_text_file(file_path, size):
+    """
+    Open a text file for streaming: returns (handle, encoding, first chunk), or
+    None if no encoding yields any content. UTF-8 is tried first; a non-empty
+    file that decodes to nothing falls back to the other encodings.
+    """
+    for encoding in ['utf-8', 'latin-1', 'cp1252', 'iso-8859-1', 'utf-16']:
+        handle = open(file_path, 'r', encoding=encoding, errors='ignore')
+        try:
+            first = handle.read(PREVIEW_CHUNK_SIZE)
+        except Exception:
+            handle.close()
+            if encoding == 'utf-8':
+                raise
+            continue
+        if first or (encoding == 'utf-8' and size == 0):
+            return handle, encoding, first
+        handle.close()
+    return None
+
+def read_text_chunks(handle, first, counter):
+    """Yield a text file's content chunk by chunk, counting its lines into counter"""
+    with handle:
+        newlines = 0
+        chunk = first
+        while chunk:
+            newlines += chunk.count('\n')
+            yield chunk
+            chunk = handle.read(PREVIEW_CHUNK_SIZE)
+        counter['lines'] = newlines + 1 if first else 0
+
 @browse_bp.route('/structure', methods=['GET'])
 def get_folder_structure():
     """Get the complete folder structure"""
@@ -191,14 +255,10 @@ def get_folder_structure():
         }), 404
     
     try:
-        structure = scan_directory(repo_path, max_depth=15)
-        
-        return jsonify({
+        return stream_directory({
             'success': True,
-            'root_path': repo_path,
-            'structure': structure,
-            'total_items': len(structure) if structure else 0
-        })
+            'root_path': repo_path
+        }, 'structure', repo_path, max_depth=15)
     except Exception as e:
         return jsonify({
             'success': False,
@@ -230,14 +290,10 @@ def get_folder_contents():
         return jsonify({'error': 'Folder not found'}), 404
     
     try:
-        contents = scan_directory(folder_path, max_depth=15)
-        
-        return jsonify({
+        return stream_directory({
             'success': True,
-            'path': folder_path,
-            'contents': contents,
-            'total_items': len(contents) if contents else 0
-        })
+            'path': folder_path
+        }, 'contents', folder_path, max_depth=15)
     except Exception as e:
         return jsonify({'error': f'Failed to scan folder: {str(e)}'}), 500
 
@@ -290,17 +346,14 @@ def get_file_content():
         }
         
         if is_image_file(file_path):
-            # For images, encode as base64
+            # For images, encode as base64 while streaming
             try:
-                with open(file_path, 'rb') as f:
-                    image_data = f.read()
-                    base64_data = base64.b64encode(image_data).decode('utf-8')
-                    response_data.update({
-                        'type': 'image',
-                        'content': f"data:{mime_type};base64,{base64_data}"
-                    })
+                image = open(file_path, 'rb')
             except Exception as e:
                 return jsonify({'error': f'Failed to read image: {str(e)}'}), 500
+            response_data['type'] = 'image'
+            return stream_json_members(
+                list(response_data.items()) + [('content', TextStream(read_image_data(image, mime_type)))])
                 
         elif is_pdf_file(file_path):
             # For PDFs, provide inline URL for viewing
@@ -331,47 +384,23 @@ def get_file_content():
             })
             
         elif is_text_file(file_path):
-            # For text files, read content with better encoding handling
+            # For text files, stream content with better encoding handling
             try:
-                # Try UTF-8 first
-                with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-                    content = f.read()
-                
-                # Ensure we got the full content
-                if len(content) == 0 and file_info['size'] > 0:
-                    # File might not be empty, try with different encoding
-                    raise UnicodeDecodeError("utf-8", b"", 0, 1, "No content read")
-                
-                response_data.update({
-                    'type': 'text',
-                    'content': content,
-                    'lines': len(content.split('\n')) if content else 0,
-                    'encoding': 'utf-8'
-                })
-                
-            except UnicodeDecodeError:
-                # Try with different encodings
-                content = None
-                for encoding in ['latin-1', 'cp1252', 'iso-8859-1', 'utf-16']:
-                    try:
-                        with open(file_path, 'r', encoding=encoding, errors='ignore') as f:
-                            content = f.read()
-                        if content:  # Only accept if we got content
-                            response_data.update({
-                                'type': 'text',
-                                'content': content,
-                                'lines': len(content.split('\n')) if content else 0,
-                                'encoding': encoding
-                            })
-                            break
-                    except (UnicodeDecodeError, Exception):
-                        continue
-                
-                if content is None:
-                    return jsonify({'error': 'Unable to decode file - unsupported encoding'}), 415
-                    
+                text = open_text_file(file_path, file_info['size'])
             except Exception as e:
                 return jsonify({'error': f'Unable to read file: {str(e)}'}), 500
+            if text is None:
+                return jsonify({'error': 'Unable to decode file - unsupported encoding'}), 415
+            
+            handle, encoding, first = text
+            counter = {'lines': 0}
+            response_data.update({
+                'type': 'text',
+                'encoding': encoding
+            })
+            return stream_json_members(
+                list(response_data.items()) + [('content', TextStream(read_text_chunks(handle, first, counter)))],
+                trailer=lambda: counter)
         else:
             # For other files, provide basic info
             response_data.update({
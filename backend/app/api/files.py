@@ -33,6 +33,19 @@ def get_file_details(file_id):
         'tags': [tag.name for tag in file.tags]
     })
 
+@file_bp.route('/<int:file_id>/similar', methods=['GET'])
+def get_similar_files(file_id):
+    """Get files with identical or nearly identical content - public endpoint"""
+    from app.services import duplicates
+    max_distance = request.args.get('max_distance', duplicates.MAX_DISTANCE, type=int)
+    limit = min(max(request.args.get('limit', 20, type=int), 1), 100)
+    
+    try:
+        with db.engine.connect() as connection:
+            return jsonify(duplicates.similar_files(connection, file_id, max_distance, limit))
+    except LookupError:
+        return jsonify({'error': 'File not found'}), 404
+
 @file_bp.route('/<int:file_id>/content', methods=['GET'])
 def get_file_content(file_id):
     """Get file content for viewing"""
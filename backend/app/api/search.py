@@ -4,7 +4,7 @@ Search API Endpoints
 
 from flask import Blueprint, request, jsonify
 from flask_login import current_user
-from sqlalchemy import or_, and_, select
+from sqlalchemy import or_, and_, select, func
 from app.models import File, Tag, SearchLog, Project, db
 from app.utils.search import fuzzy_search, get_search_suggestions
 import os
@@ -19,6 +19,7 @@ def search():
     per_page = int(os.getenv('SEARCH_RESULTS_PER_PAGE', 20))
     project_filter = request.args.get('project')
     filetype_filter = request.args.get('filetype')
+    collapse = request.args.get('collapse', '').lower() in ('1', 'true', 'duplicates')
     
     if not query:
         return jsonify({'error': 'Search query is required'}), 400
@@ -47,6 +48,13 @@ def search():
         )
     )
     
+    # Fold each duplicate cluster (see app.services.duplicates) into its lowest matching id
+    if collapse:
+        representatives = search_query.with_entities(
+            func.min(File.id).label('id'), func.count().label('copies')
+        ).group_by(func.coalesce(File.duplicate_group, File.id)).subquery()
+        search_query = File.query.filter(File.id.in_(select(representatives.c.id)))
+    
     # Paginate results
     pagination = search_query.paginate(
         page=page, 
@@ -65,6 +73,13 @@ def search():
     db.session.add(log)
     db.session.commit()
     
+    copies = {}
+    if collapse and pagination.items:
+        copies = dict(db.session.execute(
+            select(representatives.c.id, representatives.c.copies)
+            .where(representatives.c.id.in_([file.id for file in pagination.items]))
+        ).all())
+    
     # Format results
     results = []
     for file in pagination.items:
@@ -80,6 +95,8 @@ def search():
             'project': file.project.name if file.project else None,
             'tags': [tag.name for tag in file.tags]
         })
+        if collapse:
+            results[-1]['duplicates'] = copies.get(file.id, 1) - 1
     
     return jsonify({
         'results': results,
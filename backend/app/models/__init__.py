@@ -42,6 +42,8 @@ class Project(db.Model):
     created_date = db.Column(db.DateTime, default=datetime.utcnow)
     updated_date = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     is_active = db.Column(db.Boolean, default=True)
+    # Maintained by app.services.file_counts
+    active_file_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     
     # Relationships
     files = db.relationship('File', backref='project', lazy='dynamic')
@@ -59,15 +61,23 @@ class File(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     filename = db.Column(db.String(255), nullable=False)
     filepath = db.Column(db.Text, unique=True, nullable=False)
-    filetype = db.Column(db.String(50))
-    project_id = db.Column(db.Integer, db.ForeignKey('projects.id'))
+    # active_history: the counter hooks need the previous value even when
+    # the attribute was expired (e.g. after a commit) before it was changed
+    filetype = db.column_property(db.Column(db.String(50)), active_history=True)
+    project_id = db.column_property(db.Column(db.Integer, db.ForeignKey('projects.id')), active_history=True)
     description = db.Column(db.Text)
-    size = db.Column(db.BigInteger)
+    size = db.column_property(db.Column(db.BigInteger), active_history=True)
     line_count = db.Column(db.Integer)
     modified_date = db.Column(db.DateTime)
-    indexed_date = db.Column(db.DateTime, default=datetime.utcnow)
+    indexed_date = db.column_property(db.Column(db.DateTime, default=datetime.utcnow), active_history=True)
     content_hash = db.Column(db.String(64))
-    is_active = db.Column(db.Boolean, default=True)
+    is_active = db.column_property(db.Column(db.Boolean, default=True), active_history=True)
+    # Near-duplicate detection (app.services.duplicates): signed 64-bit SimHash,
+    # and the lowest file id of the duplicate cluster this file belongs to
+    simhash = db.Column(db.BigInteger)
+    duplicate_group = db.Column(db.Integer)
+    # Generation of the last directory walk that saw this file (FileIndexer mark and sweep)
+    scan_generation = db.Column(db.BigInteger)
     
     # Relationships
     tags = db.relationship('Tag', secondary=file_tags, lazy='subquery',
@@ -81,14 +91,100 @@ class Tag(db.Model):
     name = db.Column(db.String(100), unique=True, nullable=False)
     description = db.Column(db.Text)
     created_date = db.Column(db.DateTime, default=datetime.utcnow)
+    # Maintained by app.services.file_counts
+    active_file_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
 
 class SearchLog(db.Model):
     """Search log model"""
     __tablename__ = 'search_logs'
     
+    # On PostgreSQL the migrations make this table range-partitioned by month with
+    # a (id, timestamp) primary key; id alone still identifies a row for the ORM
     id = db.Column(db.Integer, primary_key=True)
     search_term = db.Column(db.Text, nullable=False)
     results_count = db.Column(db.Integer)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'))
     user_ip = db.Column(db.String(45))
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+
+class IndexState(db.Model):
+    """Single-row counter bumped whenever indexed files, tags or projects change"""
+    __tablename__ = 'index_state'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    generation = db.Column(db.BigInteger, nullable=False, default=0)
+
+class StatsCounter(db.Model):
+    """Materialized dashboard counter (see app/services/stats.py for the key scheme)"""
+    __tablename__ = 'stats_counters'
+    
+    key = db.Column(db.String(120), primary_key=True)
+    value = db.Column(db.BigInteger, nullable=False, default=0)
+    updated_date = db.Column(db.DateTime, default=datetime.utcnow)
+
+class SearchRollupHourly(db.Model):
+    """Searches per term and hour, rolled up from search_logs"""
+    __tablename__ = 'search_rollups_hourly'
+    
+    bucket = db.Column(db.DateTime, primary_key=True)
+    search_term = db.Column(db.Text, primary_key=True)
+    searches = db.Column(db.Integer, nullable=False, default=0)
+    zero_results = db.Column(db.Integer, nullable=False, default=0)
+    results_total = db.Column(db.BigInteger, nullable=False, default=0)
+
+class SearchRollupDaily(db.Model):
+    """Searches per term and day, rolled up from search_logs"""
+    __tablename__ = 'search_rollups_daily'
+    
+    day = db.Column(db.Date, primary_key=True)
+    search_term = db.Column(db.Text, primary_key=True)
+    searches = db.Column(db.Integer, nullable=False, default=0)
+    zero_results = db.Column(db.Integer, nullable=False, default=0)
+    results_total = db.Column(db.BigInteger, nullable=False, default=0)
+
+class SearchHeavyHitter(db.Model):
+    """Persisted Space-Saving sketch of the most popular search terms"""
+    __tablename__ = 'search_heavy_hitters'
+    
+    search_term = db.Column(db.Text, primary_key=True)
+    count = db.Column(db.BigInteger, nullable=False)
+    error = db.Column(db.BigInteger, nullable=False, default=0)
+
+class RollupState(db.Model):
+    """Progress marker of an incremental rollup (last processed source id)"""
+    __tablename__ = 'rollup_state'
+    
+    name = db.Column(db.String(100), primary_key=True)
+    last_id = db.Column(db.BigInteger, nullable=False, default=0)
+    total = db.Column(db.BigInteger, nullable=False, default=0)
+    updated_date = db.Column(db.DateTime, default=datetime.utcnow)
+
+class Blob(db.Model):
+    """Content-addressed upload blob with the number of active files referencing it"""
+    __tablename__ = 'blobs'
+    
+    digest = db.Column(db.String(64), primary_key=True)
+    size = db.Column(db.BigInteger, nullable=False, default=0)
+    ref_count = db.Column(db.Integer, nullable=False, default=0)
+    created_date = db.Column(db.DateTime, default=datetime.utcnow)
+    last_referenced = db.Column(db.DateTime)
+
+class FileVerification(db.Model):
+    """Stat of a file when its content was last hashed, so unchanged files are not reread"""
+    __tablename__ = 'file_verifications'
+    
+    file_id = db.Column(db.Integer, db.ForeignKey('files.id', ondelete='CASCADE'), primary_key=True)
+    size = db.Column(db.BigInteger, nullable=False)
+    mtime_ns = db.Column(db.BigInteger, nullable=False)
+    content_hash = db.Column(db.String(64), nullable=False)
+    verified_date = db.Column(db.DateTime, default=datetime.utcnow)
+
+class DirectoryDigest(db.Model):
+    """Merkle digests of a directory's indexed files, recorded when its subtree verified clean"""
+    __tablename__ = 'directory_digests'
+    
+    path = db.Column(db.Text, primary_key=True)
+    stat_digest = db.Column(db.String(64), nullable=False)
+    content_digest = db.Column(db.String(64), nullable=False)
+    file_count = db.Column(db.Integer, nullable=False, default=0)
+    updated_date = db.Column(db.DateTime, default=datetime.utcnow)
@@ -6,8 +6,8 @@ Handles all file synchronization issues and edge cases
 
 import os
 import sys
-import hashlib
 import shutil
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
 
@@ -16,9 +16,36 @@ project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(_
 backend_path = os.path.join(project_root, 'backend')
 sys.path.insert(0, backend_path)
 
-from app import create_app
-from app.models import db, File, Project, Tag
+from sqlalchemy import select, update, delete, func, bindparam
+from app.models import db, File, Project, Tag, file_tags
 from app.services.file_indexer import FileIndexer
+from app.services import integrity
+from app.services.file_counts import refresh_file_counts
+from app.services.search_index import bump_generation
+from app.services.stats import apply_deltas, file_deltas, FILE_ATTRIBUTES
+from app.utils.startup import script_app
+from app.utils import hashing
+
+# Threads for the os.stat / hashing batches (I/O bound, so more than the CPU count)
+STAT_WORKERS = int(os.getenv('ANALYZE_STAT_WORKERS', 16))
+STAT_BATCH_SIZE = 512
+
+# Rows per fetch from the streamed files query
+FETCH_SIZE = 10000
+
+# Individual issues kept for the report; the counts always cover everything
+MAX_REPORTED_ISSUES = int(os.getenv('ANALYZE_MAX_REPORTED_ISSUES', 1000))
+
+SKIPPED_DIRECTORIES = {'node_modules', '__pycache__', '.git', 'dist', 'build', 'out'}
+
+def _chunks(values, size=900):
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+def _recency(row):
+    """Sort key of the records of a path: the greatest is the one kept"""
+    return (row.indexed_date is not None, row.indexed_date or datetime.min, row.id)
 
 class AdvancedFileManager:
     """
@@ -28,12 +55,37 @@ class AdvancedFileManager:
     - Ghost file resurrection
     - Smart re-indexing
     - File integrity verification
+
+    The analysis makes one walk of the repository and one streamed query of
+    the files table and diffs the two as hash sets; only rows whose path the
+    walk did not see are checked with os.stat (batched on a thread pool).
     """
     
-    def __init__(self):
-        self.app = create_app()
+    def __init__(self, app=None):
+        self.app = app or script_app()
         self.issues_found = []
+        self.issue_counts = {}
         self.actions_taken = []
+        self.action_counts = {}
+        self.orphaned_db_records = []
+        self.orphaned_files = []
+        self.ghost_files = []
+        self.duplicate_records = []
+        self.hash_mismatches = []
+    
+    @property
+    def issue_count(self):
+        return sum(self.issue_counts.values())
+    
+    def _issue(self, kind, message):
+        self.issue_counts[kind] = self.issue_counts.get(kind, 0) + 1
+        if len(self.issues_found) < MAX_REPORTED_ISSUES:
+            self.issues_found.append(message)
+    
+    def _action(self, kind, count, message):
+        if count:
+            self.action_counts[kind] = self.action_counts.get(kind, 0) + count
+            self.actions_taken.append(message)
         
     def analyze_system(self):
         """Comprehensive system analysis"""
@@ -41,22 +93,31 @@ class AdvancedFileManager:
         print("=" * 60)
         
         with self.app.app_context():
+            repo_path = os.getenv('CODE_REPOSITORY_PATH', os.path.join(project_root, 'sample-data'))
+            disk_paths = self._walk_repository(repo_path)
+            rows = self._load_file_rows()
+            
+            # Rows whose path the walk did not see may still exist elsewhere (uploads, skipped dirs)
+            unseen = [row.filepath for row in rows.values() if row.filepath not in disk_paths]
+            existing = disk_paths | self._existing_paths(unseen)
+            
             # 1. Check for orphaned database records
-            self._check_orphaned_db_records()
+            self._check_orphaned_db_records(rows, existing)
             
             # 2. Check for orphaned files on disk
-            self._check_orphaned_files()
+            self._check_orphaned_files(disk_paths, rows, repo_path)
             
             # 3. Check for ghost files (inactive but exist on disk)
-            self._check_ghost_files()
+            self._check_ghost_files(rows, existing)
             
             # 4. Check for duplicate records
             self._check_duplicate_records()
             
             # 5. Check for hash mismatches
-            self._check_hash_mismatches()
+            self._check_hash_mismatches(rows, existing)
             
         self._generate_report()
+        return self.issue_counts
         
     def fix_all_issues(self, auto_fix=False):
         """Fix all detected issues"""
@@ -67,8 +128,10 @@ class AdvancedFileManager:
             print("Issues found:")
             for i, issue in enumerate(self.issues_found, 1):
                 print(f"  {i}. {issue}")
+            if self.issue_count > len(self.issues_found):
+                print(f"  ... and {self.issue_count - len(self.issues_found)} more")
             
-            if not self.issues_found:
+            if not self.issue_count:
                 print("✅ No issues found!")
                 return
                 
@@ -79,24 +142,28 @@ class AdvancedFileManager:
         
         with self.app.app_context():
             try:
+                connection = db.session.connection()
+                
                 # Fix ghost files first
-                self._fix_ghost_files()
+                self._fix_ghost_files(connection)
                 
                 # Fix orphaned database records
-                self._fix_orphaned_db_records()
+                self._fix_orphaned_db_records(connection)
                 
                 # Fix duplicate records
-                self._fix_duplicate_records()
+                self._fix_duplicate_records(connection)
                 
                 # Fix hash mismatches
-                self._fix_hash_mismatches()
+                self._fix_hash_mismatches(connection)
                 
+                bump_generation(connection)
                 db.session.commit()
                 print("✅ All fixes applied successfully!")
                 
             except Exception as e:
                 db.session.rollback()
                 print(f"❌ Error during fixes: {e}")
+                raise
     
     def smart_reindex(self, directory_path=None, project_id=None):
         """Smart re-indexing that handles all edge cases"""
@@ -115,24 +182,79 @@ class AdvancedFileManager:
             print(f"   🔄 Files updated: {result['files_updated']}")
             print(f"   👻 Ghost files reactivated: {result['ghost_files_reactivated']}")
             print(f"   ⏭️  Files skipped: {result['files_skipped']}")
+            print(f"   🗑️  Files deactivated (deleted from disk): {result['files_deactivated']}")
             print(f"   ❌ Errors: {len(result['errors'])}")
             
             if result['errors']:
                 print("\n⚠️  Errors encountered:")
                 for error in result['errors'][:5]:  # Show first 5 errors
                     print(f"   • {error}")
+            
+            return result
+    
+    # Gathering state
+    
+    def _walk_repository(self, repo_path):
+        """Set of indexable file paths under the repository (same rules as the indexer)"""
+        paths = set()
+        if not os.path.exists(repo_path):
+            print(f"   ⚠️  Repository path not found: {repo_path}")
+            return paths
+        
+        indexer = FileIndexer()
+        for root, dirs, files in os.walk(repo_path):
+            dirs[:] = [d for d in dirs if not d.startswith('.') and d not in SKIPPED_DIRECTORIES]
+            for filename in files:
+                if filename.startswith('.'):
+                    continue
+                filepath = os.path.join(root, filename)
+                if indexer._should_index_file(filepath):
+                    paths.add(filepath)
+        return paths
+    
+    def _load_file_rows(self):
+        """
+        {filepath: row} from one streamed query over the files table. Of
+        duplicate records of a path, the one _check_duplicate_records keeps
+        is the one kept here.
+        """
+        files = File.__table__
+        rows = {}
+        result = db.session.execute(
+            select(files.c.id, files.c.filename, files.c.filepath, files.c.content_hash, files.c.indexed_date,
+                   *[files.c[name] for name in FILE_ATTRIBUTES])
+            .execution_options(yield_per=FETCH_SIZE)
+        )
+        for row in result:
+            current = rows.get(row.filepath)
+            if current is None or _recency(row) > _recency(current):
+                rows[row.filepath] = row
+        return rows
+    
+    def _run_batches(self, function, items):
+        """Apply function to batches of items on the thread pool, preserving order"""
+        batches = list(_chunks(items, STAT_BATCH_SIZE))
+        if not batches:
+            return []
+        if len(batches) == 1:
+            return function(batches[0])
+        with ThreadPoolExecutor(max_workers=min(STAT_WORKERS, len(batches))) as executor:
+            return [value for batch in executor.map(function, batches) for value in batch]
+    
+    def _existing_paths(self, paths):
+        """The subset of paths that exist, stat-ed in parallel batches"""
+        found = self._run_batches(lambda batch: [os.path.exists(path) for path in batch], paths)
+        return {path for path, exists in zip(paths, found) if exists}
+    
+    # Checks
     
-    def _check_orphaned_db_records(self):
+    def _check_orphaned_db_records(self, rows, existing):
         """Check for database records where files don't exist on disk"""
         print("🔍 Checking for orphaned database records...")
         
-        orphaned = []
-        files = File.query.filter_by(is_active=True).all()
-        
-        for file in files:
-            if not os.path.exists(file.filepath):
-                orphaned.append(file)
-                self.issues_found.append(f"Orphaned DB record: {file.filename} (ID: {file.id})")
+        orphaned = [row for row in rows.values() if row.is_active and row.filepath not in existing]
+        for row in orphaned:
+            self._issue('orphaned_db_records', f"Orphaned DB record: {row.filename} (ID: {row.id})")
         
         if orphaned:
             print(f"   ⚠️  Found {len(orphaned)} orphaned database records")
@@ -141,30 +263,16 @@ class AdvancedFileManager:
         
         self.orphaned_db_records = orphaned
     
-    def _check_orphaned_files(self):
+    def _check_orphaned_files(self, disk_paths, rows, repo_path):
         """Check for files on disk that aren't in database"""
         print("🔍 Checking for orphaned files on disk...")
         
-        repo_path = os.getenv('CODE_REPOSITORY_PATH', os.path.join(project_root, 'sample-data'))
         if not os.path.exists(repo_path):
-            print(f"   ⚠️  Repository path not found: {repo_path}")
             return
         
-        orphaned_files = []
-        for root, dirs, files in os.walk(repo_path):
-            # Skip hidden directories
-            dirs[:] = [d for d in dirs if not d.startswith('.')]
-            
-            for filename in files:
-                if filename.startswith('.'):
-                    continue
-                    
-                filepath = os.path.join(root, filename)
-                
-                # Check if file exists in database
-                if not File.query.filter_by(filepath=filepath).first():
-                    orphaned_files.append(filepath)
-                    self.issues_found.append(f"Orphaned file on disk: {filepath}")
+        orphaned_files = sorted(disk_paths - rows.keys())
+        for filepath in orphaned_files:
+            self._issue('orphaned_files', f"Orphaned file on disk: {filepath}")
         
         if orphaned_files:
             print(f"   ⚠️  Found {len(orphaned_files)} orphaned files on disk")
@@ -173,17 +281,13 @@ class AdvancedFileManager:
         
         self.orphaned_files = orphaned_files
     
-    def _check_ghost_files(self):
+    def _check_ghost_files(self, rows, existing):
         """Check for files that exist on disk but are marked inactive in DB"""
         print("🔍 Checking for ghost files (inactive but exist on disk)...")
         
-        ghost_files = []
-        inactive_files = File.query.filter_by(is_active=False).all()
-        
-        for file in inactive_files:
-            if os.path.exists(file.filepath):
-                ghost_files.append(file)
-                self.issues_found.append(f"Ghost file: {file.filename} (exists on disk but marked inactive)")
+        ghost_files = [row for row in rows.values() if not row.is_active and row.filepath in existing]
+        for row in ghost_files:
+            self._issue('ghost_files', f"Ghost file: {row.filename} (exists on disk but marked inactive)")
         
         if ghost_files:
             print(f"   👻 Found {len(ghost_files)} ghost files")
@@ -196,16 +300,23 @@ class AdvancedFileManager:
         """Check for duplicate database records"""
         print("🔍 Checking for duplicate database records...")
         
-        duplicates = []
-        filepaths = {}
-        files = File.query.all()
-        
-        for file in files:
-            if file.filepath in filepaths:
-                duplicates.append((filepaths[file.filepath], file))
-                self.issues_found.append(f"Duplicate record: {file.filepath}")
+        files = File.__table__
+        duplicated_paths = select(files.c.filepath).group_by(files.c.filepath).having(func.count() > 1)
+        records = db.session.execute(
+            select(files.c.id, files.c.filename, files.c.filepath, files.c.indexed_date,
+                   *[files.c[name] for name in FILE_ATTRIBUTES])
+            .where(files.c.filepath.in_(duplicated_paths))
+            .order_by(files.c.filepath, files.c.indexed_date.desc().nulls_last(), files.c.id.desc())
+        ).all()
+        
+        # Keep the most recently indexed record of each path
+        duplicates, kept = [], set()
+        for record in records:
+            if record.filepath in kept:
+                duplicates.append(record)
+                self._issue('duplicate_records', f"Duplicate record: {record.filepath}")
             else:
-                filepaths[file.filepath] = file
+                kept.add(record.filepath)
         
         if duplicates:
             print(f"   ⚠️  Found {len(duplicates)} duplicate records")
@@ -214,19 +325,23 @@ class AdvancedFileManager:
         
         self.duplicate_records = duplicates
     
-    def _check_hash_mismatches(self):
+    def _check_hash_mismatches(self, rows, existing):
         """Check for files where stored hash doesn't match actual file"""
         print("🔍 Checking for hash mismatches...")
         
-        mismatches = []
-        files = File.query.filter_by(is_active=True).all()
-        
-        for file in files:
-            if os.path.exists(file.filepath):
-                actual_hash = self._calculate_hash(file.filepath)
-                if actual_hash and file.content_hash and actual_hash != file.content_hash:
-                    mismatches.append(file)
-                    self.issues_found.append(f"Hash mismatch: {file.filename}")
+        candidates = [row for row in rows.values()
+                      if row.is_active and row.content_hash and row.filepath in existing]
+        # Only files whose size or mtime changed since they were last verified are reread
+        result = integrity.verify_files(db.session.connection(), candidates)
+        db.session.commit()
+        print(f"   ⏭️  {result['proven_by_stat']} unchanged since last verified, {result['hashed']} hashed")
+        
+        mismatches = result['mismatches']
+        for row, actual_hash in mismatches:
+            if hashing.is_current(row.content_hash):
+                self._issue('hash_mismatches', f"Hash mismatch: {row.filename}")
+            else:
+                self._issue('legacy_hashes', f"Legacy (pre-SHA-256) hash: {row.filename}")
         
         if mismatches:
             print(f"   ⚠️  Found {len(mismatches)} hash mismatches")
@@ -235,68 +350,105 @@ class AdvancedFileManager:
         
         self.hash_mismatches = mismatches
     
-    def _fix_ghost_files(self):
+    # Fixes (set-based, keeping the counters the ORM hooks would maintain)
+    
+    def _state(self, row, **changes):
+        return tuple(changes.get(name, getattr(row, name)) for name in FILE_ATTRIBUTES)
+    
+    def _tag_ids(self, connection, file_ids):
+        tag_ids = set()
+        for chunk in _chunks(file_ids):
+            tag_ids.update(connection.execute(
+                select(file_tags.c.tag_id).where(file_tags.c.file_id.in_(chunk)).distinct()
+            ).scalars())
+        return tag_ids
+    
+    def _delete_records(self, connection, records):
+        files = File.__table__
+        ids = sorted({record.id for record in records})
+        tag_ids = self._tag_ids(connection, ids)
+        for chunk in _chunks(ids):
+            connection.execute(delete(file_tags).where(file_tags.c.file_id.in_(chunk)))
+            connection.execute(delete(files).where(files.c.id.in_(chunk)))
+        apply_deltas(connection, file_deltas([(self._state(record), None) for record in records]))
+        refresh_file_counts(connection, project_ids={record.project_id for record in records} - {None},
+                            tag_ids=tag_ids)
+    
+    def _not_duplicates(self, records):
+        """
+        records less the duplicate records _fix_duplicate_records deletes, so
+        no record's counters are taken back twice or from a state it no
+        longer has
+        """
+        duplicate_ids = {record.id for record in self.duplicate_records}
+        return [record for record in records if record.id not in duplicate_ids]
+    
+    def _fix_ghost_files(self, connection):
         """Reactivate ghost files"""
-        if hasattr(self, 'ghost_files') and self.ghost_files:
-            print(f"👻 Reactivating {len(self.ghost_files)} ghost files...")
-            for file in self.ghost_files:
-                file.is_active = True
-                file.indexed_date = datetime.utcnow()
-                self.actions_taken.append(f"Reactivated ghost file: {file.filename}")
-    
-    def _fix_orphaned_db_records(self):
+        ghost_files = self._not_duplicates(self.ghost_files)
+        if not ghost_files:
+            return
+        print(f"👻 Reactivating {len(ghost_files)} ghost files...")
+        files = File.__table__
+        now = datetime.utcnow()
+        ids = sorted(row.id for row in ghost_files)
+        for chunk in _chunks(ids):
+            connection.execute(update(files).where(files.c.id.in_(chunk)).values(is_active=True, indexed_date=now))
+        apply_deltas(connection, file_deltas([
+            (self._state(row), self._state(row, is_active=True, indexed_date=now)) for row in ghost_files
+        ]))
+        refresh_file_counts(connection, project_ids={row.project_id for row in ghost_files} - {None},
+                            tag_ids=self._tag_ids(connection, ids))
+        self._action('ghost_files', len(ids), f"Reactivated {len(ids)} ghost files")
+    
+    def _fix_orphaned_db_records(self, connection):
         """Remove orphaned database records"""
-        if hasattr(self, 'orphaned_db_records') and self.orphaned_db_records:
-            print(f"🗑️  Removing {len(self.orphaned_db_records)} orphaned database records...")
-            for file in self.orphaned_db_records:
-                db.session.delete(file)
-                self.actions_taken.append(f"Removed orphaned DB record: {file.filename}")
+        orphaned = self._not_duplicates(self.orphaned_db_records)
+        if not orphaned:
+            return
+        print(f"🗑️  Removing {len(orphaned)} orphaned database records...")
+        self._delete_records(connection, orphaned)
+        self._action('orphaned_db_records', len(orphaned), f"Removed {len(orphaned)} orphaned DB records")
     
-    def _fix_duplicate_records(self):
+    def _fix_duplicate_records(self, connection):
         """Fix duplicate records by keeping the most recent one"""
-        if hasattr(self, 'duplicate_records') and self.duplicate_records:
-            print(f"🔄 Fixing {len(self.duplicate_records)} duplicate records...")
-            for original, duplicate in self.duplicate_records:
-                # Keep the more recent one
-                if duplicate.indexed_date > original.indexed_date:
-                    db.session.delete(original)
-                    self.actions_taken.append(f"Removed older duplicate: {original.filename}")
-                else:
-                    db.session.delete(duplicate)
-                    self.actions_taken.append(f"Removed newer duplicate: {duplicate.filename}")
+        if not self.duplicate_records:
+            return
+        print(f"🔄 Fixing {len(self.duplicate_records)} duplicate records...")
+        self._delete_records(connection, self.duplicate_records)
+        self._action('duplicate_records', len(self.duplicate_records),
+                     f"Removed {len(self.duplicate_records)} older duplicate records")
     
-    def _fix_hash_mismatches(self):
+    def _fix_hash_mismatches(self, connection):
         """Fix hash mismatches by updating stored hashes"""
-        if hasattr(self, 'hash_mismatches') and self.hash_mismatches:
-            print(f"🔧 Fixing {len(self.hash_mismatches)} hash mismatches...")
-            for file in self.hash_mismatches:
-                new_hash = self._calculate_hash(file.filepath)
-                if new_hash:
-                    file.content_hash = new_hash
-                    self.actions_taken.append(f"Updated hash for: {file.filename}")
-    
-    def _calculate_hash(self, filepath):
-        """Calculate MD5 hash of a file"""
-        try:
-            hash_md5 = hashlib.md5()
-            with open(filepath, "rb") as f:
-                for chunk in iter(lambda: f.read(4096), b""):
-                    hash_md5.update(chunk)
-            return hash_md5.hexdigest()
-        except Exception:
-            return None
+        if not self.hash_mismatches:
+            return
+        print(f"🔧 Fixing {len(self.hash_mismatches)} hash mismatches...")
+        files = File.__table__
+        # The content changed, so the near-duplicate signature is recomputed too
+        connection.execute(
+            update(files).where(files.c.id == bindparam('target_id'))
+            .values(content_hash=bindparam('new_hash'), simhash=None),
+            [{'target_id': row.id, 'new_hash': new_hash} for row, new_hash in self.hash_mismatches]
+        )
+        self._action('hash_mismatches', len(self.hash_mismatches),
+                     f"Updated {len(self.hash_mismatches)} stored hashes")
     
     def _generate_report(self):
         """Generate analysis report"""
         print("\n📊 Analysis Report")
         print("=" * 60)
         
-        if not self.issues_found:
+        if not self.issue_count:
             print("✅ System is healthy! No issues found.")
         else:
-            print(f"⚠️  Found {len(self.issues_found)} issues:")
-            for i, issue in enumerate(self.issues_found, 1):
+            print(f"⚠️  Found {self.issue_count} issues:")
+            for kind, count in self.issue_counts.items():
+                print(f"   • {kind.replace('_', ' ')}: {count}")
+            for i, issue in enumerate(self.issues_found[:50], 1):
                 print(f"  {i}. {issue}")
+            if self.issue_count > 50:
+                print(f"  ... and {self.issue_count - 50} more")
 
 
 class AdvancedFileIndexer(FileIndexer):
@@ -314,12 +466,16 @@ class AdvancedFileIndexer(FileIndexer):
         self.ghost_files_reactivated = 0
         self.errors = []
         
+        self.deactivated_count = 0
+        
         if not os.path.exists(directory_path):
             self.errors.append(f"Directory not found: {directory_path}")
             return self._get_results()
         
         try:
-            for root, dirs, files in os.walk(directory_path):
+            self._begin_scan()
+            walk_errors = []
+            for root, dirs, files in os.walk(directory_path, onerror=walk_errors.append):
                 # Skip hidden directories
                 dirs[:] = [d for d in dirs if not d.startswith('.')]
                 dirs[:] = [d for d in dirs if d not in ['node_modules', '__pycache__', '.git', 'dist', 'build', 'out']]
@@ -333,11 +489,15 @@ class AdvancedFileIndexer(FileIndexer):
                         self.smart_index_file(filepath, directory_path, project_id)
                     except Exception as e:
                         self.errors.append(f"Error indexing {filepath}: {str(e)}")
+                    # After indexing, so a stamp flushed here includes the file's own row
+                    self._mark_seen(filepath)
                 
                 # Commit batch
                 if (self.indexed_count + self.updated_count + self.ghost_files_reactivated) % 100 == 0:
                     db.session.commit()
             
+            self._finish_scan(directory_path, walk_errors)
+            
             # Final commit
             db.session.commit()
             
@@ -449,6 +609,7 @@ class AdvancedFileIndexer(FileIndexer):
             'files_updated': self.updated_count,
             'ghost_files_reactivated': self.ghost_files_reactivated,
             'files_skipped': self.skipped_count,
+            'files_deactivated': self.deactivated_count,
             'errors': self.errors
         }
 
@@ -469,7 +630,7 @@ def main():
     manager.analyze_system()
     
     # Fix issues if found
-    if manager.issues_found:
+    if manager.issue_count:
         manager.fix_all_issues()
     
     # Perform smart re-indexing
@@ -2,13 +2,11 @@
 """
 Codex Backup & Restore Utility
 Provides comprehensive backup and restore functionality
+(command-line front end of app.services.backup)
 """
 
 import os
 import sys
-import json
-import zipfile
-import shutil
 import argparse
 from datetime import datetime
 
@@ -18,374 +16,257 @@ backend_path = os.path.join(project_root, 'backend')
 sys.path.insert(0, backend_path)
 
 def setup_app():
-    """Setup Flask app context"""
-    from app import create_app, db
-    app = create_app()
-    return app, db
+    """Setup Flask app context (built once per process)"""
+    from app import db
+    from app.utils.startup import script_app
+    return script_app(), db
+
+def print_progress(progress, message):
+    """Progress listener printing each step's messages"""
+    if message is not None:
+        print(f"   • {message}")
+
+def confirm(question):
+    return input(question).lower() in ['yes', 'y']
 
 def create_backup(backup_name=None):
     """Create a complete backup of the system"""
-    if not backup_name:
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        backup_name = f"codex_backup_{timestamp}"
-    
-    backup_dir = os.path.join(project_root, 'backups')
-    os.makedirs(backup_dir, exist_ok=True)
-    
-    backup_path = os.path.join(backup_dir, f"{backup_name}.zip")
-    
-    print(f"🔄 Creating backup: {backup_name}")
+    from app.services import backup
+
+    print(f"🔄 Creating backup: {backup_name or '(timestamped)'}")
     print("=" * 50)
-    
-    try:
-        with zipfile.ZipFile(backup_path, 'w', zipfile.ZIP_DEFLATED) as backup_zip:
-            
-            # 1. Export database data
-            print("📊 Exporting database data...")
-            db_data = export_database_data()
-            backup_zip.writestr('database/data.json', json.dumps(db_data, indent=2, default=str))
-            
-            # 2. Backup database schema
-            print("🗄️  Backing up database schema...")
-            schema_path = os.path.join(project_root, 'database', 'schema.sql')
-            if os.path.exists(schema_path):
-                backup_zip.write(schema_path, 'database/schema.sql')
-            
-            # 3. Backup file storage
-            print("📁 Backing up file storage...")
-            file_storage_path = os.path.join(project_root, 'file_storage')
-            if os.path.exists(file_storage_path):
-                for root, dirs, files in os.walk(file_storage_path):
-                    for file in files:
-                        file_path = os.path.join(root, file)
-                        arc_path = os.path.relpath(file_path, project_root)
-                        backup_zip.write(file_path, arc_path)
-            
-            # 4. Backup configuration
-            print("⚙️  Backing up configuration...")
-            config_files = ['.env', 'requirements.txt']
-            for config_file in config_files:
-                config_path = os.path.join(project_root, config_file)
-                if os.path.exists(config_path):
-                    backup_zip.write(config_path, f'config/{config_file}')
-            
-            # 5. Create backup manifest
-            print("📋 Creating backup manifest...")
-            manifest = {
-                'backup_name': backup_name,
-                'created_at': datetime.now().isoformat(),
-                'version': '1.0.0',
-                'contents': {
-                    'database_data': True,
-                    'database_schema': os.path.exists(schema_path),
-                    'file_storage': os.path.exists(file_storage_path),
-                    'configuration': True
-                },
-                'statistics': db_data.get('statistics', {})
-            }
-            backup_zip.writestr('manifest.json', json.dumps(manifest, indent=2))
-        
-        backup_size = os.path.getsize(backup_path) / (1024 * 1024)  # MB
-        print(f"✅ Backup created successfully!")
-        print(f"📄 File: {backup_path}")
-        print(f"📏 Size: {backup_size:.2f} MB")
-        return backup_path
-        
-    except Exception as e:
-        print(f"❌ Backup failed: {e}")
-        if os.path.exists(backup_path):
-            os.remove(backup_path)
-        return None
 
-def export_database_data():
-    """Export all database data to JSON format"""
     app, db = setup_app()
     with app.app_context():
-        from app.models import User, Project, File, Tag
-        
-        data = {
-            'users': [],
-            'projects': [],
-            'files': [],
-            'tags': [],
-            'file_tags': [],
-            'statistics': {}
-        }
-        
-        # Export users (excluding passwords for security)
-        for user in User.query.all():
-            data['users'].append({
-                'id': user.id,
-                'username': user.username,
-                'full_name': user.full_name,
-                'email': user.email,
-                'role': user.role,
-                'is_active': user.is_active,
-                'created_at': user.created_at,
-                'last_login': user.last_login
-            })
-        
-        # Export projects
-        for project in Project.query.all():
-            data['projects'].append({
-                'id': project.id,
-                'name': project.name,
-                'description': project.description,
-                'created_at': project.created_at
-            })
-        
-        # Export tags
-        for tag in Tag.query.all():
-            data['tags'].append({
-                'id': tag.id,
-                'name': tag.name,
-                'description': tag.description,
-                'created_at': tag.created_at
-            })
-        
-        # Export files
-        for file in File.query.all():
-            file_data = {
-                'id': file.id,
-                'filename': file.filename,
-                'filepath': file.filepath,
-                'filetype': file.filetype,
-                'size': file.size,
-                'description': file.description,
-                'content': file.content,
-                'line_count': file.line_count,
-                'project_id': file.project_id,
-                'created_at': file.created_at,
-                'updated_at': file.updated_at,
-                'tags': [tag.id for tag in file.tags]
-            }
-            data['files'].append(file_data)
-            
-            # Collect file-tag relationships
-            for tag in file.tags:
-                data['file_tags'].append({
-                    'file_id': file.id,
-                    'tag_id': tag.id
-                })
-        
-        # Add statistics
-        data['statistics'] = {
-            'users_count': len(data['users']),
-            'projects_count': len(data['projects']),
-            'files_count': len(data['files']),
-            'tags_count': len(data['tags']),
-            'export_time': datetime.now().isoformat()
-        }
-        
-        return data
-
-def restore_backup(backup_path, force=False):
+        progress = backup.Progress(print_progress)
+        try:
+            result = backup.create_backup(db.engine, backup_name, progress)
+        except Exception as e:
+            print(f"❌ Backup failed: {e}")
+            return None
+
+    stats = progress.snapshot()
+    print(f"✅ Backup created successfully!")
+    print(f"📄 File: {result['backup_path']}")
+    print(f"📏 Size: {result['size_mb']:.2f} MB")
+    print(f"⏱️  {stats['seconds']}s ({stats['mb_per_second']} MB/s)")
+    return result['backup_path']
+
+def restore_backup(backup_path, force=False, restore_config=False):
     """Restore system from backup"""
+    from app.services import backup, backup_index
+
     if not os.path.exists(backup_path):
         print(f"❌ Backup file not found: {backup_path}")
         return False
-    
+
     print(f"🔄 Restoring from backup: {backup_path}")
     print("=" * 50)
-    
+
     try:
-        with zipfile.ZipFile(backup_path, 'r') as backup_zip:
-            
-            # 1. Read manifest
-            manifest_data = backup_zip.read('manifest.json')
-            manifest = json.loads(manifest_data)
-            
-            print(f"📋 Backup Info:")
-            print(f"   Name: {manifest['backup_name']}")
-            print(f"   Created: {manifest['created_at']}")
-            print(f"   Statistics: {manifest['statistics']}")
-            
-            if not force:
-                response = input("\n⚠️  This will replace all current data. Continue? (yes/no): ")
-                if response.lower() not in ['yes', 'y']:
-                    print("❌ Restore cancelled")
-                    return False
-            
-            # 2. Clean current data
-            print("🗑️  Cleaning current data...")
-            clean_for_restore()
-            
-            # 3. Restore database data
-            print("📊 Restoring database data...")
-            db_data_json = backup_zip.read('database/data.json')
-            db_data = json.loads(db_data_json)
-            restore_database_data(db_data)
-            
-            # 4. Restore file storage
-            print("📁 Restoring file storage...")
-            file_storage_path = os.path.join(project_root, 'file_storage')
-            os.makedirs(file_storage_path, exist_ok=True)
-            
-            for file_info in backup_zip.infolist():
-                if file_info.filename.startswith('file_storage/'):
-                    backup_zip.extract(file_info, project_root)
-            
-            # 5. Restore configuration (optional)
-            config_response = input("Restore configuration files (.env, etc.)? (y/n): ")
-            if config_response.lower() in ['y', 'yes']:
-                print("⚙️  Restoring configuration...")
-                for file_info in backup_zip.infolist():
-                    if file_info.filename.startswith('config/'):
-                        # Extract to root directory
-                        config_name = os.path.basename(file_info.filename)
-                        config_content = backup_zip.read(file_info)
-                        with open(os.path.join(project_root, config_name), 'wb') as f:
-                            f.write(config_content)
-        
-        print("✅ Restore completed successfully!")
-        print("ℹ️  Please restart the application")
-        return True
-        
+        manifest = backup_index.read_manifest(backup_path)
     except Exception as e:
-        print(f"❌ Restore failed: {e}")
+        print(f"❌ Could not read backup manifest: {e}")
         return False
 
-def restore_database_data(data):
-    """Restore database data from JSON"""
-    app, db = setup_app()
-    with app.app_context():
-        from app.models import User, Project, File, Tag
-        
-        # Clear existing data
-        db.engine.execute("DELETE FROM file_tags")
-        File.query.delete()
-        Tag.query.delete()
-        Project.query.delete()
-        User.query.delete()
-        db.session.commit()
-        
-        # Restore users
-        for user_data in data['users']:
-            user = User(
-                username=user_data['username'],
-                full_name=user_data['full_name'],
-                email=user_data['email'],
-                role=user_data['role'],
-                is_active=user_data['is_active']
-            )
-            # Set a default password - should be changed after restore
-            user.set_password('admin123')
-            db.session.add(user)
-        
-        # Restore projects
-        for project_data in data['projects']:
-            project = Project(
-                name=project_data['name'],
-                description=project_data['description']
-            )
-            db.session.add(project)
-        
-        # Restore tags
-        for tag_data in data['tags']:
-            tag = Tag(
-                name=tag_data['name'],
-                description=tag_data['description']
-            )
-            db.session.add(tag)
-        
-        db.session.commit()
-        
-        # Restore files (after projects and tags are committed)
-        for file_data in data['files']:
-            file = File(
-                filename=file_data['filename'],
-                filepath=file_data['filepath'],
-                filetype=file_data['filetype'],
-                size=file_data['size'],
-                description=file_data['description'],
-                content=file_data['content'],
-                line_count=file_data['line_count'],
-                project_id=file_data['project_id']
-            )
-            db.session.add(file)
-            
-        db.session.commit()
-        
-        # Restore file-tag relationships
-        for file_tag in data['file_tags']:
-            file = File.query.get(file_tag['file_id'])
-            tag = Tag.query.get(file_tag['tag_id'])
-            if file and tag:
-                file.tags.append(tag)
-        
-        db.session.commit()
-
-def clean_for_restore():
-    """Clean system for restore"""
+    print(f"📋 Backup Info:")
+    print(f"   Name: {manifest['backup_name']}")
+    print(f"   Created: {manifest['created_at']}")
+    print(f"   Statistics: {manifest['statistics']}")
+
+    if not force:
+        if not confirm("\n⚠️  This will replace all current data. Continue? (yes/no): "):
+            print("❌ Restore cancelled")
+            return False
+        restore_config = restore_config or confirm("Restore configuration files (.env, etc.)? (y/n): ")
+
     app, db = setup_app()
     with app.app_context():
-        from app.models import User, Project, File, Tag
-        
-        # Clean database
-        db.engine.execute("DELETE FROM file_tags")
-        File.query.delete()
-        Tag.query.delete()
-        Project.query.delete()
-        User.query.delete()
-        db.session.commit()
-        
-        # Clean file storage
-        file_storage_path = os.path.join(project_root, 'file_storage')
-        if os.path.exists(file_storage_path):
-            shutil.rmtree(file_storage_path)
-        os.makedirs(file_storage_path, exist_ok=True)
+        progress = backup.Progress(print_progress)
+        try:
+            result = backup.restore_backup(db.engine, backup_path, restore_config, progress)
+        except Exception as e:
+            print(f"❌ Restore failed: {e}")
+            return False
+
+    print("✅ Restore completed successfully!")
+    if result['restart_required']:
+        print("ℹ️  Configuration was restored: please restart the application")
+    return True
 
 def list_backups():
     """List available backups"""
-    backup_dir = os.path.join(project_root, 'backups')
-    if not os.path.exists(backup_dir):
+    from app.services import backup_index
+    from app.services.backup import BACKUP_DIR
+
+    if not os.path.exists(BACKUP_DIR):
         print("📁 No backups directory found")
         return
-    
-    backups = [f for f in os.listdir(backup_dir) if f.endswith('.zip')]
+
+    backups = backup_index.list_backups(BACKUP_DIR)
     if not backups:
         print("📁 No backups found")
         return
-    
+
     print("📁 Available Backups:")
     print("-" * 50)
-    
-    for backup_file in sorted(backups, reverse=True):
-        backup_path = os.path.join(backup_dir, backup_file)
-        size = os.path.getsize(backup_path) / (1024 * 1024)  # MB
-        modified = datetime.fromtimestamp(os.path.getmtime(backup_path))
-        
-        # Try to read manifest
+
+    for backup in backups:
+        stats = backup['statistics']
+        modified = datetime.fromisoformat(backup['created_at'])
+        if 'error' in stats:
+            print(f"📄 {backup['filename']} (corrupted or old format)")
+        else:
+            print(f"📄 {backup['filename']}")
+        print(f"   Size: {backup['size_mb']:.2f} MB")
+        print(f"   Date: {modified.strftime('%Y-%m-%d %H:%M:%S')}")
+        if 'error' not in stats:
+            print(f"   Files: {stats.get('files_count', 'N/A')}")
+            print(f"   Projects: {stats.get('projects_count', 'N/A')}")
+        print("")
+
+def verify_backup(backup_path):
+    """Check every member of a backup archive (CRCs, and SHA-256 of the database members)"""
+    from app.services import backup
+
+    if not os.path.exists(backup_path):
+        print(f"❌ Backup file not found: {backup_path}")
+        return False
+
+    print(f"🔍 Verifying backup: {backup_path}")
+    try:
+        failed = backup.verify_backup(backup_path)
+    except Exception as e:
+        print(f"❌ Could not read backup: {e}")
+        return False
+
+    if failed:
+        print(f"❌ {len(failed)} members missing or corrupt")
+        for name in failed[:20]:
+            print(f"   • {name}")
+        return False
+    print("✅ Backup verified")
+    return True
+
+def create_snapshot(snapshot_name=None):
+    """Take an incremental snapshot: only chunks no earlier snapshot holds are written"""
+    from app.services import backup
+
+    print("🔄 Creating snapshot...")
+    app, db = setup_app()
+    with app.app_context():
+        try:
+            manifest = backup.create_snapshot(db.engine, snapshot_name)
+        except Exception as e:
+            print(f"❌ Snapshot failed: {e}")
+            return None
+
+    stats = manifest['statistics']
+    for entry in manifest['database']['tables']:
+        print(f"   • {entry['table']}: {entry['rows']} rows in {len(entry['chunks'])} chunks")
+    print(f"✅ Snapshot {manifest['name']} created"
+          + (f" (parent {manifest['parent']})" if manifest['parent'] else ""))
+    print(f"📦 {stats['new_chunks']} new chunks ({stats['new_bytes'] / (1024 * 1024):.2f} MB written), "
+          f"{stats['reused_chunks']} reused, {stats['logical_bytes'] / (1024 * 1024):.2f} MB covered "
+          f"in {stats['seconds']}s")
+    return manifest['name']
+
+def list_snapshots():
+    """List the snapshots in the store, newest first"""
+    from app.services.backup import snapshot_store
+
+    store = snapshot_store()
+    names = store.names()
+    if not names:
+        print("📁 No snapshots found")
+        return
+
+    print("📁 Available Snapshots:")
+    print("-" * 50)
+    for name in reversed(names):
+        manifest = store.load_manifest(name)
+        stats = manifest.get('statistics', {})
+        print(f"📸 {name}")
+        print(f"   Date: {manifest['created_at']}")
+        print(f"   Files: {stats.get('files_count', 'N/A')}  Stored files: {stats.get('stored_files', 'N/A')}")
+        print(f"   Written: {stats.get('new_bytes', 0) / (1024 * 1024):.2f} MB of "
+              f"{stats.get('logical_bytes', 0) / (1024 * 1024):.2f} MB")
+        print("")
+
+def restore_snapshot(snapshot_name, force=False, restore_config=False):
+    """Restore the database, file storage and (optionally) configuration from a snapshot"""
+    from app.services import backup
+
+    if not os.path.exists(backup.snapshot_store().manifest_path(snapshot_name)):
+        print(f"❌ Snapshot not found: {snapshot_name}")
+        return False
+
+    print(f"🔄 Restoring snapshot: {snapshot_name}")
+    print("=" * 50)
+
+    if not force:
+        if not confirm("\n⚠️  This will replace all current data. Continue? (yes/no): "):
+            print("❌ Restore cancelled")
+            return False
+        restore_config = restore_config or confirm("Restore configuration files (.env, etc.)? (y/n): ")
+
+    app, db = setup_app()
+    with app.app_context():
         try:
-            with zipfile.ZipFile(backup_path, 'r') as backup_zip:
-                manifest_data = backup_zip.read('manifest.json')
-                manifest = json.loads(manifest_data)
-                stats = manifest.get('statistics', {})
-                print(f"📄 {backup_file}")
-                print(f"   Size: {size:.2f} MB")
-                print(f"   Date: {modified.strftime('%Y-%m-%d %H:%M:%S')}")
-                print(f"   Files: {stats.get('files_count', 'N/A')}")
-                print(f"   Projects: {stats.get('projects_count', 'N/A')}")
-                print("")
-        except:
-            print(f"📄 {backup_file} (corrupted or old format)")
-            print(f"   Size: {size:.2f} MB")
-            print(f"   Date: {modified.strftime('%Y-%m-%d %H:%M:%S')}")
-            print("")
+            result = backup.restore_snapshot(db.engine, snapshot_name, restore_config,
+                                             backup.Progress(print_progress))
+        except Exception as e:
+            print(f"❌ Restore failed: {e}")
+            return False
+
+    print("✅ Restore completed successfully!")
+    if result['restart_required']:
+        print("ℹ️  Configuration was restored: please restart the application")
+    return True
+
+def prune_snapshots(keep):
+    """Drop old snapshots and the chunks only they referenced"""
+    from app.services import snapshot_store
+    from app.services.backup import snapshot_store as open_store
+
+    result = snapshot_store.prune(open_store(), keep)
+    for name in result['snapshots_removed']:
+        print(f"🗑️  Removed snapshot {name}")
+    print(f"✅ {result['objects_deleted']} unreferenced chunks deleted "
+          f"({result['bytes_freed'] / (1024 * 1024):.2f} MB freed)")
+
+def verify_snapshot(snapshot_name):
+    """Re-hash every chunk a snapshot refers to"""
+    from app.services import snapshot_store
+    from app.services.backup import snapshot_store as open_store
+
+    store = open_store()
+    bad = snapshot_store.verify(store, store.load_manifest(snapshot_name))
+    if bad:
+        print(f"❌ {len(bad)} chunks missing or corrupt")
+        for digest in bad[:20]:
+            print(f"   • {digest}")
+        return False
+    print(f"✅ Snapshot {snapshot_name} verified")
+    return True
 
 def main():
     parser = argparse.ArgumentParser(description='Codex Backup & Restore Utility')
-    parser.add_argument('action', choices=['backup', 'restore', 'list'], 
+    parser.add_argument('action', choices=['backup', 'restore', 'list', 'verify', 'snapshot', 'snapshots',
+                                           'restore-snapshot', 'verify-snapshot', 'prune-snapshots'],
                        help='Action to perform')
-    parser.add_argument('--name', help='Backup name (for backup)')
-    parser.add_argument('--file', help='Backup file path (for restore)')
+    parser.add_argument('--name', help='Backup or snapshot name')
+    parser.add_argument('--keep', type=int, help='Snapshots to keep (for prune-snapshots)')
+    parser.add_argument('--file', help='Backup file path (for restore and verify)')
     parser.add_argument('--force', action='store_true', help='Skip confirmations')
-    
+    parser.add_argument('--restore-config', action='store_true',
+                        help='Also restore .env and requirements.txt (for restore and restore-snapshot)')
+
     args = parser.parse_args()
-    
+
     print("💾 Codex Backup & Restore Utility")
     print("=" * 50)
-    
+
     if args.action == 'backup':
         create_backup(args.name)
     elif args.action == 'restore':
@@ -393,9 +274,31 @@ def main():
             print("❌ Please specify backup file with --file")
             list_backups()
             return
-        restore_backup(args.file, args.force)
+        restore_backup(args.file, args.force, args.restore_config)
     elif args.action == 'list':
         list_backups()
+    elif args.action == 'verify':
+        if not args.file:
+            print("❌ Please specify backup file with --file")
+            list_backups()
+            return
+        verify_backup(args.file)
+    elif args.action == 'snapshot':
+        create_snapshot(args.name)
+    elif args.action == 'snapshots':
+        list_snapshots()
+    elif args.action in ('restore-snapshot', 'verify-snapshot'):
+        if not args.name:
+            print("❌ Please specify the snapshot with --name")
+            list_snapshots()
+            return
+        if args.action == 'restore-snapshot':
+            restore_snapshot(args.name, args.force, args.restore_config)
+        else:
+            verify_snapshot(args.name)
+    elif args.action == 'prune-snapshots':
+        from app.services.snapshot_store import KEEP
+        prune_snapshots(args.keep if args.keep is not None else KEEP)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Codex Worker Mode Benchmark
+Starts Gunicorn in each worker mode (sync / gevent) and load-tests the
+I/O-bound browse and preview endpoints with many concurrent clients
+"""
+
+import os
+import sys
+import time
+import signal
+import socket
+import argparse
+import tempfile
+import subprocess
+import statistics
+import urllib.request
+import urllib.error
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+
+# Setup paths
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+backend_path = os.path.join(project_root, 'backend')
+sys.path.insert(0, backend_path)
+
+DEFAULT_ENDPOINTS = [
+    '/api/browse/structure',
+    '/api/browse/folder?path=device_support',
+]
+
+def find_free_port():
+    """Ask the OS for an unused TCP port"""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def find_preview_endpoint():
+    """Pick a text file from the repository for the preview endpoint"""
+    repo_path = os.getenv('CODE_REPOSITORY_PATH', os.path.join(project_root, 'sample-data'))
+    for root, dirs, files in os.walk(repo_path):
+        dirs[:] = [d for d in dirs if not d.startswith('.')]
+        for filename in files:
+            if filename.endswith(('.c', '.h', '.py', '.txt')):
+                return f"/api/browse/file?path={quote(os.path.join(root, filename), safe='')}"
+    return None
+
+def wait_for_server(base_url, timeout=60):
+    """Wait until the server accepts HTTP requests"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            urllib.request.urlopen(f"{base_url}/api/auth/status", timeout=2).read()
+            return True
+        except Exception:
+            time.sleep(0.5)
+    return False
+
+def start_server(mode, port, workers, log_dir):
+    """Start Gunicorn with the project config in the requested worker mode"""
+    env = dict(os.environ)
+    env['WORKER_CLASS'] = mode
+    env['APP_HOST'] = '127.0.0.1'
+    env['APP_PORT'] = str(port)
+    if workers:
+        env['WEB_CONCURRENCY'] = str(workers)
+
+    log_path = os.path.join(log_dir, f'gunicorn_{mode}.log')
+    command = [
+        sys.executable, '-m', 'gunicorn',
+        '-c', os.path.join(project_root, 'gunicorn_config.py'),
+        '--chdir', backend_path,
+        '--pid', os.path.join(log_dir, f'{mode}.pid'),
+        '--access-logfile', log_path,
+        '--error-logfile', log_path,
+        'wsgi:app'
+    ]
+    return subprocess.Popen(command, cwd=project_root, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+def stop_server(process):
+    """Gracefully stop the Gunicorn master"""
+    process.send_signal(signal.SIGTERM)
+    try:
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+def run_load(base_url, endpoints, concurrency, duration):
+    """Hammer the endpoints with `concurrency` clients for `duration` seconds"""
+    deadline = time.time() + duration
+
+    def client(index):
+        latencies, errors = [], 0
+        request_number = index
+        while time.time() < deadline:
+            url = base_url + endpoints[request_number % len(endpoints)]
+            request_number += 1
+            started = time.perf_counter()
+            try:
+                request = urllib.request.Request(url, headers={'Accept-Encoding': 'gzip'})
+                with urllib.request.urlopen(request, timeout=60) as response:
+                    response.read()
+                latencies.append(time.perf_counter() - started)
+            except (urllib.error.URLError, OSError):
+                errors += 1
+        return latencies, errors
+
+    started = time.time()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(client, range(concurrency)))
+    elapsed = time.time() - started
+
+    latencies = sorted(latency for client_latencies, _ in results for latency in client_latencies)
+    errors = sum(client_errors for _, client_errors in results)
+
+    def percentile(p):
+        if not latencies:
+            return 0.0
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'throughput': len(latencies) / elapsed if elapsed else 0.0,
+        'p50_ms': percentile(0.50),
+        'p95_ms': percentile(0.95),
+        'p99_ms': percentile(0.99),
+        'mean_ms': statistics.mean(latencies) * 1000 if latencies else 0.0
+    }
+
+def benchmark_mode(mode, endpoints, concurrency, duration, workers, log_dir):
+    """Benchmark a single worker mode"""
+    port = find_free_port()
+    base_url = f"http://127.0.0.1:{port}"
+
+    print(f"🚀 Starting Gunicorn ({mode}) on port {port}...")
+    process = start_server(mode, port, workers, log_dir)
+    try:
+        if not wait_for_server(base_url):
+            print(f"❌ Server in {mode} mode did not start - see {log_dir}")
+            return None
+
+        # Warm up caches and connection pools
+        run_load(base_url, endpoints, min(concurrency, 4), 2)
+
+        print(f"⏱️  Running {concurrency} concurrent clients for {duration}s...")
+        return run_load(base_url, endpoints, concurrency, duration)
+    finally:
+        stop_server(process)
+
+def main():
+    parser = argparse.ArgumentParser(description='Codex Worker Mode Benchmark')
+    parser.add_argument('--modes', nargs='+', default=['sync', 'gevent'],
+                       choices=['sync', 'gevent'], help='Worker modes to compare')
+    parser.add_argument('--concurrency', type=int, default=200,
+                       help='Number of concurrent clients')
+    parser.add_argument('--duration', type=int, default=30,
+                       help='Seconds of load per mode')
+    parser.add_argument('--workers', type=int,
+                       help='Override the worker count for every mode')
+    parser.add_argument('--endpoint', action='append', dest='endpoints',
+                       help='Endpoint path to request (repeatable)')
+
+    args = parser.parse_args()
+
+    endpoints = args.endpoints or list(DEFAULT_ENDPOINTS)
+    if not args.endpoints:
+        preview = find_preview_endpoint()
+        if preview:
+            endpoints.append(preview)
+
+    print("📈 Codex Worker Mode Benchmark")
+    print("=" * 60)
+    for endpoint in endpoints:
+        print(f"   • {endpoint}")
+    print()
+
+    log_dir = tempfile.mkdtemp(prefix='codex_bench_')
+    results = {}
+    for mode in args.modes:
+        result = benchmark_mode(mode, endpoints, args.concurrency, args.duration, args.workers, log_dir)
+        if result:
+            results[mode] = result
+        print()
+
+    if not results:
+        print("❌ No benchmark results")
+        return
+
+    print("📊 Results")
+    print("-" * 60)
+    print(f"{'mode':<8}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>10}")
+    for mode, result in results.items():
+        print(f"{mode:<8}{result['throughput']:>10.1f}{result['p50_ms']:>10.1f}"
+              f"{result['p95_ms']:>10.1f}{result['p99_ms']:>10.1f}{result['errors']:>10}")
+    print(f"\nℹ️  Gunicorn logs: {log_dir}")
+
+if __name__ == "__main__":
+    main()
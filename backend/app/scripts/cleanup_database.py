@@ -15,147 +15,88 @@ backend_path = os.path.join(project_root, 'backend')
 sys.path.insert(0, backend_path)
 
 def setup_app():
-    """Setup Flask app context"""
-    from app import create_app, db
-    app = create_app()
-    return app, db
+    """Setup Flask app context (built once per process)"""
+    from app import db
+    from app.utils.startup import script_app
+    return script_app(), db
 
-def clean_all_data():
-    """Remove all data from database (keeps structure)"""
+def print_timings(timings):
+    """Per-step timing output of a bulk operation"""
+    for step in timings.steps:
+        rows = f"{step['rows']} rows, " if step['rows'] is not None else ""
+        print(f"   • {step['step']}: {rows}{step['seconds']:.3f}s")
+    print(f"   ⏱️  Total: {timings.total:.3f}s")
+
+def run_bulk(description, operation):
+    """Run operation(connection) in one transaction; returns its timings, or None on error"""
     app, db = setup_app()
     with app.app_context():
         try:
-            print("🗑️  Cleaning all data from database...")
-            
-            # Import models
-            from app.models import User, Project, File, Tag, file_tags
-            
-            # Delete all data in correct order (respecting foreign keys)
-            db.engine.execute(file_tags.delete())
-            File.query.delete()
-            Tag.query.delete()
-            Project.query.delete()
-            
-            # Keep admin user, delete others
-            User.query.filter(User.username != 'admin').delete()
-            
-            db.session.commit()
-            print("✅ All data cleaned successfully!")
-            print("ℹ️  Admin user preserved")
-            
+            print(f"🗑️  Cleaning {description} from database...")
+            with db.engine.begin() as connection:
+                timings = operation(connection)
+            print_timings(timings)
+            return timings
         except Exception as e:
-            print(f"❌ Error cleaning data: {e}")
-            db.session.rollback()
+            print(f"❌ Error cleaning {description}: {e}")
+            return None
+
+def clean_all_data():
+    """Remove all data from database (keeps structure)"""
+    from app.services import bulk_maintenance
+
+    def operation(connection):
+        timings = bulk_maintenance.truncate_tables(connection, ['files', 'tags', 'projects'], rebuild=False)
+        # Keep admin user, delete others
+        return bulk_maintenance.delete_users_except(connection, ('admin',), timings)
+
+    if run_bulk('all data', operation):
+        print("✅ All data cleaned successfully!")
+        print("ℹ️  Admin user preserved")
 
 def clean_files_only():
     """Remove only files data"""
-    app, db = setup_app()
-    with app.app_context():
-        try:
-            print("🗑️  Cleaning files data from database...")
-            
-            # Import models
-            from app.models import File, file_tags
-            
-            # Delete file data
-            db.engine.execute(file_tags.delete())
-            File.query.delete()
-            
-            db.session.commit()
-            print("✅ Files data cleaned successfully!")
-            print("ℹ️  Projects, tags, and users preserved")
-            
-        except Exception as e:
-            print(f"❌ Error cleaning files: {e}")
-            db.session.rollback()
+    from app.services import bulk_maintenance
+
+    if run_bulk('files data', lambda connection: bulk_maintenance.truncate_tables(connection, ['files'])):
+        print("✅ Files data cleaned successfully!")
+        print("ℹ️  Projects, tags, and users preserved")
 
 def clean_projects_only():
     """Remove only projects and their files"""
-    app, db = setup_app()
-    with app.app_context():
-        try:
-            print("🗑️  Cleaning projects and their files from database...")
-            
-            # Import models
-            from app.models import Project, File, file_tags
-            
-            # Delete project-related data
-            db.engine.execute(file_tags.delete())
-            File.query.delete()
-            Project.query.delete()
-            
-            db.session.commit()
-            print("✅ Projects and files cleaned successfully!")
-            print("ℹ️  Tags and users preserved")
-            
-        except Exception as e:
-            print(f"❌ Error cleaning projects: {e}")
-            db.session.rollback()
+    from app.services import bulk_maintenance
+
+    if run_bulk('projects and their files', lambda connection: bulk_maintenance.truncate_tables(connection, ['projects'])):
+        print("✅ Projects and files cleaned successfully!")
+        print("ℹ️  Tags and users preserved")
 
 def clean_tags_only():
     """Remove only tags"""
-    app, db = setup_app()
-    with app.app_context():
-        try:
-            print("🗑️  Cleaning tags from database...")
-            
-            # Import models
-            from app.models import Tag, file_tags
-            
-            # Delete tag data
-            db.engine.execute(file_tags.delete())
-            Tag.query.delete()
-            
-            db.session.commit()
-            print("✅ Tags cleaned successfully!")
-            print("ℹ️  Files, projects, and users preserved")
-            
-        except Exception as e:
-            print(f"❌ Error cleaning tags: {e}")
-            db.session.rollback()
+    from app.services import bulk_maintenance
+
+    if run_bulk('tags', lambda connection: bulk_maintenance.truncate_tables(connection, ['tags'])):
+        print("✅ Tags cleaned successfully!")
+        print("ℹ️  Files, projects, and users preserved")
 
 def clean_users_keep_admin():
     """Remove all users except admin"""
-    app, db = setup_app()
-    with app.app_context():
-        try:
-            print("🗑️  Cleaning non-admin users from database...")
-            
-            # Import models
-            from app.models import User
-            
-            # Delete non-admin users
-            deleted_count = User.query.filter(User.username != 'admin').delete()
-            
-            db.session.commit()
-            print(f"✅ Cleaned {deleted_count} non-admin users successfully!")
-            print("ℹ️  Admin user preserved")
-            
-        except Exception as e:
-            print(f"❌ Error cleaning users: {e}")
-            db.session.rollback()
+    from app.services import bulk_maintenance
+
+    timings = run_bulk('non-admin users', bulk_maintenance.delete_users_except)
+    if timings:
+        deleted_count = next(step['rows'] for step in timings.steps if step['step'] == 'delete users')
+        print(f"✅ Cleaned {deleted_count} non-admin users successfully!")
+        print("ℹ️  Admin user preserved")
 
 def clean_inactive_files():
     """Remove only inactive files"""
-    app, db = setup_app()
-    with app.app_context():
-        try:
-            print("🗑️  Cleaning inactive files from database...")
-            
-            # Import models
-            from app.models import File
-            
-            # Count and delete inactive files
-            inactive_count = File.query.filter(File.is_active == False).count()
-            File.query.filter(File.is_active == False).delete()
-            
-            db.session.commit()
-            print(f"✅ Cleaned {inactive_count} inactive files successfully!")
-            print("ℹ️  Active files preserved")
-            
-        except Exception as e:
-            print(f"❌ Error cleaning inactive files: {e}")
-            db.session.rollback()
+    from app.services import bulk_maintenance
+
+    timings = run_bulk('inactive files', bulk_maintenance.delete_inactive_files)
+    if timings:
+        inactive_count = next(step['rows'] for step in timings.steps if step['step'] == 'delete inactive files')
+        print(f"✅ Cleaned {inactive_count} inactive files successfully!")
+        print("ℹ️  Active files preserved")
 
 def show_database_stats():
     """Show current database statistics"""
@@ -30,14 +30,8 @@ def run_cleanup(action):
 def create_quick_backup():
     """Create a quick backup"""
     print("💾 Creating quick backup...")
-    backup_script = os.path.join(project_root, 'backend', 'app', 'scripts', 'backup_restore.py')
-    
-    import subprocess
-    result = subprocess.run([
-        'python', backup_script, 'backup'
-    ], cwd=project_root)
-    
-    return result.returncode == 0
+    from app.scripts.backup_restore import create_backup
+    return create_backup() is not None
 
 def check_system_health():
     """Check system health"""
@@ -45,8 +39,9 @@ def check_system_health():
     
     # Check if database is accessible
     try:
-        from app import create_app, db
-        app = create_app()
+        from app import db
+        from app.utils.startup import script_app
+        app = script_app()
         with app.app_context():
             from app.models import User, Project, File, Tag
             
@@ -107,11 +102,12 @@ def reset_admin_password():
     print("🔑 Resetting admin password...")
     
     try:
-        from app import create_app, db
+        from app import db
+        from app.utils.startup import script_app
         from app.models import User
         from werkzeug.security import generate_password_hash
         
-        app = create_app()
+        app = script_app()
         with app.app_context():
             admin = User.query.filter_by(username='admin').first()
             if admin:
@@ -134,8 +130,9 @@ def show_quick_stats():
     print("-" * 30)
     
     try:
-        from app import create_app, db
-        app = create_app()
+        from app import db
+        from app.utils.startup import script_app
+        app = script_app()
         with app.app_context():
             from app.models import User, Project, File, Tag
             
@@ -191,41 +188,207 @@ def clean_logs():
         return False
 
 def optimize_database():
-    """Optimize database performance"""
+    """Remove long-inactive files, then VACUUM (ANALYZE) the hot tables"""
     print("🗄️  Optimizing database...")
     
     try:
-        from app import create_app, db
-        app = create_app()
+        from app import db
+        from app.utils.startup import script_app
+        from app.utils.db_pool import maintenance_engine
+        from app.services import bulk_maintenance, db_maintenance
+        app = script_app()
         with app.app_context():
-            # Run VACUUM and ANALYZE on PostgreSQL
-            db.session.execute(db.text("VACUUM ANALYZE"))
-            db.session.commit()
-            
-            # Clean up inactive files older than 30 days
-            from datetime import datetime, timedelta
-            from app.models import File
-            
+            # Clean up inactive files not seen by the indexer for 30 days
             cutoff_date = datetime.utcnow() - timedelta(days=30)
-            old_inactive = File.query.filter(
-                File.is_active == False,
-                File.updated_at < cutoff_date
-            ).delete()
+            with maintenance_engine(db.engine).begin() as connection:
+                timings = bulk_maintenance.delete_inactive_files(connection, indexed_before=cutoff_date)
+            old_inactive = next(step['rows'] for step in timings.steps if step['step'] == 'delete inactive files')
             
-            db.session.commit()
+            # VACUUM refuses to run in a transaction: db_maintenance issues it in autocommit
+            with db.engine.connect() as connection:
+                result = db_maintenance.vacuum_hot_tables(connection, force=True)
+            for step in result['steps']:
+                print(f"   • {step['action']} {step['table'] or '(database)'}: {step['seconds']}s")
             
-            print(f"✅ Database optimized, removed {old_inactive} old inactive files")
+            print(f"✅ Database optimized in {result['seconds']}s, removed {old_inactive} old inactive files")
             return True
             
     except Exception as e:
         print(f"❌ Error optimizing database: {e}")
         return False
 
+def database_report():
+    """Print dead tuples, estimated bloat, scan ratios and unused indexes"""
+    print("🩺 Database health report...")
+    
+    try:
+        from app import db
+        from app.utils.startup import script_app
+        from app.services import db_maintenance
+        app = script_app()
+        with app.app_context():
+            with db.engine.connect() as connection:
+                report = db_maintenance.report(connection)
+            
+            if not report['supported']:
+                print(f"ℹ️  Statistics views are only available on PostgreSQL (this is {report['dialect']})")
+                return True
+            
+            mb = 1024 * 1024
+            print(f"   Statistics since: {report['stats_since'] or 'server start'}")
+            print(f"   Total size: {report['totals']['bytes'] / mb:.1f} MB, estimated bloat "
+                  f"{report['totals']['estimated_table_bloat_bytes'] / mb:.1f} MB in tables, "
+                  f"{report['totals']['estimated_index_bloat_bytes'] / mb:.1f} MB in indexes")
+            for table in report['tables'][:15]:
+                print(f"   📋 {table['table']}: {table['live_rows']} rows, {table['dead_rows']} dead, "
+                      f"{table['bytes'] / mb:.1f} MB, ~{table['bloat_bytes'] / mb:.1f} MB bloat, "
+                      f"seq scans {table['seq_scan']} / index scans {table['idx_scan']}")
+            for table in report['sequential_scans']:
+                print(f"   ⚠️  {table['table']} is mostly read sequentially "
+                      f"({table['seq_rows_read']} rows read by {table['seq_scan']} scans)")
+            for index in report['unused_indexes']:
+                print(f"   ⚠️  Unused index {index['index']} on {index['table']} ({index['bytes'] / mb:.1f} MB)")
+            if report['vacuum_due']:
+                print(f"   🧹 Vacuum due: {', '.join(report['vacuum_due'])} (run optimize-db)")
+            
+            print("✅ Report complete")
+            return True
+            
+    except Exception as e:
+        print(f"❌ Error building database report: {e}")
+        return False
+
+def rollup_searches():
+    """Fold all pending search logs into the analytics rollups"""
+    print("📊 Rolling up search logs...")
+    
+    try:
+        from app import db
+        from app.utils.startup import script_app
+        from app.utils.db_pool import maintenance_engine
+        from app.services.search_analytics import rollup_searches as rollup_batch
+        app = script_app()
+        with app.app_context():
+            processed = 0
+            while True:
+                with maintenance_engine(db.engine).begin() as connection:
+                    result = rollup_batch(connection)
+                if not result['rows']:
+                    break
+                processed += result['rows']
+                print(f"   • {processed} searches rolled up (last id {result['last_id']})")
+            
+            print(f"✅ Search rollups up to date ({processed} new searches)")
+            return True
+            
+    except Exception as e:
+        print(f"❌ Error rolling up searches: {e}")
+        return False
+
+def maintain_search_logs():
+    """Create upcoming search_logs partitions, archive and drop expired ones"""
+    print("🗂️  Maintaining search log partitions...")
+    
+    try:
+        from app import db
+        from app.utils.startup import script_app
+        from app.utils.db_pool import maintenance_engine
+        from app.services import search_log_partitions as partitions
+        app = script_app()
+        with app.app_context():
+            with maintenance_engine(db.engine).begin() as connection:
+                if not partitions.is_partitioned(connection):
+                    print("ℹ️  search_logs is not partitioned (run 'flask db upgrade' on PostgreSQL)")
+                    return True
+                
+                created = partitions.ensure_partitions(connection)
+                retention = partitions.apply_retention(connection)
+            
+            for name in created:
+                print(f"   • Created partition {name}")
+            for dropped in retention['dropped']:
+                archive = dropped.get('archive')
+                if archive:
+                    print(f"   • Archived {dropped['name']}: {archive['rows']} rows -> {archive['path']}")
+                print(f"   • Dropped partition {dropped['name']}")
+            for skipped in retention['skipped']:
+                print(f"   ⚠️  Kept {skipped['name']}: {skipped['reason']}")
+            
+            print(f"✅ Search log partitions maintained (retention: {partitions.RETENTION_MONTHS} months)")
+            return True
+            
+    except Exception as e:
+        print(f"❌ Error maintaining search logs: {e}")
+        return False
+
+def dedupe_uploads():
+    """Move existing uploads into the blob store and hardlink duplicates"""
+    print("🔗 Deduplicating uploaded files...")
+    
+    try:
+        from app import db
+        from app.utils.startup import script_app
+        from app.utils.db_pool import maintenance_engine
+        from app.services import blob_store
+        app = script_app()
+        with app.app_context():
+            with maintenance_engine(db.engine).begin() as connection:
+                result = blob_store.adopt_uploads(connection)
+                summary = blob_store.store_summary(connection)
+            
+            print(f"   • {result['files']} uploaded files checked")
+            print(f"   • {result['blobs_created']} blobs created, {result['duplicates_linked']} duplicates linked")
+            if result['hashes_upgraded']:
+                print(f"   • {result['hashes_upgraded']} content hashes upgraded to sha256")
+            print(f"✅ Blob store: {summary['blobs']} blobs, {summary['saved_bytes'] / (1024 * 1024):.1f} MB saved")
+            return True
+            
+    except Exception as e:
+        print(f"❌ Error deduplicating uploads: {e}")
+        return False
+
+def verify_integrity():
+    """Verify stored content hashes, rereading only files changed since the last check"""
+    print("🔐 Verifying file integrity...")
+    
+    try:
+        from app import db
+        from app.utils.startup import script_app
+        from app.utils.db_pool import maintenance_engine
+        from app.services import integrity
+        app = script_app()
+        with app.app_context():
+            with maintenance_engine(db.engine).begin() as connection:
+                reports = integrity.verify_roots(connection)
+            
+            clean = True
+            for report in reports:
+                print(f"   📁 {report['root']}: {report['files']} files")
+                print(f"      • {report['proven_by_tree']} in {report['directories_proven']} unchanged directories, "
+                      f"{report['proven_by_stat']} unchanged files, {report['hashed']} hashed")
+                for issue in report['issues'][:20]:
+                    print(f"      ⚠️  {issue['issue'].replace('_', ' ')}: {issue['filepath']}")
+                if report['mismatches'] or report['missing']:
+                    clean = False
+                    print(f"      ❌ {report['mismatches']} hash mismatches, {report['missing']} unreadable")
+            
+            if clean:
+                print("✅ All indexed files match their stored hashes")
+            else:
+                print("⚠️  Run advanced-manager to update stored hashes and remove missing files")
+            return clean
+            
+    except Exception as e:
+        print(f"❌ Error verifying integrity: {e}")
+        return False
+
 def main():
     parser = argparse.ArgumentParser(description='DC Codex Maintenance Utility')
     parser.add_argument('action', choices=[
         'health', 'stats', 'backup', 'cleanup-all', 'cleanup-files', 
-        'cleanup-inactive', 'advanced-manager', 'reset-password', 'full-maintenance'
+        'cleanup-inactive', 'advanced-manager', 'reset-password', 'full-maintenance',
+        'rollup-searches', 'search-log-retention', 'dedupe-uploads', 'verify-integrity',
+        'optimize-db', 'db-report'
     ], help='Maintenance action to perform')
     
     args = parser.parse_args()
@@ -253,6 +416,14 @@ def main():
         success = run_advanced_file_manager()
     elif args.action == 'reset-password':
         success = reset_admin_password()
+    elif args.action == 'rollup-searches':
+        success = rollup_searches()
+    elif args.action == 'search-log-retention':
+        success = rollup_searches() and maintain_search_logs()
+    elif args.action == 'dedupe-uploads':
+        success = dedupe_uploads()
+    elif args.action == 'verify-integrity':
+        success = verify_integrity()
     elif args.action == 'full-maintenance':
         print("🚀 Running full maintenance routine...")
         print()
@@ -281,6 +452,8 @@ def main():
         success = clean_logs()
     elif args.action == 'optimize-db':
         success = optimize_database()
+    elif args.action == 'db-report':
+        success = database_report()
     
     print()
     print("=" * 50)
@@ -1,7 +1,8 @@
 #!/usr/bin/env python3
 """
 Simple Database Reset Script
-Completely resets the database and creates a fresh admin user
+Completely resets the database contents and creates a fresh admin user
+(the schema must exist: run "flask db upgrade" on a new database)
 """
 
 import os
@@ -23,26 +24,18 @@ def reset_database():
     print("🔄 Resetting DC Codex Database...")
     print("=" * 50)
     
-    app = create_app()
+    app = create_app('script')
     
     with app.app_context():
         try:
-            # Drop all tables with CASCADE
-            print("🗑️  Dropping all tables with CASCADE...")
-            
-            # First try to drop the view manually if it exists
-            try:
-                db.session.execute(db.text("DROP VIEW IF EXISTS file_details CASCADE"))
-                db.session.commit()
-            except Exception as e:
-                print(f"Note: {str(e)}")
-            
-            # Now drop all tables
-            db.drop_all()
-            
-            # Create all tables
-            print("🏗️  Creating fresh tables...")
-            db.create_all()
+            # Empty every table in place: the schema, its migrations and the
+            # search_logs partitions stay as they are
+            print("🗑️  Truncating all tables...")
+            from app.services.bulk_maintenance import truncate_tables, all_tables
+            with db.engine.begin() as connection:
+                timings = truncate_tables(connection, all_tables())
+            for step in timings.steps:
+                print(f"   • {step['step']}: {step['seconds']:.3f}s")
             
             # Create admin user
             print("👤 Creating admin user...")
@@ -142,7 +135,7 @@ def main():
     print("🔄 DC Codex Complete Reset Utility")
     print("=" * 50)
     print("This will completely reset:")
-    print("- Database (all tables and data)")
+    print("- Database (all data; the schema is kept)")
     print("- File storage directory")
     print("- Log files")
     print()
@@ -0,0 +1,22 @@
+#!/usr/bin/env python3
+"""
+Codex Background Job Runner
+Runs queued admin jobs (backups and restores) of this host until SIGTERM.
+Started and kept alive by the Gunicorn master (gunicorn_config.py); run it
+by hand only where the app is served without Gunicorn.
+"""
+
+import os
+import sys
+
+# Setup paths
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+backend_path = os.path.join(project_root, 'backend')
+sys.path.insert(0, backend_path)
+
+def main():
+    from app.services import background_jobs
+    sys.exit(0 if background_jobs.serve() else 1)
+
+if __name__ == "__main__":
+    main()
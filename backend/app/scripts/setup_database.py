@@ -60,16 +60,17 @@ def create_database():
         return False
 
 def create_tables():
-    """Create database tables using Flask-SQLAlchemy"""
+    """Create or upgrade database tables by running the migrations"""
     print("Creating database tables...")
     
     try:
-        from app import create_app, db
+        from app import create_app
+        from flask_migrate import upgrade
         
-        app = create_app()
+        app = create_app('script')
         with app.app_context():
-            # Create all tables
-            db.create_all()
+            # Apply all pending migrations (creates the tables on a fresh database)
+            upgrade()
             print("Database tables created successfully!")
             return True
             
@@ -124,7 +125,7 @@ def create_admin_user():
         from app import create_app, db
         from app.models import User
         
-        app = create_app()
+        app = create_app('script')
         with app.app_context():
             # Check if admin already exists
             if User.query.filter_by(username='admin').first():
@@ -174,7 +175,7 @@ def create_initial_data():
         from app import create_app, db
         from app.models import Project, Tag
         
-        app = create_app()
+        app = create_app('script')
         with app.app_context():
             # Create sample project
             if not Project.query.filter_by(name='Sample Project').first():
@@ -244,7 +245,7 @@ def test_connection():
         from app import create_app, db
         from app.models import User
         
-        app = create_app()
+        app = create_app('script')
         with app.app_context():
             # Test query
             user_count = User.query.count()
@@ -0,0 +1,272 @@
+"""
+Background Jobs
+Runs long admin operations (backups and restores) in the background, so the
+request that starts one returns at once with a job id. Jobs are run by one
+long-lived job runner per host (app/scripts/run_job.py), which the Gunicorn
+master starts once and restarts if it exits: the runner builds the app and
+its engine a single time and then takes queued jobs from JOB_DIR, so no job
+pays an interpreter start, Gunicorn recycling or reloading its workers does
+not interrupt a restore halfway, and the compression and hashing run on
+real threads even under gevent workers. Where no runner is alive (the
+development server), a job runs on a thread of the process that submits it.
+Each job's state is a small JSON file under JOB_DIR, which lets whichever
+web worker serves a status poll answer it; it records the pid and host of
+the process running the job, so a job whose process died is reported as
+failed instead of running forever. Jobs run one at a time per host,
+serialized by a file lock.
+"""
+
+import os
+import json
+import uuid
+import signal
+import socket
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from app.services.backup import BACKUP_DIR, Progress
+
+JOB_DIR = os.getenv('BACKGROUND_JOB_DIR', os.path.join(BACKUP_DIR, '.jobs'))
+
+# Finished job records kept for the jobs listing
+JOB_HISTORY = 50
+
+# A queued job no runner has claimed by then (and no runner is alive to) never started
+START_TIMEOUT_SECONDS = 60
+
+# Seconds between the runner's checks for queued jobs
+POLL_SECONDS = float(os.getenv('BACKGROUND_JOB_POLL_SECONDS', 1))
+
+logger = logging.getLogger(__name__)
+
+def _backup(engine, progress, backup_name):
+    from app.services import backup
+    result = backup.create_backup(engine, backup_name, progress)
+    return {key: result[key] for key in ('backup_name', 'backup_path', 'size_mb')}
+
+def _restore(engine, progress, backup_name, restore_config=False):
+    from app.services import backup
+    return backup.restore_backup(engine, backup.backup_path(backup_name), restore_config, progress)
+
+# kind -> function(engine, progress, **params) whose return value becomes the job's result
+OPERATIONS = {
+    'backup': _backup,
+    'restore': _restore,
+}
+
+def _state_path(job_id):
+    return os.path.join(JOB_DIR, f'{job_id}.json')
+
+def _claim_path(job_id):
+    return os.path.join(JOB_DIR, f'{job_id}.claim')
+
+def _save(state):
+    os.makedirs(JOB_DIR, exist_ok=True)
+    state['updated_at'] = datetime.utcnow().isoformat()
+    temp = f"{_state_path(state['id'])}.{os.getpid()}.tmp"
+    with open(temp, 'w') as target:
+        json.dump(state, target, default=str)
+    os.replace(temp, _state_path(state['id']))
+
+def _lock_file(name='lock'):
+    os.makedirs(JOB_DIR, exist_ok=True)
+    return open(os.path.join(JOB_DIR, name), 'a')
+
+@contextmanager
+def _host_lock():
+    """Held while a job runs, so backups and restores never overlap on this host"""
+    with _lock_file() as handle:
+        try:
+            import fcntl
+        except ImportError:
+            # No flock (Windows): jobs are not serialized
+            yield
+            return
+        fcntl.flock(handle, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(handle, fcntl.LOCK_UN)
+
+def _held(name):
+    """True while some process holds the lock file JOB_DIR/name"""
+    try:
+        import fcntl
+    except ImportError:
+        return False
+    if not os.path.exists(os.path.join(JOB_DIR, name)):
+        return False
+    with _lock_file(name) as handle:
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return True
+        fcntl.flock(handle, fcntl.LOCK_UN)
+    return False
+
+def job_running():
+    """True while a job on this host holds the job lock (the index watcher defers reloads meanwhile)"""
+    return _held('lock')
+
+def runner_alive():
+    """True while a job runner is serving this host's JOB_DIR"""
+    return _held('runner.lock')
+
+def _claim(job_id):
+    """Take a queued job for this process; False if another runner or thread already has"""
+    try:
+        os.close(os.open(_claim_path(job_id), os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+    except FileExistsError:
+        return False
+    return True
+
+def run(app, job_id):
+    """Run a queued job to completion on app's engine; False if it failed or was taken already"""
+    from app import db
+
+    state = get_job(job_id)
+    if state is None or state['status'] != 'queued' or not _claim(job_id):
+        return False
+    state['pid'] = os.getpid()
+    state['host'] = socket.gethostname()
+    _save(state)
+
+    def listener(progress, message):
+        state['progress'] = progress.snapshot()
+        _save(state)
+
+    with app.app_context(), _host_lock():
+        state['status'] = 'running'
+        state['started_at'] = datetime.utcnow().isoformat()
+        _save(state)
+        progress = Progress(listener)
+        try:
+            state['result'] = OPERATIONS[state['kind']](db.engine, progress, **state['params'])
+            state['status'] = 'completed'
+        except Exception as e:
+            app.logger.exception(f"Background {state['kind']} job {state['id']} failed: {e}")
+            state['status'] = 'failed'
+            state['error'] = str(e)
+        state['progress'] = progress.snapshot()
+        state['finished_at'] = datetime.utcnow().isoformat()
+        _save(state)
+    _prune()
+    return state['status'] == 'completed'
+
+def serve():
+    """
+    Body of the job runner (app/scripts/run_job.py): build the app once and
+    run this host's queued jobs, oldest first, until SIGTERM. A job under
+    way when SIGTERM arrives is finished first. Returns False at once if
+    another runner already serves JOB_DIR.
+    """
+    from app.utils.startup import script_app
+
+    with _lock_file('runner.lock') as handle:
+        try:
+            import fcntl
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except ImportError:
+            pass
+        except BlockingIOError:
+            logger.warning(f'Another job runner already serves {JOB_DIR}')
+            return False
+
+        stopping = threading.Event()
+        signal.signal(signal.SIGTERM, lambda signum, frame: stopping.set())
+        app = script_app()
+        host = socket.gethostname()
+        logger.info(f'Job runner {os.getpid()} serving {JOB_DIR}')
+        while not stopping.is_set():
+            for job in reversed(list_jobs(limit=None)):
+                if stopping.is_set():
+                    break
+                if job['status'] == 'queued' and job.get('host') == host:
+                    run(app, job['id'])
+            stopping.wait(POLL_SECONDS)
+    return True
+
+def submit(kind, params=None):
+    """
+    Queue a job running OPERATIONS[kind] with params (which must be
+    JSON-serializable) for the job runner, or start it on a thread of the
+    current app when no runner is alive. Returns the job's initial state.
+    """
+    from flask import current_app
+
+    if kind not in OPERATIONS:
+        raise ValueError(f'Unknown job kind: {kind}')
+    state = {
+        'id': uuid.uuid4().hex[:16],
+        'kind': kind,
+        'params': params or {},
+        'status': 'queued',
+        'created_at': datetime.utcnow().isoformat(),
+        'host': socket.gethostname(),
+        'pid': None,
+        'progress': None
+    }
+    _save(state)
+    if not runner_alive():
+        threading.Thread(target=run, args=(current_app._get_current_object(), state['id']),
+                         name=f"job-{state['id']}", daemon=True).start()
+    return state
+
+def _fail(job, error):
+    job['status'] = 'failed'
+    job['error'] = error
+    job['finished_at'] = datetime.utcnow().isoformat()
+    _save(job)
+    return job
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+def _check_alive(job):
+    """Fail a queued or running job of this host whose process is gone"""
+    if job['status'] not in ('queued', 'running') or job.get('host') != socket.gethostname():
+        return job
+    if job.get('pid'):
+        if not _process_alive(job['pid']):
+            return _fail(job, f"Job process {job['pid']} is no longer running")
+    elif (datetime.fromisoformat(job['created_at']) < datetime.utcnow() - timedelta(seconds=START_TIMEOUT_SECONDS)
+          and not runner_alive()):
+        # With a runner alive a queued job is only waiting for the one before it
+        return _fail(job, 'Job did not start: no job runner is running')
+    return job
+
+def get_job(job_id):
+    """A job's last saved state, or None"""
+    if not job_id.isalnum():
+        return None
+    try:
+        with open(_state_path(job_id)) as source:
+            job = json.load(source)
+    except (OSError, ValueError):
+        return None
+    return _check_alive(job)
+
+def list_jobs(limit=20):
+    """Most recently created jobs first"""
+    if not os.path.isdir(JOB_DIR):
+        return []
+    jobs = [get_job(name[:-5]) for name in os.listdir(JOB_DIR) if name.endswith('.json')]
+    jobs = [job for job in jobs if job]
+    jobs.sort(key=lambda job: job['created_at'], reverse=True)
+    return jobs[:limit]
+
+def _prune():
+    finished = [job for job in list_jobs(limit=None) if job['status'] in ('completed', 'failed')]
+    for job in finished[JOB_HISTORY:]:
+        for path in (_state_path(job['id']), _claim_path(job['id'])):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
@@ -0,0 +1,381 @@
+"""
+Backup & Restore
+Library behind backup_restore.py and the admin backup endpoints. Every
+operation runs against the caller's engine inside an app context (the job
+runner's when started from the admin tab, see background_jobs) and
+reports what it is doing through a Progress, which also keeps the byte
+counts its throughput is computed from.
+"""
+
+import os
+import json
+import time
+import shutil
+import zipfile
+from datetime import datetime
+from app.services import backup_index
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+BACKUP_DIR = os.path.join(PROJECT_ROOT, 'backups')
+
+FILE_STORAGE = os.path.join(PROJECT_ROOT, 'file_storage')
+
+CONFIG_FILES = ('.env', 'requirements.txt')
+
+MANIFEST_VERSION = '2.0.0'
+
+class Progress:
+    """
+    Step, message log and byte counter of one operation. listener(progress,
+    message) is called for every message, and with message None at most
+    every UPDATE_INTERVAL seconds as bytes are counted.
+    """
+
+    UPDATE_INTERVAL = 0.5
+
+    # Messages kept for snapshot()
+    MAX_MESSAGES = 50
+
+    def __init__(self, listener=None):
+        self.listener = listener
+        self.started = time.monotonic()
+        self.step = None
+        self.bytes = 0
+        self.items = 0
+        self.messages = []
+        self._notified = 0.0
+
+    def begin(self, step, message):
+        self.step = step
+        self.report(message)
+
+    def report(self, message):
+        self.messages = (self.messages + [message])[-self.MAX_MESSAGES:]
+        if self.listener:
+            self.listener(self, message)
+
+    def advance(self, size, items=1):
+        self.bytes += size
+        self.items += items
+        now = time.monotonic()
+        if self.listener and now - self._notified >= self.UPDATE_INTERVAL:
+            self._notified = now
+            self.listener(self, None)
+
+    def snapshot(self):
+        seconds = time.monotonic() - self.started
+        return {
+            'step': self.step,
+            'items': self.items,
+            'bytes': self.bytes,
+            'seconds': round(seconds, 3),
+            'mb_per_second': round(self.bytes / (1024 * 1024) / seconds, 2) if seconds else 0.0,
+            'messages': list(self.messages)
+        }
+
+def backup_path(name):
+    """Path of a named backup; names cannot point outside BACKUP_DIR"""
+    if not name or os.path.basename(name) != name or name.startswith('.'):
+        raise ValueError(f'Invalid backup name: {name!r}')
+    return os.path.join(BACKUP_DIR, f'{name}.zip')
+
+def reset_file_storage():
+    """Empty file_storage ahead of writing a backup's copy"""
+    if os.path.exists(FILE_STORAGE):
+        shutil.rmtree(FILE_STORAGE)
+    os.makedirs(FILE_STORAGE, exist_ok=True)
+
+# Backups
+
+def _add_file_storage(writer, progress):
+    """Queue file_storage on writer; returns {link name: stored name} for hardlinked duplicates"""
+    # Uploads are hardlinks into the blob store: archive each inode once and
+    # record the other names so restore can relink them
+    stored_inodes, links = {}, {}
+    for root, _, files in os.walk(FILE_STORAGE):
+        for file in files:
+            file_path = os.path.join(root, file)
+            arc_path = os.path.relpath(file_path, PROJECT_ROOT).replace(os.sep, '/')
+            info = os.stat(file_path)
+            inode = (info.st_dev, info.st_ino)
+            if info.st_nlink > 1 and inode in stored_inodes:
+                links[arc_path] = stored_inodes[inode]
+                continue
+            stored_inodes[inode] = arc_path
+            writer.add(file_path, arc_path)
+            progress.advance(info.st_size)
+    return links
+
+def create_backup(engine, name=None, progress=None):
+    """
+    Write backups/<name>.zip (database, schema, file storage, configuration)
+    and its sidecar manifest. Returns the backup's name, path, size and
+    manifest; on failure nothing is left behind and the error is raised.
+    """
+    from app.services import db_archive
+    from app.utils import parallel_zip
+
+    progress = progress or Progress()
+    name = name or f"codex_backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+    path = backup_path(name)
+    os.makedirs(BACKUP_DIR, exist_ok=True)
+    schema_path = os.path.join(PROJECT_ROOT, 'database', 'schema.sql')
+
+    try:
+        with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED,
+                             compresslevel=parallel_zip.COMPRESSION_LEVEL) as archive:
+            progress.begin('database', 'Exporting database data')
+            database = db_archive.export_database(engine, archive)
+            for entry in database['tables']:
+                progress.advance(entry['bytes'], 0)
+                progress.report(f"{entry['table']}: {entry['rows']} rows")
+
+            progress.begin('files', 'Backing up schema, file storage and configuration')
+            with parallel_zip.ParallelZipWriter(archive) as writer:
+                if os.path.exists(schema_path):
+                    writer.add(schema_path, 'database/schema.sql')
+                links = _add_file_storage(writer, progress) if os.path.exists(FILE_STORAGE) else {}
+                for config_file in CONFIG_FILES:
+                    config_path = os.path.join(PROJECT_ROOT, config_file)
+                    if os.path.exists(config_path):
+                        writer.add(config_path, f'config/{config_file}')
+            progress.report(f"{writer.deflated} members compressed on {parallel_zip.WORKERS} threads, "
+                            f"{writer.stored} already-compressed members stored")
+            if links:
+                archive.writestr('file_storage_links.json', json.dumps(links, indent=2))
+                progress.report(f"{len(links)} hardlinked duplicates stored once")
+
+            manifest = {
+                'backup_name': name,
+                'created_at': datetime.now().isoformat(),
+                'version': MANIFEST_VERSION,
+                'contents': {
+                    'database_data': True,
+                    'database_schema': os.path.exists(schema_path),
+                    'file_storage': os.path.exists(FILE_STORAGE),
+                    'configuration': True
+                },
+                'database': database,
+                'statistics': {
+                    **{f"{entry['table']}_count": entry['rows'] for entry in database['tables']},
+                    'export_time': database['exported_at'],
+                    'compression_level': parallel_zip.COMPRESSION_LEVEL
+                }
+            }
+            archive.writestr('manifest.json', json.dumps(manifest, indent=2))
+
+        # Listing reads this instead of opening the archive
+        backup_index.write_manifest(path, manifest)
+    except BaseException:
+        for leftover in (path, backup_index.manifest_path(path)):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+        raise
+
+    progress.begin('done', 'Backup created')
+    return {
+        'backup_name': name,
+        'backup_path': path,
+        'size_mb': round(os.path.getsize(path) / (1024 * 1024), 2),
+        'manifest': manifest
+    }
+
+def verify_backup(path):
+    """Members of a backup that are missing or fail their CRC / SHA-256 check"""
+    from app.utils import parallel_zip
+
+    manifest = backup_index.read_manifest(path)
+    return parallel_zip.verify_archive(path, backup_index.member_checksums(manifest))
+
+# Restores
+
+def _restore_database(engine, archive, manifest, progress):
+    from app.services import db_restore
+
+    result = db_restore.restore_database(engine, archive, manifest['database'], progress=progress.report)
+    progress.advance(sum(entry['bytes'] for entry in manifest['database']['tables']), 0)
+    progress.report(f"staged {result['seconds']['stage']}s, swapped {result['seconds']['swap']}s, "
+                    f"rebuilt {result['seconds']['rebuild'] + result['seconds']['derived']:.3f}s")
+    if result['users_without_password']:
+        progress.report(f"{result['users_without_password']} restored users need a new password "
+                        f"(maintenance.py reset-password for admin)")
+    return result
+
+def _after_restore():
+    """Drop per-process state that described the replaced data"""
+    from app.utils.user_cache import user_cache
+    user_cache.clear()
+
+def restore_backup(engine, path, restore_config=False, progress=None):
+    """
+    Replace the database and file storage with a backup's (and the
+    configuration files too with restore_config). The database is restored
+    in one transaction before file storage is touched, so a corrupt archive
+    leaves both as they were. Returns the database restore's report.
+    """
+    progress = progress or Progress()
+    with zipfile.ZipFile(path, 'r') as archive:
+        manifest = json.loads(archive.read('manifest.json'))
+
+        progress.begin('database', 'Restoring database data')
+        if 'database' in manifest:
+            result = _restore_database(engine, archive, manifest, progress)
+            reset_file_storage()
+        else:
+            # Archives from before the streaming export
+            progress.report('Cleaning current data')
+            clean_for_restore()
+            restore_database_data(json.loads(archive.read('database/data.json')))
+            result = {'tables': {}, 'users_without_password': 0, 'seconds': {}}
+
+        progress.begin('files', 'Restoring file storage')
+        os.makedirs(FILE_STORAGE, exist_ok=True)
+        for info in archive.infolist():
+            if info.filename.startswith('file_storage/'):
+                archive.extract(info, PROJECT_ROOT)
+                progress.advance(info.file_size)
+
+        if 'file_storage_links.json' in archive.namelist():
+            links = json.loads(archive.read('file_storage_links.json'))
+            for arc_path, source in links.items():
+                link_path = os.path.join(PROJECT_ROOT, *arc_path.split('/'))
+                source_path = os.path.join(PROJECT_ROOT, *source.split('/'))
+                os.makedirs(os.path.dirname(link_path), exist_ok=True)
+                if os.path.exists(link_path):
+                    os.remove(link_path)
+                try:
+                    os.link(source_path, link_path)
+                except OSError:
+                    shutil.copyfile(source_path, link_path)
+            progress.report(f"{len(links)} hardlinks recreated")
+
+        if restore_config:
+            progress.begin('config', 'Restoring configuration')
+            for info in archive.infolist():
+                if info.filename.startswith('config/'):
+                    config_name = os.path.basename(info.filename)
+                    with open(os.path.join(PROJECT_ROOT, config_name), 'wb') as target:
+                        target.write(archive.read(info))
+
+    _after_restore()
+    progress.begin('done', 'Restore completed')
+    return dict(result, restart_required=restore_config)
+
+def restore_database_data(data):
+    """Restore database data from JSON (into the tables clean_for_restore emptied)"""
+    from app import db
+    from app.models import User, Project, File, Tag
+
+    # Restore users
+    for user_data in data['users']:
+        user = User(
+            username=user_data['username'],
+            full_name=user_data['full_name'],
+            email=user_data['email'],
+            role=user_data['role'],
+            is_active=user_data['is_active']
+        )
+        # Set a default password - should be changed after restore
+        user.set_password('admin123')
+        db.session.add(user)
+
+    # Restore projects
+    for project_data in data['projects']:
+        project = Project(
+            name=project_data['name'],
+            description=project_data['description']
+        )
+        db.session.add(project)
+
+    # Restore tags
+    for tag_data in data['tags']:
+        tag = Tag(
+            name=tag_data['name'],
+            description=tag_data['description']
+        )
+        db.session.add(tag)
+
+    db.session.commit()
+
+    # Restore files (after projects and tags are committed)
+    for file_data in data['files']:
+        file = File(
+            filename=file_data['filename'],
+            filepath=file_data['filepath'],
+            filetype=file_data['filetype'],
+            size=file_data['size'],
+            description=file_data['description'],
+            content=file_data['content'],
+            line_count=file_data['line_count'],
+            project_id=file_data['project_id']
+        )
+        db.session.add(file)
+
+    db.session.commit()
+
+    # Restore file-tag relationships
+    for file_tag in data['file_tags']:
+        file = File.query.get(file_tag['file_id'])
+        tag = Tag.query.get(file_tag['tag_id'])
+        if file and tag:
+            file.tags.append(tag)
+
+    db.session.commit()
+
+def clean_for_restore():
+    """Clean system for restore"""
+    from app import db
+    from app.services.bulk_maintenance import truncate_tables
+
+    # users cascades to search_logs, which the legacy format does not carry either
+    with db.engine.begin() as connection:
+        truncate_tables(connection, ['files', 'tags', 'projects', 'users'])
+
+    reset_file_storage()
+
+# Snapshots
+
+def snapshot_store():
+    """Snapshot store at SNAPSHOT_STORE_PATH (default backups/snapshots)"""
+    from app.services import snapshot_store as store
+    return store.SnapshotStore(store.STORE_PATH or os.path.join(BACKUP_DIR, 'snapshots'))
+
+def create_snapshot(engine, name=None, progress=None):
+    """Take an incremental snapshot; returns its manifest"""
+    from app.services import snapshot_store as snapshots
+
+    progress = progress or Progress()
+    progress.begin('snapshot', 'Creating snapshot')
+    manifest = snapshots.create_snapshot(snapshot_store(), engine, PROJECT_ROOT, [FILE_STORAGE],
+                                         config_files=CONFIG_FILES, name=name)
+    progress.advance(manifest['statistics']['logical_bytes'], manifest['statistics']['stored_files'])
+    progress.begin('done', f"Snapshot {manifest['name']} created")
+    return manifest
+
+def restore_snapshot(engine, name, restore_config=False, progress=None):
+    """Restore the database, file storage and (optionally) configuration from a snapshot"""
+    from app.services import snapshot_store as snapshots
+
+    progress = progress or Progress()
+    store = snapshot_store()
+    manifest = store.load_manifest(name)
+    missing = snapshots.missing_objects(store, manifest)
+    if missing:
+        raise ValueError(f'Snapshot is incomplete: {len(missing)} chunks missing from the store')
+
+    progress.begin('database', 'Restoring database data')
+    result = _restore_database(engine, snapshots.SnapshotArchive(store, manifest), manifest, progress)
+
+    progress.begin('files', 'Restoring file storage')
+    reset_file_storage()
+    written = snapshots.materialize_files(store, manifest, PROJECT_ROOT)
+    progress.advance(sum(entry['size'] for entry in manifest['files'] if entry['kind'] == 'storage'), written)
+    progress.report(f"{written} files written")
+    if restore_config:
+        progress.begin('config', 'Restoring configuration')
+        snapshots.materialize_files(store, manifest, PROJECT_ROOT, kinds=('config',))
+
+    _after_restore()
+    progress.begin('done', 'Restore completed')
+    return dict(result, restart_required=restore_config)
@@ -0,0 +1,64 @@
+"""
+Backup Index
+Every backup zip has a sidecar <name>.manifest.json holding a copy of its
+manifest, so listing backups is a directory read plus small JSON loads
+rather than opening every archive. Backups made before the sidecars existed
+are read from their zip's manifest.json instead.
+"""
+
+import os
+import json
+import zipfile
+from datetime import datetime
+
+MANIFEST_SUFFIX = '.manifest.json'
+
+def manifest_path(backup_path):
+    return os.path.splitext(backup_path)[0] + MANIFEST_SUFFIX
+
+def write_manifest(backup_path, manifest):
+    path = manifest_path(backup_path)
+    temp = f'{path}.tmp'
+    with open(temp, 'w') as target:
+        json.dump(manifest, target, indent=2)
+    os.replace(temp, path)
+
+def read_manifest(backup_path):
+    """The backup's manifest from its sidecar, else from inside the zip (raises if neither is readable)"""
+    try:
+        with open(manifest_path(backup_path)) as source:
+            return json.load(source)
+    except (OSError, ValueError):
+        pass
+    with zipfile.ZipFile(backup_path, 'r') as archive:
+        return json.loads(archive.read('manifest.json'))
+
+def member_checksums(manifest):
+    """{member: sha256} of the database members a manifest records"""
+    return {entry['member']: entry['sha256'] for entry in manifest.get('database', {}).get('tables', [])}
+
+def list_backups(backup_dir):
+    """Backups in backup_dir, newest first, each with its manifest statistics"""
+    if not os.path.isdir(backup_dir):
+        return []
+    backups = []
+    for filename in os.listdir(backup_dir):
+        if not filename.endswith('.zip'):
+            continue
+        path = os.path.join(backup_dir, filename)
+        info = os.stat(path)
+        backup = {
+            'filename': filename,
+            'name': filename[:-len('.zip')],
+            'path': path,
+            'size_mb': round(info.st_size / (1024 * 1024), 2),
+            'created_at': datetime.fromtimestamp(info.st_mtime).isoformat(),
+            'statistics': {}
+        }
+        try:
+            backup['statistics'] = read_manifest(path).get('statistics', {})
+        except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+            backup['statistics'] = {'error': 'Could not read backup manifest'}
+        backups.append(backup)
+    backups.sort(key=lambda backup: backup['created_at'], reverse=True)
+    return backups
@@ -0,0 +1,291 @@
+"""
+Content-Addressed Blob Store
+Uploaded file contents are kept once under BLOB_STORE_PATH, sharded by the
+leading hex digits of their SHA-256 (ab/cd/abcd...). The path recorded in a
+File row is materialized from its blob as a hardlink (falling back to a
+reflink, then a plain copy), so the same library uploaded to many projects
+occupies disk space once. The blobs table counts the active File rows that
+reference each blob; the scheduled collection reconciles those counts from
+the files table and deletes blobs nobody references any more.
+"""
+
+import os
+import stat
+import uuid
+import shutil
+from datetime import datetime, timedelta
+from sqlalchemy import select, update, delete, func, bindparam
+from app.utils.upsert import upsert_add
+from app.utils import hashing
+
+ENABLED = os.getenv('BLOB_STORE_ENABLED', 'True').lower() == 'true'
+
+# Unreferenced blobs (and stray temporary files) younger than this are kept,
+# so uploads still in flight never lose their blob
+GRACE_SECONDS = int(os.getenv('BLOB_GC_GRACE_SECONDS', 3600))
+
+# Linux FICLONE ioctl: copy-on-write clone on btrfs, XFS and similar
+_FICLONE = 0x40049409
+
+def upload_root():
+    return os.path.abspath(os.getenv('UPLOAD_FOLDER', 'file_storage'))
+
+def store_root():
+    return os.path.abspath(os.getenv('BLOB_STORE_PATH', os.path.join(upload_root(), '.blobs')))
+
+def blob_path(digest):
+    return os.path.join(store_root(), digest[:2], digest[2:4], digest)
+
+def temp_path():
+    """Scratch path on the store's filesystem, so ingest() is a rename"""
+    directory = os.path.join(store_root(), 'tmp')
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, uuid.uuid4().hex)
+
+def claim(digest, size):
+    """
+    Mark a blob as referenced now, creating its row if needed, in a
+    transaction of its own. collect_blobs only deletes rows unreferenced for
+    GRACE_SECONDS, so a claimed blob outlives the upload transaction that
+    counts the reference; and a collection already deleting the row holds it
+    locked until its files are gone, so the claim waits and ingest then
+    writes the blob afresh.
+    """
+    from app import db
+    from app.models import Blob
+
+    now = datetime.utcnow()
+    with db.engine.begin() as connection:
+        upsert_add(connection, Blob.__table__, ['digest'], [
+            {'digest': digest, 'size': size, 'ref_count': 0, 'created_date': now, 'last_referenced': now}
+        ], add_columns=['ref_count'], replace_columns=['last_referenced'])
+
+def ingest(path, digest):
+    """Move a fully written file into the store; returns False if the blob already existed"""
+    target = blob_path(digest)
+    claim(digest, os.path.getsize(path))
+    if os.path.exists(target):
+        os.remove(path)
+        return False
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    # Read-only: every materialized hardlink shares this inode
+    os.chmod(path, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+    os.replace(path, target)
+    return True
+
+def _reflink(source, target):
+    import fcntl
+
+    with open(source, 'rb') as src, open(target, 'wb') as dst:
+        try:
+            fcntl.ioctl(dst.fileno(), _FICLONE, src.fileno())
+        except OSError:
+            dst.close()
+            os.remove(target)
+            raise
+
+def materialize(digest, target):
+    """Create target from a blob: hardlink, else reflink, else copy. Returns the method used"""
+    source = blob_path(digest)
+    try:
+        os.link(source, target)
+        return 'hardlink'
+    except OSError:
+        pass
+    try:
+        _reflink(source, target)
+        return 'reflink'
+    except (ImportError, OSError):
+        pass
+    shutil.copyfile(source, target)
+    return 'copy'
+
+def store(path, digest, target):
+    """Ingest a freshly written file and materialize it at target"""
+    ingest(path, digest)
+    return materialize(digest, target)
+
+def discard(path):
+    """Remove a materialized file (read-only hardlinks need their write bit on Windows)"""
+    try:
+        os.remove(path)
+    except PermissionError:
+        os.chmod(path, stat.S_IWRITE | stat.S_IREAD)
+        os.remove(path)
+
+def is_blob_backed(filepath):
+    return bool(filepath) and os.path.abspath(filepath).startswith(upload_root() + os.sep)
+
+def _escape_like(value):
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+# Reference counting
+
+def add_references(connection, references):
+    """Count new File rows per blob; references is [(digest, size)]"""
+    from app.models import Blob
+
+    now = datetime.utcnow()
+    totals = {}
+    for digest, size in references:
+        count, _ = totals.get(digest, (0, size))
+        totals[digest] = (count + 1, size)
+    upsert_add(connection, Blob.__table__, ['digest'], [
+        {'digest': digest, 'size': size, 'ref_count': count, 'created_date': now, 'last_referenced': now}
+        for digest, (count, size) in totals.items()
+    ], add_columns=['ref_count'], replace_columns=['last_referenced'])
+
+def release(connection, digests):
+    """Drop one reference per digest (the blob itself goes at the next collection)"""
+    from app.models import Blob
+
+    rows = [{'target': digest} for digest in digests if digest]
+    if rows:
+        connection.execute(
+            update(Blob.__table__)
+            .where(Blob.__table__.c.digest == bindparam('target'), Blob.__table__.c.ref_count > 0)
+            .values(ref_count=Blob.__table__.c.ref_count - 1),
+            rows
+        )
+
+def reconcile_references(connection):
+    """Recompute every ref_count from the active upload rows in files"""
+    from app.models import Blob, File
+
+    blobs, files = Blob.__table__, File.__table__
+    prefix = _escape_like(upload_root() + os.sep) + '%'
+    connection.execute(update(blobs).values(ref_count=(
+        select(func.count()).select_from(files)
+        .where(files.c.content_hash == blobs.c.digest, files.c.is_active == True,
+               files.c.filepath.like(prefix, escape='\\'))
+        .scalar_subquery()
+    )))
+    connection.execute(update(blobs).where(blobs.c.ref_count > 0).values(last_referenced=datetime.utcnow()))
+
+# Collection
+
+def _older_than(path, cutoff):
+    try:
+        return os.stat(path).st_mtime < cutoff
+    except FileNotFoundError:
+        return False
+
+def collect_blobs(connection):
+    """Scheduled job: reconcile counts, then delete unreferenced blobs and stray files"""
+    from app.models import Blob
+
+    blobs = Blob.__table__
+    reconcile_references(connection)
+
+    # Only rows this statement actually deleted lose their files: a blob claimed
+    # since (see claim) no longer matches, and one claimed meanwhile waits for us
+    cutoff = datetime.utcnow() - timedelta(seconds=GRACE_SECONDS)
+    expired = connection.execute(
+        delete(blobs).where(
+            blobs.c.ref_count == 0,
+            func.coalesce(blobs.c.last_referenced, blobs.c.created_date) < cutoff
+        ).returning(blobs.c.digest, blobs.c.size)
+    ).all()
+    freed = 0
+    for digest, size in expired:
+        path = blob_path(digest)
+        if os.path.exists(path):
+            discard(path)
+            freed += size or 0
+
+    # Files without a row: writes whose transaction rolled back, or leftovers in tmp
+    root = store_root()
+    mtime_cutoff = (datetime.now() - timedelta(seconds=GRACE_SECONDS)).timestamp()
+    strays = 0
+    if os.path.isdir(root):
+        for directory, _, names in os.walk(root):
+            candidates = [name for name in names if _older_than(os.path.join(directory, name), mtime_cutoff)]
+            if not candidates:
+                continue
+            known = set()
+            if os.path.basename(directory) != 'tmp':
+                for start in range(0, len(candidates), 500):
+                    known.update(connection.execute(
+                        select(blobs.c.digest).where(blobs.c.digest.in_(candidates[start:start + 500]))
+                    ).scalars())
+            for name in candidates:
+                if name not in known:
+                    discard(os.path.join(directory, name))
+                    strays += 1
+
+    return {'blobs_deleted': len(expired), 'bytes_freed': freed, 'stray_files_deleted': strays}
+
+def store_summary(connection):
+    """Blob count, stored bytes and the bytes the references would take without dedup"""
+    from app.models import Blob
+
+    blobs = Blob.__table__
+    count, stored, logical = connection.execute(select(
+        func.count(),
+        func.coalesce(func.sum(blobs.c.size), 0),
+        func.coalesce(func.sum(blobs.c.size * blobs.c.ref_count), 0)
+    )).one()
+    return {
+        'enabled': ENABLED,
+        'path': store_root(),
+        'blobs': count,
+        'stored_bytes': int(stored),
+        'referenced_bytes': int(logical),
+        'saved_bytes': max(int(logical) - int(stored), 0)
+    }
+
+# Adopting files uploaded before the store existed
+
+def adopt_uploads(connection):
+    """Move existing upload files into the store, replacing duplicates with hardlinks"""
+    from app.models import File
+
+    files = File.__table__
+    prefix = _escape_like(upload_root() + os.sep) + '%'
+    rows = connection.execute(
+        select(files.c.id, files.c.filepath, files.c.content_hash)
+        .where(files.c.is_active == True, files.c.filepath.like(prefix, escape='\\'))
+        .order_by(files.c.id)
+    ).all()
+
+    adopted = linked = saved = 0
+    rehashed, sizes = [], {}
+    for file_id, filepath, content_hash in rows:
+        if not os.path.isfile(filepath):
+            continue
+        # Uploads made before sha256 was used carry a 32-character MD5 hash
+        digest = content_hash if hashing.is_current(content_hash) else hashing.hash_file(filepath)
+        if digest != content_hash:
+            rehashed.append({'target_id': file_id, 'digest': digest})
+        sizes[digest] = os.path.getsize(filepath)
+
+        target = blob_path(digest)
+        if not os.path.exists(target):
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            try:
+                os.link(filepath, target)
+            except OSError:
+                shutil.copyfile(filepath, target)
+            os.chmod(target, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+            adopted += 1
+        elif not os.path.samefile(filepath, target):
+            size = os.path.getsize(filepath)
+            replacement = filepath + '.dedupe'
+            method = materialize(digest, replacement)
+            os.replace(replacement, filepath)
+            linked += 1
+            if method != 'copy':
+                saved += size
+
+    if rehashed:
+        connection.execute(
+            update(files).where(files.c.id == bindparam('target_id')).values(content_hash=bindparam('digest')),
+            rehashed
+        )
+
+    # Make sure every blob has a row, then take exact counts from the files table
+    add_references(connection, list(sizes.items()))
+    reconcile_references(connection)
+
+    return {'files': len(rows), 'blobs_created': adopted, 'duplicates_linked': linked,
+            'bytes_saved': saved, 'hashes_upgraded': len(rehashed)}
@@ -0,0 +1,142 @@
+"""
+Bulk Maintenance
+Set-based emptying of tables for the cleanup, reset and restore scripts.
+Whole tables go with a single TRUNCATE ... RESTART IDENTITY CASCADE on
+PostgreSQL, which writes no per-row WAL and leaves no dead tuples behind;
+on a partitioned search_logs it empties every partition while keeping the
+partitions themselves. The tables a truncate cascades to are worked out
+from the foreign keys in the metadata and processed children first, so the
+same plan runs as plain DELETEs on SQLite. Partial cleanups (inactive
+files, non-admin users) are single DELETE statements that detach the rows
+referencing them first. Every operation then rebuilds the state derived
+from the removed rows and returns per-step timings.
+"""
+
+import time
+from sqlalchemy import select, update, delete, text
+
+# Never emptied: index_state holds the single generation row the search index polls
+PRESERVED_TABLES = {'index_state'}
+
+# Cleared along with the table they summarize
+DERIVED_FROM = {
+    'files': ('directory_digests',),
+    'search_logs': ('search_rollups_hourly', 'search_rollups_daily', 'search_heavy_hitters', 'rollup_state'),
+}
+
+def _tables():
+    from app import db
+    return db.metadata.tables
+
+def _sorted_tables():
+    from app import db
+    return db.metadata.sorted_tables
+
+class Timings:
+    """Steps of one operation as {'step', 'rows', 'seconds'}"""
+
+    def __init__(self):
+        self.steps = []
+
+    def run(self, step, function, *args):
+        started = time.perf_counter()
+        rows = function(*args)
+        self.steps.append({'step': step, 'rows': rows, 'seconds': round(time.perf_counter() - started, 3)})
+        return rows
+
+    @property
+    def total(self):
+        return round(sum(step['seconds'] for step in self.steps), 3)
+
+def dependents_first(names):
+    """names plus every table whose foreign keys reach them (and what they derive), children first"""
+    tables = _tables()
+    selected = set(names)
+    changed = True
+    while changed:
+        changed = False
+        for table in tables.values():
+            reached = any(key.column.table.name in selected for key in table.foreign_keys) or any(
+                table.name in DERIVED_FROM.get(name, ()) for name in selected)
+            if table.name not in selected and reached:
+                selected.add(table.name)
+                changed = True
+    ordered = [table.name for table in reversed(_sorted_tables()) if table.name in selected]
+    return [name for name in ordered if name not in PRESERVED_TABLES]
+
+def all_tables():
+    """Every application table that a full reset empties"""
+    return dependents_first([table.name for table in _sorted_tables()])
+
+def _truncate(connection, names):
+    if connection.dialect.name == 'postgresql':
+        quoted = ', '.join(f'"{name}"' for name in names)
+        connection.execute(text(f'TRUNCATE {quoted} RESTART IDENTITY CASCADE'))
+        return None
+    tables = _tables()
+    removed = 0
+    for name in names:
+        removed += connection.execute(delete(tables[name])).rowcount
+    # Let AUTOINCREMENT ids start over, as RESTART IDENTITY does
+    if connection.execute(text("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_sequence'")).first():
+        for name in names:
+            connection.execute(text('DELETE FROM sqlite_sequence WHERE name = :name'), {'name': name})
+    return removed
+
+def rebuild_derived(connection):
+    """Recompute what the bulk statements bypassed (the ORM flush hooks never saw them)"""
+    from app.services.stats import refresh_counters
+    from app.services.file_counts import refresh_file_counts
+    from app.services.search_index import bump_generation
+    from app.services.blob_store import reconcile_references
+
+    refresh_counters(connection)
+    refresh_file_counts(connection)
+    reconcile_references(connection)
+    bump_generation(connection)
+
+def _finish(connection, timings, rebuild):
+    if rebuild:
+        timings.run('rebuild derived state', rebuild_derived, connection)
+    return timings
+
+def truncate_tables(connection, names, timings=None, rebuild=True):
+    """
+    Empty the tables and their dependents. Steps are added to timings (a new
+    Timings by default), which is returned; pass rebuild=False when another
+    operation follows in the same transaction and will rebuild instead.
+    """
+    timings = timings or Timings()
+    ordered = dependents_first(names)
+    timings.run(f"truncate {', '.join(ordered)}", _truncate, connection, ordered)
+    return _finish(connection, timings, rebuild)
+
+def delete_inactive_files(connection, timings=None, rebuild=True, indexed_before=None):
+    """Remove the rows of deactivated files (only those last indexed before indexed_before, if given)"""
+    tables = _tables()
+    files, file_tags = tables['files'], tables['file_tags']
+    condition = files.c.is_active == False
+    if indexed_before is not None:
+        condition = condition & (files.c.indexed_date < indexed_before)
+    inactive = select(files.c.id).where(condition).scalar_subquery()
+
+    timings = timings or Timings()
+    timings.run('delete file_tags of inactive files', lambda: connection.execute(
+        delete(file_tags).where(file_tags.c.file_id.in_(inactive))).rowcount)
+    # file_verifications follow through ON DELETE CASCADE
+    timings.run('delete inactive files', lambda: connection.execute(
+        delete(files).where(condition)).rowcount)
+    return _finish(connection, timings, rebuild)
+
+def delete_users_except(connection, keep=('admin',), timings=None, rebuild=True):
+    """Remove every user whose username is not in keep; their search history stays, anonymized"""
+    tables = _tables()
+    users, search_logs = tables['users'], tables['search_logs']
+    removed = select(users.c.id).where(users.c.username.notin_(keep)).scalar_subquery()
+
+    timings = timings or Timings()
+    timings.run('detach search_logs', lambda: connection.execute(
+        update(search_logs).where(search_logs.c.user_id.in_(removed)).values(user_id=None)).rowcount)
+    timings.run('delete users', lambda: connection.execute(
+        delete(users).where(users.c.username.notin_(keep))).rowcount)
+    return _finish(connection, timings, rebuild)
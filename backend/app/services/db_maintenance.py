@@ -0,0 +1,287 @@
+"""
+Database Maintenance
+Targeted VACUUM (ANALYZE) of the tables the application rewrites most, and a
+health report built from the pg_stat_* views: dead tuples and estimated
+bloat per table and index, sequential versus index scans, and indexes that
+have never been scanned. VACUUM cannot run inside a transaction block, so
+it is issued on a separate AUTOCOMMIT connection; a table (or, for the
+partitioned search_logs, a partition) is only processed once its dead or
+changed rows pass the configured fraction of its live rows, leaving
+everything else to autovacuum.
+"""
+
+import os
+import time
+from contextlib import contextmanager
+from sqlalchemy import text
+
+# Tables considered for the scheduled VACUUM (partitions count as their parent)
+HOT_TABLES = [name.strip() for name in os.getenv(
+    'DB_MAINTENANCE_TABLES',
+    'files,file_tags,file_verifications,directory_digests,blobs,search_logs,'
+    'search_rollups_hourly,search_rollups_daily,search_heavy_hitters,stats_counters'
+).split(',') if name.strip()]
+
+# VACUUM once dead tuples exceed this fraction of the table (and MIN_DEAD_TUPLES)
+DEAD_TUPLE_RATIO = float(os.getenv('DB_VACUUM_DEAD_RATIO', 0.05))
+MIN_DEAD_TUPLES = int(os.getenv('DB_VACUUM_MIN_DEAD_TUPLES', 1000))
+
+# ANALYZE alone once this fraction of rows changed since the last analyze
+ANALYZE_CHANGE_RATIO = float(os.getenv('DB_ANALYZE_CHANGE_RATIO', 0.1))
+
+# Tables smaller than this are not reported for their sequential scans
+SEQ_SCAN_MIN_ROWS = int(os.getenv('DB_REPORT_SEQ_SCAN_MIN_ROWS', 10000))
+
+# Estimated per-row overhead: heap tuple header plus line pointer, index tuple header plus line pointer
+_HEAP_TUPLE_OVERHEAD = 24 + 4
+_INDEX_TUPLE_OVERHEAD = 8 + 4
+_BTREE_FILLFACTOR = 90
+# Width assumed for an expression index column (pg_stats has none for it)
+_EXPRESSION_WIDTH = 8
+
+def _align(width):
+    return (width + 7) // 8 * 8
+
+def _quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+def _table_stats(connection):
+    """pg_stat_user_tables rows of ordinary tables and partitions, with the partition's parent"""
+    return connection.execute(text(
+        "SELECT c.relname, COALESCE(parent.relname, c.relname) AS parent, c.relpages, c.reltuples, "
+        "       s.n_live_tup, s.n_dead_tup, s.n_mod_since_analyze, "
+        "       s.seq_scan, s.seq_tup_read, COALESCE(s.idx_scan, 0) AS idx_scan, "
+        "       GREATEST(s.last_vacuum, s.last_autovacuum) AS last_vacuum, "
+        "       GREATEST(s.last_analyze, s.last_autoanalyze) AS last_analyze, "
+        "       pg_relation_size(c.oid) AS heap_bytes, pg_total_relation_size(c.oid) AS total_bytes, "
+        "       COALESCE((SELECT option_value::int FROM pg_options_to_table(c.reloptions) "
+        "                 WHERE option_name = 'fillfactor'), 100) AS fillfactor "
+        "FROM pg_stat_user_tables s "
+        "JOIN pg_class c ON c.oid = s.relid "
+        "LEFT JOIN pg_inherits i ON i.inhrelid = c.oid "
+        "LEFT JOIN pg_class parent ON parent.oid = i.inhparent "
+        "WHERE c.relkind = 'r'"
+    )).mappings().all()
+
+def _needs_vacuum(row):
+    dead = row['n_dead_tup']
+    return dead >= MIN_DEAD_TUPLES and dead > DEAD_TUPLE_RATIO * (row['n_live_tup'] + dead)
+
+def _needs_analyze(row):
+    changed = row['n_mod_since_analyze']
+    return changed >= MIN_DEAD_TUPLES and changed > ANALYZE_CHANGE_RATIO * max(row['n_live_tup'], 1)
+
+def plan(connection, force=False):
+    """
+    [(relation, 'vacuum' | 'analyze')] for the hot tables that are due (every
+    hot relation with force). Partitions are planned individually, so only
+    the month being written to is vacuumed.
+    """
+    planned = []
+    for row in _table_stats(connection):
+        if row['parent'] not in HOT_TABLES:
+            continue
+        if force or _needs_vacuum(row):
+            planned.append((row['relname'], 'vacuum'))
+        elif _needs_analyze(row):
+            planned.append((row['relname'], 'analyze'))
+    return planned
+
+@contextmanager
+def _autocommit(engine):
+    """
+    Pooled connection in AUTOCOMMIT mode without the engine's statement
+    timeout, which would cancel VACUUM of any sizable table; the timeout is
+    reset before the connection goes back to the pool.
+    """
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+        if engine.dialect.name != 'postgresql':
+            yield connection
+            return
+        connection.exec_driver_sql('SET statement_timeout = 0')
+        try:
+            yield connection
+        finally:
+            connection.exec_driver_sql('RESET statement_timeout')
+
+def _run(engine, planned):
+    steps = []
+    with _autocommit(engine) as autocommit:
+        for relation, action in planned:
+            statement = 'VACUUM (ANALYZE)' if action == 'vacuum' else 'ANALYZE'
+            started = time.perf_counter()
+            autocommit.exec_driver_sql(f'{statement} {_quote(relation)}')
+            steps.append({'table': relation, 'action': action,
+                          'seconds': round(time.perf_counter() - started, 3)})
+    return steps
+
+def vacuum_hot_tables(connection, force=False):
+    """
+    Scheduled job: VACUUM (ANALYZE) the hot tables with too many dead tuples
+    and ANALYZE those whose contents changed a lot. The statements run on
+    their own AUTOCOMMIT connection; connection is only read for the plan.
+    SQLite has no per-table vacuum, so there the hot tables are analyzed
+    (and, with force, the whole database file is vacuumed).
+    """
+    started = time.perf_counter()
+    if connection.dialect.name == 'postgresql':
+        planned = plan(connection, force)
+    else:
+        existing = set(connection.exec_driver_sql(
+            "SELECT name FROM sqlite_master WHERE type = 'table'").scalars())
+        planned = [(name, 'analyze') for name in HOT_TABLES if name in existing]
+
+    steps = _run(connection.engine, planned)
+    if force and connection.dialect.name == 'sqlite':
+        vacuum_started = time.perf_counter()
+        with _autocommit(connection.engine) as autocommit:
+            autocommit.exec_driver_sql('VACUUM')
+        steps.append({'table': None, 'action': 'vacuum',
+                      'seconds': round(time.perf_counter() - vacuum_started, 3)})
+
+    return {
+        'vacuumed': [step['table'] for step in steps if step['action'] == 'vacuum'],
+        'analyzed': [step['table'] for step in steps if step['action'] == 'analyze'],
+        'steps': steps,
+        'seconds': round(time.perf_counter() - started, 3)
+    }
+
+def _column_widths(connection):
+    rows = connection.execute(text(
+        "SELECT tablename, attname, avg_width, null_frac FROM pg_stats "
+        "WHERE schemaname = ANY(current_schemas(false))"
+    )).all()
+    return {(table, column): (width, null_frac) for table, column, width, null_frac in rows}
+
+def _estimated_bloat(actual_bytes, rows, row_bytes, fillfactor, block_size):
+    """Bytes beyond what rows of row_bytes would occupy at fillfactor (a statistics-based estimate)"""
+    if actual_bytes <= block_size or rows <= 0:
+        return 0
+    needed = rows * row_bytes * 100 / fillfactor
+    # Round up to whole pages, as the relation can only be that small
+    needed = (int(needed) // block_size + 1) * block_size
+    return max(0, actual_bytes - needed)
+
+def _ratio(part, whole):
+    return round(part / whole, 3) if whole else None
+
+def _index_stats(connection):
+    return connection.execute(text(
+        "SELECT c.relname AS index_name, COALESCE(parent.relname, c.relname) AS parent, "
+        "       s.relname AS table_name, COALESCE(parent_table.relname, s.relname) AS table_parent, "
+        "       s.idx_scan, c.reltuples, pg_relation_size(c.oid) AS bytes, "
+        "       i.indisunique, i.indisprimary, am.amname, "
+        "       ARRAY(SELECT COALESCE(a.attname, '') FROM unnest(i.indkey::int2[]) WITH ORDINALITY k(attnum, position) "
+        "             LEFT JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = k.attnum "
+        "             ORDER BY k.position) AS columns "
+        "FROM pg_stat_user_indexes s "
+        "JOIN pg_index i ON i.indexrelid = s.indexrelid "
+        "JOIN pg_class c ON c.oid = s.indexrelid "
+        "JOIN pg_am am ON am.oid = c.relam "
+        "LEFT JOIN pg_inherits ii ON ii.inhrelid = c.oid "
+        "LEFT JOIN pg_class parent ON parent.oid = ii.inhparent "
+        "LEFT JOIN pg_inherits ti ON ti.inhrelid = s.relid "
+        "LEFT JOIN pg_class parent_table ON parent_table.oid = ti.inhparent "
+        "WHERE c.relkind = 'i'"
+    )).mappings().all()
+
+def _report_tables(rows, widths, block_size):
+    row_widths = {}
+    for (table, _), (width, null_frac) in widths.items():
+        row_widths[table] = row_widths.get(table, 0) + width * (1 - null_frac)
+
+    tables = {}
+    for row in rows:
+        name = row['parent']
+        row_width = row_widths.get(row['relname'], row_widths.get(name, 0))
+        bloat = _estimated_bloat(row['heap_bytes'], row['reltuples'],
+                                 _HEAP_TUPLE_OVERHEAD + _align(int(row_width)), row['fillfactor'], block_size)
+        table = tables.setdefault(name, {
+            'table': name, 'partitions': 0, 'live_rows': 0, 'dead_rows': 0, 'bytes': 0, 'heap_bytes': 0,
+            'bloat_bytes': 0, 'seq_scan': 0, 'seq_rows_read': 0, 'idx_scan': 0,
+            'last_vacuum': None, 'last_analyze': None, 'vacuum_due': False
+        })
+        if row['relname'] != name:
+            table['partitions'] += 1
+        table['live_rows'] += row['n_live_tup']
+        table['dead_rows'] += row['n_dead_tup']
+        table['bytes'] += row['total_bytes']
+        table['heap_bytes'] += row['heap_bytes']
+        table['bloat_bytes'] += bloat
+        table['seq_scan'] += row['seq_scan']
+        table['seq_rows_read'] += row['seq_tup_read']
+        table['idx_scan'] += row['idx_scan']
+        table['vacuum_due'] = table['vacuum_due'] or _needs_vacuum(row)
+        for key in ('last_vacuum', 'last_analyze'):
+            if row[key] and (table[key] is None or row[key] > table[key]):
+                table[key] = row[key]
+
+    for table in tables.values():
+        table['dead_ratio'] = _ratio(table['dead_rows'], table['live_rows'] + table['dead_rows'])
+        table['bloat_ratio'] = _ratio(table['bloat_bytes'], table['heap_bytes'])
+        table['seq_scan_ratio'] = _ratio(table['seq_scan'], table['seq_scan'] + table['idx_scan'])
+        for key in ('last_vacuum', 'last_analyze'):
+            table[key] = table[key].isoformat() if table[key] else None
+    return sorted(tables.values(), key=lambda table: table['bytes'], reverse=True)
+
+def _report_indexes(rows, widths, block_size):
+    indexes = {}
+    for row in rows:
+        name = row['parent']
+        if row['amname'] == 'btree':
+            key_width = sum(widths.get((row['table_name'], column), widths.get(
+                (row['table_parent'], column), (_EXPRESSION_WIDTH, 0)))[0] for column in row['columns'])
+            bloat = _estimated_bloat(row['bytes'], row['reltuples'],
+                                     _INDEX_TUPLE_OVERHEAD + _align(key_width), _BTREE_FILLFACTOR, block_size)
+        else:
+            bloat = None
+        index = indexes.setdefault(name, {
+            'index': name, 'table': row['table_parent'], 'method': row['amname'],
+            'unique': row['indisunique'] or row['indisprimary'], 'scans': 0, 'bytes': 0, 'bloat_bytes': 0
+        })
+        index['scans'] += row['idx_scan']
+        index['bytes'] += row['bytes']
+        index['bloat_bytes'] = None if bloat is None or index['bloat_bytes'] is None else index['bloat_bytes'] + bloat
+
+    for index in indexes.values():
+        index['bloat_ratio'] = _ratio(index['bloat_bytes'], index['bytes']) if index['bloat_bytes'] is not None else None
+    return sorted(indexes.values(), key=lambda index: index['bytes'], reverse=True)
+
+def report(connection):
+    """
+    Table and index health from the statistics views. Scan counts are
+    cumulative since stats_reset; bloat is estimated from pg_stats column
+    widths (run ANALYZE first for a meaningful figure), not measured.
+    """
+    if connection.dialect.name != 'postgresql':
+        return {'dialect': connection.dialect.name, 'supported': False}
+
+    block_size = int(connection.exec_driver_sql("SELECT current_setting('block_size')").scalar())
+    stats_reset = connection.exec_driver_sql(
+        'SELECT stats_reset FROM pg_stat_database WHERE datname = current_database()').scalar()
+    widths = _column_widths(connection)
+    tables = _report_tables(_table_stats(connection), widths, block_size)
+    indexes = _report_indexes(_index_stats(connection), widths, block_size)
+
+    return {
+        'dialect': 'postgresql',
+        'supported': True,
+        'stats_since': stats_reset.isoformat() if stats_reset else None,
+        'tables': tables,
+        'indexes': indexes,
+        'vacuum_due': [table['table'] for table in tables if table['vacuum_due']],
+        # Large tables read mostly by sequential scan: candidates for an index
+        'sequential_scans': sorted(
+            [table for table in tables
+             if table['live_rows'] >= SEQ_SCAN_MIN_ROWS and (table['seq_scan_ratio'] or 0) > 0.5],
+            key=lambda table: table['seq_rows_read'], reverse=True),
+        # Never scanned since stats_since; unique indexes are kept for their constraint
+        'unused_indexes': [index for index in indexes if index['scans'] == 0 and not index['unique']],
+        'totals': {
+            'bytes': sum(table['bytes'] for table in tables),
+            'estimated_table_bloat_bytes': sum(table['bloat_bytes'] for table in tables),
+            'estimated_index_bloat_bytes': sum(index['bloat_bytes'] or 0 for index in indexes),
+            'unused_index_bytes': sum(index['bytes'] for index in indexes
+                                      if index['scans'] == 0 and not index['unique'])
+        }
+    }
@@ -0,0 +1,274 @@
+"""
+Database Restore
+Loads an archive written by app.services.db_archive in one transaction.
+Each table member is first loaded into a temporary staging table (COPY
+FROM STDIN on PostgreSQL, executemany batches elsewhere) while the live
+tables are still untouched. Then the live tables are emptied, their
+secondary indexes and foreign keys dropped, the staged rows moved in with
+one INSERT ... SELECT per table, and the indexes and constraints rebuilt
+once at the end. Sequences are moved past the restored ids and the tables
+derived from the restored rows (counters, file counts, search rollups,
+blob references, verification state) are rebuilt or cleared.
+"""
+
+import io
+import time
+import hashlib
+from sqlalchemy import (Table, Column, MetaData, Text, Integer, select, insert, update, delete, func, text,
+                        literal, bindparam)
+from app.services.db_archive import read_table, HashingReader, NULL
+from app.utils.db_pool import maintenance_engine
+
+BATCH_SIZE = 5000
+
+STAGING_PREFIX = 'restore_'
+
+# Not archived: cleared by a restore and rebuilt from the restored tables
+DERIVED_TABLES = ('file_verifications', 'directory_digests', 'search_rollups_hourly',
+                  'search_rollups_daily', 'search_heavy_hitters', 'rollup_state', 'stats_counters')
+
+# Archives carry no password hashes. Restored users keep the password of the
+# current account with the same username; others get this hash, which never
+# matches, until an administrator sets a password
+UNUSABLE_PASSWORD = '!'
+
+def _tables():
+    from app import db
+    return db.metadata.tables
+
+# Staging
+
+def _staging_table(target, columns):
+    """Temporary table shaped like the archive member (unknown columns as text)"""
+    return Table(
+        STAGING_PREFIX + target.name, MetaData(),
+        *[Column(name, target.c[name].type if name in target.c else Text()) for name in columns],
+        prefixes=['TEMPORARY']
+    )
+
+def _copy_in(connection, archive, entry, staging):
+    """PostgreSQL: COPY the member into staging, verifying its checksum on the way"""
+    digest = hashlib.sha256()
+    names = ', '.join(f'"{name}"' for name in entry['columns'])
+    cursor = connection.connection.driver_connection.cursor()
+    try:
+        with archive.open(entry['member']) as source:
+            cursor.copy_expert(
+                f'COPY "{staging.name}" ({names}) FROM STDIN '
+                f"WITH (FORMAT csv, HEADER true, NULL '{NULL}')",
+                io.BufferedReader(HashingReader(source, digest))
+            )
+    finally:
+        cursor.close()
+    rows = connection.execute(select(func.count()).select_from(staging)).scalar()
+    if rows != entry['rows'] or digest.hexdigest() != entry['sha256']:
+        raise ValueError(f"Archive member {entry['member']} is corrupt (checksum or row count mismatch)")
+    return rows
+
+def _insert_batches(connection, archive, entry, staging):
+    """Any database: executemany batches of the parsed rows (read_table verifies the checksum)"""
+    rows, batch = 0, []
+    for row in read_table(archive, entry):
+        batch.append(row)
+        if len(batch) >= BATCH_SIZE:
+            connection.execute(insert(staging), batch)
+            rows += len(batch)
+            batch = []
+    if batch:
+        connection.execute(insert(staging), batch)
+        rows += len(batch)
+    return rows
+
+# Deferred indexes and constraints
+
+def _deferred_postgresql(connection, names):
+    """(indexes, foreign keys) touching the tables: [(name, definition)], [(table, name, definition)]"""
+    indexes = connection.execute(text('''
+        SELECT index_class.relname, pg_get_indexdef(i.indexrelid)
+        FROM pg_index i
+        JOIN pg_class table_class ON table_class.oid = i.indrelid
+        JOIN pg_class index_class ON index_class.oid = i.indexrelid
+        WHERE table_class.relname = ANY(:names)
+          AND table_class.relnamespace = current_schema()::regnamespace
+          AND NOT i.indisprimary AND NOT i.indisunique
+          AND NOT EXISTS (SELECT 1 FROM pg_constraint c WHERE c.conindid = i.indexrelid)
+          AND NOT EXISTS (SELECT 1 FROM pg_inherits h WHERE h.inhrelid = i.indexrelid)
+    '''), {'names': list(names)}).all()
+    # Constraints of partitions are inherited from their parent's and go with it
+    foreign_keys = connection.execute(text('''
+        SELECT conrelid::regclass::text, conname, pg_get_constraintdef(oid)
+        FROM pg_constraint
+        WHERE contype = 'f' AND conparentid = 0
+          AND (conrelid::regclass::text = ANY(:names) OR confrelid::regclass::text = ANY(:names))
+    '''), {'names': list(names)}).all()
+    return indexes, foreign_keys
+
+def _deferred_sqlite(connection, names):
+    # Unique indexes stay: they are part of the data's validity, not just speed
+    indexes = connection.execute(text(
+        "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL "
+        "AND tbl_name IN :names AND sql NOT LIKE 'CREATE UNIQUE%'"
+    ).bindparams(bindparam('names', expanding=True)), {'names': list(names)}).all()
+    # SQLite only enforces foreign keys when asked to, and cannot drop them
+    return indexes, []
+
+def _drop_deferred(connection, indexes, foreign_keys):
+    for table, name, _ in foreign_keys:
+        connection.execute(text(f'ALTER TABLE {table} DROP CONSTRAINT "{name}"'))
+    for name, _ in indexes:
+        connection.execute(text(f'DROP INDEX IF EXISTS "{name}"'))
+
+def _recreate_deferred(connection, indexes, foreign_keys):
+    for _, definition in indexes:
+        # A partitioned table's index is reported as ON ONLY, which would skip the partitions
+        connection.execute(text(definition.replace(' ON ONLY ', ' ON ')))
+    for table, name, definition in foreign_keys:
+        connection.execute(text(f'ALTER TABLE {table} ADD CONSTRAINT "{name}" {definition}'))
+
+# Moving staged rows in
+
+def _password_source(connection):
+    """Current password hashes keyed by username, staged so the users INSERT can look them up"""
+    users = _tables()['users']
+    passwords = Table(STAGING_PREFIX + 'passwords', MetaData(),
+                      Column('username', users.c.username.type), Column('password_hash', users.c.password_hash.type),
+                      prefixes=['TEMPORARY'])
+    passwords.create(connection)
+    connection.execute(insert(passwords).from_select(
+        ['username', 'password_hash'], select(users.c.username, users.c.password_hash)
+    ))
+    return passwords
+
+def _fill(target, column, staging, passwords):
+    """Value for a column the archive does not carry"""
+    if target.name == 'users' and column.name == 'password_hash':
+        return func.coalesce(
+            select(passwords.c.password_hash).where(passwords.c.username == staging.c.username)
+            .scalar_subquery(), UNUSABLE_PASSWORD
+        )
+    if column.server_default is None and column.default is not None and column.default.is_scalar:
+        return literal(column.default.arg, column.type)
+    return None
+
+def _move_in(connection, target, staging, passwords):
+    names, values = [], []
+    for column in target.columns:
+        if column.name in staging.c:
+            names.append(column.name)
+            values.append(staging.c[column.name])
+            continue
+        value = _fill(target, column, staging, passwords)
+        if value is not None:
+            names.append(column.name)
+            values.append(value)
+    connection.execute(insert(target).from_select(names, select(*values)))
+
+def _repair_references(connection):
+    """Point or drop references to rows the archive did not contain, before the foreign keys return"""
+    tables = _tables()
+    files, projects, tags = tables['files'], tables['projects'], tables['tags']
+    file_tags, search_logs, users = tables['file_tags'], tables['search_logs'], tables['users']
+    connection.execute(update(files).where(files.c.project_id.isnot(None),
+                                           files.c.project_id.notin_(select(projects.c.id)))
+                       .values(project_id=None))
+    connection.execute(delete(file_tags).where((file_tags.c.file_id.notin_(select(files.c.id)))
+                                               | (file_tags.c.tag_id.notin_(select(tags.c.id)))))
+    connection.execute(update(search_logs).where(search_logs.c.user_id.isnot(None),
+                                                 search_logs.c.user_id.notin_(select(users.c.id)))
+                       .values(user_id=None))
+
+def _reset_sequences(connection, targets):
+    """Move serial sequences past the restored ids (PostgreSQL)"""
+    for target in targets:
+        key = list(target.primary_key.columns)
+        if len(key) != 1 or not key[0].autoincrement or not isinstance(key[0].type, Integer):
+            continue
+        connection.execute(text(
+            f'SELECT setval(pg_get_serial_sequence(:table, :column), '
+            f'COALESCE((SELECT MAX("{key[0].name}") FROM "{target.name}"), 0) + 1, false)'
+        ), {'table': target.name, 'column': key[0].name})
+
+def _rebuild_derived(connection):
+    from app.services.stats import refresh_counters
+    from app.services.file_counts import refresh_file_counts
+    from app.services.search_index import bump_generation
+    from app.services.blob_store import reconcile_references
+
+    refresh_counters(connection)
+    refresh_file_counts(connection)
+    reconcile_references(connection)
+    bump_generation(connection)
+    # Search rollups start over from the restored search_logs on the next rollup run
+
+def restore_database(engine, archive, manifest, progress=None):
+    """
+    Replace the archived tables with the archive's contents (manifest: the
+    'database' section written by db_archive.export_database). Nothing is
+    changed unless the whole restore succeeds. progress(message) is called
+    as each step finishes. Returns rows per table, timings and the number of
+    restored users left without a usable password.
+    """
+    tables = _tables()
+    entries = [entry for entry in manifest['tables'] if entry['table'] in tables]
+    targets = [tables[entry['table']] for entry in entries]
+    derived = [tables[name] for name in DERIVED_TABLES if name in tables]
+    report = progress or (lambda message: None)
+    timings, restored = {}, {}
+
+    # COPYs, INSERT ... SELECTs, index builds and FK validation of whole
+    # tables: none of them fits DB_STATEMENT_TIMEOUT_MS on a real database
+    with maintenance_engine(engine).begin() as connection:
+        postgres = connection.dialect.name == 'postgresql'
+
+        started = time.perf_counter()
+        stagings = {}
+        for entry, target in zip(entries, targets):
+            staging = _staging_table(target, entry['columns'])
+            staging.create(connection)
+            load = _copy_in if postgres else _insert_batches
+            restored[target.name] = load(connection, archive, entry, staging)
+            stagings[target.name] = staging
+            report(f"{target.name}: {restored[target.name]} rows staged")
+        passwords = _password_source(connection) if 'users' in stagings else None
+        timings['stage'] = time.perf_counter() - started
+
+        started = time.perf_counter()
+        names = [table.name for table in targets + derived]
+        indexes, foreign_keys = (_deferred_postgresql if postgres else _deferred_sqlite)(connection, names)
+        _drop_deferred(connection, indexes, foreign_keys)
+        if postgres:
+            connection.execute(text(f'TRUNCATE {", ".join(names)} RESTART IDENTITY'))
+        else:
+            for table in reversed(targets + derived):
+                connection.execute(delete(table))
+        for target in targets:
+            _move_in(connection, target, stagings[target.name], passwords)
+        report("Staged rows moved in")
+        timings['swap'] = time.perf_counter() - started
+
+        started = time.perf_counter()
+        _repair_references(connection)
+        _recreate_deferred(connection, indexes, foreign_keys)
+        if postgres:
+            _reset_sequences(connection, targets)
+        report(f"{len(indexes)} indexes and {len(foreign_keys)} foreign keys rebuilt")
+        timings['rebuild'] = time.perf_counter() - started
+
+        started = time.perf_counter()
+        _rebuild_derived(connection)
+        timings['derived'] = time.perf_counter() - started
+
+        without_password = 0
+        if 'users' in stagings:
+            users = tables['users']
+            without_password = connection.execute(
+                select(func.count()).select_from(users).where(users.c.password_hash == UNUSABLE_PASSWORD)
+            ).scalar()
+        for staging in list(stagings.values()) + ([passwords] if passwords is not None else []):
+            staging.drop(connection)
+
+    return {
+        'tables': restored,
+        'users_without_password': without_password,
+        'seconds': {step: round(value, 3) for step, value in timings.items()}
+    }
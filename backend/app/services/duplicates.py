@@ -0,0 +1,323 @@
+"""
+Duplicate Detection
+Exact duplicates share a content_hash; near-duplicates have SimHash
+signatures (app.utils.similarity) at most SIMHASH_MAX_DISTANCE bits apart.
+The analysis job computes missing signatures, clusters the catalog through
+the signature bands and stores each cluster as files.duplicate_group (the
+lowest file id in it). The admin report and search collapsing read that
+column; single-file lookups go through the band indexes directly.
+"""
+
+import os
+from collections import defaultdict
+from sqlalchemy import select, update, func, or_, text, bindparam
+from app.utils import similarity
+
+MAX_DISTANCE = min(int(os.getenv('SIMHASH_MAX_DISTANCE', 5)), similarity.MAX_DISTANCE)
+
+# Only the start of very large files is used for their signature
+SIGNATURE_MAX_BYTES = int(os.getenv('SIMHASH_MAX_KB', 256)) * 1024
+
+# Signatures computed per analysis run for files indexed without one
+BACKFILL_BATCH = int(os.getenv('SIMHASH_BACKFILL_BATCH', 2000))
+
+# Files read per query by the analysis
+ANALYSIS_PAGE = int(os.getenv('DUPLICATE_ANALYSIS_PAGE', 5000))
+
+def file_signature(path):
+    """Signed SimHash of a file, as stored in files.simhash"""
+    return similarity.to_signed(similarity.file_simhash(path, SIGNATURE_MAX_BYTES))
+
+def scan_signature(scan):
+    """file_signature() from a ContentScan made with head_bytes=SIGNATURE_MAX_BYTES, without rereading"""
+    return similarity.to_signed(similarity.content_simhash(scan.head[:SIGNATURE_MAX_BYTES]))
+
+def _files():
+    from app.models import File
+    return File.__table__
+
+def backfill_signatures(connection, limit=BACKFILL_BATCH):
+    """Compute signatures for active files that have none yet"""
+    files = _files()
+    rows = connection.execute(
+        select(files.c.id, files.c.filepath)
+        .where(files.c.is_active == True, files.c.simhash.is_(None))
+        .order_by(files.c.id).limit(limit)
+    ).all()
+    if rows:
+        connection.execute(
+            update(files).where(files.c.id == bindparam('target_id')).values(simhash=bindparam('signature')),
+            [{'target_id': file_id, 'signature': file_signature(filepath)} for file_id, filepath in rows]
+        )
+    return len(rows)
+
+def cluster(rows, max_distance=MAX_DISTANCE):
+    """
+    {file id: group id} for files with at least one exact or near duplicate.
+    rows: [(id, simhash, content_hash)]. Only signatures sharing a band
+    value are compared, so the work grows with bucket sizes, not n squared.
+    """
+    parent = {}
+
+    def find(item):
+        while parent[item] != item:
+            parent[item] = parent[parent[item]]
+            item = parent[item]
+        return item
+
+    def union(a, b):
+        a, b = find(a), find(b)
+        if a != b:
+            parent[max(a, b)] = min(a, b)
+
+    by_hash, by_signature = {}, {}
+    for file_id, signature, content_hash in rows:
+        parent[file_id] = file_id
+        if content_hash:
+            union(file_id, by_hash.setdefault(content_hash, file_id))
+        if signature is not None and signature != similarity.NO_SIGNATURE:
+            union(file_id, by_signature.setdefault(similarity.to_unsigned(signature), file_id))
+
+    if max_distance > 0:
+        signature_bands = {signature: similarity.bands(signature) for signature in by_signature}
+        for band in range(len(similarity.BAND_WIDTHS)):
+            buckets = defaultdict(list)
+            for signature, values in signature_bands.items():
+                buckets[values[band]].append(signature)
+            for members in buckets.values():
+                for position, signature in enumerate(members):
+                    for other in members[position + 1:]:
+                        if similarity.distance(signature, other) <= max_distance:
+                            union(by_signature[signature], by_signature[other])
+
+    groups = defaultdict(list)
+    for file_id in parent:
+        groups[find(file_id)].append(file_id)
+    return {file_id: group for group, members in groups.items() if len(members) > 1 for file_id in members}
+
+def _active_pages(connection, *columns):
+    """Active files in id order, ANALYSIS_PAGE rows per query (keyset pagination)"""
+    files = _files()
+    last_id = 0
+    while True:
+        rows = connection.execute(
+            select(files.c.id, *columns)
+            .where(files.c.is_active == True, files.c.id > last_id)
+            .order_by(files.c.id).limit(ANALYSIS_PAGE)
+        ).all()
+        if not rows:
+            return
+        yield rows
+        last_id = rows[-1].id
+
+def analyze_duplicates(connection):
+    """
+    Scheduled job: fill in signatures, recluster and store duplicate_group
+    where it changed. The catalog is read a page at a time and only files
+    that can match anything (a hash or a signature) are kept for clustering,
+    so the job's memory grows with those tuples rather than with full rows.
+    """
+    files = _files()
+    computed = backfill_signatures(connection)
+
+    counted = {'files': 0}
+
+    def candidates():
+        for rows in _active_pages(connection, files.c.simhash, files.c.content_hash):
+            counted['files'] += len(rows)
+            for file_id, signature, content_hash in rows:
+                if content_hash or (signature is not None and signature != similarity.NO_SIGNATURE):
+                    yield file_id, signature, content_hash
+
+    groups = cluster(candidates())
+
+    changed = 0
+    for rows in _active_pages(connection, files.c.duplicate_group):
+        changes = [{'target_id': file_id, 'group': groups.get(file_id)}
+                   for file_id, group in rows if groups.get(file_id) != group]
+        if changes:
+            connection.execute(
+                update(files).where(files.c.id == bindparam('target_id')).values(duplicate_group=bindparam('group')),
+                changes
+            )
+            changed += len(changes)
+    connection.execute(
+        update(files).where(files.c.is_active == False, files.c.duplicate_group.isnot(None))
+        .values(duplicate_group=None)
+    )
+
+    return {
+        'signatures_computed': computed,
+        'files': counted['files'],
+        'groups': len(set(groups.values())),
+        'files_in_groups': len(groups),
+        'files_changed': changed
+    }
+
+def _describe(row, projects):
+    return {
+        'id': row.id,
+        'filename': row.filename,
+        'filepath': row.filepath,
+        'project': projects.get(row.project_id),
+        'size': row.size
+    }
+
+def _project_names(connection, project_ids):
+    from app.models import Project
+
+    projects = Project.__table__
+    ids = [project_id for project_id in set(project_ids) if project_id is not None]
+    if not ids:
+        return {}
+    return dict(connection.execute(select(projects.c.id, projects.c.name).where(projects.c.id.in_(ids))).all())
+
+def _member_columns(files):
+    return (files.c.id, files.c.filename, files.c.filepath, files.c.project_id, files.c.size,
+            files.c.content_hash, files.c.simhash, files.c.duplicate_group)
+
+def exact_duplicates(connection, project_id=None, page=1, per_page=20):
+    """Sets of active files with identical content, most wasted bytes first"""
+    files = _files()
+    active = [files.c.is_active == True, files.c.content_hash.isnot(None)]
+    if project_id is not None:
+        active.append(files.c.content_hash.in_(
+            select(files.c.content_hash).where(files.c.project_id == project_id, files.c.is_active == True)
+        ))
+
+    copies = func.count().label('copies')
+    size = func.max(files.c.size).label('size')
+    grouped = (select(files.c.content_hash, copies, size)
+               .where(*active).group_by(files.c.content_hash).having(func.count() > 1))
+    summary = grouped.subquery()
+    total, wasted = connection.execute(select(
+        func.count(), func.coalesce(func.sum((summary.c.copies - 1) * summary.c.size), 0)
+    )).one()
+    sets = connection.execute(
+        grouped.order_by(((copies - 1) * size).desc(), files.c.content_hash)
+        .limit(per_page).offset((page - 1) * per_page)
+    ).all()
+
+    members = connection.execute(
+        select(*_member_columns(files))
+        .where(files.c.is_active == True, files.c.content_hash.in_([row.content_hash for row in sets]))
+        .order_by(files.c.id)
+    ).all() if sets else []
+    projects = _project_names(connection, [row.project_id for row in members])
+    by_hash = defaultdict(list)
+    for row in members:
+        by_hash[row.content_hash].append(_describe(row, projects))
+
+    return {
+        'groups': [{
+            'content_hash': row.content_hash,
+            'copies': row.copies,
+            'size': row.size,
+            'wasted_bytes': (row.copies - 1) * (row.size or 0),
+            'files': by_hash[row.content_hash]
+        } for row in sets],
+        'total': total,
+        'wasted_bytes': int(wasted),
+        'page': page,
+        'per_page': per_page
+    }
+
+def similar_groups(connection, project_id=None, page=1, per_page=20):
+    """Clusters recorded by the last analysis (exact and near duplicates), largest first"""
+    files = _files()
+    conditions = [files.c.is_active == True, files.c.duplicate_group.isnot(None)]
+    if project_id is not None:
+        conditions.append(files.c.duplicate_group.in_(
+            select(files.c.duplicate_group).where(files.c.project_id == project_id)
+        ))
+
+    members_count = func.count().label('files')
+    grouped = select(files.c.duplicate_group, members_count).where(*conditions).group_by(files.c.duplicate_group)
+    total = connection.execute(select(func.count()).select_from(grouped.subquery())).scalar()
+    clusters = connection.execute(
+        grouped.order_by(members_count.desc(), files.c.duplicate_group)
+        .limit(per_page).offset((page - 1) * per_page)
+    ).all()
+
+    members = connection.execute(
+        select(*_member_columns(files))
+        .where(files.c.is_active == True, files.c.duplicate_group.in_([row.duplicate_group for row in clusters]))
+        .order_by(files.c.id)
+    ).all() if clusters else []
+    projects = _project_names(connection, [row.project_id for row in members])
+    by_group = defaultdict(list)
+    for row in members:
+        by_group[row.duplicate_group].append(row)
+
+    groups = []
+    for row in clusters:
+        rows = by_group[row.duplicate_group]
+        # Distances are reported against the cluster's first file
+        first = rows[0]
+        described = []
+        for member in rows:
+            entry = _describe(member, projects)
+            entry['exact'] = member.content_hash == first.content_hash
+            entry['distance'] = (similarity.distance(member.simhash, first.simhash)
+                                 if member.simhash and first.simhash else None)
+            described.append(entry)
+        groups.append({
+            'group': row.duplicate_group,
+            'files': described,
+            'projects': sorted({entry['project'] for entry in described if entry['project']})
+        })
+
+    return {'groups': groups, 'total': total, 'page': page, 'per_page': per_page}
+
+def similar_files(connection, file_id, max_distance=MAX_DISTANCE, limit=20):
+    """Active files identical or similar to file_id, closest first (LookupError if missing)"""
+    files = _files()
+    target = connection.execute(
+        select(*_member_columns(files)).where(files.c.id == file_id, files.c.is_active == True)
+    ).first()
+    if target is None:
+        raise LookupError('File not found')
+    max_distance = max(0, min(int(max_distance), similarity.MAX_DISTANCE))
+
+    candidates = []
+    if target.content_hash:
+        candidates.append(files.c.content_hash == target.content_hash)
+    has_signature = target.simhash is not None and target.simhash != similarity.NO_SIGNATURE
+    if has_signature:
+        for index, value in enumerate(similarity.bands(target.simhash)):
+            candidates.append(text(f"{similarity.band_sql(index, 'files.simhash')} = :band{index}")
+                              .bindparams(**{f'band{index}': value}))
+    if not candidates:
+        return {'file_id': file_id, 'max_distance': max_distance, 'results': []}
+
+    rows = connection.execute(
+        select(*_member_columns(files))
+        .where(files.c.id != file_id, files.c.is_active == True, or_(*candidates))
+    ).all()
+
+    matches = []
+    for row in rows:
+        exact = bool(target.content_hash) and row.content_hash == target.content_hash
+        if exact:
+            distance = 0
+        elif has_signature and row.simhash not in (None, similarity.NO_SIGNATURE):
+            distance = similarity.distance(row.simhash, target.simhash)
+            if distance > max_distance:
+                continue
+        else:
+            continue
+        matches.append((distance, not exact, row.id, row, exact))
+    matches.sort(key=lambda match: match[:3])
+    matches = matches[:limit]
+
+    projects = _project_names(connection, [match[3].project_id for match in matches])
+    results = []
+    for distance, _, _, row, exact in matches:
+        entry = _describe(row, projects)
+        entry.update({
+            'exact': exact,
+            'distance': distance,
+            'similarity': round(1 - distance / similarity.BITS, 3)
+        })
+        results.append(entry)
+    return {'file_id': file_id, 'max_distance': max_distance, 'results': results}
@@ -0,0 +1,332 @@
+"""
+Batch File Operations
+Applies a list of create / update / deactivate / move operations to the
+files table in one transaction. Everything the batch refers to (files,
+projects, file paths, tags) is validated with one query per kind, and the
+changes are written with bulk statements grouped by kind. Operations apply
+in order: when several touch the same file, the last value of each field
+wins.
+"""
+
+import os
+from collections import defaultdict
+from datetime import datetime
+from sqlalchemy import select, insert, update, delete, bindparam
+from app.services import blob_store
+from app.services.file_counts import refresh_file_counts
+from app.services.search_index import bump_generation
+from app.services.stats import apply_deltas, file_deltas, FILE_ATTRIBUTES
+
+# Upper bound on operations per request
+MAX_OPERATIONS = int(os.getenv('FILE_BATCH_MAX_OPERATIONS', 5000))
+
+OPERATIONS = ('create', 'update', 'deactivate', 'move')
+
+def _tables():
+    from app.models import File, Project, Tag, file_tags
+    return File.__table__, Project.__table__, Tag.__table__, file_tags
+
+def _chunks(values, size=900):
+    """Slices small enough for IN lists on every backend (sqlite caps bound parameters)"""
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+def _target_ids(operation):
+    ids = operation.get('ids')
+    if ids is None and operation.get('id') is not None:
+        ids = [operation['id']]
+    if not isinstance(ids, list) or not ids:
+        raise ValueError('id or ids is required')
+    return [int(file_id) for file_id in ids]
+
+def _tag_names(operation):
+    tags = operation.get('tags')
+    if tags is None:
+        return None
+    if not isinstance(tags, list) or not all(isinstance(name, str) and name.strip() for name in tags):
+        raise ValueError('tags must be a list of tag names')
+    return list(dict.fromkeys(name.strip() for name in tags))
+
+def _parse(operations):
+    """Shape-check every operation; returns ([parsed or None], {index: error})"""
+    parsed, errors = [], {}
+    for index, operation in enumerate(operations):
+        try:
+            if not isinstance(operation, dict):
+                raise ValueError('operation must be an object')
+            kind = operation.get('op')
+            if kind not in OPERATIONS:
+                raise ValueError(f'op must be one of: {", ".join(OPERATIONS)}')
+
+            item = {'op': kind}
+            if kind == 'create':
+                for field in ('filename', 'filepath', 'project_id'):
+                    if not operation.get(field):
+                        raise ValueError(f'{field} is required')
+                modified = operation.get('modified_date')
+                item.update({
+                    'filename': operation['filename'],
+                    'filepath': operation['filepath'],
+                    'project_id': int(operation['project_id']),
+                    'description': operation.get('description', ''),
+                    'size': int(operation.get('size', 0) or 0),
+                    'line_count': int(operation.get('line_count', 0) or 0),
+                    'modified_date': datetime.fromisoformat(modified) if modified else datetime.utcnow(),
+                    'tags': _tag_names(operation) or []
+                })
+            elif kind == 'update':
+                item['ids'] = _target_ids(operation)
+                if len(item['ids']) != 1:
+                    raise ValueError('update takes a single id')
+                if 'description' in operation:
+                    item['description'] = operation['description']
+                if operation.get('project_id') is not None:
+                    item['project_id'] = int(operation['project_id'])
+                item['tags'] = _tag_names(operation)
+            elif kind == 'deactivate':
+                item['ids'] = _target_ids(operation)
+            else:
+                item['ids'] = _target_ids(operation)
+                if operation.get('project_id') is None:
+                    raise ValueError('project_id is required')
+                item['project_id'] = int(operation['project_id'])
+            parsed.append(item)
+        except (TypeError, ValueError) as e:
+            parsed.append(None)
+            errors[index] = str(e)
+    return parsed, errors
+
+def _load_references(connection, parsed):
+    """One query each for the files, projects and file paths the batch refers to"""
+    files, projects, _, _ = _tables()
+    file_ids, project_ids, filepaths = set(), set(), set()
+    for item in parsed:
+        if item is None:
+            continue
+        file_ids.update(item.get('ids', ()))
+        if item.get('project_id') is not None:
+            project_ids.add(item['project_id'])
+        if item['op'] == 'create':
+            filepaths.add(item['filepath'])
+
+    existing_files = {}
+    for chunk in _chunks(sorted(file_ids)):
+        for row in connection.execute(
+            select(files.c.id, *[files.c[name] for name in FILE_ATTRIBUTES]).where(files.c.id.in_(chunk))
+        ):
+            existing_files[row[0]] = tuple(row[1:])
+
+    active_projects = set()
+    for chunk in _chunks(sorted(project_ids)):
+        active_projects.update(connection.execute(
+            select(projects.c.id).where(projects.c.id.in_(chunk), projects.c.is_active == True)
+        ).scalars())
+
+    taken_paths = set()
+    for chunk in _chunks(sorted(filepaths)):
+        taken_paths.update(connection.execute(
+            select(files.c.filepath).where(files.c.filepath.in_(chunk))
+        ).scalars())
+
+    return existing_files, active_projects, taken_paths
+
+def _validate(parsed, errors, existing_files, active_projects, taken_paths):
+    seen_paths = set()
+    for index, item in enumerate(parsed):
+        if item is None:
+            continue
+        missing = [file_id for file_id in item.get('ids', ()) if file_id not in existing_files]
+        if missing:
+            errors[index] = f'files not found: {missing[:20]}'
+        elif item.get('project_id') is not None and item['project_id'] not in active_projects:
+            errors[index] = f"project {item['project_id']} not found"
+        elif item['op'] == 'create':
+            if item['filepath'] in taken_paths:
+                errors[index] = 'file already exists in the system'
+            elif item['filepath'] in seen_paths:
+                errors[index] = 'filepath repeated in this batch'
+            seen_paths.add(item['filepath'])
+
+def _resolve_tags(connection, names):
+    """{name: id} for the given tag names, creating the missing tags"""
+    _, _, tags, _ = _tables()
+    resolved = {}
+    for chunk in _chunks(sorted(names)):
+        resolved.update(connection.execute(select(tags.c.name, tags.c.id).where(tags.c.name.in_(chunk))).all())
+    missing = sorted(set(names) - set(resolved))
+    if missing:
+        now = datetime.utcnow()
+        connection.execute(insert(tags), [
+            {'name': name, 'description': 'Auto-created tag', 'created_date': now} for name in missing
+        ])
+        for chunk in _chunks(missing):
+            resolved.update(connection.execute(select(tags.c.name, tags.c.id).where(tags.c.name.in_(chunk))).all())
+    return resolved, len(missing)
+
+def _apply(connection, parsed, existing_files):
+    files, _, _, file_tags = _tables()
+    now = datetime.utcnow()
+
+    # Fold the operations into the final state of each existing file
+    plans = defaultdict(dict)
+    creates = []
+    for item in parsed:
+        if item['op'] == 'create':
+            creates.append(item)
+            continue
+        for file_id in item['ids']:
+            plan = plans[file_id]
+            if item['op'] == 'deactivate':
+                plan['is_active'] = False
+            if 'project_id' in item:
+                plan['project_id'] = item['project_id']
+            if 'description' in item:
+                plan['description'] = item['description']
+            if item.get('tags') is not None:
+                plan['tags'] = item['tags']
+
+    tag_names = {name for item in creates for name in item['tags']}
+    tag_names.update(name for plan in plans.values() for name in plan.get('tags', ()))
+    tag_ids, tags_created = _resolve_tags(connection, tag_names) if tag_names else ({}, 0)
+
+    # Existing files: one statement per kind of change
+    descriptions = [{'target_id': file_id, 'description': plan['description']}
+                    for file_id, plan in sorted(plans.items()) if 'description' in plan]
+    if descriptions:
+        connection.execute(
+            update(files).where(files.c.id == bindparam('target_id'))
+            .values(description=bindparam('description')), descriptions
+        )
+
+    moves = defaultdict(list)
+    for file_id, plan in plans.items():
+        if 'project_id' in plan and plan['project_id'] != existing_files[file_id][3]:
+            moves[plan['project_id']].append(file_id)
+    for project_id, file_ids in sorted(moves.items()):
+        for chunk in _chunks(sorted(file_ids)):
+            connection.execute(update(files).where(files.c.id.in_(chunk)).values(project_id=project_id))
+
+    deactivated = sorted(file_id for file_id, plan in plans.items()
+                         if plan.get('is_active') is False and existing_files[file_id][0] is not False)
+    released = []
+    for chunk in _chunks(deactivated):
+        connection.execute(update(files).where(files.c.id.in_(chunk)).values(is_active=False))
+        released.extend(content_hash for filepath, content_hash in connection.execute(
+            select(files.c.filepath, files.c.content_hash).where(files.c.id.in_(chunk))
+        ) if blob_store.is_blob_backed(filepath))
+    # Deactivated uploads stop referencing their blobs, as a single delete does
+    blob_store.release(connection, released)
+
+    retagged = sorted(file_id for file_id, plan in plans.items() if 'tags' in plan)
+    old_tag_ids = set()
+    for chunk in _chunks(retagged):
+        old_tag_ids.update(connection.execute(
+            select(file_tags.c.tag_id).where(file_tags.c.file_id.in_(chunk)).distinct()
+        ).scalars())
+        connection.execute(delete(file_tags).where(file_tags.c.file_id.in_(chunk)))
+    associations = [{'file_id': file_id, 'tag_id': tag_ids[name]}
+                    for file_id in retagged for name in plans[file_id]['tags']]
+
+    # New files: one multi-row insert; ids are looked up by their unique filepath
+    created_ids = {}
+    if creates:
+        connection.execute(insert(files), [{
+            'filename': item['filename'],
+            'filepath': item['filepath'],
+            'filetype': os.path.splitext(item['filename'])[1].lower(),
+            'project_id': item['project_id'],
+            'description': item['description'],
+            'size': item['size'],
+            'line_count': item['line_count'],
+            'modified_date': item['modified_date'],
+            'indexed_date': now,
+            'is_active': True
+        } for item in creates])
+        for chunk in _chunks([item['filepath'] for item in creates]):
+            created_ids.update(connection.execute(
+                select(files.c.filepath, files.c.id).where(files.c.filepath.in_(chunk))
+            ).all())
+        associations.extend({'file_id': created_ids[item['filepath']], 'tag_id': tag_ids[name]}
+                            for item in creates for name in item['tags'])
+
+    if associations:
+        connection.execute(insert(file_tags), associations)
+
+    # Keep the tables the ORM hooks would have maintained in step
+    changes = []
+    for file_id, plan in plans.items():
+        before = existing_files[file_id]
+        after = (False if plan.get('is_active') is False else before[0], before[1], before[2],
+                 plan.get('project_id', before[3]), before[4])
+        if after != before:
+            changes.append((before, after))
+    changes.extend((None, (True, item['size'], os.path.splitext(item['filename'])[1].lower(),
+                           item['project_id'], now)) for item in creates)
+    deltas = file_deltas(changes)
+    deltas['totals:tags'] += tags_created
+    apply_deltas(connection, deltas)
+
+    affected_projects = {item['project_id'] for item in creates}
+    for before, after in changes:
+        if before is not None:
+            affected_projects.add(before[3])
+        affected_projects.add(after[3])
+    affected_projects.discard(None)
+    affected_tags = old_tag_ids | {association['tag_id'] for association in associations}
+    if deactivated:
+        for chunk in _chunks(deactivated):
+            affected_tags.update(connection.execute(
+                select(file_tags.c.tag_id).where(file_tags.c.file_id.in_(chunk)).distinct()
+            ).scalars())
+    if affected_projects or affected_tags:
+        refresh_file_counts(connection, project_ids=affected_projects, tag_ids=affected_tags)
+    bump_generation(connection)
+
+    return created_ids, {
+        'created': len(creates),
+        'updated': len({row['target_id'] for row in descriptions} | set(retagged)),
+        'moved': sum(len(file_ids) for file_ids in moves.values()),
+        'deactivated': len(deactivated),
+        'tags_created': tags_created
+    }
+
+def run_batch(connection, operations, atomic=True):
+    """
+    Validate and apply a batch of file operations on connection (inside the
+    caller's transaction). With atomic=True nothing is written when any
+    operation is invalid; otherwise the valid operations are applied.
+    """
+    if not isinstance(operations, list) or not operations:
+        raise ValueError('operations must be a non-empty list')
+    if not isinstance(atomic, bool):
+        raise ValueError('atomic must be true or false')
+    if len(operations) > MAX_OPERATIONS:
+        raise ValueError(f'at most {MAX_OPERATIONS} operations per batch')
+
+    parsed, errors = _parse(operations)
+    existing_files, active_projects, taken_paths = _load_references(connection, parsed)
+    _validate(parsed, errors, existing_files, active_projects, taken_paths)
+
+    applied = not (errors and atomic)
+    created_ids, summary = {}, {}
+    if applied:
+        valid = [item for index, item in enumerate(parsed) if index not in errors]
+        if valid:
+            created_ids, summary = _apply(connection, valid, existing_files)
+
+    results = []
+    for index, item in enumerate(parsed):
+        if index in errors:
+            results.append({'index': index, 'status': 'error', 'error': errors[index]})
+        elif not applied:
+            results.append({'index': index, 'status': 'skipped'})
+        else:
+            result = {'index': index, 'status': 'ok', 'op': item['op']}
+            if item['op'] == 'create':
+                result['file_id'] = created_ids.get(item['filepath'])
+            else:
+                result['file_ids'] = item['ids']
+            results.append(result)
+
+    return {'applied': applied, 'errors': len(errors), 'summary': summary, 'results': results}
@@ -0,0 +1,129 @@
+"""
+Per-Project and Per-Tag File Counts
+Maintains the active_file_count columns on projects and tags so the public
+project and tag listings are a single query. ORM flushes apply +/- deltas in
+the same transaction (no read-modify-write, so concurrent writers cannot
+lose updates); set-based SQL calls refresh_file_counts for the ids it touched,
+and a scheduled full refresh repairs any drift.
+"""
+
+from collections import Counter
+from sqlalchemy import event, select, update, func, bindparam
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import get_history, PASSIVE_NO_INITIALIZE
+
+def _before_after(instance, attribute):
+    history = get_history(instance, attribute)
+    if history.added or history.deleted:
+        return (history.deleted[0] if history.deleted else None,
+                history.added[0] if history.added else None)
+    value = getattr(instance, attribute)
+    return value, value
+
+def _tag_history(instance, load):
+    """(tag ids before, tag ids after) of a file's tags collection in this flush"""
+    history = get_history(instance, 'tags', passive=PASSIVE_NO_INITIALIZE)
+    if load and not (history.unchanged or history.added or history.deleted):
+        history = get_history(instance, 'tags')
+    unchanged = [tag.id for tag in history.unchanged or ()]
+    before = unchanged + [tag.id for tag in history.deleted or ()]
+    after = unchanged + [tag.id for tag in history.added or ()]
+    return before, after
+
+def _contribute(project_deltas, tag_deltas, project_id, tag_ids, sign):
+    if project_id is not None:
+        project_deltas[project_id] += sign
+    for tag_id in tag_ids:
+        if tag_id is not None:
+            tag_deltas[tag_id] += sign
+
+def _collect_deltas(session):
+    from app.models import File
+
+    project_deltas, tag_deltas = Counter(), Counter()
+
+    for instance in session.new:
+        if isinstance(instance, File) and instance.is_active is not False:
+            _contribute(project_deltas, tag_deltas, instance.project_id,
+                        [tag.id for tag in instance.tags], 1)
+
+    for instance in session.dirty:
+        if not isinstance(instance, File):
+            continue
+        old_active, new_active = _before_after(instance, 'is_active')
+        old_project, new_project = _before_after(instance, 'project_id')
+        activity_changed = (old_active is not False) != (new_active is not False)
+        # The tags collection is only loaded when the file's activity flips
+        old_tags, new_tags = _tag_history(instance, load=activity_changed)
+        if not activity_changed and old_project == new_project and old_tags == new_tags:
+            continue
+        if old_active is not False:
+            _contribute(project_deltas, tag_deltas, old_project, old_tags, -1)
+        if new_active is not False:
+            _contribute(project_deltas, tag_deltas, new_project, new_tags, 1)
+
+    for instance in session.deleted:
+        if isinstance(instance, File):
+            old_active, _ = _before_after(instance, 'is_active')
+            if old_active is not False:
+                old_project, _ = _before_after(instance, 'project_id')
+                old_tags, _ = _tag_history(instance, load=True)
+                _contribute(project_deltas, tag_deltas, old_project, old_tags, -1)
+
+    return project_deltas, tag_deltas
+
+def _apply(connection, table, deltas):
+    rows = [{'target_id': key, 'delta': amount} for key, amount in sorted(deltas.items()) if amount]
+    if rows:
+        connection.execute(
+            update(table)
+            .where(table.c.id == bindparam('target_id'))
+            .values(active_file_count=table.c.active_file_count + bindparam('delta')),
+            rows
+        )
+
+def _after_flush(session, flush_context):
+    from app.models import Project, Tag
+
+    project_deltas, tag_deltas = _collect_deltas(session)
+    if project_deltas or tag_deltas:
+        connection = session.connection()
+        _apply(connection, Project.__table__, project_deltas)
+        _apply(connection, Tag.__table__, tag_deltas)
+
+def install_file_count_tracking():
+    """Keep active_file_count in step with ORM changes to files and their tags"""
+    if not event.contains(Session, 'after_flush', _after_flush):
+        event.listen(Session, 'after_flush', _after_flush)
+
+def refresh_file_counts(connection, project_ids=None, tag_ids=None):
+    """Recompute active_file_count for the given ids (all rows when both are None)"""
+    from app.models import Project, Tag, File, file_tags
+
+    everything = project_ids is None and tag_ids is None
+    files = File.__table__
+    updated = 0
+
+    if everything or project_ids:
+        projects = Project.__table__
+        statement = update(projects).values(active_file_count=(
+            select(func.count()).select_from(files)
+            .where(files.c.project_id == projects.c.id, files.c.is_active == True)
+            .scalar_subquery()
+        ))
+        if not everything:
+            statement = statement.where(projects.c.id.in_(sorted(set(project_ids))))
+        updated += connection.execute(statement).rowcount
+
+    if everything or tag_ids:
+        tags = Tag.__table__
+        statement = update(tags).values(active_file_count=(
+            select(func.count()).select_from(file_tags.join(files, files.c.id == file_tags.c.file_id))
+            .where(file_tags.c.tag_id == tags.c.id, files.c.is_active == True)
+            .scalar_subquery()
+        ))
+        if not everything:
+            statement = statement.where(tags.c.id.in_(sorted(set(tag_ids))))
+        updated += connection.execute(statement).rowcount
+
+    return updated
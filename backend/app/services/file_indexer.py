@@ -4,14 +4,25 @@ Scans and indexes files from the code repository
 """
 
 import os
-import hashlib
+import time
 import mimetypes
 from datetime import datetime
 from pathlib import Path
-from app.models import File, Project, Tag, db
-import chardet
+from sqlalchemy import select, update, or_
+from app.models import File, Project, Tag, file_tags, db
+from app.services.duplicates import SIGNATURE_MAX_BYTES, file_signature, scan_signature
+from app.services.file_counts import refresh_file_counts
+from app.services.search_index import bump_generation
+from app.services.stats import apply_deltas, file_deltas, FILE_ATTRIBUTES
+from app.utils.hashing import scan_file
 from flask import current_app
 
+# Seen paths stamped with the scan generation per statement
+STAMP_BATCH_SIZE = 500
+
+def _escape_like(value):
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
 class FileIndexer:
     def __init__(self):
         # Get allowed extensions from environment or use default list
@@ -23,6 +34,9 @@ class FileIndexer:
         self.updated_count = 0
         self.errors = []
         self.skipped_count = 0
+        self.deactivated_count = 0
+        self.scan_generation = None
+        self._seen_paths = []
     
     def _parse_size(self, size_str):
         """Parse size string to bytes"""
@@ -46,32 +60,15 @@ class FileIndexer:
             if size > self.max_file_size:
                 return None
             
-            # Count lines for text files
-            line_count = 0
-            try:
-                # Detect encoding
-                with open(filepath, 'rb') as f:
-                    raw_data = f.read(min(10000, size))  # Read first 10KB
-                    detected = chardet.detect(raw_data)
-                    encoding = detected['encoding'] or 'utf-8'
-                
-                # Count lines
-                with open(filepath, 'r', encoding=encoding, errors='replace') as f:
-                    line_count = sum(1 for _ in f)
-            except:
-                line_count = 0
-            
-            # Calculate file hash
-            hasher = hashlib.sha256()
-            with open(filepath, 'rb') as f:
-                while chunk := f.read(8192):
-                    hasher.update(chunk)
+            # One read of the file yields its line count, hash and signature
+            scan = scan_file(filepath, SIGNATURE_MAX_BYTES)
             
             return {
-                'size': size,
-                'line_count': line_count,
+                'size': scan.size,
+                'line_count': scan.line_count,
                 'modified_date': modified_date,
-                'content_hash': hasher.hexdigest()
+                'content_hash': scan.hexdigest(),
+                'simhash': scan_signature(scan)
             }
         except Exception as e:
             self.errors.append(f"Error reading {filepath}: {str(e)}")
@@ -194,15 +191,52 @@ class FileIndexer:
         # Remove duplicates
         return list(set(tags))
     
-    def index_file(self, filepath, base_path, project_id=None):
-        """Index a single file"""
+    def _signature(self, filepath, file_info):
+        """Near-duplicate signature, unless file_info already carries one"""
+        if 'simhash' in file_info:
+            return file_info['simhash']
+        return file_signature(filepath)
+    
+    def _refresh_existing(self, existing, file_info, project):
+        """Reactivate or update an already indexed file; returns True when it changed"""
+        if not existing.is_active:
+            # This is a ghost file (deleted but exists on disk) - reactivate it!
+            existing.is_active = True
+            existing.size = file_info['size']
+            existing.line_count = file_info['line_count']
+            existing.modified_date = file_info['modified_date']
+            existing.content_hash = file_info['content_hash']
+            existing.simhash = self._signature(existing.filepath, file_info)
+            existing.indexed_date = datetime.utcnow()
+            existing.project_id = project.id
+            self.updated_count += 1
+            print(f"👻 Reactivated ghost file: {existing.filepath}")
+            return True
+        
+        # File is active, check if it needs updating
+        if existing.content_hash != file_info['content_hash']:
+            existing.size = file_info['size']
+            existing.line_count = file_info['line_count']
+            existing.modified_date = file_info['modified_date']
+            existing.content_hash = file_info['content_hash']
+            existing.simhash = self._signature(existing.filepath, file_info)
+            existing.indexed_date = datetime.utcnow()
+            self.updated_count += 1
+            print(f"Updated: {existing.filepath}")
+            return True
+        
+        print(f"Already indexed (no changes): {existing.filepath}")
+        return False
+    
+    def index_file(self, filepath, base_path, project_id=None, file_info=None):
+        """Index a single file (file_info skips re-reading a file whose details are already known)"""
         try:
             if not self._should_index_file(filepath):
                 self.skipped_count += 1
                 return False
             
             # Get file info
-            file_info = self._get_file_info(filepath)
+            file_info = file_info or self._get_file_info(filepath)
             if not file_info:
                 self.skipped_count += 1
                 return False
@@ -231,31 +265,8 @@ class FileIndexer:
             existing = File.query.filter_by(filepath=filepath).first()
             
             if existing:
-                if not existing.is_active:
-                    # This is a ghost file (deleted but exists on disk) - reactivate it!
-                    existing.is_active = True
-                    existing.size = file_info['size']
-                    existing.line_count = file_info['line_count']
-                    existing.modified_date = file_info['modified_date']
-                    existing.content_hash = file_info['content_hash']
-                    existing.indexed_date = datetime.utcnow()
-                    existing.project_id = project.id
-                    self.updated_count += 1
-                    print(f"👻 Reactivated ghost file: {filepath}")
-                    return True
-                else:
-                    # File is active, check if it needs updating
-                    if existing.content_hash != file_info['content_hash']:
-                        existing.size = file_info['size']
-                        existing.line_count = file_info['line_count']
-                        existing.modified_date = file_info['modified_date']
-                        existing.content_hash = file_info['content_hash']
-                        existing.indexed_date = datetime.utcnow()
-                        self.updated_count += 1
-                        print(f"Updated: {filepath}")
-                    else:
-                        print(f"Already indexed (no changes): {filepath}")
-                    return True
+                self._refresh_existing(existing, file_info, project)
+                return True
             
             # Create new file record
             filename = os.path.basename(filepath)
@@ -270,7 +281,8 @@ class FileIndexer:
                 line_count=file_info['line_count'],
                 modified_date=file_info['modified_date'],
                 content_hash=file_info['content_hash'],
-                description=f"Auto-indexed from {project_name}"
+                simhash=self._signature(filepath, file_info),
+                description=f"Auto-indexed from {project.name}"
             )
             
             # Auto-generate and add tags
@@ -296,6 +308,142 @@ class FileIndexer:
             self.errors.append(f"Error indexing {filepath}: {str(e)}")
             return False
     
+    def _resolve_tags(self, names):
+        """{name: Tag} for names, creating missing tags with a single flush"""
+        tags = {}
+        names = sorted(set(names))
+        for start in range(0, len(names), 500):
+            for tag in Tag.query.filter(Tag.name.in_(names[start:start + 500])):
+                tags[tag.name] = tag
+        missing = [name for name in names if name not in tags]
+        for name in missing:
+            tags[name] = Tag(name=name, description="Auto-generated tag")
+        if missing:
+            db.session.add_all([tags[name] for name in missing])
+            db.session.flush()
+        return tags
+    
+    def index_files(self, entries, project, description=None, tag_names=(), auto_tags=True):
+        """
+        Index many files whose details are already known (e.g. just written by an upload).
+        entries: [(filepath, file_info)]. Existing rows are looked up and tags resolved with
+        one query per batch instead of per file. Returns the File rows in entry order;
+        the caller commits.
+        """
+        paths = [filepath for filepath, _ in entries]
+        existing = {}
+        for start in range(0, len(paths), 500):
+            for file in File.query.filter(File.filepath.in_(paths[start:start + 500])):
+                existing[file.filepath] = file
+        
+        wanted = {filepath: list(dict.fromkeys(
+                      [*tag_names, *(self._auto_generate_tags(filepath) if auto_tags else [])]))
+                  for filepath in paths if filepath not in existing}
+        tags = self._resolve_tags(name for names in wanted.values() for name in names)
+        
+        files, new_files = [], []
+        for filepath, file_info in entries:
+            if filepath in existing:
+                self._refresh_existing(existing[filepath], file_info, project)
+                files.append(existing[filepath])
+                continue
+            
+            new_file = File(
+                filename=os.path.basename(filepath),
+                filepath=filepath,
+                filetype=Path(filepath).suffix.lower(),
+                project_id=project.id,
+                size=file_info['size'],
+                line_count=file_info['line_count'],
+                modified_date=file_info['modified_date'],
+                content_hash=file_info['content_hash'],
+                simhash=self._signature(filepath, file_info),
+                description=description if description is not None else f"Auto-indexed from {project.name}"
+            )
+            new_file.tags = [tags[name] for name in wanted[filepath]]
+            new_files.append(new_file)
+            files.append(new_file)
+        
+        db.session.add_all(new_files)
+        db.session.flush()
+        self.indexed_count += len(new_files)
+        return files
+    
+    # Mark and sweep: every file a directory walk sees is stamped with the walk's
+    # generation; afterwards active rows under the root with an older one are gone
+    
+    def _begin_scan(self):
+        # Microseconds since the epoch: increasing across walks, so overlapping
+        # walks never sweep files a later one has seen
+        self.scan_generation = time.time_ns() // 1000
+        self.deactivated_count = 0
+        self._seen_paths = []
+    
+    def _mark_seen(self, filepath):
+        self._seen_paths.append(filepath)
+        if len(self._seen_paths) >= STAMP_BATCH_SIZE:
+            self._stamp_seen()
+    
+    def _stamp_seen(self):
+        """Write the scan generation to the rows of the paths seen since the last stamp"""
+        if not self._seen_paths:
+            return
+        # New File rows must exist before they can be stamped
+        db.session.flush()
+        files = File.__table__
+        # Only ever raise the stamp: an older walk finishing late must not lower
+        # a newer walk's generation and have that walk sweep a file both saw
+        db.session.execute(
+            update(files)
+            .where(files.c.filepath.in_(self._seen_paths),
+                   or_(files.c.scan_generation.is_(None), files.c.scan_generation < self.scan_generation))
+            .values(scan_generation=self.scan_generation)
+        )
+        self._seen_paths = []
+    
+    def _sweep_unseen(self, directory_path):
+        """Deactivate active files under directory_path that the walk did not see; returns how many"""
+        self._stamp_seen()
+        files = File.__table__
+        prefix = _escape_like(directory_path.rstrip(os.sep) + os.sep) + '%'
+        swept = db.session.execute(
+            update(files)
+            .where(files.c.is_active == True, files.c.filepath.like(prefix, escape='\\'),
+                   or_(files.c.scan_generation.is_(None), files.c.scan_generation < self.scan_generation))
+            .values(is_active=False)
+            .returning(files.c.id, *[files.c[name] for name in FILE_ATTRIBUTES])
+        ).all()
+        if not swept:
+            return 0
+        
+        # A set-based UPDATE bypasses the ORM hooks that keep these in step
+        connection = db.session.connection()
+        changes = []
+        for row in swept:
+            after = tuple(getattr(row, name) for name in FILE_ATTRIBUTES)
+            changes.append((tuple(True if name == 'is_active' else value
+                                  for name, value in zip(FILE_ATTRIBUTES, after)), after))
+        apply_deltas(connection, file_deltas(changes))
+        ids = [row.id for row in swept]
+        tag_ids = set()
+        for start in range(0, len(ids), 900):
+            tag_ids.update(connection.execute(
+                select(file_tags.c.tag_id).where(file_tags.c.file_id.in_(ids[start:start + 900])).distinct()
+            ).scalars())
+        refresh_file_counts(connection, project_ids={row.project_id for row in swept} - {None}, tag_ids=tag_ids)
+        bump_generation(connection)
+        print(f"Deactivated {len(swept)} files no longer on disk under {directory_path}")
+        return len(swept)
+    
+    def _finish_scan(self, directory_path, walk_errors):
+        """Sweep after a complete walk; a directory that could not be listed leaves everything as is"""
+        if walk_errors:
+            self._stamp_seen()
+            self.errors.extend(f"Could not read {error.filename}: {error.strerror}" for error in walk_errors)
+            self.errors.append("Skipped deactivating deleted files: the walk was incomplete")
+            return
+        self.deactivated_count = self._sweep_unseen(directory_path)
+    
     def index_directory(self, directory_path, project_id=None):
         """Recursively index all files in a directory"""
         self.indexed_count = 0
@@ -309,12 +457,15 @@ class FileIndexer:
                 'files_indexed': 0,
                 'files_updated': 0,
                 'files_skipped': 0,
+                'files_deactivated': 0,
                 'errors': self.errors
             }
         
         try:
+            self._begin_scan()
+            walk_errors = []
             # Walk through directory
-            for root, dirs, files in os.walk(directory_path):
+            for root, dirs, files in os.walk(directory_path, onerror=walk_errors.append):
                 # Skip hidden directories
                 dirs[:] = [d for d in dirs if not d.startswith('.')]
                 # Skip common non-code directories
@@ -329,11 +480,15 @@ class FileIndexer:
                         self.index_file(filepath, directory_path, project_id)
                     except Exception as e:
                         self.errors.append(f"Error indexing {filepath}: {str(e)}")
+                    # After indexing, so a stamp flushed here includes the file's own row
+                    self._mark_seen(filepath)
                 
                 # Commit batch
                 if (self.indexed_count + self.updated_count) % 100 == 0:
                     db.session.commit()
             
+            self._finish_scan(directory_path, walk_errors)
+            
             # Final commit
             db.session.commit()
             
@@ -345,5 +500,6 @@ class FileIndexer:
             'files_indexed': self.indexed_count,
             'files_updated': self.updated_count,
             'files_skipped': self.skipped_count,
+            'files_deactivated': self.deactivated_count,
             'errors': self.errors
         }
@@ -0,0 +1,319 @@
+"""
+Integrity Verification
+Checks that indexed files still hash to files.content_hash without rereading
+the repository each time. file_verifications remembers the size and mtime a
+file had when it was last hashed; while those are unchanged the recorded
+hash is trusted, and only the remaining files are rehashed, in batches on a
+process pool. Tree verification additionally keeps a Merkle digest per
+directory (directory_digests): a directory whose digest over its files'
+stats and stored hashes is unchanged since it last verified clean is
+accepted as a whole, without even comparing its files one by one.
+"""
+
+import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
+from sqlalchemy import select, delete, or_
+from app.utils import hashing
+from app.utils.upsert import upsert_add
+
+# Hashing processes; 1 hashes in the calling process
+WORKERS = int(os.getenv('INTEGRITY_WORKERS', os.cpu_count() or 1))
+
+# Paths per task sent to a hashing process
+HASH_BATCH_SIZE = 64
+
+# Below this many files the process pool costs more to start than it saves
+POOL_MIN_FILES = int(os.getenv('INTEGRITY_POOL_MIN_FILES', 256))
+
+# Threads used to stat files the tree scan did not reach
+STAT_WORKERS = 16
+
+MERKLE_ENABLED = os.getenv('INTEGRITY_MERKLE', 'True').lower() == 'true'
+
+# Individual problems listed in a tree report; the counts cover everything
+MAX_REPORTED_ISSUES = 100
+
+SKIPPED_DIRECTORIES = {'node_modules', '__pycache__', '.git', 'dist', 'build', 'out'}
+
+def _chunks(values, size=900):
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+def _escape_like(value):
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+def _encode(name):
+    return name.encode('utf-8', 'surrogateescape')
+
+# Reading files
+
+def hash_paths(paths, workers=WORKERS):
+    """[hex digest or None] for paths, on a process pool when there are enough of them"""
+    paths = list(paths)
+    if workers <= 1 or len(paths) < POOL_MIN_FILES:
+        return hashing.hash_files(paths)
+    batches = list(_chunks(paths, HASH_BATCH_SIZE))
+    # spawn, not fork: the web and scheduler processes run threads holding locks
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=min(workers, len(batches)), mp_context=context) as executor:
+        return [digest for batch in executor.map(hashing.hash_files, batches) for digest in batch]
+
+def _stat(path):
+    try:
+        result = os.stat(path)
+    except OSError:
+        return None
+    return result.st_size, result.st_mtime_ns
+
+def stat_paths(paths):
+    """{path: (size, mtime_ns) or None}, stat-ed on a thread pool"""
+    paths = list(paths)
+    if len(paths) <= HASH_BATCH_SIZE:
+        return {path: _stat(path) for path in paths}
+    with ThreadPoolExecutor(max_workers=STAT_WORKERS) as executor:
+        return dict(zip(paths, executor.map(_stat, paths, chunksize=HASH_BATCH_SIZE)))
+
+# File verification
+
+def _verifications(connection, file_ids):
+    from app.models import FileVerification
+
+    table = FileVerification.__table__
+    records = {}
+    for chunk in _chunks(file_ids):
+        for row in connection.execute(
+            select(table.c.file_id, table.c.size, table.c.mtime_ns, table.c.content_hash)
+            .where(table.c.file_id.in_(chunk))
+        ):
+            records[row.file_id] = row
+    return records
+
+def verify_files(connection, rows, stats=None, workers=WORKERS):
+    """
+    Compare rows (id, filepath, content_hash) with the files on disk.
+    stats: {filepath: (size, mtime_ns)} the caller already has; the rest are
+    stat-ed here. Returns counts plus 'mismatches' as [(row, actual hash)]
+    and 'missing' as [row] for files that could not be read.
+    """
+    from app.models import FileVerification
+
+    rows = list(rows)
+    stats = dict(stats or {})
+    stats.update(stat_paths([row.filepath for row in rows if row.filepath not in stats]))
+    records = _verifications(connection, [row.id for row in rows])
+
+    result = {'checked': len(rows), 'proven_by_stat': 0, 'hashed': 0, 'mismatches': [], 'missing': []}
+    stale = []
+    for row in rows:
+        signature = stats.get(row.filepath)
+        record = records.get(row.id)
+        if signature is None:
+            result['missing'].append(row)
+        elif record is not None and (record.size, record.mtime_ns) == signature:
+            # Unchanged since it was last read: the hash recorded then still holds
+            if record.content_hash == row.content_hash:
+                result['proven_by_stat'] += 1
+            else:
+                result['mismatches'].append((row, record.content_hash))
+        else:
+            stale.append(row)
+
+    now = datetime.utcnow()
+    verified = []
+    for row, actual in zip(stale, hash_paths([row.filepath for row in stale], workers)):
+        if actual is None:
+            result['missing'].append(row)
+            continue
+        result['hashed'] += 1
+        size, mtime_ns = stats[row.filepath]
+        # The stat was taken before hashing, so a write racing the read forces a rehash next time
+        verified.append({'file_id': row.id, 'size': size, 'mtime_ns': mtime_ns,
+                         'content_hash': actual, 'verified_date': now})
+        if actual != row.content_hash:
+            result['mismatches'].append((row, actual))
+
+    for chunk in _chunks(verified, 1000):
+        upsert_add(connection, FileVerification.__table__, ['file_id'], chunk, add_columns=[],
+                   replace_columns=['size', 'mtime_ns', 'content_hash', 'verified_date'])
+    return result
+
+# Tree verification
+
+class _Directory:
+    """A scanned directory holding indexed files (directly or below)"""
+    __slots__ = ('path', 'name', 'files', 'children', 'file_count', 'stat_digest')
+
+    def __init__(self, path, name):
+        self.path = path
+        self.name = name
+        self.files = []
+        self.children = []
+        self.file_count = 0
+        self.stat_digest = None
+
+def _scan(path, name, rows, stats):
+    """Directory tree of the indexed files under path, with stat digests computed bottom-up"""
+    node = _Directory(path, name)
+    try:
+        with os.scandir(path) as iterator:
+            entries = sorted(iterator, key=lambda entry: entry.name)
+    except OSError:
+        return node
+
+    for entry in entries:
+        if entry.name.startswith('.'):
+            continue
+        try:
+            if entry.is_dir(follow_symlinks=False):
+                if entry.name not in SKIPPED_DIRECTORIES:
+                    child = _scan(entry.path, entry.name, rows, stats)
+                    if child.file_count:
+                        node.children.append(child)
+            elif entry.path in rows:
+                result = entry.stat()
+                stats[entry.path] = (result.st_size, result.st_mtime_ns)
+                node.files.append((entry.name, rows[entry.path]))
+        except OSError:
+            continue
+
+    hasher = hashing.new_hasher()
+    for name, row in node.files:
+        size, mtime_ns = stats[row.filepath]
+        hasher.update(b'f\0' + _encode(name) + f'\0{size}\0{mtime_ns}\0{row.content_hash}\n'.encode())
+    for child in node.children:
+        hasher.update(b'd\0' + _encode(child.name) + f'\0{child.stat_digest}\n'.encode())
+    node.stat_digest = hasher.hexdigest()
+    node.file_count = len(node.files) + sum(child.file_count for child in node.children)
+    return node
+
+def _tree_rows(connection, root):
+    from app.models import File
+
+    files = File.__table__
+    rows = {}
+    result = connection.execute(
+        select(files.c.id, files.c.filepath, files.c.content_hash)
+        .where(files.c.is_active == True, files.c.content_hash.isnot(None),
+               files.c.filepath.like(_escape_like(root + os.sep) + '%', escape='\\'))
+        .execution_options(yield_per=10000)
+    )
+    for row in result:
+        rows[row.filepath] = row
+    return rows
+
+def _stored_digests(connection, root):
+    from app.models import DirectoryDigest
+
+    table = DirectoryDigest.__table__
+    return {row.path: row for row in connection.execute(
+        select(table.c.path, table.c.stat_digest, table.c.content_digest)
+        .where(or_(table.c.path == root, table.c.path.like(_escape_like(root + os.sep) + '%', escape='\\')))
+    )}
+
+def _mark_seen(node, seen_paths):
+    """Add the paths of every directory below node"""
+    stack = list(node.children)
+    while stack:
+        child = stack.pop()
+        seen_paths.add(child.path)
+        stack.extend(child.children)
+
+def verify_tree(connection, root, merkle=MERKLE_ENABLED, workers=WORKERS):
+    """
+    Verify every active indexed file under root. With merkle, directories
+    whose stat digest matches the one stored when they last verified clean
+    are skipped whole; digests are then rewritten for the clean directories
+    and dropped for the rest. Returns counts, the root's content digest and
+    the first problems found.
+    """
+    from app.models import DirectoryDigest
+
+    root = root.rstrip(os.sep) or os.sep
+    rows = _tree_rows(connection, root)
+    stats = {}
+    tree = _scan(root, os.path.basename(root), rows, stats)
+    stored = _stored_digests(connection, root) if merkle else {}
+
+    proven, pending = set(), []
+    proven_files = 0
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        record = stored.get(node.path)
+        if merkle and record is not None and record.stat_digest == node.stat_digest:
+            proven.add(node.path)
+            proven_files += node.file_count
+            continue
+        pending.extend(row for _, row in node.files)
+        stack.extend(node.children)
+
+    # Indexed files the scan did not reach (hidden or skipped directories, deleted files)
+    pending.extend(row for path, row in rows.items() if path not in stats)
+    result = verify_files(connection, pending, stats, workers)
+
+    actual = {row.id: digest for row, digest in result['mismatches']}
+    bad = set(actual) | {row.id for row in result['missing']}
+    clean_nodes, dirty_paths, seen_paths = [], [], set()
+
+    def finish(node):
+        """(clean, content digest) of a subtree, recording which directories to store"""
+        seen_paths.add(node.path)
+        if node.path in proven:
+            _mark_seen(node, seen_paths)
+            return True, stored[node.path].content_digest
+        clean = True
+        hasher = hashing.new_hasher()
+        for name, row in node.files:
+            clean = clean and row.id not in bad
+            hasher.update(b'f\0' + _encode(name) + f'\0{actual.get(row.id, row.content_hash)}\n'.encode())
+        for child in node.children:
+            child_clean, digest = finish(child)
+            clean = clean and child_clean
+            hasher.update(b'd\0' + _encode(child.name) + f'\0{digest}\n'.encode())
+        content_digest = hasher.hexdigest()
+        if clean:
+            clean_nodes.append({'path': node.path, 'stat_digest': node.stat_digest,
+                                'content_digest': content_digest, 'file_count': node.file_count})
+        else:
+            dirty_paths.append(node.path)
+        return clean, content_digest
+
+    root_clean, root_digest = finish(tree) if tree.file_count else (not bad, None)
+
+    if merkle:
+        table = DirectoryDigest.__table__
+        now = datetime.utcnow()
+        for chunk in _chunks(clean_nodes, 1000):
+            upsert_add(connection, table, ['path'], [dict(node, updated_date=now) for node in chunk],
+                       add_columns=[], replace_columns=['stat_digest', 'content_digest', 'file_count', 'updated_date'])
+        obsolete = dirty_paths + [path for path in stored if path not in seen_paths]
+        for chunk in _chunks(obsolete):
+            connection.execute(delete(table).where(table.c.path.in_(chunk)))
+
+    issues = [{'id': row.id, 'filepath': row.filepath, 'issue': 'hash_mismatch', 'actual_hash': digest}
+              for row, digest in result['mismatches'][:MAX_REPORTED_ISSUES]]
+    issues += [{'id': row.id, 'filepath': row.filepath, 'issue': 'missing'}
+               for row in result['missing'][:MAX_REPORTED_ISSUES - len(issues)]]
+    return {
+        'root': root,
+        'clean': root_clean,
+        'files': len(rows),
+        'directories_proven': len(proven),
+        'proven_by_tree': proven_files,
+        'proven_by_stat': result['proven_by_stat'],
+        'hashed': result['hashed'],
+        'mismatches': len(result['mismatches']),
+        'missing': len(result['missing']),
+        'root_digest': root_digest,
+        'issues': issues
+    }
+
+def verify_roots(connection, merkle=MERKLE_ENABLED):
+    """verify_tree() over the code repository and the upload folder"""
+    from app.services.blob_store import upload_root
+
+    roots = [os.getenv('CODE_REPOSITORY_PATH'), upload_root()]
+    return [verify_tree(connection, root, merkle) for root in roots if root and os.path.isdir(root)]
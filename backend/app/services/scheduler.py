@@ -0,0 +1,118 @@
+"""
+Background Job Scheduler
+Runs periodic maintenance jobs (APScheduler) inside each web worker. Every
+run takes a PostgreSQL transaction-level advisory lock first, so only one
+worker across the deployment executes a given job at a time.
+"""
+
+import os
+import zlib
+import threading
+from datetime import datetime
+
+_scheduler = None
+_scheduler_pid = None
+_start_lock = threading.Lock()
+
+# Last outcome of each job in this worker
+job_status = {}
+
+def _jobs():
+    """(name, function, interval seconds) for every scheduled job"""
+    from app.services import (stats, file_counts, search_analytics, search_log_partitions, blob_store, duplicates,
+                              db_maintenance)
+
+    return [
+        ('refresh_stats', stats.refresh_counters, int(os.getenv('STATS_REFRESH_INTERVAL', 900))),
+        ('refresh_file_counts', file_counts.refresh_file_counts, int(os.getenv('FILE_COUNT_REFRESH_INTERVAL', 3600))),
+        ('rollup_searches', search_analytics.rollup_searches, int(os.getenv('SEARCH_ROLLUP_INTERVAL', 60))),
+        ('maintain_search_logs', search_log_partitions.maintain_search_log_partitions,
+         int(os.getenv('SEARCH_LOG_MAINTENANCE_INTERVAL', 21600))),
+        ('collect_blobs', blob_store.collect_blobs, int(os.getenv('BLOB_GC_INTERVAL', 86400))),
+        ('analyze_duplicates', duplicates.analyze_duplicates, int(os.getenv('DUPLICATE_ANALYSIS_INTERVAL', 3600))),
+        ('vacuum_hot_tables', db_maintenance.vacuum_hot_tables, int(os.getenv('DB_MAINTENANCE_INTERVAL', 3600))),
+    ]
+
+def _lock_key(name):
+    return zlib.crc32(f'codex-job:{name}'.encode())
+
+def run_exclusive(app, name, job):
+    """
+    Run job(connection) in one transaction, unless another worker holds its
+    lock. Jobs are maintenance work and run without the statement timeout.
+    """
+    from app import db
+    from app.utils.db_pool import maintenance_engine
+
+    with app.app_context():
+        started = datetime.utcnow()
+        try:
+            with maintenance_engine(db.engine).begin() as connection:
+                if connection.dialect.name == 'postgresql':
+                    acquired = connection.exec_driver_sql(
+                        f'SELECT pg_try_advisory_xact_lock({_lock_key(name)})'
+                    ).scalar()
+                    if not acquired:
+                        job_status[name] = {'status': 'skipped', 'at': started.isoformat()}
+                        return None
+                result = job(connection)
+            job_status[name] = {
+                'status': 'ok',
+                'at': started.isoformat(),
+                'seconds': round((datetime.utcnow() - started).total_seconds(), 3),
+                'result': result
+            }
+            return result
+        except Exception as e:
+            app.logger.error(f'Scheduled job {name} failed: {e}')
+            job_status[name] = {'status': 'failed', 'at': started.isoformat(), 'error': str(e)}
+            return None
+
+def start_scheduler(app):
+    """Start the scheduler in this process (once per pid, so it survives forking)"""
+    global _scheduler, _scheduler_pid
+
+    with _start_lock:
+        if _scheduler_pid == os.getpid():
+            return _scheduler
+        _scheduler_pid = os.getpid()
+
+        try:
+            from apscheduler.schedulers.background import BackgroundScheduler
+        except ImportError:
+            app.logger.warning('APScheduler not installed - periodic jobs are disabled')
+            return None
+
+        scheduler = BackgroundScheduler(daemon=True, job_defaults={'coalesce': True, 'max_instances': 1})
+        for name, job, interval in _jobs():
+            if interval > 0:
+                scheduler.add_job(run_exclusive, 'interval', seconds=interval,
+                                  args=(app, name, job), id=name, jitter=min(60, interval // 10))
+        scheduler.start()
+        _scheduler = scheduler
+        app.logger.info(f'Scheduler started with jobs: {[job.id for job in scheduler.get_jobs()]}')
+        return scheduler
+
+def init_scheduler(app):
+    """Start the scheduler lazily on the first request each worker serves"""
+    if os.getenv('SCHEDULER_ENABLED', 'True').lower() != 'true':
+        return
+
+    @app.before_request
+    def ensure_scheduler():
+        if _scheduler_pid != os.getpid():
+            start_scheduler(app)
+
+def run_soon(app, name):
+    """Run a scheduled job in the background now instead of at its next interval"""
+    if _scheduler is not None and _scheduler_pid == os.getpid() and _scheduler.get_job(name):
+        _scheduler.modify_job(name, next_run_time=datetime.now())
+        return
+    threading.Thread(target=run_job, args=(app, name), name=f'job-{name}', daemon=True).start()
+
+def run_job(app, name):
+    """Run a scheduled job immediately (admin endpoint / CLI)"""
+    for job_name, job, _ in _jobs():
+        if job_name == name:
+            return run_exclusive(app, name, job)
+    raise KeyError(name)
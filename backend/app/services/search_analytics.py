@@ -0,0 +1,204 @@
+"""
+Search Analytics Rollups
+Folds new search_logs rows into hourly and daily per-term rollup tables and a
+Space-Saving sketch of the most popular terms. Each run only reads the rows
+logged since the previous run (tracked by id in rollup_state), so the cost of
+the analytics endpoint stays flat however large search_logs grows.
+"""
+
+import os
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta, date
+from sqlalchemy import select, delete, func, case
+from app.utils.sketches import SpaceSaving
+from app.utils.upsert import upsert_add
+
+ROLLUP_NAME = 'search_logs'
+
+# Rows processed per run; a backlog is worked off over consecutive runs
+BATCH_SIZE = int(os.getenv('SEARCH_ROLLUP_BATCH_SIZE', 100000))
+
+# Rows younger than this are left for the next run, so ids from transactions
+# still in flight are not skipped
+SETTLE_SECONDS = int(os.getenv('SEARCH_ROLLUP_SETTLE_SECONDS', 60))
+
+HOURLY_RETENTION_DAYS = int(os.getenv('SEARCH_ROLLUP_HOURLY_DAYS', 14))
+DAILY_RETENTION_DAYS = int(os.getenv('SEARCH_ROLLUP_DAILY_DAYS', 400))
+
+# Number of terms monitored by the heavy-hitters sketch
+SKETCH_CAPACITY = int(os.getenv('SEARCH_HEAVY_HITTERS_CAPACITY', 500))
+
+# Longer terms are truncated so they fit in a primary key
+MAX_TERM_LENGTH = 200
+
+def _hour_bucket(connection, column):
+    if connection.dialect.name == 'postgresql':
+        return func.date_trunc('hour', column)
+    return func.strftime('%Y-%m-%d %H:00:00', column)
+
+def _as_datetime(value):
+    return datetime.fromisoformat(value) if isinstance(value, str) else value
+
+def _load_state(connection):
+    from app.models import RollupState
+
+    row = connection.execute(
+        select(RollupState.last_id, RollupState.total, RollupState.updated_date)
+        .where(RollupState.name == ROLLUP_NAME)
+    ).first()
+    if row is None:
+        connection.execute(RollupState.__table__.insert().values(
+            name=ROLLUP_NAME, last_id=0, total=0, updated_date=None
+        ))
+        return 0, 0, None
+    return row
+
+def rollup_watermark(connection):
+    """Id of the last search log already folded into the rollups"""
+    return _load_state(connection)[0]
+
+def _update_sketch(connection, term_counts, total):
+    from app.models import SearchHeavyHitter
+
+    table = SearchHeavyHitter.__table__
+    items = connection.execute(
+        select(SearchHeavyHitter.search_term, SearchHeavyHitter.count, SearchHeavyHitter.error)
+    ).all()
+    sketch = SpaceSaving(SKETCH_CAPACITY, items, total)
+    for term, count in sorted(term_counts.items(), key=lambda item: (-item[1], item[0])):
+        sketch.update(term, count)
+
+    connection.execute(delete(table))
+    connection.execute(table.insert(), [
+        {'search_term': term, 'count': count, 'error': error} for term, count, error in sketch.items()
+    ])
+    return sketch.total
+
+def rollup_searches(connection):
+    """Fold the next batch of settled search logs into the rollups"""
+    from app.models import SearchLog, SearchRollupHourly, SearchRollupDaily, RollupState
+
+    last_id, total, _ = _load_state(connection)
+    settled_before = datetime.utcnow() - timedelta(seconds=SETTLE_SECONDS)
+    # The batch is the next BATCH_SIZE rows by position, not an id window:
+    # ids can jump arbitrarily (dropped partitions, a restore resetting last_id)
+    batch = (
+        select(SearchLog.id)
+        .where(SearchLog.id > last_id, SearchLog.timestamp < settled_before)
+        .order_by(SearchLog.id)
+        .limit(BATCH_SIZE)
+        .subquery()
+    )
+    upper_id = connection.execute(select(func.max(batch.c.id))).scalar()
+    if upper_id is None:
+        return {'rows': 0, 'last_id': last_id}
+
+    bucket = _hour_bucket(connection, SearchLog.timestamp)
+    term = func.substr(SearchLog.search_term, 1, MAX_TERM_LENGTH)
+    grouped = connection.execute(
+        select(
+            bucket,
+            term,
+            func.count(),
+            func.sum(case((SearchLog.results_count == 0, 1), else_=0)),
+            func.sum(func.coalesce(SearchLog.results_count, 0))
+        )
+        .where(SearchLog.id > last_id, SearchLog.id <= upper_id, SearchLog.timestamp.isnot(None))
+        .group_by(bucket, term)
+    ).all()
+
+    hourly, daily, term_counts = [], defaultdict(lambda: [0, 0, 0]), Counter()
+    for hour, search_term, searches, zero_results, results_total in grouped:
+        hour = _as_datetime(hour)
+        hourly.append({'bucket': hour, 'search_term': search_term, 'searches': searches,
+                       'zero_results': zero_results, 'results_total': results_total})
+        day_totals = daily[(hour.date(), search_term)]
+        day_totals[0] += searches
+        day_totals[1] += zero_results
+        day_totals[2] += results_total
+        term_counts[search_term] += searches
+
+    measures = ['searches', 'zero_results', 'results_total']
+    upsert_add(connection, SearchRollupHourly.__table__, ['bucket', 'search_term'], hourly, measures)
+    upsert_add(connection, SearchRollupDaily.__table__, ['day', 'search_term'], [
+        {'day': day, 'search_term': search_term, 'searches': values[0],
+         'zero_results': values[1], 'results_total': values[2]}
+        for (day, search_term), values in daily.items()
+    ], measures)
+
+    total = _update_sketch(connection, term_counts, total)
+
+    # Retention
+    now = datetime.utcnow()
+    connection.execute(delete(SearchRollupHourly).where(
+        SearchRollupHourly.bucket < now - timedelta(days=HOURLY_RETENTION_DAYS)))
+    connection.execute(delete(SearchRollupDaily).where(
+        SearchRollupDaily.day < now.date() - timedelta(days=DAILY_RETENTION_DAYS)))
+
+    connection.execute(
+        RollupState.__table__.update()
+        .where(RollupState.name == ROLLUP_NAME)
+        .values(last_id=upper_id, total=total, updated_date=now)
+    )
+    return {'rows': sum(term_counts.values()), 'last_id': upper_id}
+
+def search_stats(connection, days=None, limit=10):
+    """Search analytics from the rollups plus the not yet rolled up tail"""
+    from app.models import SearchLog, SearchRollupDaily, SearchHeavyHitter
+
+    last_id, total, updated = _load_state(connection)
+    today = datetime.utcnow().date()
+    today_start = datetime.combine(today, datetime.min.time())
+
+    rolled_today = connection.execute(
+        select(func.coalesce(func.sum(SearchRollupDaily.searches), 0))
+        .where(SearchRollupDaily.day == today)
+    ).scalar()
+    # Logs newer than the watermark; a timestamp range (not func.date) marks today's
+    tail_total, tail_today = connection.execute(
+        select(func.count(), func.coalesce(func.sum(case((SearchLog.timestamp >= today_start, 1), else_=0)), 0))
+        .where(SearchLog.id > last_id)
+    ).one()
+
+    if days:
+        since = today - timedelta(days=days - 1)
+        searches = func.sum(SearchRollupDaily.searches)
+        popular = [
+            {'term': term, 'count': int(count)}
+            for term, count in connection.execute(
+                select(SearchRollupDaily.search_term, searches)
+                .where(SearchRollupDaily.day >= since)
+                .group_by(SearchRollupDaily.search_term)
+                .order_by(searches.desc(), SearchRollupDaily.search_term)
+                .limit(limit)
+            )
+        ]
+    else:
+        popular = [
+            {'term': term, 'count': count, 'error': error}
+            for term, count, error in SpaceSaving(SKETCH_CAPACITY, connection.execute(
+                select(SearchHeavyHitter.search_term, SearchHeavyHitter.count, SearchHeavyHitter.error)
+            ).all()).top(limit)
+        ]
+
+    zero_since = today - timedelta(days=(days or 7) - 1)
+    zero_results = func.sum(SearchRollupDaily.zero_results)
+    zero_result_searches = [
+        {'term': term, 'count': int(count)}
+        for term, count in connection.execute(
+            select(SearchRollupDaily.search_term, zero_results)
+            .where(SearchRollupDaily.day >= zero_since)
+            .group_by(SearchRollupDaily.search_term)
+            .having(zero_results > 0)
+            .order_by(zero_results.desc(), SearchRollupDaily.search_term)
+            .limit(limit)
+        )
+    ]
+
+    return {
+        'searches_today': int(rolled_today) + int(tail_today),
+        'popular_searches': popular,
+        'zero_result_searches': zero_result_searches,
+        'total_searches': total + tail_total,
+        'rolled_up_to': updated.isoformat() if isinstance(updated, (datetime, date)) else updated
+    }
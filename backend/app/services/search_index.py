@@ -0,0 +1,242 @@
+"""
+Read-Only Search Index Snapshot
+Compact in-memory copy of filenames and suggestion terms, built once in the
+Gunicorn master (preload_app) and shared copy-on-write with forked workers.
+
+Everything is stored in a few bytes blobs and typed arrays rather than in
+millions of small Python objects: a worker reading the snapshot only touches
+the refcounts of these containers, so the pages holding the data itself stay
+shared with the master.
+"""
+
+import os
+import gc
+import time
+import bisect
+from array import array
+from sqlalchemy import event, select, update
+from sqlalchemy.orm import Session
+
+# Separator between entries of a folded blob; never part of a search query
+_SEPARATOR = b'\0'
+
+class PackedStrings:
+    """Immutable list of strings backed by one bytes blob plus offset arrays"""
+
+    __slots__ = ('_blob', '_offsets', '_folded', '_folded_offsets')
+
+    def __init__(self, strings):
+        blob, offsets = bytearray(), array('I', [0])
+        folded, folded_offsets = bytearray(), array('I')
+        for value in strings:
+            blob += value.encode('utf-8')
+            offsets.append(len(blob))
+            folded_offsets.append(len(folded))
+            folded += value.lower().encode('utf-8') + _SEPARATOR
+        folded_offsets.append(len(folded))
+
+        self._blob = bytes(blob)
+        self._offsets = offsets
+        self._folded = bytes(folded)
+        self._folded_offsets = folded_offsets
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, index):
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        return self._blob[self._offsets[index]:self._offsets[index + 1]].decode('utf-8')
+
+    def folded(self, index):
+        """Lower-cased entry, as used for matching"""
+        start, end = self._folded_offsets[index], self._folded_offsets[index + 1] - 1
+        return self._folded[start:end].decode('utf-8')
+
+    def matching(self, needle):
+        """Yield the index of every entry containing needle (case-insensitive)"""
+        needle = needle.lower().encode('utf-8')
+        if not needle or _SEPARATOR in needle:
+            return
+        position = self._folded.find(needle)
+        while position != -1:
+            index = bisect.bisect_right(self._folded_offsets, position) - 1
+            yield index
+            # Resume at the next entry so each entry is reported once
+            position = self._folded.find(needle, self._folded_offsets[index + 1])
+
+    @property
+    def nbytes(self):
+        return (len(self._blob) + len(self._folded) +
+                self._offsets.itemsize * len(self._offsets) +
+                self._folded_offsets.itemsize * len(self._folded_offsets))
+
+class _FoldedView:
+    """Sequence of folded entries, so bisect can search a sorted PackedStrings"""
+
+    __slots__ = ('_strings',)
+
+    def __init__(self, strings):
+        self._strings = strings
+
+    def __len__(self):
+        return len(self._strings)
+
+    def __getitem__(self, index):
+        return self._strings.folded(index)
+
+class SearchIndexSnapshot:
+    """Active filenames and suggestion terms at one index generation"""
+
+    def __init__(self, generation, files, terms):
+        # files: (id, filename) pairs; terms: suggestion strings
+        files = sorted(files, key=lambda item: item[0])
+        self.generation = generation
+        self.built_at = time.time()
+        self.file_ids = array('i', (file_id for file_id, _ in files))
+        self.filenames = PackedStrings(filename for _, filename in files)
+
+        # Sorted by folded value for prefix lookups
+        self.terms = PackedStrings(sorted(set(terms), key=lambda term: (term.lower(), term)))
+
+    def __len__(self):
+        return len(self.file_ids)
+
+    def iter_files(self):
+        """Yield (id, filename) for every active file"""
+        filenames = self.filenames
+        for index, file_id in enumerate(self.file_ids):
+            yield file_id, filenames[index]
+
+    def files_matching(self, query):
+        """Ids of files whose name contains query"""
+        return [self.file_ids[index] for index in self.filenames.matching(query)]
+
+    def terms_with_prefix(self, prefix, limit):
+        folded = _FoldedView(self.terms)
+        prefix = prefix.lower()
+        start = bisect.bisect_left(folded, prefix)
+        results = []
+        for index in range(start, len(self.terms)):
+            if len(results) >= limit or not folded[index].startswith(prefix):
+                break
+            results.append(self.terms[index])
+        return results
+
+    def suggestions(self, query, limit=10):
+        """Terms containing query, prefix matches first, then shortest"""
+        matches = self.terms_with_prefix(query, limit)
+        if len(matches) < limit:
+            seen = set(matches)
+            contained = sorted(
+                (self.terms[index] for index in self.terms.matching(query)),
+                key=len
+            )
+            for term in contained:
+                if term not in seen:
+                    matches.append(term)
+                    seen.add(term)
+                if len(matches) >= limit:
+                    break
+        matches.sort(key=lambda term: (not term.lower().startswith(query.lower()), len(term)))
+        return matches[:limit]
+
+    def describe(self):
+        return {
+            'generation': self.generation,
+            'files': len(self.file_ids),
+            'terms': len(self.terms),
+            'bytes': (self.filenames.nbytes + self.terms.nbytes +
+                      self.file_ids.itemsize * len(self.file_ids)),
+            'built_at': self.built_at,
+            'pid': os.getpid()
+        }
+
+# Snapshot installed in this process (None when preloading is disabled)
+_snapshot = None
+
+def get_snapshot():
+    """Current snapshot, or None when searches should go to the database"""
+    return _snapshot
+
+def install_snapshot(snapshot):
+    global _snapshot
+    _snapshot = snapshot
+
+def read_generation(connection):
+    """Index generation stored in the database"""
+    from app.models import IndexState
+    generation = connection.execute(select(IndexState.generation).where(IndexState.id == 1)).scalar()
+    return generation or 0
+
+def build_snapshot(db):
+    """Load active files, tags and projects into a new snapshot (needs an app context)"""
+    from app.models import File, Project, Tag
+
+    with db.engine.connect() as connection:
+        generation = read_generation(connection)
+        files = connection.execute(
+            select(File.id, File.filename).where(File.is_active == True)
+        ).all()
+        tag_names = connection.execute(select(Tag.name)).scalars().all()
+        project_names = connection.execute(
+            select(Project.name).where(Project.is_active == True)
+        ).scalars().all()
+
+    terms = set(tag_names) | set(project_names)
+    for _, filename in files:
+        terms.add(filename)
+        stem = os.path.splitext(filename)[0]
+        if stem:
+            terms.add(stem)
+
+    return SearchIndexSnapshot(generation, files, terms)
+
+def preload_snapshot(app, db):
+    """Build the snapshot in the Gunicorn master before workers fork"""
+    started = time.perf_counter()
+    with app.app_context():
+        snapshot = build_snapshot(db)
+        install_snapshot(snapshot)
+        # The master must not hand pooled connections to its children
+        db.engine.dispose()
+
+    # Move everything allocated so far out of the collector's reach: a GC pass
+    # in a worker would otherwise write to every object header and unshare pages
+    gc.collect()
+    gc.freeze()
+
+    app.logger.info(
+        f'Search index snapshot built in {(time.perf_counter() - started) * 1000:.1f}ms: {snapshot.describe()}'
+    )
+    return snapshot
+
+def bump_generation(connection):
+    """
+    Mark the indexed data as changed so preloaded snapshots get rebuilt. A
+    no-op unless generation tracking is installed (PRELOAD_APP): without
+    snapshots nobody reads the generation, and the update would only queue
+    writers behind the single index_state row.
+    """
+    from app.models import IndexState
+    if not event.contains(Session, 'after_flush', _after_flush):
+        return
+    connection.execute(
+        update(IndexState).where(IndexState.id == 1).values(generation=IndexState.generation + 1)
+    )
+
+def _touches_index(session):
+    from app.models import File, Project, Tag
+    tracked = (File, Project, Tag)
+    return any(isinstance(instance, tracked)
+               for instance in (*session.new, *session.dirty, *session.deleted))
+
+def install_generation_tracking():
+    """Bump the generation in the same transaction as any ORM change to files, tags or projects"""
+    if event.contains(Session, 'after_flush', _after_flush):
+        return
+    event.listen(Session, 'after_flush', _after_flush)
+
+def _after_flush(session, flush_context):
+    if _touches_index(session):
+        bump_generation(session.connection())
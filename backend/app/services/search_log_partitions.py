@@ -0,0 +1,193 @@
+"""
+Search Log Partitions
+On PostgreSQL search_logs is range-partitioned by month (search_logs_YYYY_MM
+plus a search_logs_default catch-all). This module creates upcoming
+partitions and enforces the retention policy: partitions older than
+SEARCH_LOG_RETENTION_MONTHS are exported to gzip-compressed CSV and dropped
+as a whole, instead of deleting rows.
+"""
+
+import os
+import re
+import gzip
+from datetime import datetime, date
+from sqlalchemy import text
+from app.utils.hashing import hash_file
+
+PARENT_TABLE = 'search_logs'
+DEFAULT_PARTITION = 'search_logs_default'
+
+# Months of empty partitions kept ready ahead of the current one
+PARTITIONS_AHEAD = int(os.getenv('SEARCH_LOG_PARTITIONS_AHEAD', 3))
+
+# Whole months of logs to keep besides the current one (0 keeps everything)
+RETENTION_MONTHS = int(os.getenv('SEARCH_LOG_RETENTION_MONTHS', 12))
+
+ARCHIVE_ENABLED = os.getenv('SEARCH_LOG_ARCHIVE', 'True').lower() == 'true'
+
+def archive_directory():
+    project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '..'))
+    return os.getenv('SEARCH_LOG_ARCHIVE_PATH', os.path.join(project_root, 'archives', 'search_logs'))
+
+_BOUND_PATTERN = re.compile(r"FROM \('([^']+)'\) TO \('([^']+)'\)")
+
+def month_start(moment, offset=0):
+    """First day of the month `offset` months after moment's month"""
+    month_index = moment.year * 12 + (moment.month - 1) + offset
+    return date(month_index // 12, month_index % 12 + 1, 1)
+
+def partition_name(start):
+    return f'{PARENT_TABLE}_{start.year:04d}_{start.month:02d}'
+
+def is_partitioned(connection):
+    if connection.dialect.name != 'postgresql':
+        return False
+    return connection.execute(text(
+        'SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(:parent))'
+    ), {'parent': PARENT_TABLE}).scalar()
+
+def list_partitions(connection):
+    """Partitions of search_logs with their month range and size"""
+    rows = connection.execute(text(
+        "SELECT child.relname, pg_get_expr(child.relpartbound, child.oid), "
+        "       child.reltuples::bigint, pg_total_relation_size(child.oid) "
+        "FROM pg_inherits i "
+        "JOIN pg_class child ON child.oid = i.inhrelid "
+        "WHERE i.inhparent = to_regclass(:parent) "
+        "ORDER BY child.relname"
+    ), {'parent': PARENT_TABLE}).all()
+
+    partitions = []
+    for name, bound, estimated_rows, size in rows:
+        match = _BOUND_PATTERN.search(bound or '')
+        partitions.append({
+            'name': name,
+            'default': bound == 'DEFAULT',
+            'from': datetime.fromisoformat(match.group(1)).date() if match else None,
+            'to': datetime.fromisoformat(match.group(2)).date() if match else None,
+            'estimated_rows': max(estimated_rows, 0),
+            'size_bytes': size
+        })
+    return partitions
+
+def _exists(connection, table):
+    return connection.execute(text('SELECT to_regclass(:name) IS NOT NULL'), {'name': table}).scalar()
+
+def create_partition(connection, start):
+    """
+    Create the partition for the month beginning at start (no-op if it exists).
+
+    The partition is built as a standalone table and then attached, which
+    takes only SHARE UPDATE EXCLUSIVE on search_logs (CREATE TABLE ...
+    PARTITION OF would take ACCESS EXCLUSIVE): searches keep logging to the
+    other partitions throughout. Rows for the month that landed in the
+    default partition are copied over while everything stays writable; only
+    the default partition is then locked, to move the rows logged meanwhile
+    and let ATTACH check it. Needs a maintenance_engine connection, since the
+    copy is as long as the stranded month.
+    """
+    name = partition_name(start)
+    end = month_start(start, 1)
+    if _exists(connection, name):
+        return False
+
+    bounds = {'start': start, 'end': end}
+    in_month = 'timestamp >= :start AND timestamp < :end'
+    connection.execute(text(f'CREATE TABLE {name} (LIKE {PARENT_TABLE} INCLUDING DEFAULTS INCLUDING INDEXES)'))
+    # Proves the rows fit the bounds, so ATTACH skips scanning the new table
+    connection.execute(text(
+        f"ALTER TABLE {name} ADD CONSTRAINT {name}_bounds CHECK (timestamp >= '{start}' AND timestamp < '{end}')"
+    ))
+
+    if _exists(connection, DEFAULT_PARTITION):
+        connection.execute(text(f'INSERT INTO {name} SELECT * FROM {DEFAULT_PARTITION} WHERE {in_month}'), bounds)
+        connection.execute(text(f'LOCK TABLE {DEFAULT_PARTITION} IN ACCESS EXCLUSIVE MODE'))
+        connection.execute(text(
+            f'WITH moved AS (DELETE FROM {DEFAULT_PARTITION} WHERE {in_month} RETURNING *) '
+            f'INSERT INTO {name} SELECT * FROM moved ON CONFLICT DO NOTHING'
+        ), bounds)
+
+    connection.execute(text(
+        f"ALTER TABLE {PARENT_TABLE} ATTACH PARTITION {name} FOR VALUES FROM ('{start}') TO ('{end}')"
+    ))
+    connection.execute(text(f'ALTER TABLE {name} DROP CONSTRAINT {name}_bounds'))
+    return True
+
+def ensure_partitions(connection, months_ahead=PARTITIONS_AHEAD):
+    """Make sure the default partition and the current and next months_ahead months exist"""
+    today = datetime.utcnow()
+    created = []
+    if not _exists(connection, DEFAULT_PARTITION):
+        connection.execute(text(f'CREATE TABLE {DEFAULT_PARTITION} PARTITION OF {PARENT_TABLE} DEFAULT'))
+        created.append(DEFAULT_PARTITION)
+    for offset in range(months_ahead + 1):
+        start = month_start(today, offset)
+        if create_partition(connection, start):
+            created.append(partition_name(start))
+    return created
+
+def archive_partition(connection, name, directory=None):
+    """Export a partition to <directory>/<name>.csv.gz with COPY, returning file details"""
+    directory = directory or archive_directory()
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f'{name}.csv.gz')
+    partial_path = path + '.partial'
+
+    # COPY streams straight from the server into the gzip file; it is one
+    # statement lasting as long as a month of logs takes to compress, so the
+    # connection must come from maintenance_engine (the scheduler's does)
+    cursor = connection.connection.cursor()
+    try:
+        with gzip.open(partial_path, 'wb') as archive:
+            cursor.copy_expert(f'COPY (SELECT * FROM {name} ORDER BY id) TO STDOUT WITH (FORMAT csv, HEADER)',
+                               archive)
+        rows = cursor.rowcount
+    finally:
+        cursor.close()
+    os.replace(partial_path, path)
+
+    return {'path': path, 'rows': rows, 'bytes': os.path.getsize(path), 'sha256': hash_file(path)}
+
+def apply_retention(connection, retention_months=RETENTION_MONTHS, archive=ARCHIVE_ENABLED):
+    """Archive and drop partitions that ended before the retention window"""
+    from app.services.search_analytics import rollup_watermark
+
+    if retention_months <= 0:
+        return {'dropped': [], 'skipped': []}
+
+    cutoff = month_start(datetime.utcnow(), -retention_months)
+    watermark = rollup_watermark(connection)
+    dropped, skipped = [], []
+
+    for partition in list_partitions(connection):
+        if partition['default'] or partition['to'] is None or partition['to'] > cutoff:
+            continue
+
+        name = partition['name']
+        # Never drop rows the analytics rollups have not folded in yet
+        newest_id = connection.execute(text(f'SELECT max(id) FROM {name}')).scalar()
+        if newest_id is not None and newest_id > watermark:
+            skipped.append({'name': name, 'reason': 'not rolled up yet'})
+            continue
+
+        details = {'name': name}
+        if archive and newest_id is not None:
+            details['archive'] = archive_partition(connection, name)
+        connection.execute(text(f'DROP TABLE {name}'))
+        dropped.append(details)
+
+    return {'dropped': dropped, 'skipped': skipped}
+
+def maintain_search_log_partitions(connection):
+    """Scheduled job: create upcoming partitions and enforce retention"""
+    if not is_partitioned(connection):
+        return {'partitioned': False}
+
+    created = ensure_partitions(connection)
+    retention = apply_retention(connection)
+    return {
+        'partitioned': True,
+        'created': created,
+        'dropped': [partition['name'] for partition in retention['dropped']],
+        'skipped': retention['skipped']
+    }
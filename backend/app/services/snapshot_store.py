@@ -0,0 +1,409 @@
+"""
+Snapshot Store
+Incremental backups kept as content-addressed chunks. Every chunk is
+stored once under objects/ab/<sha256> (zlib-compressed) and a snapshot is
+just a JSON manifest listing the chunks of each table export and each
+file, so a new snapshot writes only the chunks no earlier snapshot has.
+
+- Files up to FILE_CHUNK_SIZE are one chunk keyed by their own SHA-256,
+  the hash uploads and blobs are already named by. Blob store files whose
+  object exists are not read at all, and other files whose size and mtime
+  match the previous snapshot reuse its chunk list unread.
+- Table exports (app.services.db_archive CSV) are cut into chunks after
+  lines chosen by their CRC, so a changed row only changes the chunk
+  around it instead of shifting every chunk after it.
+"""
+
+import io
+import os
+import re
+import json
+import zlib
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+from app.utils import hashing
+
+STORE_PATH = os.getenv('SNAPSHOT_STORE_PATH', '')
+
+COMPRESSION_LEVEL = int(os.getenv('SNAPSHOT_COMPRESSION_LEVEL', 6))
+
+# Snapshots kept by prune() unless told otherwise
+KEEP = int(os.getenv('SNAPSHOT_KEEP', 14))
+
+FILE_CHUNK_SIZE = 8 * 1024 * 1024
+
+# Table chunks: at least MIN bytes, cut after a line whose CRC has the low
+# seven bits clear (one line in 128 on average), and never more than MAX bytes
+TABLE_CHUNK_MIN = 256 * 1024
+TABLE_CHUNK_MAX = 4 * 1024 * 1024
+CUT_MASK = (1 << 7) - 1
+
+# Unreferenced objects younger than this survive collection (a snapshot may
+# still be writing; reused objects are touched so they count as young too)
+GC_GRACE_SECONDS = 3600
+
+_DIGEST_NAME = re.compile(r'^[0-9a-f]{64}$')
+
+class SnapshotStore:
+    """Objects and manifests under one root directory"""
+
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+        self.objects = os.path.join(self.root, 'objects')
+        self.manifests = os.path.join(self.root, 'snapshots')
+        self.written = 0
+        self.written_bytes = 0
+        self.reused = 0
+
+    # Objects
+
+    def object_path(self, digest):
+        return os.path.join(self.objects, digest[:2], digest)
+
+    def has(self, digest):
+        return os.path.exists(self.object_path(digest))
+
+    def touch(self, digests):
+        """Mark objects a new snapshot reuses as recently used; False if any is missing"""
+        try:
+            for digest in digests:
+                os.utime(self.object_path(digest))
+        except FileNotFoundError:
+            return False
+        return True
+
+    def put(self, data, digest=None):
+        """Store a chunk unless it is already present; returns its digest"""
+        if digest is None:
+            hasher = hashing.new_hasher()
+            hasher.update(data)
+            digest = hasher.hexdigest()
+        path = self.object_path(digest)
+        if self.touch([digest]):
+            self.reused += 1
+            return digest
+        compressed = zlib.compress(data, COMPRESSION_LEVEL)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp = f'{path}.{uuid.uuid4().hex}.tmp'
+        with open(temp, 'wb') as target:
+            target.write(compressed)
+        os.replace(temp, path)
+        self.written += 1
+        self.written_bytes += len(compressed)
+        return digest
+
+    def get(self, digest):
+        with open(self.object_path(digest), 'rb') as source:
+            return zlib.decompress(source.read())
+
+    def open_chunks(self, chunks):
+        """Readable binary stream over the concatenated chunks"""
+        return io.BufferedReader(_ChunkReader(self, chunks), buffer_size=1024 * 1024)
+
+    @contextmanager
+    def lock(self, exclusive=False):
+        """Held shared while a snapshot is written and exclusively while prune collects objects"""
+        os.makedirs(self.root, exist_ok=True)
+        with open(os.path.join(self.root, 'lock'), 'a') as handle:
+            try:
+                import fcntl
+            except ImportError:
+                # No flock (Windows): the grace period alone protects writers
+                yield
+                return
+            fcntl.flock(handle, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(handle, fcntl.LOCK_UN)
+
+    # Manifests
+
+    def manifest_path(self, name):
+        return os.path.join(self.manifests, f'{name}.json')
+
+    def save_manifest(self, manifest):
+        os.makedirs(self.manifests, exist_ok=True)
+        path = self.manifest_path(manifest['name'])
+        temp = f'{path}.tmp'
+        with open(temp, 'w') as target:
+            json.dump(manifest, target)
+        os.replace(temp, path)
+
+    def load_manifest(self, name):
+        with open(self.manifest_path(name)) as source:
+            return json.load(source)
+
+    def names(self):
+        """Snapshot names, oldest first"""
+        if not os.path.isdir(self.manifests):
+            return []
+        manifests = [name[:-5] for name in os.listdir(self.manifests) if name.endswith('.json')]
+        return sorted(manifests, key=lambda name: os.path.getmtime(self.manifest_path(name)))
+
+    def latest(self):
+        names = self.names()
+        return self.load_manifest(names[-1]) if names else None
+
+class _ChunkReader(io.RawIOBase):
+    def __init__(self, store, chunks):
+        self.store = store
+        self.chunks = iter(chunks)
+        self.current = memoryview(b'')
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self.current:
+            digest = next(self.chunks, None)
+            if digest is None:
+                return 0
+            self.current = memoryview(self.store.get(digest))
+        size = min(len(buffer), len(self.current))
+        buffer[:size] = self.current[:size]
+        self.current = self.current[size:]
+        return size
+
+class _TableChunker:
+    """File-like target for db_archive.write_table that stores content-defined chunks"""
+
+    def __init__(self, store):
+        self.store = store
+        self.chunks = []
+        self.pending = bytearray()
+        self.partial = b''
+
+    def write(self, data):
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        lines = (self.partial + data).split(b'\n')
+        self.partial = lines.pop()
+        for line in lines:
+            self.pending += line
+            self.pending += b'\n'
+            if len(self.pending) >= TABLE_CHUNK_MAX or (
+                    len(self.pending) >= TABLE_CHUNK_MIN and not zlib.crc32(line) & CUT_MASK):
+                self._cut()
+        return len(data)
+
+    def _cut(self):
+        if self.pending:
+            self.chunks.append(self.store.put(bytes(self.pending)))
+            self.pending = bytearray()
+
+    def close(self):
+        self.pending += self.partial
+        self.partial = b''
+        self._cut()
+        return self.chunks
+
+class SnapshotArchive:
+    """The open(member) interface of a ZipFile over a snapshot's table exports, for db_restore"""
+
+    def __init__(self, store, manifest):
+        self.store = store
+        self.members = {entry['member']: entry['chunks'] for entry in manifest['database']['tables']}
+
+    def open(self, member):
+        return self.store.open_chunks(self.members[member])
+
+# Taking snapshots
+
+def snapshot_database(store, engine):
+    """Export every archived table into chunks; returns the manifest's database section"""
+    from app.services import db_archive
+
+    entries = []
+    with db_archive.consistent_snapshot(engine) as connection:
+        for name in db_archive.TABLES:
+            chunker = _TableChunker(store)
+            entry = db_archive.write_table(connection, name, chunker)
+            entry['member'] = f'database/{name}.csv'
+            entry['chunks'] = chunker.close()
+            entries.append(entry)
+    return {'format': db_archive.FORMAT, 'exported_at': datetime.utcnow().isoformat(), 'tables': entries}
+
+def _store_file(store, path, size):
+    """(sha256, chunks) of a file, storing the chunks that are new"""
+    hasher = hashing.new_hasher()
+    with open(path, 'rb') as source:
+        if size <= FILE_CHUNK_SIZE:
+            # One chunk, named by the file's own hash
+            data = source.read()
+            hasher.update(data)
+            return hasher.hexdigest(), [store.put(data, hasher.hexdigest())]
+        chunks = []
+        while data := source.read(FILE_CHUNK_SIZE):
+            hasher.update(data)
+            chunks.append(store.put(data))
+    return hasher.hexdigest(), chunks
+
+def snapshot_files(store, base, roots, previous=None, kind='storage'):
+    """
+    Manifest entries for every file under roots (paths relative to base).
+    previous: {path: entry} from the last snapshot, reused when size and
+    mtime are unchanged. Hardlinked names of one inode are stored once and
+    recorded with link_to.
+    """
+    from app.services.blob_store import store_root
+
+    blobs = store_root()
+    roots = [os.path.abspath(root) for root in roots]
+    previous = previous or {}
+    entries, inodes = [], {}
+    for root in roots:
+        if os.path.isfile(root):
+            walk = [(os.path.dirname(root), [], [os.path.basename(root)])]
+        elif os.path.isdir(root):
+            walk = os.walk(root)
+        else:
+            continue
+        for directory, _, files in walk:
+            for filename in sorted(files):
+                path = os.path.join(directory, filename)
+                relative = os.path.relpath(path, base).replace(os.sep, '/')
+                info = os.stat(path)
+                entry = {'path': relative, 'kind': kind, 'size': info.st_size, 'mtime_ns': info.st_mtime_ns}
+
+                inode = (info.st_dev, info.st_ino)
+                if info.st_nlink > 1 and inode in inodes:
+                    entry['link_to'] = inodes[inode]['path']
+                    entry['sha256'] = inodes[inode]['sha256']
+                    entries.append(entry)
+                    continue
+
+                known = previous.get(relative)
+                if known and 'chunks' in known and known['size'] == entry['size'] \
+                        and known['mtime_ns'] == entry['mtime_ns'] and store.touch(known['chunks']):
+                    entry['sha256'], entry['chunks'] = known['sha256'], known['chunks']
+                elif (_DIGEST_NAME.match(filename) and info.st_size <= FILE_CHUNK_SIZE
+                      and path.startswith(blobs + os.sep) and store.touch([filename])):
+                    # Blob store files are named by the SHA-256 of their (immutable) contents
+                    entry['sha256'], entry['chunks'] = filename, [filename]
+                else:
+                    entry['sha256'], entry['chunks'] = _store_file(store, path, info.st_size)
+                inodes[inode] = entry
+                entries.append(entry)
+    return entries
+
+def create_snapshot(store, engine, base, storage_roots, config_files=(), name=None):
+    """Write a snapshot of the database and files; returns its manifest"""
+    started = time.perf_counter()
+    name = name or f"codex_snapshot_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+    if os.path.exists(store.manifest_path(name)):
+        raise ValueError(f'Snapshot {name} already exists')
+
+    # Until the manifest is saved nothing references the chunks being reused
+    # or written: keep prune from collecting them meanwhile
+    with store.lock():
+        parent = store.latest()
+        previous = {entry['path']: entry for entry in (parent or {}).get('files', [])}
+
+        database = snapshot_database(store, engine)
+        files = snapshot_files(store, base, storage_roots, previous)
+        files += snapshot_files(store, base, [os.path.join(base, path) for path in config_files],
+                                previous, 'config')
+
+        manifest = {
+            'name': name,
+            'created_at': datetime.now().isoformat(),
+            'parent': parent['name'] if parent else None,
+            'database': database,
+            'files': files,
+            'statistics': {
+                **{f"{entry['table']}_count": entry['rows'] for entry in database['tables']},
+                'stored_files': len(files),
+                'logical_bytes': sum(entry['bytes'] for entry in database['tables'])
+                                 + sum(entry['size'] for entry in files if 'link_to' not in entry),
+                'new_chunks': store.written,
+                'new_bytes': store.written_bytes,
+                'reused_chunks': store.reused,
+                'seconds': round(time.perf_counter() - started, 3)
+            }
+        }
+        store.save_manifest(manifest)
+    return manifest
+
+# Restoring
+
+def missing_objects(store, manifest):
+    """Chunks a snapshot refers to that are not in the store"""
+    chunks = {digest for entry in manifest['database']['tables'] for digest in entry['chunks']}
+    chunks.update(digest for entry in manifest['files'] for digest in entry.get('chunks', ()))
+    return sorted(digest for digest in chunks if not store.has(digest))
+
+def materialize_files(store, manifest, base, kinds=('storage',)):
+    """Write a snapshot's files under base (hardlinks recreated, falling back to copies)"""
+    written = 0
+    for entry in sorted(manifest['files'], key=lambda entry: 'link_to' in entry):
+        if entry['kind'] not in kinds:
+            continue
+        path = os.path.join(base, *entry['path'].split('/'))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if os.path.lexists(path):
+            os.remove(path)
+        if 'link_to' in entry:
+            source = os.path.join(base, *entry['link_to'].split('/'))
+            try:
+                os.link(source, path)
+                continue
+            except OSError:
+                chunks = next(item['chunks'] for item in manifest['files'] if item['path'] == entry['link_to'])
+        else:
+            chunks = entry['chunks']
+        with open(path, 'wb') as target:
+            for digest in chunks:
+                target.write(store.get(digest))
+        os.utime(path, ns=(entry['mtime_ns'], entry['mtime_ns']))
+        written += 1
+    return written
+
+# Retention
+
+def prune(store, keep=KEEP):
+    """Delete all but the newest keep snapshots, then the objects no remaining snapshot uses"""
+    with store.lock(exclusive=True):
+        return _prune(store, keep)
+
+def _prune(store, keep):
+    names = store.names()
+    removed = names[:-keep] if keep > 0 else names
+    for name in removed:
+        os.remove(store.manifest_path(name))
+
+    referenced = set()
+    for name in store.names():
+        manifest = store.load_manifest(name)
+        referenced.update(digest for entry in manifest['database']['tables'] for digest in entry['chunks'])
+        referenced.update(digest for entry in manifest['files'] for digest in entry.get('chunks', ()))
+
+    cutoff = time.time() - GC_GRACE_SECONDS
+    deleted = freed = 0
+    if os.path.isdir(store.objects):
+        for directory, _, files in os.walk(store.objects):
+            for filename in files:
+                path = os.path.join(directory, filename)
+                if filename in referenced or os.path.getmtime(path) > cutoff:
+                    continue
+                freed += os.path.getsize(path)
+                os.remove(path)
+                deleted += 1
+    return {'snapshots_removed': removed, 'objects_deleted': deleted, 'bytes_freed': freed}
+
+def verify(store, manifest):
+    """Digests of chunks that are missing or whose contents no longer match their name"""
+    chunks = {digest for entry in manifest['database']['tables'] for digest in entry['chunks']}
+    chunks.update(digest for entry in manifest['files'] for digest in entry.get('chunks', ()))
+    bad = []
+    for digest in sorted(chunks):
+        try:
+            hasher = hashing.new_hasher()
+            hasher.update(store.get(digest))
+            if hasher.hexdigest() != digest:
+                bad.append(digest)
+        except (OSError, zlib.error):
+            bad.append(digest)
+    return bad
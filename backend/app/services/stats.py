@@ -0,0 +1,261 @@
+"""
+Dashboard Statistics Counters
+Keeps the numbers shown on the admin dashboard in the stats_counters table.
+ORM flushes that touch files, projects, tags, users or search logs adjust
+the counters in the same transaction, and a scheduled refresh recomputes
+them from scratch to absorb anything written with bulk SQL.
+
+Counter keys:
+    totals:<name>          files, projects, tags, users, total_size
+    filetype:<type>        active files per file type
+    project:<id>           active files per project
+    indexed:<YYYY-MM-DD>   active files by indexed_date day
+    searches:<YYYY-MM-DD>  searches logged per day
+"""
+
+import os
+import zlib
+from collections import Counter
+from datetime import datetime, timedelta
+from sqlalchemy import event, select, delete, func, cast, literal, union_all, String
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import get_history
+from app.utils.upsert import upsert_add
+
+# Daily counters older than this are dropped by the refresh
+DAILY_RETENTION_DAYS = int(os.getenv('STATS_DAILY_RETENTION_DAYS', 30))
+
+# Days covered by the dashboard "this week" figures (matches today - 7 inclusive)
+WEEK_DAYS = 7
+
+def day_key(prefix, moment):
+    return f'{prefix}:{moment:%Y-%m-%d}'
+
+def apply_deltas(connection, deltas):
+    """Add deltas ({key: amount}) to the counters, creating missing keys"""
+    from app.models import StatsCounter
+
+    now = datetime.utcnow()
+    rows = [{'key': key, 'value': int(amount), 'updated_date': now}
+            for key, amount in deltas.items() if amount]
+    upsert_add(connection, StatsCounter.__table__, ['key'], rows,
+               add_columns=['value'], replace_columns=['updated_date'])
+
+# Incremental maintenance
+
+def _before_after(instance, attribute):
+    """(old, new) value of an attribute within the current flush"""
+    history = get_history(instance, attribute)
+    if history.added or history.deleted:
+        old = history.deleted[0] if history.deleted else None
+        new = history.added[0] if history.added else None
+        return old, new
+    value = getattr(instance, attribute)
+    return value, value
+
+def _file_contribution(values, sign, deltas):
+    is_active, size, filetype, project_id, indexed_date = values
+    if is_active is False:
+        return
+    deltas['totals:files'] += sign
+    deltas['totals:total_size'] += sign * (size or 0)
+    deltas[f'filetype:{filetype}'] += sign
+    if project_id is not None:
+        deltas[f'project:{project_id}'] += sign
+    if indexed_date is not None:
+        deltas[day_key('indexed', indexed_date)] += sign
+
+FILE_ATTRIBUTES = ('is_active', 'size', 'filetype', 'project_id', 'indexed_date')
+
+def file_deltas(changes):
+    """Counter deltas for bulk SQL: [(before, after)] tuples of FILE_ATTRIBUTES values, None for a missing side"""
+    deltas = Counter()
+    for before, after in changes:
+        if before is not None:
+            _file_contribution(before, -1, deltas)
+        if after is not None:
+            _file_contribution(after, 1, deltas)
+    return deltas
+
+def _collect_deltas(session):
+    from app.models import File, Project, Tag, User, SearchLog
+
+    deltas = Counter()
+    for instance in session.new:
+        if isinstance(instance, File):
+            _file_contribution([getattr(instance, name) for name in FILE_ATTRIBUTES], 1, deltas)
+        elif isinstance(instance, (Project, User)) and instance.is_active is not False:
+            deltas[f'totals:{instance.__tablename__}'] += 1
+        elif isinstance(instance, Tag):
+            deltas['totals:tags'] += 1
+        elif isinstance(instance, SearchLog):
+            deltas[day_key('searches', instance.timestamp or datetime.utcnow())] += 1
+
+    for instance in session.dirty:
+        if isinstance(instance, File):
+            pairs = [_before_after(instance, name) for name in FILE_ATTRIBUTES]
+            if any(old != new for old, new in pairs):
+                _file_contribution([old for old, _ in pairs], -1, deltas)
+                _file_contribution([new for _, new in pairs], 1, deltas)
+        elif isinstance(instance, (Project, User)):
+            old, new = _before_after(instance, 'is_active')
+            if (old is not False) != (new is not False):
+                deltas[f'totals:{instance.__tablename__}'] += 1 if new is not False else -1
+
+    for instance in session.deleted:
+        if isinstance(instance, File):
+            _file_contribution([_before_after(instance, name)[0] for name in FILE_ATTRIBUTES], -1, deltas)
+        elif isinstance(instance, (Project, User)) and instance.is_active is not False:
+            deltas[f'totals:{instance.__tablename__}'] -= 1
+        elif isinstance(instance, Tag):
+            deltas['totals:tags'] -= 1
+
+    return deltas
+
+def _after_flush(session, flush_context):
+    deltas = _collect_deltas(session)
+    if deltas:
+        apply_deltas(session.connection(), deltas)
+
+def install_stats_tracking():
+    """Keep counters in step with ORM changes (bulk SQL is picked up by the refresh)"""
+    if not event.contains(Session, 'after_flush', _after_flush):
+        event.listen(Session, 'after_flush', _after_flush)
+
+# Full refresh
+
+# Serializes refreshes against each other (never against the flush-time upserts)
+REFRESH_LOCK_KEY = zlib.crc32(b'codex-stats-refresh')
+
+def _counter_query():
+    """One SELECT of (key, value) rows recomputing every counter with set-based aggregates"""
+    from app.models import File, Project, Tag, User, SearchLog
+
+    def total(name, value, source, *where):
+        return select(literal(f'totals:{name}').label('key'), value.label('value')).select_from(source).where(*where)
+
+    def keyed(prefix, column):
+        return literal(f'{prefix}:') + cast(column, String)
+
+    since = datetime.combine(datetime.utcnow().date() - timedelta(days=DAILY_RETENTION_DAYS), datetime.min.time())
+    indexed_day = func.date(File.indexed_date)
+    search_day = func.date(SearchLog.timestamp)
+    filetype_key = keyed('filetype', func.coalesce(File.filetype, 'None'))
+    project_key = keyed('project', File.project_id)
+
+    return union_all(
+        total('files', func.count(), File, File.is_active == True),
+        total('total_size', func.coalesce(func.sum(File.size), 0), File, File.is_active == True),
+        total('projects', func.count(), Project, Project.is_active == True),
+        total('tags', func.count(), Tag),
+        total('users', func.count(), User, User.is_active == True),
+        select(filetype_key, func.count()).where(File.is_active == True).group_by(filetype_key),
+        select(project_key, func.count())
+        .where(File.is_active == True, File.project_id.isnot(None))
+        .group_by(project_key),
+        select(keyed('indexed', indexed_day), func.count())
+        .where(File.is_active == True, File.indexed_date >= since)
+        .group_by(indexed_day),
+        select(keyed('searches', search_day), func.count())
+        .where(SearchLog.timestamp >= since)
+        .group_by(search_day)
+    )
+
+def compute_counters(connection):
+    """Recompute every counter: {key: value}"""
+    return {key: int(value or 0) for key, value in connection.execute(_counter_query())}
+
+def refresh_counters(connection):
+    """
+    Correct every counter to its freshly computed value without locking the
+    counters table. A single statement computes the aggregates and reads the
+    stored counters from the same snapshot, and only their difference is
+    added to the counters: deltas committed after that snapshot are already
+    in the table (or land on top of the correction), so none is lost and the
+    flush-time upserts never wait for the aggregates. Returns the number of
+    counters.
+    """
+    from app.models import StatsCounter
+
+    table = StatsCounter.__table__
+    if connection.dialect.name == 'postgresql':
+        # A second refresh must not apply a correction computed before this one commits
+        connection.exec_driver_sql(f'SELECT pg_advisory_xact_lock({REFRESH_LOCK_KEY})')
+
+    computed = _counter_query().subquery()
+    both = union_all(
+        select(computed.c.key, computed.c.value, literal(1).label('computed'), literal(0).label('stored')),
+        select(table.c.key, -table.c.value, literal(0), literal(1))
+    ).subquery()
+    groups = connection.execute(
+        select(both.c.key, func.sum(both.c.value), func.max(both.c.computed), func.max(both.c.stored))
+        .group_by(both.c.key)
+    ).all()
+
+    now = datetime.utcnow()
+    upsert_add(connection, table, ['key'], [
+        {'key': key, 'value': int(correction or 0), 'updated_date': now}
+        for key, correction, is_computed, is_stored in groups if correction or not is_stored
+    ], add_columns=['value'], replace_columns=['updated_date'])
+    # Keys that no longer count anything (a delta arriving meanwhile keeps its row)
+    stale = [key for key, _, is_computed, _ in groups if not is_computed]
+    for offset in range(0, len(stale), 500):
+        connection.execute(delete(table).where(table.c.key.in_(stale[offset:offset + 500]), table.c.value == 0))
+    return sum(1 for group in groups if group[2])
+
+# Dashboard read
+
+def read_dashboard(connection):
+    """
+    Dashboard statistics from the counters table in a single query. Before
+    the first refresh (or after a reset) the table is empty: the figures are
+    zero and 'updated' is None, and the caller schedules the refresh.
+    """
+    from app.models import StatsCounter, Project
+
+    project_key = literal('project:') + cast(Project.id, String)
+    rows = connection.execute(
+        select(StatsCounter.key, StatsCounter.value, Project.name, StatsCounter.updated_date)
+        .outerjoin(Project, StatsCounter.key == project_key)
+    ).all()
+
+    today = datetime.utcnow().date()
+    week_days = {f'{today - timedelta(days=offset):%Y-%m-%d}' for offset in range(WEEK_DAYS + 1)}
+
+    totals, file_types, projects = {}, [], []
+    files_this_week = searches_this_week = 0
+    updated = None
+    for key, value, project_name, updated_date in rows:
+        kind, _, name = key.partition(':')
+        if updated_date and (updated is None or updated_date > updated):
+            updated = updated_date
+        if kind == 'totals':
+            totals[name] = value
+        elif kind == 'filetype' and value > 0:
+            file_types.append({'type': None if name == 'None' else name, 'count': value})
+        elif kind == 'project' and value > 0 and project_name is not None:
+            projects.append({'name': project_name, 'files': value})
+        elif kind == 'indexed' and name in week_days:
+            files_this_week += value
+        elif kind == 'searches' and name in week_days:
+            searches_this_week += value
+
+    file_types.sort(key=lambda item: item['count'], reverse=True)
+    projects.sort(key=lambda item: item['files'], reverse=True)
+
+    return {
+        'totals': {
+            'files': totals.get('files', 0),
+            'projects': totals.get('projects', 0),
+            'tags': totals.get('tags', 0),
+            'users': totals.get('users', 0),
+            'total_size': totals.get('total_size', 0)
+        },
+        'activity': {
+            'files_this_week': files_this_week,
+            'searches_this_week': searches_this_week
+        },
+        'file_types': file_types[:10],
+        'active_projects': projects[:5],
+        'updated': updated.isoformat() if updated else None
+    }
@@ -0,0 +1,165 @@
+"""
+Bulk Tag Operations
+Delete, merge, rename, apply and remove tags with set-based statements on
+file_tags instead of loading the tagged files through the ORM. Each
+operation keeps the side tables the ORM hooks would otherwise maintain
+(active file counts, dashboard tag total, search index generation) in step
+within the same transaction.
+"""
+
+from sqlalchemy import select, insert, delete, update, exists, literal
+from app.services.file_counts import refresh_file_counts
+from app.services.search_index import bump_generation
+from app.services.stats import apply_deltas
+
+class TagNameConflict(ValueError):
+    """Another tag already has the requested name"""
+
+def _tables():
+    from app.models import Tag, File, file_tags
+    return Tag.__table__, File.__table__, file_tags
+
+def _ids(values, field):
+    try:
+        ids = sorted({int(value) for value in values})
+    except (TypeError, ValueError):
+        raise ValueError(f'{field} must be a list of integer ids')
+    if not ids:
+        raise ValueError(f'{field} must not be empty')
+    return ids
+
+def _require_tags(connection, tag_ids):
+    tags, _, _ = _tables()
+    found = set(connection.execute(select(tags.c.id).where(tags.c.id.in_(tag_ids))).scalars())
+    missing = sorted(set(tag_ids) - found)
+    if missing:
+        raise LookupError(f'Tags not found: {missing}')
+
+def file_selection(filters, active_only=True):
+    """SELECT of file ids matching filters (file_ids, project_id, filetype, search, tag_id or all)"""
+    _, files, file_tags = _tables()
+    filters = filters or {}
+    conditions = []
+
+    if filters.get('file_ids') is not None:
+        conditions.append(files.c.id.in_(_ids(filters['file_ids'], 'file_ids')))
+    if filters.get('project_id') is not None:
+        conditions.append(files.c.project_id == int(filters['project_id']))
+    if filters.get('filetype'):
+        conditions.append(files.c.filetype == filters['filetype'])
+    if filters.get('search'):
+        conditions.append(files.c.filename.ilike(f"%{filters['search']}%"))
+    if filters.get('tag_id') is not None:
+        conditions.append(exists().where(
+            file_tags.c.file_id == files.c.id, file_tags.c.tag_id == int(filters['tag_id'])
+        ))
+
+    # An empty filter would touch the whole catalog; make callers say so
+    if not conditions and not filters.get('all'):
+        raise ValueError('Provide a file filter (file_ids, project_id, filetype, search, tag_id) or "all": true')
+
+    if active_only:
+        conditions.append(files.c.is_active == True)
+    return select(files.c.id).where(*conditions)
+
+def _finish(connection, tag_ids=(), deleted_tags=0):
+    if tag_ids:
+        refresh_file_counts(connection, tag_ids=tag_ids)
+    if deleted_tags:
+        apply_deltas(connection, {'totals:tags': -deleted_tags})
+    bump_generation(connection)
+
+def delete_tags(connection, tag_ids):
+    """Delete tags and all their file associations"""
+    tags, _, file_tags = _tables()
+    tag_ids = _ids(tag_ids, 'tag_ids')
+    _require_tags(connection, tag_ids)
+
+    unlinked = connection.execute(delete(file_tags).where(file_tags.c.tag_id.in_(tag_ids))).rowcount
+    deleted = connection.execute(delete(tags).where(tags.c.id.in_(tag_ids))).rowcount
+    _finish(connection, deleted_tags=deleted)
+    return {'tags_deleted': deleted, 'associations_removed': unlinked}
+
+def merge_tags(connection, source_ids, target_id):
+    """Move every file of the source tags onto the target tag, then delete the sources"""
+    tags, _, file_tags = _tables()
+    target_id = int(target_id)
+    source_ids = [tag_id for tag_id in _ids(source_ids, 'source_ids') if tag_id != target_id]
+    if not source_ids:
+        raise ValueError('source_ids must contain a tag other than the target')
+    _require_tags(connection, source_ids + [target_id])
+
+    already_tagged = select(file_tags.c.file_id).where(file_tags.c.tag_id == target_id)
+    moved = connection.execute(insert(file_tags).from_select(
+        ['file_id', 'tag_id'],
+        select(file_tags.c.file_id, literal(target_id))
+        .where(file_tags.c.tag_id.in_(source_ids), file_tags.c.file_id.not_in(already_tagged))
+        .distinct()
+    )).rowcount
+    unlinked = connection.execute(delete(file_tags).where(file_tags.c.tag_id.in_(source_ids))).rowcount
+    deleted = connection.execute(delete(tags).where(tags.c.id.in_(source_ids))).rowcount
+    _finish(connection, tag_ids=[target_id], deleted_tags=deleted)
+    return {'tags_deleted': deleted, 'files_added_to_target': moved, 'associations_removed': unlinked}
+
+def rename_tag(connection, tag_id, name):
+    """Rename a tag (TagNameConflict if the name is taken; merge instead)"""
+    tags, _, _ = _tables()
+    tag_id = int(tag_id)
+    name = (name or '').strip()
+    if not name:
+        raise ValueError('name is required')
+    _require_tags(connection, [tag_id])
+
+    taken = connection.execute(select(tags.c.id).where(tags.c.name == name, tags.c.id != tag_id)).first()
+    if taken:
+        raise TagNameConflict(f'Tag name already exists (tag {taken.id}); merge the tags instead')
+
+    renamed = connection.execute(update(tags).where(tags.c.id == tag_id).values(name=name)).rowcount
+    _finish(connection)
+    return {'tags_renamed': renamed}
+
+def apply_tag(connection, tag_id, filters):
+    """Attach a tag to every active file matching filters"""
+    _, _, file_tags = _tables()
+    tag_id = int(tag_id)
+    _require_tags(connection, [tag_id])
+
+    selection = file_selection(filters).subquery()
+    already_tagged = select(file_tags.c.file_id).where(file_tags.c.tag_id == tag_id)
+    added = connection.execute(insert(file_tags).from_select(
+        ['file_id', 'tag_id'],
+        select(selection.c.id, literal(tag_id)).where(selection.c.id.not_in(already_tagged))
+    )).rowcount
+    _finish(connection, tag_ids=[tag_id])
+    return {'files_tagged': added}
+
+def remove_tag(connection, tag_id, filters):
+    """Detach a tag from every file (active or not) matching filters"""
+    _, _, file_tags = _tables()
+    tag_id = int(tag_id)
+    _require_tags(connection, [tag_id])
+
+    removed = connection.execute(delete(file_tags).where(
+        file_tags.c.tag_id == tag_id,
+        file_tags.c.file_id.in_(file_selection(filters, active_only=False))
+    )).rowcount
+    _finish(connection, tag_ids=[tag_id])
+    return {'files_untagged': removed}
+
+def run_bulk_operation(connection, payload):
+    """Dispatch a POST /tags/bulk payload to the matching operation"""
+    action = payload.get('action')
+    if action == 'delete':
+        return delete_tags(connection, payload.get('tag_ids') or [])
+    if action == 'merge':
+        if payload.get('target_id') is None:
+            raise ValueError('target_id is required')
+        return merge_tags(connection, payload.get('source_ids') or [], payload['target_id'])
+    if action in ('rename', 'apply', 'remove') and payload.get('tag_id') is None:
+        raise ValueError('tag_id is required')
+    if action == 'rename':
+        return rename_tag(connection, payload.get('tag_id'), payload.get('name'))
+    if action in ('apply', 'remove'):
+        operation = apply_tag if action == 'apply' else remove_tag
+        return operation(connection, payload['tag_id'], payload.get('filters'))
+    raise ValueError('action must be one of: delete, merge, rename, apply, remove')
@@ -0,0 +1,283 @@
+"""
+Upload Handling
+Writes uploaded files, and the members of zip/tar archives, to the upload
+folder in a single pass that also computes the size, line count and sha256.
+Name collisions for the whole request are resolved with one query, and the
+saved files are handed to the indexer in bulk.
+"""
+
+import os
+import re
+import stat
+import shutil
+import tarfile
+import zipfile
+from datetime import datetime
+from sqlalchemy import select, or_
+from werkzeug.utils import secure_filename
+from app.services import blob_store
+from app.services.duplicates import SIGNATURE_MAX_BYTES, scan_signature
+from app.utils.hashing import ContentScan
+
+CHUNK_SIZE = 1024 * 1024
+
+ARCHIVE_SUFFIXES = ('.zip', '.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tbz2', '.tar.xz', '.txz')
+
+# Zip-bomb guards for a single archive
+MAX_ARCHIVE_MEMBERS = int(os.getenv('UPLOAD_MAX_ARCHIVE_MEMBERS', 10000))
+MAX_EXTRACTED_BYTES = int(os.getenv('UPLOAD_MAX_EXTRACTED_MB', 1024)) * 1024 * 1024
+
+# Directories inside archives that are never worth indexing (same list as the directory scan)
+SKIPPED_DIRECTORIES = {'node_modules', '__pycache__', '.git', 'dist', 'build', 'out', '__MACOSX'}
+
+_DRIVE_PATTERN = re.compile(r'^[A-Za-z]:')
+
+def is_archive(filename):
+    return filename.lower().endswith(ARCHIVE_SUFFIXES)
+
+def _archive_stem(filename):
+    lower = filename.lower()
+    for suffix in sorted(ARCHIVE_SUFFIXES, key=len, reverse=True):
+        if lower.endswith(suffix):
+            return filename[:-len(suffix)] or 'archive'
+    return filename
+
+def write_stream(source, path, max_bytes=None):
+    """Copy a binary stream to path, computing size, line count, sha256 and SimHash on the way"""
+    scan = ContentScan(SIGNATURE_MAX_BYTES)
+    partial_path = path + '.partial'
+    try:
+        with open(partial_path, 'wb') as target:
+            while chunk := source.read(CHUNK_SIZE):
+                if max_bytes is not None and scan.size + len(chunk) > max_bytes:
+                    raise ValueError(f'exceeds the {max_bytes // (1024 * 1024)}MB limit')
+                scan.update(chunk)
+                target.write(chunk)
+        os.replace(partial_path, path)
+    except BaseException:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        raise
+
+    return {
+        'size': scan.size,
+        'line_count': scan.line_count,
+        'content_hash': scan.hexdigest(),
+        'simhash': scan_signature(scan),
+        'modified_date': datetime.utcnow()
+    }
+
+def save_stream(source, path, max_bytes=None):
+    """write_stream() into the blob store, materializing the result at path"""
+    if not blob_store.ENABLED:
+        return write_stream(source, path, max_bytes)
+    scratch = blob_store.temp_path()
+    info = write_stream(source, scratch, max_bytes)
+    info['storage'] = blob_store.store(scratch, info['content_hash'], path)
+    return info
+
+def _escape_like(value):
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+def unique_filenames(connection, filenames, directory):
+    """Collision-free names (against the files table, the directory and each other) in one query"""
+    from app.models import File
+
+    if not filenames:
+        return []
+    files = File.__table__
+    conditions = []
+    for name in set(filenames):
+        base, ext = os.path.splitext(name)
+        conditions.append(files.c.filename == name)
+        conditions.append(files.c.filename.like(f'{_escape_like(base)}\\_%{_escape_like(ext)}', escape='\\'))
+    taken = set(connection.execute(select(files.c.filename).where(or_(*conditions))).scalars())
+
+    resolved = []
+    for name in filenames:
+        base, ext = os.path.splitext(name)
+        candidate, counter = name, 1
+        while candidate in taken or os.path.exists(os.path.join(directory, candidate)):
+            candidate = f'{base}_{counter}{ext}'
+            counter += 1
+        taken.add(candidate)
+        resolved.append(candidate)
+    return resolved
+
+def _unique_directory(parent, name):
+    candidate, counter = name, 1
+    while os.path.exists(os.path.join(parent, candidate)):
+        candidate = f'{name}_{counter}'
+        counter += 1
+    path = os.path.join(parent, candidate)
+    os.makedirs(path)
+    return path
+
+def _safe_member_path(name):
+    """Relative path for an archive member, or None if it must not be extracted"""
+    name = name.replace('\\', '/')
+    if name.startswith('/') or _DRIVE_PATTERN.match(name):
+        return None
+    parts = [part for part in name.split('/') if part not in ('', '.')]
+    if not parts or '..' in parts:
+        return None
+    if any(part.startswith('.') or part in SKIPPED_DIRECTORIES for part in parts):
+        return None
+    parts = [secure_filename(part) for part in parts]
+    if not all(parts):
+        return None
+    return os.path.join(*parts)
+
+class _Extraction:
+    """Book-keeping shared by the zip and tar readers"""
+
+    def __init__(self, directory, accept, max_member_bytes):
+        self.directory = os.path.abspath(directory)
+        self.accept = accept
+        self.max_member_bytes = max_member_bytes
+        self.members = 0
+        self.total_bytes = 0
+        # {path: info}: a member stored twice (a/x.c and ./a/x.c) is one file, the last copy wins
+        self.entries = {}
+        self.skipped = []
+
+    def add(self, name, source):
+        self.members += 1
+        if self.members > MAX_ARCHIVE_MEMBERS:
+            raise ValueError(f'archive has more than {MAX_ARCHIVE_MEMBERS} members')
+
+        relative = _safe_member_path(name)
+        if relative is None or (self.accept and not self.accept(relative)):
+            self.skipped.append(name)
+            return
+
+        path = os.path.join(self.directory, relative)
+        if os.path.commonpath([self.directory, os.path.abspath(path)]) != self.directory:
+            self.skipped.append(name)
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # A copy this member replaces no longer counts towards the size limit
+        replaced = self.entries.get(path)
+        remaining = MAX_EXTRACTED_BYTES - self.total_bytes + (replaced['size'] if replaced else 0)
+        if self.max_member_bytes is not None and self.max_member_bytes < remaining:
+            # Oversized members are skipped, like oversized files in a directory scan
+            try:
+                with source() as member:
+                    info = save_stream(member, path, max_bytes=self.max_member_bytes)
+            except ValueError:
+                self.skipped.append(name)
+                return
+        else:
+            try:
+                with source() as member:
+                    info = save_stream(member, path, max_bytes=remaining)
+            except ValueError:
+                raise ValueError(f'archive expands beyond {MAX_EXTRACTED_BYTES // (1024 * 1024)}MB')
+        self.total_bytes += info['size'] - (replaced['size'] if replaced else 0)
+        self.entries[path] = info
+
+def extract_archive(stream, filename, directory, accept=None, max_member_bytes=None):
+    """Extract a zip or tar archive into directory; returns ([(path, info)], [skipped names])"""
+    extraction = _Extraction(directory, accept, max_member_bytes)
+
+    if filename.lower().endswith('.zip'):
+        with zipfile.ZipFile(stream) as archive:
+            for member in archive.infolist():
+                mode = member.external_attr >> 16
+                if member.is_dir() or stat.S_ISLNK(mode):
+                    continue
+                extraction.add(member.filename, lambda member=member: archive.open(member))
+    else:
+        # Streaming mode: members are read in order without seeking
+        with tarfile.open(fileobj=stream, mode='r|*') as archive:
+            for member in archive:
+                if not member.isfile():
+                    continue
+                extraction.add(member.name, lambda member=member: archive.extractfile(member))
+
+    return list(extraction.entries.items()), extraction.skipped
+
+def remove_paths(paths):
+    """Delete files and extraction directories written by a failed upload"""
+    for path in paths:
+        if os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+        elif os.path.exists(path):
+            os.remove(path)
+
+def store_uploads(uploads, project, upload_folder, description='', tags=(), accept=None, extract=True):
+    """
+    Save and index uploaded files (werkzeug FileStorage objects) for project.
+    Returns {'results': [...per upload...], 'paths': [...written...]}; the
+    caller commits, or passes paths to remove_paths() if the commit fails.
+    """
+    from app import db
+    from app.services.file_indexer import FileIndexer
+
+    os.makedirs(upload_folder, exist_ok=True)
+    results = [None] * len(uploads)
+    plain, archives = [], []
+    for index, upload in enumerate(uploads):
+        name = secure_filename(upload.filename or '')
+        if extract and is_archive(name):
+            archives.append((index, upload, name))
+        elif not name or (accept and not accept(name)):
+            results[index] = {'name': upload.filename, 'status': 'error', 'error': 'File type not allowed'}
+        else:
+            plain.append((index, upload, name))
+
+    indexer = FileIndexer()
+    written, plain_entries, extracted = [], [], []
+    try:
+        names = unique_filenames(db.session.connection(), [name for _, _, name in plain], upload_folder)
+        for (index, upload, _), name in zip(plain, names):
+            path = os.path.abspath(os.path.join(upload_folder, name))
+            info = save_stream(upload.stream, path)
+            written.append(path)
+            plain_entries.append((index, path, info))
+
+        for index, upload, name in archives:
+            directory = _unique_directory(upload_folder, _archive_stem(name))
+            written.append(directory)
+            try:
+                entries, skipped = extract_archive(upload.stream, name, directory, accept, indexer.max_file_size)
+            except (ValueError, zipfile.BadZipFile, tarfile.TarError) as e:
+                shutil.rmtree(directory, ignore_errors=True)
+                written.remove(directory)
+                results[index] = {'name': upload.filename, 'status': 'error', 'error': f'Invalid archive: {e}'}
+                continue
+            extracted.append((index, upload.filename, entries, skipped))
+
+        files = indexer.index_files([(path, info) for _, path, info in plain_entries], project,
+                                    description=description, tag_names=tags, auto_tags=False)
+        for (index, _, _), file in zip(plain_entries, files):
+            results[index] = {'name': uploads[index].filename, 'status': 'ok', 'file': {
+                'id': file.id,
+                'filename': file.filename,
+                'size': file.size,
+                'project': project.name
+            }}
+
+        archive_files = indexer.index_files(
+            [entry for _, _, entries, _ in extracted for entry in entries], project,
+            description=description or None, tag_names=tags
+        )
+        position = 0
+        for index, name, entries, skipped in extracted:
+            ids = [file.id for file in archive_files[position:position + len(entries)]]
+            position += len(entries)
+            results[index] = {'name': name, 'status': 'ok', 'archive': True,
+                              'files_indexed': len(ids), 'file_ids': ids,
+                              'skipped': len(skipped), 'skipped_members': skipped[:50]}
+
+        saved = [info for _, _, info in plain_entries]
+        saved += [info for _, _, entries, _ in extracted for _, info in entries]
+        blob_store.add_references(db.session.connection(), [
+            (info['content_hash'], info['size']) for info in saved if 'storage' in info
+        ])
+    except BaseException:
+        remove_paths(written)
+        raise
+
+    return {'results': results, 'paths': written}
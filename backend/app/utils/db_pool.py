@@ -0,0 +1,177 @@
+"""
+Database Connection Pool Configuration
+Sizes the SQLAlchemy pool from the Gunicorn worker count so that all workers
+together stay inside the PostgreSQL connection budget, and records checkout
+latency so pool starvation is visible
+"""
+
+import os
+import time
+import threading
+import multiprocessing
+from sqlalchemy import event, exc
+from sqlalchemy.pool import NullPool, QueuePool
+
+def _env_bool(name, default):
+    return os.getenv(name, str(default)).lower() == 'true'
+
+def worker_count():
+    """Number of Gunicorn worker processes sharing the database (mirrors gunicorn_config.py)"""
+    if os.getenv('WEB_CONCURRENCY'):
+        return max(1, int(os.getenv('WEB_CONCURRENCY')))
+    if os.getenv('WORKER_CLASS', 'sync').lower() == 'gevent':
+        return multiprocessing.cpu_count() + 1
+    return multiprocessing.cpu_count() * 2 + 1
+
+class PoolMetrics:
+    """Per-process counters for pool checkouts"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.checkouts = 0
+            self.timeouts = 0
+            self.slow_checkouts = 0
+            self.total_wait = 0.0
+            self.max_wait = 0.0
+            self.in_use = 0
+            self.peak_in_use = 0
+
+    def record_wait(self, seconds, slow_threshold):
+        with self._lock:
+            self.checkouts += 1
+            self.total_wait += seconds
+            self.max_wait = max(self.max_wait, seconds)
+            if seconds >= slow_threshold:
+                self.slow_checkouts += 1
+
+    def record_timeout(self, seconds):
+        with self._lock:
+            self.timeouts += 1
+            self.max_wait = max(self.max_wait, seconds)
+
+    def record_checkout(self):
+        with self._lock:
+            self.in_use += 1
+            self.peak_in_use = max(self.peak_in_use, self.in_use)
+
+    def record_checkin(self):
+        with self._lock:
+            self.in_use = max(0, self.in_use - 1)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'pid': os.getpid(),
+                'checkouts': self.checkouts,
+                'timeouts': self.timeouts,
+                'slow_checkouts': self.slow_checkouts,
+                'avg_wait_ms': round(self.total_wait / self.checkouts * 1000, 3) if self.checkouts else 0.0,
+                'max_wait_ms': round(self.max_wait * 1000, 3),
+                'in_use': self.in_use,
+                'peak_in_use': self.peak_in_use
+            }
+
+pool_metrics = PoolMetrics()
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that measures how long each checkout waits for a connection"""
+
+    slow_checkout_seconds = float(os.getenv('DB_POOL_SLOW_CHECKOUT_MS', 100)) / 1000
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            pool_metrics.record_timeout(time.perf_counter() - started)
+            raise
+        pool_metrics.record_wait(time.perf_counter() - started, self.slow_checkout_seconds)
+        return connection
+
+# Execution option set by maintenance_engine
+LIFT_STATEMENT_TIMEOUT = 'lift_statement_timeout'
+
+def build_engine_options(database_uri):
+    """Build SQLALCHEMY_ENGINE_OPTIONS for the configured database"""
+    if not database_uri.startswith('postgresql'):
+        return {'pool_pre_ping': _env_bool('DB_POOL_PRE_PING', True)}
+
+    statement_timeout = int(os.getenv('DB_STATEMENT_TIMEOUT_MS', 30000))
+
+    if _env_bool('DB_PGBOUNCER', False):
+        # PgBouncer (transaction pooling) owns the pool: hold no idle connections
+        # here and send no startup parameters it would reject. The statement
+        # timeout is applied per transaction instead (see install_pool_listeners).
+        return {'poolclass': NullPool}
+
+    workers = worker_count()
+    budget = int(os.getenv('DB_MAX_CONNECTIONS', 90))
+    per_worker = max(2, budget // workers)
+
+    pool_size = int(os.getenv('DB_POOL_SIZE', max(1, per_worker * 3 // 4)))
+    max_overflow = int(os.getenv('DB_MAX_OVERFLOW', max(0, per_worker - pool_size)))
+
+    options = {
+        'poolclass': TimedQueuePool,
+        'pool_size': pool_size,
+        'max_overflow': max_overflow,
+        'pool_timeout': int(os.getenv('DB_POOL_TIMEOUT', 30)),
+        'pool_recycle': int(os.getenv('DB_POOL_RECYCLE', 1800)),
+        'pool_pre_ping': _env_bool('DB_POOL_PRE_PING', True),
+        'pool_use_lifo': True
+    }
+    if statement_timeout > 0:
+        options['connect_args'] = {'options': f'-c statement_timeout={statement_timeout}'}
+    return options
+
+def install_pool_listeners(app, engine):
+    """Attach checkout/checkin metrics and PgBouncer-safe statement timeouts"""
+    @event.listens_for(engine, 'checkout')
+    def on_checkout(dbapi_connection, connection_record, connection_proxy):
+        pool_metrics.record_checkout()
+
+    @event.listens_for(engine, 'checkin')
+    def on_checkin(dbapi_connection, connection_record):
+        pool_metrics.record_checkin()
+
+    statement_timeout = int(os.getenv('DB_STATEMENT_TIMEOUT_MS', 30000))
+    if engine.dialect.name == 'postgresql' and statement_timeout > 0:
+        pgbouncer = _env_bool('DB_PGBOUNCER', False)
+
+        @event.listens_for(engine, 'begin')
+        def on_begin(connection):
+            if connection.get_execution_options().get(LIFT_STATEMENT_TIMEOUT):
+                connection.exec_driver_sql('SET LOCAL statement_timeout = 0')
+            elif pgbouncer:
+                connection.exec_driver_sql(f'SET LOCAL statement_timeout = {statement_timeout}')
+
+    app.logger.info(f'Database pool configured: {describe_pool(engine)}')
+
+def maintenance_engine(engine):
+    """
+    The engine for maintenance work - migrations, scheduled jobs, maintenance
+    commands, restores and exports - whose transactions run without
+    DB_STATEMENT_TIMEOUT_MS: bulk copies, rebuilds and full-table aggregates
+    legitimately take minutes. The timeout is lifted with SET LOCAL when each
+    transaction begins, so pooled connections keep the default afterwards.
+    """
+    return engine.execution_options(**{LIFT_STATEMENT_TIMEOUT: True})
+
+def describe_pool(engine):
+    """Current pool sizing and occupancy"""
+    pool = engine.pool
+    info = {'class': type(pool).__name__, 'workers': worker_count()}
+    if isinstance(pool, QueuePool):
+        info.update({
+            'size': pool.size(),
+            'max_overflow': pool._max_overflow,
+            'checked_in': pool.checkedin(),
+            'checked_out': pool.checkedout(),
+            'overflow': pool.overflow(),
+            'timeout': pool.timeout()
+        })
+    return info
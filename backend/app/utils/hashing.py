@@ -0,0 +1,81 @@
+"""
+Content Hashing
+The one definition of files.content_hash: hex SHA-256 of the file's bytes.
+The indexer, uploads, blob store and integrity checks all hash through here.
+"""
+
+import hashlib
+
+ALGORITHM = 'sha256'
+
+# Hex digest length; anything else in content_hash predates the switch to SHA-256
+DIGEST_LENGTH = 64
+
+CHUNK_SIZE = 1024 * 1024
+
+def new_hasher():
+    return hashlib.new(ALGORITHM)
+
+def hash_file(path):
+    """Hex digest of a file's contents (raises OSError if it cannot be read)"""
+    hasher = new_hasher()
+    with open(path, 'rb') as source:
+        while chunk := source.read(CHUNK_SIZE):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+class ContentScan:
+    """
+    Size, line count and content hash of a byte stream fed chunk by chunk,
+    plus its first head_bytes bytes, so one read of a file serves them all.
+    Lines are counted like iterating a text file: \n, \r\n and a lone \r
+    each end one, and a last unterminated line counts too.
+    """
+
+    def __init__(self, head_bytes=0):
+        self.hasher = new_hasher()
+        self.size = 0
+        self.lines = 0
+        self.head_bytes = head_bytes
+        self.head = bytearray()
+        self.previous = b''
+
+    def update(self, chunk):
+        self.size += len(chunk)
+        self.hasher.update(chunk)
+        self.lines += chunk.count(b'\n') + chunk.count(b'\r') - chunk.count(b'\r\n')
+        if self.previous == b'\r' and chunk[:1] == b'\n':
+            self.lines -= 1
+        self.previous = chunk[-1:]
+        if len(self.head) < self.head_bytes:
+            self.head += chunk[:self.head_bytes - len(self.head)]
+
+    @property
+    def line_count(self):
+        return self.lines + 1 if self.size and self.previous not in (b'\n', b'\r') else self.lines
+
+    def hexdigest(self):
+        return self.hasher.hexdigest()
+
+def scan_file(path, head_bytes=0):
+    """ContentScan of a whole file (raises OSError if it cannot be read)"""
+    scan = ContentScan(head_bytes)
+    with open(path, 'rb') as source:
+        while chunk := source.read(CHUNK_SIZE):
+            scan.update(chunk)
+    return scan
+
+def try_hash_file(path):
+    """hash_file(), or None if the file cannot be read"""
+    try:
+        return hash_file(path)
+    except OSError:
+        return None
+
+def hash_files(paths):
+    """[try_hash_file(path)] for a batch of paths (the unit of work sent to worker processes)"""
+    return [try_hash_file(path) for path in paths]
+
+def is_current(content_hash):
+    """True if content_hash was produced by this module's algorithm"""
+    return bool(content_hash) and len(content_hash) == DIGEST_LENGTH
@@ -0,0 +1,213 @@
+"""
+Response Utilities
+Negotiated response compression and streaming JSON encoding for large payloads
+"""
+
+import os
+import types
+import zlib
+from flask import Response, current_app, request, stream_with_context
+
+try:
+    import brotli
+except ImportError:  # brotli is optional - fall back to gzip only
+    brotli = None
+
+COMPRESSIBLE_MIMETYPES = {
+    'application/json', 'application/javascript', 'application/xml',
+    'text/html', 'text/css', 'text/plain', 'text/javascript', 'image/svg+xml'
+}
+
+# Flush streamed JSON to the client in chunks of roughly this many bytes
+STREAM_CHUNK_SIZE = 64 * 1024
+
+def _parse_accept_encoding(header):
+    """Parse an Accept-Encoding header into a {coding: q} dict"""
+    codings = {}
+    for part in (header or '').split(','):
+        part = part.strip()
+        if not part:
+            continue
+        coding, _, params = part.partition(';')
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        codings[coding.strip().lower()] = q
+    return codings
+
+def choose_encoding(accept_encoding):
+    """Pick the best supported content coding for an Accept-Encoding header"""
+    codings = _parse_accept_encoding(accept_encoding)
+    wildcard = codings.get('*', 0.0)
+
+    candidates = ['br', 'gzip'] if brotli is not None else ['gzip']
+    best, best_q = None, 0.0
+    for coding in candidates:
+        q = codings.get(coding, wildcard)
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+class _Compressor:
+    """Incremental gzip/brotli compressor with a common interface"""
+
+    def __init__(self, encoding, level):
+        self.encoding = encoding
+        if encoding == 'br':
+            self._impl = brotli.Compressor(quality=min(level, 11))
+        else:
+            # wbits=31 produces a gzip container
+            self._impl = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data):
+        if self.encoding == 'br':
+            return self._impl.process(data)
+        return self._impl.compress(data)
+
+    def flush(self):
+        if self.encoding == 'br':
+            return self._impl.flush()
+        return self._impl.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        if self.encoding == 'br':
+            return self._impl.finish()
+        return self._impl.flush()
+
+def _compress_stream(chunks, encoding, level):
+    """Compress an iterable of byte/str chunks on the fly"""
+    compressor = _Compressor(encoding, level)
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode('utf-8')
+        if not chunk:
+            continue
+        data = compressor.compress(chunk) + compressor.flush()
+        if data:
+            yield data
+    yield compressor.finish()
+
+def init_compression(app):
+    """Register the after_request hook that compresses eligible responses"""
+    app.config.setdefault('COMPRESSION_ENABLED', os.getenv('COMPRESSION_ENABLED', 'True').lower() == 'true')
+    app.config.setdefault('COMPRESSION_MIN_SIZE', int(os.getenv('COMPRESSION_MIN_SIZE', 1024)))
+    app.config.setdefault('COMPRESSION_LEVEL', int(os.getenv('COMPRESSION_LEVEL', 6)))
+
+    @app.after_request
+    def compress_response(response):
+        if not app.config['COMPRESSION_ENABLED']:
+            return response
+
+        if response.status_code < 200 or response.status_code in (204, 206, 304):
+            return response
+        if response.mimetype not in COMPRESSIBLE_MIMETYPES:
+            return response
+        if 'Content-Encoding' in response.headers:
+            return response
+
+        encoding = choose_encoding(request.headers.get('Accept-Encoding'))
+        if not encoding:
+            return response
+
+        level = app.config['COMPRESSION_LEVEL']
+
+        if response.is_streamed:
+            # send_file() responses are streamed file wrappers - leave them to the front-end server
+            if response.direct_passthrough:
+                return response
+            response.response = _compress_stream(response.response, encoding, level)
+            response.headers.pop('Content-Length', None)
+        else:
+            if (response.content_length or 0) < app.config['COMPRESSION_MIN_SIZE']:
+                return response
+            compressor = _Compressor(encoding, level)
+            response.set_data(compressor.compress(response.get_data()) + compressor.finish())
+
+        response.headers['Content-Encoding'] = encoding
+        response.vary.add('Accept-Encoding')
+        return response
+
+    return app
+
+class TextStream:
+    """A JSON string member whose text is produced chunk by chunk (e.g. read from a file)"""
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+
+def _iter_json(value, dumps):
+    """Encode a value as JSON fragments, streaming nested generators lazily"""
+    if isinstance(value, TextStream):
+        # JSON escapes each character on its own, so the escaped chunks concatenate
+        yield '"'
+        for chunk in value.chunks:
+            if chunk:
+                yield dumps(chunk)[1:-1]
+        yield '"'
+    elif isinstance(value, types.GeneratorType):
+        yield '['
+        first = True
+        for item in value:
+            if not first:
+                yield ','
+            first = False
+            yield from _iter_json(item, dumps)
+        yield ']'
+    elif isinstance(value, dict) and any(isinstance(v, types.GeneratorType) for v in value.values()):
+        yield from _iter_members(value.items(), dumps)
+    else:
+        yield dumps(value)
+
+def _iter_members(members, dumps, trailer=None):
+    """Encode (key, value) pairs as a JSON object, optionally followed by trailer() members"""
+    yield '{'
+    first = True
+    for key, value in members:
+        if not first:
+            yield ','
+        first = False
+        yield dumps(str(key)) + ':'
+        yield from _iter_json(value, dumps)
+    if trailer is not None:
+        for key, value in (trailer() or {}).items():
+            if not first:
+                yield ','
+            first = False
+            yield dumps(str(key)) + ':'
+            yield from _iter_json(value, dumps)
+    yield '}'
+
+def stream_json(envelope, key, items, trailer=None, status=200):
+    """
+    Stream a JSON object whose `key` member is a (possibly very large) list.
+
+    `envelope` holds the members emitted before the list, `items` is any iterable
+    of JSON-serializable objects (generators nested inside items are streamed as
+    lists too) and `trailer` is an optional callable returning extra members
+    that are only known once the list has been consumed.
+    """
+    members = list(envelope.items()) + [(key, (item for item in items))]
+    return stream_json_members(members, trailer, status)
+
+def stream_json_members(members, trailer=None, status=200):
+    """
+    Stream a JSON object built from (key, value) `members`; generator values are
+    streamed as lists and TextStream values as strings, without holding either
+    in memory. `trailer` is as for stream_json.
+    """
+    def generate():
+        dumps = current_app.json.dumps
+        buffer, size = [], 0
+        for fragment in _iter_members(members, dumps, trailer):
+            buffer.append(fragment)
+            size += len(fragment)
+            if size >= STREAM_CHUNK_SIZE:
+                yield ''.join(buffer)
+                buffer, size = [], 0
+        yield ''.join(buffer)
+
+    return Response(stream_with_context(generate()), status=status, mimetype='application/json')
@@ -2,18 +2,23 @@
 Search Utility Functions
 """
 
-from fuzzywuzzy import fuzz, process
 from app.models import File, Tag, Project
+from app.services.search_index import get_snapshot
 import os
 
 def fuzzy_search(query, threshold=None):
     """Perform fuzzy search on filenames"""
+    from fuzzywuzzy import fuzz
+    
     if threshold is None:
         threshold = float(os.getenv('FUZZY_THRESHOLD', 0.7)) * 100
     
-    # Get all active files
-    files = File.query.filter_by(is_active=True).all()
-    filenames = [(f.id, f.filename) for f in files]
+    # Get all active files (from the shared snapshot when the app was preloaded)
+    snapshot = get_snapshot()
+    if snapshot is not None:
+        filenames = snapshot.iter_files()
+    else:
+        filenames = File.query.with_entities(File.id, File.filename).filter_by(is_active=True).all()
     
     # Perform fuzzy matching
     matches = []
@@ -28,6 +33,10 @@ def fuzzy_search(query, threshold=None):
 
 def get_search_suggestions(query, limit=10):
     """Get search suggestions based on partial query"""
+    snapshot = get_snapshot()
+    if snapshot is not None:
+        return snapshot.suggestions(query, limit)
+    
     suggestions = set()
     
     # Search in filenames
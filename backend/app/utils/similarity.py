@@ -0,0 +1,94 @@
+"""
+Near-Duplicate Signatures
+64-bit SimHash (Charikar) over token shingles of a file's text. Files whose
+signatures differ in only a few bits are near-duplicates. Signatures are
+split into bands for locality-sensitive lookup: two signatures within
+len(BAND_WIDTHS) - 1 bits of each other agree exactly on at least one band,
+so a candidate search only has to look at files sharing a band value.
+"""
+
+import re
+import hashlib
+
+BITS = 64
+BAND_WIDTHS = (11, 11, 11, 11, 10, 10)
+
+# (shift, mask) of each band, most significant band first
+_BANDS = [(BITS - sum(BAND_WIDTHS[:index + 1]), (1 << width) - 1) for index, width in enumerate(BAND_WIDTHS)]
+
+# Larger distances are not guaranteed to be found through the bands
+MAX_DISTANCE = len(BAND_WIDTHS) - 1
+
+SHINGLE_SIZE = 3
+
+# Files with fewer shingles than this get no signature (too little text to compare)
+MIN_SHINGLES = 8
+
+# Stored for files without a signature, so they are not rehashed on every run
+NO_SIGNATURE = 0
+
+_BYTES_WITH_BIT = [[byte for byte in range(256) if byte >> bit & 1] for bit in range(8)]
+
+# Identifiers, keywords and numbers; punctuation and comment decoration are ignored
+_TOKEN_PATTERN = re.compile(r'[A-Za-z_][A-Za-z0-9_]*|\d+')
+
+def simhash(text):
+    """Unsigned 64-bit SimHash of text, or NO_SIGNATURE for very short texts"""
+    tokens = _TOKEN_PATTERN.findall(text)
+    # Distinct shingles only, so repeated boilerplate lines do not outweigh the rest
+    shingles = set(zip(*(tokens[offset:] for offset in range(SHINGLE_SIZE))))
+    total = len(shingles)
+    if total < MIN_SHINGLES:
+        return NO_SIGNATURE
+
+    # Histogram of each byte of the feature hashes; per-bit counts are derived
+    # from the 8 x 256 histogram instead of testing 64 bits per shingle
+    histogram = [[0] * 256 for _ in range(BITS // 8)]
+    for shingle in shingles:
+        digest = hashlib.blake2b(' '.join(shingle).encode('utf-8', 'replace'), digest_size=BITS // 8).digest()
+        for position, byte in enumerate(digest):
+            histogram[position][byte] += 1
+
+    value = 0
+    for position, counts in enumerate(histogram):
+        for bit in range(8):
+            ones = sum(counts[byte] for byte in _BYTES_WITH_BIT[bit])
+            if 2 * ones > total:
+                value |= 1 << (BITS - 8 * (position + 1) + bit)
+    return value if value != NO_SIGNATURE else 1
+
+def content_simhash(data):
+    """SimHash of the leading bytes of a file (NO_SIGNATURE for binary content)"""
+    if b'\x00' in data[:8192]:
+        return NO_SIGNATURE
+    return simhash(bytes(data).decode('utf-8', 'replace'))
+
+def file_simhash(path, max_bytes=1024 * 1024):
+    """SimHash of the first max_bytes of a file (NO_SIGNATURE if it cannot be read)"""
+    try:
+        with open(path, 'rb') as source:
+            data = source.read(max_bytes)
+    except OSError:
+        return NO_SIGNATURE
+    return content_simhash(data)
+
+def to_signed(value):
+    """Unsigned signature to the signed BIGINT stored in the database"""
+    return value - (1 << BITS) if value >= 1 << (BITS - 1) else value
+
+def to_unsigned(value):
+    return value + (1 << BITS) if value < 0 else value
+
+def distance(a, b):
+    """Hamming distance between two signatures (signed or unsigned)"""
+    return ((to_unsigned(a) ^ to_unsigned(b)) & ((1 << BITS) - 1)).bit_count()
+
+def bands(value):
+    """Band values of a signature, most significant band first"""
+    value = to_unsigned(value)
+    return [(value >> shift) & mask for shift, mask in _BANDS]
+
+def band_sql(index, column='simhash'):
+    """SQL expression for one band; the expression indexes on files use this exact text"""
+    shift, mask = _BANDS[index]
+    return f'(({column} >> {shift}) & {mask})'
@@ -0,0 +1,71 @@
+"""
+Streaming Sketches
+Space-Saving top-K counter (Metwally et al.) used to track the most popular
+search terms in constant memory
+"""
+
+import heapq
+
+class SpaceSaving:
+    """
+    Approximate heavy hitters with at most `capacity` monitored items.
+
+    Every item whose true count exceeds total / capacity is guaranteed to be
+    monitored. Each reported count overestimates the true count by at most
+    its `error`, so count - error is a lower bound.
+    """
+
+    def __init__(self, capacity, items=None, total=0):
+        self.capacity = capacity
+        self.total = total
+        self._counts = {}   # item -> [count, error]
+        self._heap = []     # (count, item), may contain stale entries
+        for item, count, error in items or ():
+            self._counts[item] = [count, error]
+            self._heap.append((count, item))
+        heapq.heapify(self._heap)
+
+    def __len__(self):
+        return len(self._counts)
+
+    def __contains__(self, item):
+        return item in self._counts
+
+    def _pop_minimum(self):
+        while self._heap:
+            count, item = heapq.heappop(self._heap)
+            current = self._counts.get(item)
+            if current is not None and current[0] == count:
+                return item, count
+        raise IndexError('sketch is empty')
+
+    def update(self, item, weight=1):
+        """Count `weight` more occurrences of item"""
+        self.total += weight
+        entry = self._counts.get(item)
+        if entry is not None:
+            entry[0] += weight
+            heapq.heappush(self._heap, (entry[0], item))
+        elif len(self._counts) < self.capacity:
+            self._counts[item] = [weight, 0]
+            heapq.heappush(self._heap, (weight, item))
+        else:
+            # Replace the least counted item; the newcomer inherits its count as error
+            evicted, minimum = self._pop_minimum()
+            del self._counts[evicted]
+            self._counts[item] = [minimum + weight, minimum]
+            heapq.heappush(self._heap, (minimum + weight, item))
+
+        # Keep stale heap entries from piling up
+        if len(self._heap) > 4 * self.capacity + 64:
+            self._heap = [(count, key) for key, (count, _) in self._counts.items()]
+            heapq.heapify(self._heap)
+
+    def top(self, k):
+        """[(item, count, error)] for the k highest counts"""
+        ranked = sorted(self._counts.items(), key=lambda entry: (-entry[1][0], entry[1][1], entry[0]))
+        return [(item, count, error) for item, (count, error) in ranked[:k]]
+
+    def items(self):
+        """All monitored (item, count, error) triples, for persisting the sketch"""
+        return [(item, count, error) for item, (count, error) in self._counts.items()]
@@ -0,0 +1,156 @@
+"""
+Application Startup Helpers
+Phase timing for create_app and one-time database schema preparation
+"""
+
+import os
+import time
+from contextlib import contextmanager
+
+# Database URIs whose schema has already been prepared in this process
+_prepared_databases = set()
+
+# Database-only app shared by the CLI scripts running in this process
+_script_app = None
+
+# Arbitrary key for the PostgreSQL advisory lock serializing startup upgrades
+UPGRADE_LOCK_KEY = 0x436F646578
+
+class StartupTimer:
+    """Collects the duration of each create_app phase"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases = {}
+
+    @contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + (time.perf_counter() - started)
+
+    def report(self):
+        """Phase durations in milliseconds"""
+        report = {name: round(seconds * 1000, 1) for name, seconds in self.phases.items()}
+        report['total'] = round((time.perf_counter() - self.started) * 1000, 1)
+        return report
+
+    def summary(self):
+        report = self.report()
+        total = report.pop('total')
+        breakdown = ', '.join(f'{name} {ms}ms' for name, ms in report.items())
+        return f'{total}ms ({breakdown})'
+
+def script_app():
+    """Build the database-only script app once and reuse it"""
+    global _script_app
+    if _script_app is None:
+        from app import create_app
+        _script_app = create_app('script')
+    return _script_app
+
+def startup_mode():
+    """
+    How create_app treats the database schema (DB_STARTUP_MODE):
+    - verify:  compare the database revision with the migration head (default)
+    - upgrade: run pending migrations, serialized across workers
+    - create:  legacy db.create_all() plus default admin bootstrap
+    - skip:    do not touch the database at startup
+    """
+    mode = os.getenv('DB_STARTUP_MODE', 'verify').lower()
+    return mode if mode in ('verify', 'upgrade', 'create', 'skip') else 'verify'
+
+def prepare_database(app, db, mode):
+    """Prepare the schema once per process and database, returning what was done"""
+    key = app.config['SQLALCHEMY_DATABASE_URI']
+    if mode == 'skip':
+        return 'skipped'
+    if key in _prepared_databases:
+        return 'already prepared'
+
+    if mode == 'create':
+        result = _create_schema(app, db)
+    elif mode == 'upgrade':
+        result = _upgrade_schema(app, db)
+    else:
+        result = _verify_schema(app, db)
+
+    _prepared_databases.add(key)
+    return result
+
+def _migration_head():
+    from alembic.script import ScriptDirectory
+    from flask import current_app
+
+    config = current_app.extensions['migrate'].migrate.get_config()
+    return ScriptDirectory.from_config(config).get_current_head()
+
+def _current_revision(db):
+    from alembic.runtime.migration import MigrationContext
+
+    with db.engine.connect() as connection:
+        return MigrationContext.configure(connection).get_current_revision()
+
+def _verify_schema(app, db):
+    head = _migration_head()
+    current = _current_revision(db)
+
+    if current == head:
+        return f'schema at revision {current}'
+    if current is None:
+        app.logger.warning(
+            'Database has no migration revision - run "flask db upgrade" '
+            '(or "flask db stamp head" for a database created with db.create_all())'
+        )
+        return 'schema unversioned'
+
+    app.logger.warning(f'Database schema at revision {current}, migrations head is {head} - run "flask db upgrade"')
+    return f'schema behind ({current} -> {head})'
+
+def _upgrade_schema(app, db):
+    from flask_migrate import upgrade
+
+    if db.engine.dialect.name != 'postgresql':
+        upgrade()
+        return 'schema upgraded'
+
+    # Only one worker runs the migrations; the others wait and find nothing to do
+    with db.engine.connect() as connection:
+        connection.exec_driver_sql(f'SELECT pg_advisory_lock({UPGRADE_LOCK_KEY})')
+        try:
+            if _current_revision(db) != _migration_head():
+                upgrade()
+                return 'schema upgraded'
+            return 'schema already current'
+        finally:
+            connection.exec_driver_sql(f'SELECT pg_advisory_unlock({UPGRADE_LOCK_KEY})')
+            connection.commit()
+
+def _create_schema(app, db):
+    from app.models import User, IndexState
+    from werkzeug.security import generate_password_hash
+
+    db.create_all()
+    app.logger.info('Database tables created/verified')
+
+    if db.session.get(IndexState, 1) is None:
+        db.session.add(IndexState(id=1, generation=0))
+        db.session.commit()
+
+    # Create default admin if none exists
+    admin = User.query.filter_by(role='admin').first()
+    if not admin:
+        default_admin = User(
+            username='admin',
+            password_hash=generate_password_hash('admin123'),
+            email='admin@dccodex.local',
+            full_name='System Administrator',
+            role='admin',
+            is_active=True
+        )
+        db.session.add(default_admin)
+        db.session.commit()
+        app.logger.info('Default admin user created')
+    return 'tables created'
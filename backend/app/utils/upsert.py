@@ -0,0 +1,30 @@
+"""
+Upsert Helpers
+INSERT ... ON CONFLICT statements for PostgreSQL (and SQLite in development)
+"""
+
+def dialect_insert(connection, table):
+    """INSERT construct supporting on_conflict_* for the connection's dialect"""
+    if connection.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(table)
+
+def upsert_add(connection, table, key_columns, rows, add_columns, replace_columns=()):
+    """
+    Insert rows, or add their add_columns onto the existing row with the same
+    key (replace_columns are overwritten instead). Rows are written in key
+    order so concurrent writers lock them in the same sequence.
+    """
+    if not rows:
+        return
+    statement = dialect_insert(connection, table)
+    updates = {name: table.c[name] + statement.excluded[name] for name in add_columns}
+    updates.update({name: statement.excluded[name] for name in replace_columns})
+    statement = statement.on_conflict_do_update(
+        index_elements=[table.c[name] for name in key_columns],
+        set_=updates
+    )
+    rows = sorted(rows, key=lambda row: tuple(row[name] for name in key_columns))
+    connection.execute(statement, rows)
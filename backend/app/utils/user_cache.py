@@ -0,0 +1,91 @@
+"""
+User Lookup Cache
+Short-lived per-worker cache behind the Flask-Login user_loader, so
+authenticated requests do not query the users table every time
+"""
+
+import os
+import time
+import threading
+from collections import OrderedDict
+from sqlalchemy import inspect
+from sqlalchemy.orm import make_transient_to_detached
+
+class UserCache:
+    """Thread-safe TTL cache of user column values keyed by user id"""
+
+    def __init__(self, ttl, max_entries):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or entry[0] < time.monotonic():
+                self._entries.pop(user_id, None)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, user_id, values):
+        with self._lock:
+            self._entries[user_id] = (time.monotonic() + self.ttl, values)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'pid': os.getpid(),
+                'ttl': self.ttl,
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses
+            }
+
+user_cache = UserCache(
+    ttl=float(os.getenv('USER_CACHE_TTL', 60)),
+    max_entries=int(os.getenv('USER_CACHE_SIZE', 1000))
+)
+
+def _column_values(user):
+    return {attr.key: getattr(user, attr.key) for attr in inspect(user).mapper.column_attrs}
+
+def load_cached_user(db, user_id):
+    """
+    Return the user for a session id, hitting the database at most once per
+    USER_CACHE_TTL seconds per worker. Changes made through update_user,
+    delete_user, login or change_password invalidate the entry immediately
+    in the worker that made them; other workers pick them up within the TTL.
+    """
+    from app.models import User
+
+    if user_cache.ttl <= 0:
+        return db.session.get(User, user_id)
+
+    values = user_cache.get(user_id)
+    if values is None:
+        user = db.session.get(User, user_id)
+        if user is not None:
+            user_cache.put(user_id, _column_values(user))
+        return user
+
+    # Rebuild the instance from cached columns and attach it without a SELECT
+    user = User(**values)
+    make_transient_to_detached(user)
+    return db.session.merge(user, load=False)
@@ -0,0 +1,139 @@
+"""initial schema
+
+Baseline for databases created before migrations were introduced: tables
+that already exist (from db.create_all() or database/schema.sql) are left
+untouched, missing ones are created, and a default admin is seeded once.
+
+Revision ID: 25e95285d4f4
+Revises:
+Create Date: 2026-10-19 09:00:00.000000
+
+"""
+from datetime import datetime
+from alembic import op
+import sqlalchemy as sa
+from werkzeug.security import generate_password_hash
+
+
+# revision identifiers, used by Alembic.
+revision = '25e95285d4f4'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def _existing_tables():
+    return set(sa.inspect(op.get_bind()).get_table_names())
+
+
+def upgrade():
+    existing = _existing_tables()
+
+    if 'users' not in existing:
+        op.create_table(
+            'users',
+            sa.Column('id', sa.Integer(), primary_key=True),
+            sa.Column('username', sa.String(length=100), nullable=False, unique=True),
+            sa.Column('password_hash', sa.String(length=255), nullable=False),
+            sa.Column('email', sa.String(length=255)),
+            sa.Column('full_name', sa.String(length=255)),
+            sa.Column('role', sa.String(length=50)),
+            sa.Column('is_active', sa.Boolean()),
+            sa.Column('created_date', sa.DateTime()),
+            sa.Column('last_login', sa.DateTime())
+        )
+
+    if 'projects' not in existing:
+        op.create_table(
+            'projects',
+            sa.Column('id', sa.Integer(), primary_key=True),
+            sa.Column('name', sa.String(length=255), nullable=False, unique=True),
+            sa.Column('description', sa.Text()),
+            sa.Column('created_date', sa.DateTime()),
+            sa.Column('updated_date', sa.DateTime()),
+            sa.Column('is_active', sa.Boolean())
+        )
+
+    if 'tags' not in existing:
+        op.create_table(
+            'tags',
+            sa.Column('id', sa.Integer(), primary_key=True),
+            sa.Column('name', sa.String(length=100), nullable=False, unique=True),
+            sa.Column('description', sa.Text()),
+            sa.Column('created_date', sa.DateTime())
+        )
+
+    if 'files' not in existing:
+        op.create_table(
+            'files',
+            sa.Column('id', sa.Integer(), primary_key=True),
+            sa.Column('filename', sa.String(length=255), nullable=False),
+            sa.Column('filepath', sa.Text(), nullable=False, unique=True),
+            sa.Column('filetype', sa.String(length=50)),
+            sa.Column('project_id', sa.Integer(), sa.ForeignKey('projects.id')),
+            sa.Column('description', sa.Text()),
+            sa.Column('size', sa.BigInteger()),
+            sa.Column('line_count', sa.Integer()),
+            sa.Column('modified_date', sa.DateTime()),
+            sa.Column('indexed_date', sa.DateTime()),
+            sa.Column('content_hash', sa.String(length=64)),
+            sa.Column('is_active', sa.Boolean())
+        )
+
+    if 'file_tags' not in existing:
+        op.create_table(
+            'file_tags',
+            sa.Column('file_id', sa.Integer(), sa.ForeignKey('files.id'), primary_key=True),
+            sa.Column('tag_id', sa.Integer(), sa.ForeignKey('tags.id'), primary_key=True)
+        )
+
+    if 'search_logs' not in existing:
+        op.create_table(
+            'search_logs',
+            sa.Column('id', sa.Integer(), primary_key=True),
+            sa.Column('search_term', sa.Text(), nullable=False),
+            sa.Column('results_count', sa.Integer()),
+            sa.Column('user_id', sa.Integer(), sa.ForeignKey('users.id')),
+            sa.Column('user_ip', sa.String(length=45)),
+            sa.Column('timestamp', sa.DateTime())
+        )
+
+    # Indexes from database/schema.sql
+    for name, table, columns in [
+        ('idx_files_filename', 'files', 'filename'),
+        ('idx_files_project', 'files', 'project_id'),
+        ('idx_files_filetype', 'files', 'filetype'),
+        ('idx_files_modified', 'files', 'modified_date'),
+        ('idx_search_logs_term', 'search_logs', 'search_term'),
+        ('idx_search_logs_timestamp', 'search_logs', 'timestamp'),
+        ('idx_file_tags_file', 'file_tags', 'file_id'),
+        ('idx_file_tags_tag', 'file_tags', 'tag_id'),
+    ]:
+        op.execute(f'CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})')
+
+    # Seed the default admin once, instead of on every worker boot
+    bind = op.get_bind()
+    if bind.execute(sa.text("SELECT 1 FROM users WHERE role = 'admin'")).first() is None:
+        bind.execute(
+            sa.text(
+                "INSERT INTO users (username, password_hash, email, full_name, role, is_active, created_date) "
+                "VALUES (:username, :password_hash, :email, :full_name, 'admin', :is_active, :created_date)"
+            ),
+            {
+                'username': 'admin',
+                'password_hash': generate_password_hash('admin123'),
+                'email': 'admin@dccodex.local',
+                'full_name': 'System Administrator',
+                'is_active': True,
+                'created_date': datetime.utcnow()
+            }
+        )
+
+
+def downgrade():
+    op.drop_table('search_logs')
+    op.drop_table('file_tags')
+    op.drop_table('files')
+    op.drop_table('tags')
+    op.drop_table('projects')
+    op.drop_table('users')
@@ -0,0 +1,33 @@
+"""index state generation counter
+
+Revision ID: 7c1d4e9a2b63
+Revises: 25e95285d4f4
+Create Date: 2026-10-19 11:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7c1d4e9a2b63'
+down_revision = '25e95285d4f4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if 'index_state' not in sa.inspect(op.get_bind()).get_table_names():
+        op.create_table(
+            'index_state',
+            sa.Column('id', sa.Integer(), primary_key=True),
+            sa.Column('generation', sa.BigInteger(), nullable=False, server_default='0')
+        )
+
+    bind = op.get_bind()
+    if bind.execute(sa.text('SELECT 1 FROM index_state WHERE id = 1')).first() is None:
+        bind.execute(sa.text('INSERT INTO index_state (id, generation) VALUES (1, 0)'))
+
+
+def downgrade():
+    op.drop_table('index_state')
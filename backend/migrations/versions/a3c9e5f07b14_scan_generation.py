@@ -0,0 +1,28 @@
+"""scan generation for mark-and-sweep indexing
+
+Revision ID: a3c9e5f07b14
+Revises: d8b2f4a61c37
+Create Date: 2026-10-20 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a3c9e5f07b14'
+down_revision = 'd8b2f4a61c37'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    columns = {column['name'] for column in sa.inspect(op.get_bind()).get_columns('files')}
+    if 'scan_generation' not in columns:
+        # NULL until the next walk of the file's directory stamps it
+        op.add_column('files', sa.Column('scan_generation', sa.BigInteger()))
+
+
+def downgrade():
+    with op.batch_alter_table('files') as batch_op:
+        batch_op.drop_column('scan_generation')
@@ -0,0 +1,31 @@
+"""dashboard stats counters
+
+Revision ID: a3f08c5d91e2
+Revises: 7c1d4e9a2b63
+Create Date: 2026-10-19 13:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a3f08c5d91e2'
+down_revision = '7c1d4e9a2b63'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if 'stats_counters' not in sa.inspect(op.get_bind()).get_table_names():
+        op.create_table(
+            'stats_counters',
+            sa.Column('key', sa.String(length=120), primary_key=True),
+            sa.Column('value', sa.BigInteger(), nullable=False, server_default='0'),
+            sa.Column('updated_date', sa.DateTime())
+        )
+    # Counters are filled on the first dashboard read or scheduled refresh
+
+
+def downgrade():
+    op.drop_table('stats_counters')
@@ -0,0 +1,41 @@
+"""active file counts on projects and tags
+
+Revision ID: b6d3a9e14f72
+Revises: e8c2f6a1b407
+Create Date: 2026-10-19 17:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b6d3a9e14f72'
+down_revision = 'e8c2f6a1b407'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    for table in ('projects', 'tags'):
+        columns = {column['name'] for column in inspector.get_columns(table)}
+        if 'active_file_count' not in columns:
+            op.add_column(table, sa.Column('active_file_count', sa.Integer(), nullable=False, server_default='0'))
+
+    op.execute(
+        'UPDATE projects SET active_file_count = ('
+        'SELECT count(*) FROM files WHERE files.project_id = projects.id AND files.is_active = true)'
+    )
+    op.execute(
+        'UPDATE tags SET active_file_count = ('
+        'SELECT count(*) FROM file_tags JOIN files ON files.id = file_tags.file_id '
+        'WHERE file_tags.tag_id = tags.id AND files.is_active = true)'
+    )
+
+
+def downgrade():
+    with op.batch_alter_table('tags') as batch_op:
+        batch_op.drop_column('active_file_count')
+    with op.batch_alter_table('projects') as batch_op:
+        batch_op.drop_column('active_file_count')
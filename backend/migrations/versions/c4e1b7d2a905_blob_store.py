@@ -0,0 +1,36 @@
+"""content-addressed blob store for uploads
+
+Revision ID: c4e1b7d2a905
+Revises: b6d3a9e14f72
+Create Date: 2026-10-19 18:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4e1b7d2a905'
+down_revision = 'b6d3a9e14f72'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if 'blobs' not in sa.inspect(op.get_bind()).get_table_names():
+        op.create_table(
+            'blobs',
+            sa.Column('digest', sa.String(length=64), primary_key=True),
+            sa.Column('size', sa.BigInteger(), nullable=False, server_default='0'),
+            sa.Column('ref_count', sa.Integer(), nullable=False, server_default='0'),
+            sa.Column('created_date', sa.DateTime()),
+            sa.Column('last_referenced', sa.DateTime())
+        )
+    # Reference counts are reconciled against files.content_hash
+    op.execute('CREATE INDEX IF NOT EXISTS idx_files_content_hash ON files (content_hash)')
+    # Existing uploads join the store with "maintenance.py dedupe-uploads"
+
+
+def downgrade():
+    op.execute('DROP INDEX IF EXISTS idx_files_content_hash')
+    op.drop_table('blobs')
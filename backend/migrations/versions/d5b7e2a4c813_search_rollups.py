@@ -0,0 +1,64 @@
+"""search analytics rollups and heavy hitters
+
+Revision ID: d5b7e2a4c813
+Revises: a3f08c5d91e2
+Create Date: 2026-10-19 15:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd5b7e2a4c813'
+down_revision = 'a3f08c5d91e2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    existing = set(sa.inspect(op.get_bind()).get_table_names())
+
+    if 'search_rollups_hourly' not in existing:
+        op.create_table(
+            'search_rollups_hourly',
+            sa.Column('bucket', sa.DateTime(), primary_key=True),
+            sa.Column('search_term', sa.Text(), primary_key=True),
+            sa.Column('searches', sa.Integer(), nullable=False, server_default='0'),
+            sa.Column('zero_results', sa.Integer(), nullable=False, server_default='0'),
+            sa.Column('results_total', sa.BigInteger(), nullable=False, server_default='0')
+        )
+
+    if 'search_rollups_daily' not in existing:
+        op.create_table(
+            'search_rollups_daily',
+            sa.Column('day', sa.Date(), primary_key=True),
+            sa.Column('search_term', sa.Text(), primary_key=True),
+            sa.Column('searches', sa.Integer(), nullable=False, server_default='0'),
+            sa.Column('zero_results', sa.Integer(), nullable=False, server_default='0'),
+            sa.Column('results_total', sa.BigInteger(), nullable=False, server_default='0')
+        )
+
+    if 'search_heavy_hitters' not in existing:
+        op.create_table(
+            'search_heavy_hitters',
+            sa.Column('search_term', sa.Text(), primary_key=True),
+            sa.Column('count', sa.BigInteger(), nullable=False),
+            sa.Column('error', sa.BigInteger(), nullable=False, server_default='0')
+        )
+
+    if 'rollup_state' not in existing:
+        op.create_table(
+            'rollup_state',
+            sa.Column('name', sa.String(length=100), primary_key=True),
+            sa.Column('last_id', sa.BigInteger(), nullable=False, server_default='0'),
+            sa.Column('total', sa.BigInteger(), nullable=False, server_default='0'),
+            sa.Column('updated_date', sa.DateTime())
+        )
+
+
+def downgrade():
+    op.drop_table('rollup_state')
+    op.drop_table('search_heavy_hitters')
+    op.drop_table('search_rollups_daily')
+    op.drop_table('search_rollups_hourly')
@@ -0,0 +1,43 @@
+"""incremental integrity verification
+
+Revision ID: d8b2f4a61c37
+Revises: f1a7c3e95d28
+Create Date: 2026-10-19 22:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd8b2f4a61c37'
+down_revision = 'f1a7c3e95d28'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    tables = sa.inspect(op.get_bind()).get_table_names()
+    if 'file_verifications' not in tables:
+        op.create_table(
+            'file_verifications',
+            sa.Column('file_id', sa.Integer(), sa.ForeignKey('files.id', ondelete='CASCADE'), primary_key=True),
+            sa.Column('size', sa.BigInteger(), nullable=False),
+            sa.Column('mtime_ns', sa.BigInteger(), nullable=False),
+            sa.Column('content_hash', sa.String(length=64), nullable=False),
+            sa.Column('verified_date', sa.DateTime())
+        )
+    if 'directory_digests' not in tables:
+        op.create_table(
+            'directory_digests',
+            sa.Column('path', sa.Text(), primary_key=True),
+            sa.Column('stat_digest', sa.String(length=64), nullable=False),
+            sa.Column('content_digest', sa.String(length=64), nullable=False),
+            sa.Column('file_count', sa.Integer(), nullable=False, server_default='0'),
+            sa.Column('updated_date', sa.DateTime())
+        )
+
+
+def downgrade():
+    op.drop_table('directory_digests')
+    op.drop_table('file_verifications')
@@ -0,0 +1,120 @@
+"""partition search_logs by month
+
+Rebuilds search_logs as a range-partitioned table (PostgreSQL only) with
+one partition per month that holds data, the current and next months, and
+a default partition. Existing rows are copied over; ids and the id sequence
+are kept. Other databases keep the plain table.
+
+Revision ID: e8c2f6a1b407
+Revises: d5b7e2a4c813
+Create Date: 2026-10-19 17:00:00.000000
+
+"""
+from datetime import datetime, date
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e8c2f6a1b407'
+down_revision = 'd5b7e2a4c813'
+branch_labels = None
+depends_on = None
+
+# Empty monthly partitions created ahead of the current month
+MONTHS_AHEAD = 3
+
+
+def _month(moment, offset=0):
+    index = moment.year * 12 + (moment.month - 1) + offset
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _is_partitioned(bind):
+    return bind.execute(sa.text(
+        "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass('search_logs'))"
+    )).scalar()
+
+
+def upgrade():
+    bind = op.get_bind()
+    if bind.dialect.name != 'postgresql' or _is_partitioned(bind):
+        return
+
+    # Copying every search log and indexing the copy takes as long as the log
+    # is big: lift any statement timeout for the rest of the transaction
+    op.execute('SET LOCAL statement_timeout = 0')
+
+    op.execute('ALTER TABLE search_logs RENAME TO search_logs_legacy')
+    op.execute('ALTER INDEX IF EXISTS search_logs_pkey RENAME TO search_logs_legacy_pkey')
+    op.execute('DROP INDEX IF EXISTS idx_search_logs_term')
+    op.execute('DROP INDEX IF EXISTS idx_search_logs_timestamp')
+
+    op.execute("""
+        CREATE TABLE search_logs (
+            id INTEGER NOT NULL DEFAULT nextval('search_logs_id_seq'),
+            search_term TEXT NOT NULL,
+            results_count INTEGER,
+            user_id INTEGER REFERENCES users(id),
+            user_ip VARCHAR(45),
+            timestamp TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (id, timestamp)
+        ) PARTITION BY RANGE (timestamp)
+    """)
+    op.execute('ALTER SEQUENCE search_logs_id_seq OWNED BY search_logs.id')
+
+    # One partition per month from the oldest log through MONTHS_AHEAD months from now
+    oldest = bind.execute(sa.text('SELECT min(timestamp) FROM search_logs_legacy')).scalar()
+    now = datetime.utcnow()
+    start = _month(oldest or now)
+    last = _month(now, MONTHS_AHEAD)
+    while start <= last:
+        end = _month(start, 1)
+        op.execute(
+            f"CREATE TABLE search_logs_{start.year:04d}_{start.month:02d} PARTITION OF search_logs "
+            f"FOR VALUES FROM ('{start}') TO ('{end}')"
+        )
+        start = end
+    op.execute('CREATE TABLE search_logs_default PARTITION OF search_logs DEFAULT')
+
+    op.execute("""
+        INSERT INTO search_logs (id, search_term, results_count, user_id, user_ip, timestamp)
+        SELECT id, search_term, results_count, user_id, user_ip, COALESCE(timestamp, CURRENT_TIMESTAMP)
+        FROM search_logs_legacy
+    """)
+    op.execute('DROP TABLE search_logs_legacy')
+
+    op.execute('CREATE INDEX IF NOT EXISTS idx_search_logs_term ON search_logs (search_term)')
+    op.execute('CREATE INDEX IF NOT EXISTS idx_search_logs_timestamp ON search_logs (timestamp)')
+    op.execute('ANALYZE search_logs')
+
+
+def downgrade():
+    bind = op.get_bind()
+    if bind.dialect.name != 'postgresql' or not _is_partitioned(bind):
+        return
+
+    op.execute('SET LOCAL statement_timeout = 0')
+
+    op.execute('ALTER TABLE search_logs RENAME TO search_logs_partitioned')
+    op.execute('ALTER INDEX IF EXISTS search_logs_pkey RENAME TO search_logs_partitioned_pkey')
+    op.execute('DROP INDEX IF EXISTS idx_search_logs_term')
+    op.execute('DROP INDEX IF EXISTS idx_search_logs_timestamp')
+    op.execute("""
+        CREATE TABLE search_logs (
+            id INTEGER PRIMARY KEY DEFAULT nextval('search_logs_id_seq'),
+            search_term TEXT NOT NULL,
+            results_count INTEGER,
+            user_id INTEGER REFERENCES users(id),
+            user_ip VARCHAR(45),
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    op.execute('ALTER SEQUENCE search_logs_id_seq OWNED BY search_logs.id')
+    op.execute("""
+        INSERT INTO search_logs (id, search_term, results_count, user_id, user_ip, timestamp)
+        SELECT id, search_term, results_count, user_id, user_ip, timestamp FROM search_logs_partitioned
+    """)
+    op.execute('DROP TABLE search_logs_partitioned')
+    op.execute('CREATE INDEX IF NOT EXISTS idx_search_logs_term ON search_logs (search_term)')
+    op.execute('CREATE INDEX IF NOT EXISTS idx_search_logs_timestamp ON search_logs (timestamp)')
@@ -0,0 +1,49 @@
+"""duplicate and near-duplicate detection
+
+Revision ID: f1a7c3e95d28
+Revises: c4e1b7d2a905
+Create Date: 2026-10-19 20:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f1a7c3e95d28'
+down_revision = 'c4e1b7d2a905'
+branch_labels = None
+depends_on = None
+
+# Must match app.utils.similarity.band_sql(); written out so the migration
+# does not change if the application code does
+BAND_EXPRESSIONS = [
+    '((simhash >> 53) & 2047)',
+    '((simhash >> 42) & 2047)',
+    '((simhash >> 31) & 2047)',
+    '((simhash >> 20) & 2047)',
+    '((simhash >> 10) & 1023)',
+    '((simhash >> 0) & 1023)',
+]
+
+
+def upgrade():
+    columns = {column['name'] for column in sa.inspect(op.get_bind()).get_columns('files')}
+    if 'simhash' not in columns:
+        op.add_column('files', sa.Column('simhash', sa.BigInteger()))
+    if 'duplicate_group' not in columns:
+        op.add_column('files', sa.Column('duplicate_group', sa.Integer()))
+
+    op.execute('CREATE INDEX IF NOT EXISTS idx_files_duplicate_group ON files (duplicate_group)')
+    for index, expression in enumerate(BAND_EXPRESSIONS):
+        op.execute(f'CREATE INDEX IF NOT EXISTS idx_files_simhash_band{index} ON files ({expression})')
+    # Signatures for existing files are computed by the analyze_duplicates job
+
+
+def downgrade():
+    for index in range(len(BAND_EXPRESSIONS)):
+        op.execute(f'DROP INDEX IF EXISTS idx_files_simhash_band{index}')
+    op.execute('DROP INDEX IF EXISTS idx_files_duplicate_group')
+    with op.batch_alter_table('files') as batch_op:
+        batch_op.drop_column('duplicate_group')
+        batch_op.drop_column('simhash')
@@ -11,7 +11,8 @@ CREATE TABLE IF NOT EXISTS projects (
     description TEXT,
     created_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     updated_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    is_active BOOLEAN DEFAULT TRUE
+    is_active BOOLEAN DEFAULT TRUE,
+    active_file_count INTEGER NOT NULL DEFAULT 0
 );
 
 -- Files table
@@ -27,7 +28,10 @@ CREATE TABLE IF NOT EXISTS files (
     modified_date TIMESTAMP,
     indexed_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     content_hash VARCHAR(64),
-    is_active BOOLEAN DEFAULT TRUE
+    is_active BOOLEAN DEFAULT TRUE,
+    simhash BIGINT,
+    duplicate_group INTEGER,
+    scan_generation BIGINT
 );
 
 -- Tags table
@@ -35,7 +39,8 @@ CREATE TABLE IF NOT EXISTS tags (
     id SERIAL PRIMARY KEY,
     name VARCHAR(100) NOT NULL UNIQUE,
     description TEXT,
-    created_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    created_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    active_file_count INTEGER NOT NULL DEFAULT 0
 );
 
 -- File tags junction table
@@ -58,15 +63,19 @@ CREATE TABLE IF NOT EXISTS users (
     last_login TIMESTAMP
 );
 
--- Search logs table
+-- Search logs table, range-partitioned by month. Monthly partitions
+-- (search_logs_YYYY_MM) are created ahead of time by the application's
+-- maintain_search_logs job; rows outside them land in search_logs_default.
 CREATE TABLE IF NOT EXISTS search_logs (
-    id SERIAL PRIMARY KEY,
+    id SERIAL,
     search_term TEXT NOT NULL,
     results_count INTEGER,
     user_id INTEGER REFERENCES users(id),
     user_ip VARCHAR(45),
-    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-);
+    timestamp TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id, timestamp)
+) PARTITION BY RANGE (timestamp);
+CREATE TABLE IF NOT EXISTS search_logs_default PARTITION OF search_logs DEFAULT;
 
 -- File downloads table
 CREATE TABLE IF NOT EXISTS file_downloads (
@@ -77,11 +86,95 @@ CREATE TABLE IF NOT EXISTS file_downloads (
     user_ip VARCHAR(45)
 );
 
+-- Index generation (bumped on every file/tag/project change; drives search snapshot reloads)
+CREATE TABLE IF NOT EXISTS index_state (
+    id INTEGER PRIMARY KEY,
+    generation BIGINT NOT NULL DEFAULT 0
+);
+INSERT INTO index_state (id, generation) VALUES (1, 0) ON CONFLICT (id) DO NOTHING;
+
+-- Dashboard counters (maintained by the application, recomputed on a schedule)
+CREATE TABLE IF NOT EXISTS stats_counters (
+    key VARCHAR(120) PRIMARY KEY,
+    value BIGINT NOT NULL DEFAULT 0,
+    updated_date TIMESTAMP
+);
+
+-- Search analytics rollups (filled incrementally from search_logs)
+CREATE TABLE IF NOT EXISTS search_rollups_hourly (
+    bucket TIMESTAMP NOT NULL,
+    search_term TEXT NOT NULL,
+    searches INTEGER NOT NULL DEFAULT 0,
+    zero_results INTEGER NOT NULL DEFAULT 0,
+    results_total BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (bucket, search_term)
+);
+
+CREATE TABLE IF NOT EXISTS search_rollups_daily (
+    day DATE NOT NULL,
+    search_term TEXT NOT NULL,
+    searches INTEGER NOT NULL DEFAULT 0,
+    zero_results INTEGER NOT NULL DEFAULT 0,
+    results_total BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, search_term)
+);
+
+-- Space-Saving sketch of the most popular search terms
+CREATE TABLE IF NOT EXISTS search_heavy_hitters (
+    search_term TEXT PRIMARY KEY,
+    count BIGINT NOT NULL,
+    error BIGINT NOT NULL DEFAULT 0
+);
+
+-- Incremental rollup progress (last processed source row id)
+CREATE TABLE IF NOT EXISTS rollup_state (
+    name VARCHAR(100) PRIMARY KEY,
+    last_id BIGINT NOT NULL DEFAULT 0,
+    total BIGINT NOT NULL DEFAULT 0,
+    updated_date TIMESTAMP
+);
+
+-- Content-addressed upload blobs (file_storage/.blobs), reference counted from files
+CREATE TABLE IF NOT EXISTS blobs (
+    digest VARCHAR(64) PRIMARY KEY,
+    size BIGINT NOT NULL DEFAULT 0,
+    ref_count INTEGER NOT NULL DEFAULT 0,
+    created_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    last_referenced TIMESTAMP
+);
+
+-- Stat of each file when its content was last hashed by the integrity check
+CREATE TABLE IF NOT EXISTS file_verifications (
+    file_id INTEGER PRIMARY KEY REFERENCES files(id) ON DELETE CASCADE,
+    size BIGINT NOT NULL,
+    mtime_ns BIGINT NOT NULL,
+    content_hash VARCHAR(64) NOT NULL,
+    verified_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Per-directory Merkle digests of directories whose subtree last verified clean
+CREATE TABLE IF NOT EXISTS directory_digests (
+    path TEXT PRIMARY KEY,
+    stat_digest VARCHAR(64) NOT NULL,
+    content_digest VARCHAR(64) NOT NULL,
+    file_count INTEGER NOT NULL DEFAULT 0,
+    updated_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
 -- Create indexes for better performance
 CREATE INDEX IF NOT EXISTS idx_files_filename ON files(filename);
 CREATE INDEX IF NOT EXISTS idx_files_project ON files(project_id);
 CREATE INDEX IF NOT EXISTS idx_files_filetype ON files(filetype);
 CREATE INDEX IF NOT EXISTS idx_files_modified ON files(modified_date);
+CREATE INDEX IF NOT EXISTS idx_files_content_hash ON files(content_hash);
+CREATE INDEX IF NOT EXISTS idx_files_duplicate_group ON files(duplicate_group);
+-- SimHash bands (see app/utils/similarity.py); queries must use the same expressions
+CREATE INDEX IF NOT EXISTS idx_files_simhash_band0 ON files(((simhash >> 53) & 2047));
+CREATE INDEX IF NOT EXISTS idx_files_simhash_band1 ON files(((simhash >> 42) & 2047));
+CREATE INDEX IF NOT EXISTS idx_files_simhash_band2 ON files(((simhash >> 31) & 2047));
+CREATE INDEX IF NOT EXISTS idx_files_simhash_band3 ON files(((simhash >> 20) & 2047));
+CREATE INDEX IF NOT EXISTS idx_files_simhash_band4 ON files(((simhash >> 10) & 1023));
+CREATE INDEX IF NOT EXISTS idx_files_simhash_band5 ON files(((simhash >> 0) & 1023));
 CREATE INDEX IF NOT EXISTS idx_search_logs_term ON search_logs(search_term);
 CREATE INDEX IF NOT EXISTS idx_search_logs_timestamp ON search_logs(timestamp);
 CREATE INDEX IF NOT EXISTS idx_file_tags_file ON file_tags(file_id);
@@ -1,6 +1,8 @@
 // Codex Admin Panel JavaScript - Complete Implementation
 
 const API_BASE = '/api';
+// Files sent per upload request (archives count as one file)
+const UPLOAD_BATCH_SIZE = 20;
 let currentSection = 'dashboard';
 let currentUser = null;
 let currentPage = 1;
@@ -107,20 +109,31 @@ async function handleFiles(files, isModal = false) {
     let processedFiles = 0;
 
     try {
-        for (let file of files) {
+        const fileList = Array.from(files);
+        for (let start = 0; start < fileList.length; start += UPLOAD_BATCH_SIZE) {
+            const batch = fileList.slice(start, start + UPLOAD_BATCH_SIZE);
             try {
-                const result = await uploadSingleFile(file, {
+                const batchResults = await uploadFileBatch(batch, {
                     project_id: projectSelect.value,
                     description: descriptionInput ? descriptionInput.value : '',
                     tags: tagsInput ? tagsInput.value : ''
                 });
-                results.push({ file: file.name, success: true, message: 'Uploaded successfully' });
+                batch.forEach((file, index) => {
+                    const result = batchResults[index] || { status: 'error', error: 'No result returned' };
+                    if (result.status !== 'ok') {
+                        results.push({ file: file.name, success: false, message: result.error || 'Upload failed' });
+                    } else if (result.archive) {
+                        results.push({ file: file.name, success: true, message: `Extracted and indexed ${result.files_indexed} files` + (result.skipped ? ` (${result.skipped} skipped)` : '') });
+                    } else {
+                        results.push({ file: file.name, success: true, message: 'Uploaded successfully' });
+                    }
+                });
             } catch (error) {
-                console.error('Upload error for file:', file.name, error);
-                results.push({ file: file.name, success: false, message: error.message || 'Upload failed' });
+                console.error('Upload error for batch:', error);
+                batch.forEach(file => results.push({ file: file.name, success: false, message: error.message || 'Upload failed' }));
             }
             
-            processedFiles++;
+            processedFiles += batch.length;
             if (progressContainer) {
                 const progress = (processedFiles / totalFiles) * 100;
                 const progressFill = document.getElementById('uploadProgressFill');
@@ -173,34 +186,32 @@ async function handleFiles(files, isModal = false) {
     }
 }
 
-// Upload single file
-async function uploadSingleFile(file, metadata) {
-    return new Promise(async (resolve, reject) => {
-        const formData = new FormData();
-        formData.append('file', file);
-        formData.append('project_id', metadata.project_id);
-        formData.append('description', metadata.description);
-        formData.append('tags', metadata.tags);
+// Upload several files (or zip/tar archives) in one request; resolves to one result per file
+async function uploadFileBatch(files, metadata) {
+    const formData = new FormData();
+    files.forEach(file => formData.append('files', file));
+    formData.append('project_id', metadata.project_id);
+    formData.append('description', metadata.description);
+    formData.append('tags', metadata.tags);
 
-        try {
-            const response = await fetch(`${API_BASE}/admin/files/upload`, {
-                method: 'POST',
-                body: formData,
-                credentials: 'include'
-            });
+    const response = await fetch(`${API_BASE}/admin/files/upload`, {
+        method: 'POST',
+        body: formData,
+        credentials: 'include'
+    });
 
-            const result = await response.json();
+    const result = await response.json();
 
-            if (response.ok) {
-                resolve(result);
-            } else {
-                reject(new Error(result.error || 'Upload failed'));
-            }
-        } catch (error) {
-            console.error('Upload error:', error);
-            reject(error);
-        }
-    });
+    if (result.results) {
+        return result.results;
+    }
+    if (response.ok) {
+        return [{ status: 'ok', file: result.file }];
+    }
+    if (files.length === 1) {
+        return [{ status: 'error', error: result.error || 'Upload failed' }];
+    }
+    throw new Error(result.error || 'Upload failed');
 }
 
 // Check admin authentication
@@ -609,6 +620,7 @@ async function loadFiles(page = 1) {
         
         tbody.innerHTML = data.results.map(file => `
             <tr>
+                <td><input type="checkbox" class="file-select" value="${file.id}" onchange="updateFileSelection()"></td>
                 <td>
                     <div class="file-name">
                         <i class="${getFileIcon(file.filetype)}"></i>
@@ -636,6 +648,8 @@ async function loadFiles(page = 1) {
             </tr>
         `).join('');
         
+        updateFileSelection();
+        
         // Update pagination
         updatePagination('filesPagination', data.page, data.pages, page => loadFiles(page));
         
@@ -688,39 +702,43 @@ async function handleEditFile(event) {
     const fileId = document.getElementById('editFileId').value;
     const formData = new FormData(event.target);
     
-    const data = {
+    const operation = {
+        op: 'update',
+        id: parseInt(fileId),
         description: formData.get('description'),
-        project_id: formData.get('project_id'),
+        project_id: formData.get('project_id') ? parseInt(formData.get('project_id')) : null,
         tags: formData.get('tags').split(',').map(t => t.trim()).filter(t => t)
     };
     
     try {
-        const response = await fetch(`${API_BASE}/admin/files/${fileId}`, {
-            method: 'PUT',
-            headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify(data),
-            credentials: 'include'
-        });
-        
-        if (response.ok) {
-            showMessage('File updated successfully', 'success');
-            closeModal('editFileModal');
-            loadFiles();
-        } else {
-            const error = await response.json();
-            showMessage('Error: ' + error.error, 'error');
-        }
+        await runFileBatch([operation]);
+        showMessage('File updated successfully', 'success');
+        closeModal('editFileModal');
+        loadFiles();
     } catch (error) {
-        showMessage('Failed to update file', 'error');
+        showMessage('Error: ' + error.message, 'error');
     }
 }
 
 // Delete file
 async function deleteFile(fileId) {
+    await deleteFiles([fileId]);
+}
+
+// Delete the files ticked in the files table
+async function deleteSelectedFiles() {
+    const ids = Array.from(document.querySelectorAll('.file-select:checked')).map(box => parseInt(box.value));
+    if (ids.length) await deleteFiles(ids);
+}
+
+// Delete files from the database (one batch request for all of them)
+async function deleteFiles(fileIds) {
     // Show custom confirmation dialog
     const confirmed = await showConfirmDialog(
-        'Delete File',
-        'Are you sure you want to delete this file from the database?',
+        fileIds.length > 1 ? 'Delete Files' : 'Delete File',
+        fileIds.length > 1
+            ? `Are you sure you want to delete these ${fileIds.length} files from the database?`
+            : 'Are you sure you want to delete this file from the database?',
         'Delete',
         'Cancel'
     );
@@ -729,28 +747,54 @@ async function deleteFile(fileId) {
     
     try {
         showLoading(true);
-        
-        const response = await fetch(`${API_BASE}/admin/files/${fileId}`, {
-            method: 'DELETE',
-            credentials: 'include'
-        });
-        
-        if (response.ok) {
-            const result = await response.json();
-            showMessage(result.message || 'File deleted successfully', 'success');
-            loadFiles();
-        } else {
-            const error = await response.json();
-            showMessage('Failed to delete file: ' + (error.error || 'Unknown error'), 'error');
-        }
+        const result = await runFileBatch([{ op: 'deactivate', ids: fileIds }]);
+        const count = result.summary.deactivated;
+        showMessage(`${count} file${count !== 1 ? 's' : ''} deleted from database`, 'success');
+        loadFiles();
     } catch (error) {
         console.error('Delete error:', error);
-        showMessage('Error deleting file', 'error');
+        showMessage('Failed to delete files: ' + error.message, 'error');
     } finally {
         showLoading(false);
     }
 }
 
+// Tick or untick every file on the current page
+function toggleAllFiles(checked) {
+    document.querySelectorAll('.file-select').forEach(box => { box.checked = checked; });
+    updateFileSelection();
+}
+
+function updateFileSelection() {
+    const boxes = document.querySelectorAll('.file-select');
+    const selected = document.querySelectorAll('.file-select:checked').length;
+    const selectAll = document.getElementById('selectAllFiles');
+    const button = document.getElementById('deleteSelectedFiles');
+    if (selectAll) selectAll.checked = boxes.length > 0 && selected === boxes.length;
+    if (button) {
+        button.disabled = selected === 0;
+        button.innerHTML = `<i class="fas fa-trash"></i> Delete Selected${selected ? ` (${selected})` : ''}`;
+    }
+}
+
+// Apply file operations through POST /admin/files/batch in one transaction;
+// resolves to the batch result, rejects with the first operation error
+async function runFileBatch(operations) {
+    const response = await fetch(`${API_BASE}/admin/files/batch`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ operations, atomic: true }),
+        credentials: 'include'
+    });
+    
+    const result = await response.json();
+    if (!response.ok) {
+        const failed = (result.results || []).find(item => item.status === 'error');
+        throw new Error(failed ? failed.error : (result.error || 'Batch failed'));
+    }
+    return result;
+}
+
 // Load projects
 async function loadProjects() {
     try {
@@ -1264,7 +1308,8 @@ async function handleAddFile(event) {
     const form = event.target;
     const formData = new FormData(form);
     
-    const data = {
+    const operation = {
+        op: 'create',
         filename: formData.get('filename'),
         filepath: formData.get('filepath'),
         project_id: parseInt(formData.get('project_id')),
@@ -1273,24 +1318,13 @@ async function handleAddFile(event) {
     };
     
     try {
-        const response = await fetch(`${API_BASE}/admin/files`, {
-            method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify(data),
-            credentials: 'include'
-        });
-        
-        if (response.ok) {
-            showMessage('File added successfully', 'success');
-            closeModal('addFileModal');
-            form.reset();
-            loadFiles();
-        } else {
-            const error = await response.json();
-            showMessage('Error: ' + error.error, 'error');
-        }
+        await runFileBatch([operation]);
+        showMessage('File added successfully', 'success');
+        closeModal('addFileModal');
+        form.reset();
+        loadFiles();
     } catch (error) {
-        showMessage('Failed to add file', 'error');
+        showMessage('Error: ' + error.message, 'error');
     }
 }
 
@@ -1588,16 +1622,23 @@ async function handleCreateBackup(event) {
             credentials: 'include'
         });
         
-        const result = await response.json();
+        const started = await response.json();
+        if (!response.ok || started.success === false) {
+            showMessage(`Backup failed: ${started.message || started.error || 'Unknown error'}`, 'error');
+            return;
+        }
         
-        if (response.ok && (result.success !== false)) {
-            const backupName = result.backup_name || result.name || 'backup';
+        closeModal('createBackupModal');
+        const job = await waitForBackupJob(started.job_id);
+        
+        if (job.status === 'completed') {
+            const result = job.result || {};
+            const backupName = result.backup_name || started.backup_name || 'backup';
             const sizeMb = result.size_mb || 'unknown';
             showMessage(`Backup created successfully: ${backupName} (${sizeMb} MB)`, 'success');
-            closeModal('createBackupModal');
             loadBackups(); // Refresh the list
         } else {
-            showMessage(`Backup failed: ${result.message || result.error || 'Unknown error'}`, 'error');
+            showMessage(`Backup failed: ${job.error || 'Unknown error'}`, 'error');
         }
         
     } catch (error) {
@@ -1608,6 +1649,38 @@ async function handleCreateBackup(event) {
     }
 }
 
+// Poll a background backup or restore job until it finishes; returns its final state
+async function waitForBackupJob(jobId) {
+    const loadingText = document.querySelector('#loadingOverlay p');
+    try {
+        while (true) {
+            await new Promise(resolve => setTimeout(resolve, 1000));
+            const response = await fetch(`${API_BASE}/admin/backup-jobs/${encodeURIComponent(jobId)}`, {
+                credentials: 'include'
+            });
+            if (!response.ok) throw new Error('Lost track of the backup job');
+            
+            const job = await response.json();
+            if (job.status === 'completed' || job.status === 'failed') {
+                return job;
+            }
+            if (loadingText) loadingText.textContent = describeBackupJob(job);
+        }
+    } finally {
+        if (loadingText) loadingText.textContent = 'Loading...';
+    }
+}
+
+function describeBackupJob(job) {
+    const progress = job.progress;
+    if (!progress) {
+        return job.status === 'queued' ? 'Waiting for another backup or restore to finish...' : 'Starting...';
+    }
+    const lastMessage = progress.messages.length ? progress.messages[progress.messages.length - 1] : 'Working';
+    const megabytes = (progress.bytes / (1024 * 1024)).toFixed(1);
+    return `${lastMessage}... ${megabytes} MB (${progress.mb_per_second} MB/s)`;
+}
+
 function showRestoreBackupModal(backupName) {
     document.getElementById('restoreBackupName').value = backupName;
     document.getElementById('restoreBackupInfo').innerHTML = `
@@ -1644,18 +1717,24 @@ async function handleRestoreBackup(event) {
             credentials: 'include'
         });
         
-        const result = await response.json();
+        const started = await response.json();
+        if (!response.ok || started.success === false) {
+            showMessage(`Restore failed: ${started.message || started.error || 'Unknown error'}`, 'error');
+            return;
+        }
         
-        if (response.ok && (result.success !== false)) {
-            showMessage(result.message || 'Restore completed successfully', 'success');
-            closeModal('restoreBackupModal');
+        closeModal('restoreBackupModal');
+        const job = await waitForBackupJob(started.job_id);
+        
+        if (job.status === 'completed') {
+            showMessage('Restore completed successfully', 'success');
             
-            // Show restart message
+            // The page still shows the data from before the restore
             setTimeout(async () => {
                 const confirmed = await showConfirmDialog(
-                    'Restart Required',
-                    'Restore completed successfully! The application needs to be restarted. Restart now?',
-                    'Restart',
+                    'Reload Required',
+                    'Restore completed successfully! Reload the page to see the restored data?',
+                    'Reload',
                     'Later'
                 );
                 if (confirmed) {
@@ -1663,7 +1742,7 @@ async function handleRestoreBackup(event) {
                 }
             }, 2000);
         } else {
-            showMessage(`Restore failed: ${result.message || result.error || 'Unknown error'}`, 'error');
+            showMessage(`Restore failed: ${job.error || 'Unknown error'}`, 'error');
         }
         
     } catch (error) {
@@ -1888,7 +1967,16 @@ function displayAnalysisResults(result) {
             </div>
         `;
     });
-    
+
+    if (result.issues_truncated) {
+        html += `
+            <div class="issue-item">
+                <i class="fas fa-ellipsis-h"></i>
+                <span>... and ${issuesFound - issues.length} more</span>
+            </div>
+        `;
+    }
+
     container.innerHTML = html;
 }
 
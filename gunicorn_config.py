@@ -1,22 +1,57 @@
 """
 DC Codex Production Server
 Uses Gunicorn for better performance in production
+
+Worker modes (WORKER_CLASS):
+- sync:   one request per process, cpu_count * 2 + 1 processes (default)
+- gevent: cooperative greenlets, a handful of processes each holding up to
+          WORKER_CONNECTIONS concurrent requests. Suited to our traffic, which
+          is dominated by file reads and database waits.
+
+PRELOAD_APP=True loads the application once in the master and builds the
+read-only search index snapshot there; workers inherit it copy-on-write.
+The master polls the index generation every INDEX_RELOAD_INTERVAL seconds
+and, once it has moved and then held still for a full interval, reloads
+itself (SIGHUP), forking fresh workers that see the rebuilt snapshot.
+
+With JOB_RUNNER=True (default) the master also starts the background job
+runner (backend/app/scripts/run_job.py) once and restarts it if it exits.
+The runner is a process of its own, so reloads and worker recycling never
+interrupt a backup or restore.
 """
 
 import os
+import sys
+import time
+import signal
+import threading
+import subprocess
 import multiprocessing
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv()
 
+preload_app = os.getenv('PRELOAD_APP', 'False').lower() == 'true'
+
+# A preloaded app is imported by the master, before any gevent worker could
+# patch the standard library - patch here so the inherited modules cooperate
+if preload_app and os.getenv('WORKER_CLASS', 'sync').lower() == 'gevent':
+    from gevent import monkey
+    monkey.patch_all()
+
 # Server socket
 bind = f"{os.getenv('APP_HOST', '0.0.0.0')}:{os.getenv('APP_PORT', '5000')}"
 
 # Worker processes
-workers = multiprocessing.cpu_count() * 2 + 1
-worker_class = 'sync'
-worker_connections = 1000
+worker_class = os.getenv('WORKER_CLASS', 'sync').lower()
+
+if worker_class == 'gevent':
+    workers = int(os.getenv('WEB_CONCURRENCY', multiprocessing.cpu_count() + 1))
+    worker_connections = int(os.getenv('WORKER_CONNECTIONS', 1000))
+else:
+    workers = int(os.getenv('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+
 timeout = 120
 keepalive = 2
 
@@ -39,3 +74,120 @@ tmp_upload_dir = None
 if os.getenv('ENABLE_HTTPS', 'False').lower() == 'true':
     keyfile = os.getenv('SSL_KEY_PATH')
     certfile = os.getenv('SSL_CERT_PATH')
+
+# Seconds between index generation checks in the master (0 disables hot reload)
+index_reload_interval = int(os.getenv('INDEX_RELOAD_INTERVAL', 30))
+
+# Run backups and restores on a job runner process supervised by the master
+job_runner = os.getenv('JOB_RUNNER', 'True').lower() == 'true'
+
+# Minimum seconds between job runner starts, so a runner failing at startup is not respawned nonstop
+JOB_RUNNER_RESTART_DELAY = 10
+
+JOB_RUNNER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend', 'app', 'scripts', 'run_job.py')
+
+_job_runner = None
+_stopping = threading.Event()
+
+# Server hooks
+
+def _build_search_snapshot(server):
+    from app import db
+    from app.services.search_index import preload_snapshot
+    try:
+        preload_snapshot(server.app.wsgi(), db)
+    except Exception as e:
+        server.log.error(f'Search index snapshot not built: {e}')
+
+def _watch_index_generation(server, interval):
+    """Reload the master (SIGHUP) when the database index generation has moved and settled"""
+    from sqlalchemy import create_engine
+    from sqlalchemy.pool import NullPool
+    from app.services.search_index import get_snapshot, read_generation
+    from app.services.background_jobs import job_running
+
+    app = server.app.wsgi()
+    engine = create_engine(app.config['SQLALCHEMY_DATABASE_URI'], poolclass=NullPool)
+    pending = None
+    # Generation seen at the previous check: a running index walk keeps moving
+    # it, and reloading after every batch would recycle the workers nonstop
+    previous = None
+    while True:
+        time.sleep(interval)
+        snapshot = get_snapshot()
+        if snapshot is None:
+            continue
+        if job_running():
+            # A backup or restore is under way and moves the generation itself:
+            # reload once it has finished and the generation has settled
+            previous = None
+            continue
+        try:
+            with engine.connect() as connection:
+                generation = read_generation(connection)
+        except Exception as e:
+            server.log.warning(f'Index generation check failed: {e}')
+            continue
+        settled = generation == previous
+        previous = generation
+        if settled and generation != snapshot.generation and generation != pending:
+            server.log.info(f'Index generation {snapshot.generation} -> {generation}, reloading workers')
+            pending = generation
+            os.kill(os.getpid(), signal.SIGHUP)
+
+def _supervise_job_runner(server):
+    """Keep one background job runner alive beside the workers"""
+    global _job_runner
+    while not _stopping.is_set():
+        started = time.monotonic()
+        # A session of its own: signals aimed at the master and workers (reloads, Ctrl-C) never reach it
+        _job_runner = subprocess.Popen([sys.executable, JOB_RUNNER_SCRIPT], stdin=subprocess.DEVNULL,
+                                       start_new_session=True)
+        server.log.info(f'Background job runner started (pid {_job_runner.pid})')
+        returncode = _job_runner.wait()
+        if _stopping.is_set():
+            return
+        server.log.warning(f'Background job runner exited with status {returncode}, restarting')
+        _stopping.wait(max(0, JOB_RUNNER_RESTART_DELAY - (time.monotonic() - started)))
+
+def when_ready(server):
+    """Start the job runner; build the shared search snapshot before the first workers are forked"""
+    if job_runner:
+        threading.Thread(target=_supervise_job_runner, args=(server,), name='job-runner', daemon=True).start()
+    if not server.cfg.preload_app:
+        return
+    _build_search_snapshot(server)
+    if index_reload_interval > 0:
+        # Import what the watcher uses before any worker is forked: a worker forked while the
+        # watcher thread held a module's import lock would hang the first time it imports it
+        import sqlalchemy.pool
+        import app.services.background_jobs
+        import app.services.search_index
+        threading.Thread(target=_watch_index_generation, args=(server, index_reload_interval),
+                         name='index-watcher', daemon=True).start()
+
+def on_reload(server):
+    """Rebuild the snapshot in the master; the workers spawned next inherit it"""
+    if server.cfg.preload_app:
+        _build_search_snapshot(server)
+
+def post_fork(server, worker):
+    """Make psycopg2 cooperative so DB waits yield to other greenlets"""
+    if worker_class == 'gevent':
+        try:
+            from psycogreen.gevent import patch_psycopg
+            patch_psycopg()
+        except ImportError:
+            server.log.warning('psycogreen not installed - database calls will block the gevent worker')
+
+    if server.cfg.preload_app:
+        # Connections opened by the master before forking belong to the master
+        from app import db
+        with server.app.wsgi().app_context():
+            db.engine.dispose(close=False)
+
+def on_exit(server):
+    """Stop the job runner; a job under way is finished first"""
+    _stopping.set()
+    if _job_runner is not None and _job_runner.poll() is None:
+        _job_runner.send_signal(signal.SIGTERM)